@@ -42,12 +42,14 @@ exec python $OPT "$0" $FLG "$@"
 
 from __future__ import print_function
 
+import time
+_start_time = time.time()
+
 import logging
 import logging.config
 import os
 import sys
 import traceback
-import time
 import inspect
 import types
 import threading
@@ -55,8 +57,6 @@ import threading
 import pox.core
 core = pox.core.initialize()
 
-import pox.openflow
-import pox.openflow.of_01
 from pox.lib.util import str_to_bool
 
 # Function to run on main thread
@@ -67,6 +67,117 @@ try:
 except ImportError:
   __pypy__ = None
 
+class BootProfiler (object):
+  """
+  Records where startup time goes
+
+  Times each module imported for the first time (both including and
+  excluding the modules it imports in turn), each component launch, and
+  when core goes up.  The report is printed once core is up.
+  Enabled with the --profile-boot[=N] POX option, where N is how many of
+  the slowest imports to show.
+  """
+  def __init__ (self, start_time = None, top = 15):
+    self.start_time = start_time if start_time is not None else time.time()
+    self.top = top
+    self.imports = {} # name -> (total, self) seconds
+    self.launches = [] # (name, seconds)
+    self.events = [] # (name, time)
+    self._stack = []
+    self._old_import = None
+    self._listeners = []
+
+  def install (self):
+    import __builtin__
+    if self._old_import is not None: return
+    self._old_import = __builtin__.__import__
+    __builtin__.__import__ = self._import
+    self._listeners = [
+        core.addListenerByName("GoingUpEvent", self._handle_GoingUpEvent,
+                               once=True),
+        core.addListenerByName("UpEvent", self._handle_UpEvent, once=True)]
+
+  def uninstall (self):
+    import __builtin__
+    if self._old_import is None: return
+    if __builtin__.__import__ == self._import:
+      __builtin__.__import__ = self._old_import
+    self._old_import = None
+    core.removeListeners(self._listeners)
+
+  @staticmethod
+  def _new_module_name (name, globals, level):
+    """
+    Returns the name a module will be loaded as, or None if it's loaded
+    """
+    if name in sys.modules: return None
+    if level != 0 and globals and '__name__' in globals:
+      # Maybe an implicit relative import
+      pkg = globals.get('__package__')
+      if not pkg:
+        pkg = globals['__name__']
+        if '__path__' not in globals: pkg = pkg.rpartition('.')[0]
+      if pkg:
+        full = pkg + '.' + name
+        if sys.modules.get(full) is not None: return None
+        return full
+    return name
+
+  def _import (self, name, globals=None, locals=None, fromlist=None,
+               level=-1):
+    key = self._new_module_name(name, globals, level)
+    if key is None:
+      return self._old_import(name, globals, locals, fromlist, level)
+    self._stack.append(0.0)
+    start = time.time()
+    try:
+      return self._old_import(name, globals, locals, fromlist, level)
+    finally:
+      total = time.time() - start
+      children = self._stack.pop()
+      if self._stack: self._stack[-1] += total
+      if sys.modules.get(key) is None: key = name
+      if key not in self.imports:
+        self.imports[key] = (total, total - children)
+
+  def time_launch (self, name, f, *args, **kw):
+    """
+    Calls f, recording how long it took as the launch of name
+    """
+    start = time.time()
+    try:
+      return f(*args, **kw)
+    finally:
+      self.launches.append((name, time.time() - start))
+
+  def _handle_GoingUpEvent (self, event):
+    self.events.append(("GoingUpEvent", time.time()))
+
+  def _handle_UpEvent (self, event):
+    self.events.append(("UpEvent", time.time()))
+    self.uninstall()
+    print(self.format())
+
+  def format (self):
+    ms = lambda t: t * 1000
+    lines = ["Boot profile (ms since start unless noted):"]
+    imports = sorted(self.imports.items(), key=lambda i: i[1][1],
+                     reverse=True)
+    total = sum(i[1][1] for i in imports)
+    lines.append(" Imports: %i modules, %.1f ms" % (len(imports), ms(total)))
+    lines.append("  %9s %9s  %s" % ("self", "cumul", "module"))
+    for name,(cumul,self_time) in imports[:self.top]:
+      lines.append("  %9.1f %9.1f  %s" % (ms(self_time), ms(cumul), name))
+    lines.append(" Launches:")
+    for name,t in self.launches:
+      lines.append("  %9.1f  %s" % (ms(t), name))
+    for name,t in self.events:
+      lines.append(" %s at %.1f" % (name, ms(t - self.start_time)))
+    return "\n".join(lines)
+
+_profiler = None
+
+
 def _do_import (name):
   """
   Try to import the named component.
@@ -232,7 +343,11 @@ def _do_launch (argv):
         return False
 
       try:
-        if f(**params) is False:
+        if _profiler:
+          r = _profiler.time_launch(cname, f, **params)
+        else:
+          r = f(**params)
+        if r is False:
           # Abort startup
           return False
       except TypeError as exc:
@@ -351,6 +466,8 @@ Notable POX options include:
   --verbose       Print more debugging information (especially useful for
                   problems on startup)
   --no-openflow   Don't automatically load the OpenFlow module
+  --profile-boot  Print where startup time went once POX is up (use
+                  --profile-boot=N to list the N slowest imports)
   --log-config=F  Load a Python log configuration file (if you include the
                   option without specifying F, it defaults to logging.cfg)
 
@@ -384,6 +501,13 @@ class POXOptions (Options):
     print(core._get_python_version())
     sys.exit(0)
 
+  def _set_profile_boot (self, given_name, name, value):
+    global _profiler
+    top = 15 if value is True else int(value)
+    if _profiler is None:
+      _profiler = BootProfiler(_start_time, top)
+      _profiler.install()
+
   def _set_no_openflow (self, given_name, name, value):
     self.enable_openflow = not str_to_bool(value)
 
@@ -424,12 +548,21 @@ def _pre_startup ():
     logging.getLogger().setLevel(logging.DEBUG)
 
   if _options.enable_openflow:
-    pox.openflow.launch() # Default OpenFlow launch
+    # Only imported when wanted, since it pulls in libopenflow and more
+    import pox.openflow
+    if _profiler:
+      _profiler.time_launch("openflow", pox.openflow.launch)
+    else:
+      pox.openflow.launch() # Default OpenFlow launch
 
 
 def _post_startup ():
   if _options.enable_openflow:
-    pox.openflow.of_01.launch() # Usually, we launch of_01
+    import pox.openflow.of_01
+    if _profiler:
+      _profiler.time_launch("openflow.of_01", pox.openflow.of_01.launch)
+    else:
+      pox.openflow.of_01.launch() # Usually, we launch of_01
 
 
 def _setup_logging ():
@@ -198,6 +198,7 @@ class POXCore (EventMixin):
     self.scheduler = recoco.Scheduler(daemon=True)
 
     self._waiters = [] # List of waiting components
+    self._executor = None
 
   @property
   def banner (self):
@@ -208,6 +209,16 @@ class POXCore (EventMixin):
   def version_string (self):
     return "POX %s (%s)" % ('.'.join(map(str,self.version)),self.version_name)
 
+  @property
+  def executor (self):
+    """
+    A shared pox.lib.executor.Executor for running CPU-heavy work
+    """
+    if self._executor is None:
+      from pox.lib.executor import Executor
+      self._executor = Executor()
+    return self._executor
+
   def callDelayed (_self, _seconds, _func, *args, **kw):
     """
     Calls the function at a later time.
@@ -90,7 +90,7 @@ def do_launch (cls, address = '127.0.0.1', port = 6633, max_retry_delay = 16,
   def up (event):
     import pox.lib.ioworker
     global loop
-    loop = pox.lib.ioworker.RecocoIOLoop()
+    loop = pox.lib.ioworker.new_ioloop()
     #loop.more_debugging = True
     loop.start()
     OpenFlowWorker.begin(loop=loop, addr=address, port=port,
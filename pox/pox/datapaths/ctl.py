@@ -103,7 +103,7 @@ def create_server (port = 7791):
   # Set up IO loop
   global _ioloop
   if not _ioloop:
-    _ioloop = RecocoIOLoop()
+    _ioloop = new_ioloop()
     #_ioloop.more_debugging = True
     _ioloop.start()
 
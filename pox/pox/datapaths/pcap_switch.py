@@ -17,15 +17,22 @@ Software switch with PCap ports
 
 Example:
 ./pox.py --no-openflow datapaths.pcap_switch --address=localhost
+
+Passing --batch_size enables the batched receive path, which buffers frames
+in a bounded ring per interface and forwards table hits straight from the
+raw bytes:
+./pox.py --no-openflow datapaths.pcap_switch --batch_size=64 --ring_size=4096
 """
 
 from pox.core import core
 from pox.datapaths import do_launch
 from pox.datapaths.switch import SoftwareSwitchBase, OFConnection
 from pox.datapaths.switch import ExpireMixin
+from pox.datapaths.switch import _raw_flow_key
 import pox.lib.pxpcap as pxpcap
 from Queue import Queue
-from threading import Thread
+from threading import Thread, Event
+from collections import deque
 import pox.openflow.libopenflow_01 as of
 from pox.lib.packet import ethernet
 import logging
@@ -36,6 +43,52 @@ DEFAULT_CTL_PORT = 7791
 
 _switches = {}
 
+
+class RxRing (object):
+  """
+  Bounded receive ring for a single interface
+
+  The pcap thread for the interface is the only producer and the switch's
+  consumer thread is the only consumer.  deque's append() and popleft()
+  are atomic, so neither side needs a lock, and each counter is only ever
+  written by one thread.
+  """
+  def __init__ (self, size):
+    self.size = size
+    self._q = deque()
+    self.enqueued = 0
+    self.dropped = 0
+
+  def put (self, data):
+    """
+    Adds a frame, returning False (and counting a drop) if the ring is full
+    """
+    if len(self._q) >= self.size:
+      self.dropped += 1
+      return False
+    self._q.append(data)
+    self.enqueued += 1
+    return True
+
+  def drain (self, port_no, limit, out):
+    """
+    Moves up to limit (data,port_no) pairs to the list out
+
+    Returns the number of frames moved.
+    """
+    q = self._q
+    n = 0
+    try:
+      while n < limit:
+        out.append((q.popleft(), port_no))
+        n += 1
+    except IndexError:
+      pass
+    return n
+
+  def __len__ (self):
+    return len(self._q)
+
 def _do_ctl (event):
   r = _do_ctl2(event)
   if r is None:
@@ -86,6 +139,14 @@ def _do_ctl2 (event):
         for no,p in sw.ports.iteritems():
           s.append(" %3s %s" % (no, p.name))
       return "\n".join(s)
+    elif event.first == "stats":
+      ra(0)
+      s = []
+      for sw in _switches.values():
+        s.append("Switch %s" % (sw.name,))
+        for k,v in sorted(sw.rx_stats.iteritems()):
+          s.append(" %s: %s" % (k, v))
+      return "\n".join(s)
 
     else:
       raise RuntimeError("Unknown command")
@@ -97,9 +158,13 @@ def _do_ctl2 (event):
 
 def launch (address = '127.0.0.1', port = 6633, max_retry_delay = 16,
     dpid = None, ports = '', extra = None, ctl_port = None,
-    __INSTANCE__ = None):
+    batch_size = None, ring_size = None, __INSTANCE__ = None):
   """
   Launches a switch
+
+  batch_size enables the batched receive path and sets the maximum number
+  of frames handed to the switch at once.  ring_size is the number of
+  frames each interface may buffer before dropping.
   """
 
   if not pxpcap.enabled:
@@ -116,12 +181,18 @@ def launch (address = '127.0.0.1', port = 6633, max_retry_delay = 16,
     ctl.server(ctl_port)
     core.ctld.addListenerByName("CommandEvent", _do_ctl)
 
+  kw = {}
+  if batch_size is not None:
+    kw['batch_size'] = int(batch_size)
+  if ring_size is not None:
+    kw['ring_size'] = int(ring_size)
+
   _ports = ports.strip()
   def up (event):
     ports = [p for p in _ports.split(",") if p]
 
     sw = do_launch(PCapSwitch, address, port, max_retry_delay, dpid,
-                   ports=ports, extra_args=extra)
+                   ports=ports, extra_args=extra, **kw)
     _switches[sw.name] = sw
 
   core.addListenerByName("UpEvent", up)
@@ -131,6 +202,10 @@ class PCapSwitch (ExpireMixin, SoftwareSwitchBase):
   # Default level for loggers of this class
   default_log_level = logging.INFO
 
+  # Defaults for the batched receive path
+  default_ring_size = 4096
+  max_pending_batches = 4
+
   def __init__ (self, **kw):
     """
     Create a switch instance
@@ -138,11 +213,31 @@ class PCapSwitch (ExpireMixin, SoftwareSwitchBase):
     Additional options over superclass:
     log_level (default to default_log_level) is level for this instance
     ports is a list of interface names
+    batch_size enables the batched receive path (see rx_raw_batch()) and
+      is the most frames handed to the switch at once
+    ring_size is the per-interface ring length for the batched path
     """
     log_level = kw.pop('log_level', self.default_log_level)
 
+    self.batch_size = kw.pop('batch_size', None)
+    self.ring_size = kw.pop('ring_size', self.default_ring_size)
+
+    # Batched receive path state
+    self._rings = {} # port_no -> RxRing
+    self._rx_wakeup = Event()
+    self._batch_done = Event()
+    self._rx_quit = False
+    self._batches_queued = 0 # Only written by the consumer thread
+    self._batches_done = 0 # Only written by the scheduler
+    self._rx_stalls = 0
+    self._fast_path_count = 0
+    self._slow_path_count = 0
+
     self.q = Queue()
-    self.t = Thread(target=self._consumer_threadproc)
+    if self.batch_size:
+      self.t = Thread(target=self._batch_consumer_threadproc)
+    else:
+      self.t = Thread(target=self._consumer_threadproc)
     core.addListeners(self)
 
     ports = kw.pop('ports', [])
@@ -205,7 +300,11 @@ class PCapSwitch (ExpireMixin, SoftwareSwitchBase):
 
     self.add_port(phy)
 
-    px = pxpcap.PCap(name, callback = self._pcap_rx, start = False)
+    if self.batch_size:
+      self._rings[phy.port_no] = RxRing(self.ring_size)
+      px = pxpcap.PCap(name, callback = self._pcap_rx_ring, start = False)
+    else:
+      px = pxpcap.PCap(name, callback = self._pcap_rx, start = False)
     px.port_no = phy.port_no
     self.px[phy.port_no] = px
 
@@ -225,10 +324,31 @@ class PCapSwitch (ExpireMixin, SoftwareSwitchBase):
     px = self.px[name_or_num]
     px.stop()
     px.port_no = None
+    self._rings.pop(name_or_num, None)
     self.delete_port(name_or_num)
 
   def _handle_GoingDownEvent (self, event):
     self.q.put(None)
+    self._rx_quit = True
+    self._rx_wakeup.set()
+    self._batch_done.set()
+
+  @property
+  def rx_stats (self):
+    """
+    Counters for the batched receive path
+    """
+    r = {}
+    r['batches'] = self._batches_done
+    r['batches_pending'] = self._batches_queued - self._batches_done
+    r['stalls'] = self._rx_stalls
+    r['fast_path'] = self._fast_path_count
+    r['slow_path'] = self._slow_path_count
+    for port_no,ring in self._rings.items():
+      r['port%s_enqueued' % (port_no,)] = ring.enqueued
+      r['port%s_dropped' % (port_no,)] = ring.dropped
+      r['port%s_queued' % (port_no,)] = len(ring)
+    return r
 
   def _consumer_threadproc (self):
     timeout = 3
@@ -260,7 +380,184 @@ class PCapSwitch (ExpireMixin, SoftwareSwitchBase):
     if px.port_no is None: return
     self.q.put((px.port_no, data))
 
-  def _output_packet_physical (self, packet, port_no):
+  def _pcap_rx_ring (self, px, data, sec, usec, length):
+    ring = self._rings.get(px.port_no)
+    if ring is None: return
+    if ring.put(data):
+      self._rx_wakeup.set()
+
+  def _batch_consumer_threadproc (self):
+    """
+    Moves frames from the interface rings to the scheduler in batches
+
+    Frames are not parsed here.  If the scheduler already has
+    max_pending_batches batches it hasn't gotten to, we stop draining so
+    that the rings fill up and drop at the edge instead of queueing
+    without bound.
+    """
+    wakeup = self._rx_wakeup
+    done = self._batch_done
+    while core.running and not self._rx_quit:
+      done.clear()
+      if (self._batches_queued - self._batches_done
+          >= self.max_pending_batches):
+        self._rx_stalls += 1
+        done.wait(1)
+        continue
+
+      batch = []
+      rings = self._rings.items()
+      while rings and len(batch) < self.batch_size:
+        # Round-robin across interfaces so one busy port can't hog a batch
+        share = max(1, (self.batch_size - len(batch)) // len(rings))
+        moved = 0
+        for port_no,ring in rings:
+          moved += ring.drain(port_no, share, batch)
+          if len(batch) >= self.batch_size: break
+        if not moved: break
+
+      if not batch:
+        wakeup.wait(3)
+        wakeup.clear()
+        continue
+
+      self._batches_queued += 1
+      core.callLater(self.rx_raw_batch, batch)
+
+  def rx_raw_batch (self, batch):
+    """
+    Processes a batch of unparsed (data,port_no) pairs
+
+    Frames which hit a cached flow whose actions are all plain outputs are
+    forwarded as raw bytes without ever building an ethernet object.
+    Everything else goes through rx_packet() as usual.  Port counters for
+    the fast path are accumulated for the whole batch and applied once.
+    """
+    try:
+      rx = {}
+      tx = {}
+      for data,port_no in batch:
+        if not self._rx_raw(data, port_no, tx):
+          continue
+        c = rx.get(port_no)
+        if c is None:
+          rx[port_no] = [1, len(data)]
+        else:
+          c[0] += 1
+          c[1] += len(data)
+
+      stats = self.port_stats
+      for port_no,(packets,nbytes) in rx.iteritems():
+        ps = stats.get(port_no)
+        if ps is None: continue
+        ps.rx_packets += packets
+        ps.rx_bytes += nbytes
+      for port_no,(packets,nbytes) in tx.iteritems():
+        ps = stats.get(port_no)
+        if ps is None: continue
+        ps.tx_packets += packets
+        ps.tx_bytes += nbytes
+    finally:
+      self._batches_done += 1
+      self._batch_done.set()
+
+  def _rx_raw (self, data, in_port, tx):
+    """
+    Tries to forward a raw frame using the microflow cache
+
+    Returns True if it was handled here (and rx stats are the caller's
+    job), or False if it was passed on to rx_packet() (which fills in
+    the microflow cache for next time).
+    """
+    port = self.ports.get(in_port)
+    microflows = self._microflows
+    if (microflows is not None and port is not None
+        and not port.config & (of.OFPPC_NO_RECV|of.OFPPC_NO_RECV_STP)
+        and not self.config_flags & of.OFPC_FRAG_MASK):
+      if microflows.table is not self.table:
+        microflows.reset(self.table)
+      key = _raw_flow_key(data, in_port)
+      flow = microflows.get(key) if key is not None else None
+      entry = flow[0] if flow is not None else None
+      if entry is not None:
+        # The flow record's extra slot holds (actions, out_ports)
+        raw = flow[4]
+        if raw is None or raw[0] is not entry.actions:
+          # New flow, or actions were replaced by a modify flow_mod
+          raw = flow[4] = (entry.actions, self._raw_out_ports(entry.actions))
+        out_ports = raw[1]
+        if out_ports:
+          microflows.hits += 1
+          self._lookup_count += 1
+          self._matched_count += 1
+          self._fast_path_count += 1
+          entry.touch_packet(len(data))
+          self._output_raw(data, out_ports, in_port, tx)
+          return True
+
+    self._slow_path_count += 1
+    self.rx_packet(ethernet(data), in_port, packet_data=data)
+    return False
+
+  def _raw_out_ports (self, actions):
+    """
+    Returns output ports if actions can be done on raw bytes, else None
+    """
+    out_ports = []
+    for action in actions:
+      if type(action) is not of.ofp_action_output: return None
+      port = action.port
+      if port < of.OFPP_MAX or port in (of.OFPP_IN_PORT, of.OFPP_FLOOD,
+                                        of.OFPP_ALL):
+        out_ports.append(port)
+      else:
+        return None
+    return out_ports
+
+  def _output_raw (self, data, out_ports, in_port, tx):
+    """
+    Sends raw bytes out the given ports, honoring port config and state
+
+    This mirrors the physical port handling of _output_packet().
+    """
+    size = len(data)
+    for out_port in out_ports:
+      if out_port < of.OFPP_MAX:
+        if out_port == in_port:
+          self.log.warn("Dropping packet sent on port %i: Input port",
+                        out_port)
+          continue
+        nos = (out_port,)
+      elif out_port == of.OFPP_IN_PORT:
+        nos = (in_port,)
+      elif out_port == of.OFPP_FLOOD:
+        nos = [no for no in self._flood_ports if no != in_port]
+      else: # OFPP_ALL
+        nos = [no for no in self._all_ports if no != in_port]
+
+      for no in nos:
+        port = self.ports.get(no)
+        if port is None:
+          self.log.warn("Dropping packet sent on port %i: Invalid port", no)
+          continue
+        if port.config & (of.OFPPC_NO_FWD|of.OFPPC_PORT_DOWN):
+          self.log.warn("Dropping packet sent on port %i: "
+                        "Forwarding disabled or port down", no)
+          continue
+        if port.state & of.OFPPS_LINK_DOWN:
+          self.log.debug("Dropping packet sent on port %i: Link down", no)
+          continue
+        px = self.px.get(no)
+        if not px: continue
+        px.inject(data)
+        c = tx.get(no)
+        if c is None:
+          tx[no] = [1, size]
+        else:
+          c[0] += 1
+          c[1] += size
+
+  def _output_packet_physical (self, packet, port_no, packet_data=None):
     """
     send a packet out a single physical port
 
@@ -268,4 +565,4 @@ class PCapSwitch (ExpireMixin, SoftwareSwitchBase):
     """
     px = self.px.get(port_no)
     if not px: return
-    px.inject(packet)
+    px.inject(packet if packet_data is None else packet_data)
@@ -38,17 +38,300 @@ from pox.openflow.libopenflow_01 import *
 import pox.openflow.libopenflow_01 as of
 from pox.openflow.util import make_type_to_unpacker_table
 from pox.openflow.flow_table import FlowTable, TableEntry
+from pox.openflow.flow_table import FlowTableModification
 from pox.lib.packet import *
 
 import logging
 import struct
 import time
+import inspect
+from collections import deque
 
 
 # Multicast address used for STP 802.1D
 _STP_MAC = EthAddr('01:80:c2:00:00:00')
 
 
+_unpack_H = struct.Struct("!H").unpack_from
+_unpack_HH = struct.Struct("!HH").unpack_from
+_unpack_BB = struct.Struct("!BB").unpack_from
+_unpack_ipv4 = struct.Struct("!BBHHHBBHII").unpack_from
+_unpack_arp = struct.Struct("!HHBBH6sI6sI").unpack_from
+
+
+def _raw_flow_key (data, in_port):
+  """
+  Pulls the OpenFlow 1.0 match fields straight out of a raw frame
+
+  Returns a tuple equal to _match_key() of the exact match the packet
+  library would build for the same frame, or None if the frame isn't one
+  of the common cases we handle here (Ethernet II, at most one VLAN tag,
+  carrying ARP, unfragmented IPv4, or some other ethertype).
+  """
+  dlen = len(data)
+  if dlen < 14: return None
+  dl_type = _unpack_H(data, 12)[0]
+  off = 14
+  dl_vlan = of.OFP_VLAN_NONE
+  dl_vlan_pcp = 0
+  if dl_type == ethernet.VLAN_TYPE:
+    if dlen < 18: return None
+    tci,dl_type = _unpack_HH(data, 14)
+    dl_vlan = tci & 0x0fff
+    dl_vlan_pcp = tci >> 13
+    off = 18
+  if dl_type < 1536:
+    # LLC/SNAP -- leave it to the packet library
+    return None
+
+  nw_tos = nw_proto = nw_src = nw_dst = tp_src = tp_dst = None
+
+  if dl_type == ethernet.IP_TYPE:
+    if dlen < off + 20: return None
+    (vhl, nw_tos, iplen, _, frag, _, nw_proto, _, nw_src,
+        nw_dst) = _unpack_ipv4(data, off)
+    hl = (vhl & 0x0f) * 4
+    if (vhl >> 4) != 4 or hl < 20 or hl >= iplen or off + hl > dlen:
+      return None
+    if frag & 0x3fff:
+      # Fragment (MF set or nonzero offset)
+      return None
+    end = min(off + iplen, dlen)
+    off += hl
+    if nw_proto == 6:
+      if end - off < 20: return None
+      tp_src,tp_dst = _unpack_HH(data, off)
+    elif nw_proto == 17:
+      if end - off < 8: return None
+      tp_src,tp_dst = _unpack_HH(data, off)
+    elif nw_proto == 1:
+      if end - off < 4: return None
+      tp_src,tp_dst = _unpack_BB(data, off)
+  elif dl_type == ethernet.ARP_TYPE:
+    if dlen < off + 28: return None
+    (hwtype, prototype, hwlen, protolen, opcode, _, nw_src, _,
+        nw_dst) = _unpack_arp(data, off)
+    if hwtype != 1 or prototype != 0x0800 or hwlen != 6 or protolen != 4:
+      return None
+    if opcode <= 255:
+      nw_proto = opcode
+    else:
+      nw_src = nw_dst = None
+
+  return (in_port, data[6:12], data[0:6], dl_vlan, dl_vlan_pcp, dl_type,
+          nw_tos, nw_proto, nw_src, nw_dst, tp_src, tp_dst)
+
+
+def _match_key (match):
+  """
+  Returns the _raw_flow_key()-style tuple for an exact ofp_match
+  """
+  dl_src = match.dl_src
+  dl_dst = match.dl_dst
+  nw_src = match.nw_src
+  nw_dst = match.nw_dst
+  return (match.in_port,
+          None if dl_src is None else dl_src.toRaw(),
+          None if dl_dst is None else dl_dst.toRaw(),
+          match.dl_vlan, match.dl_vlan_pcp, match.dl_type,
+          match.nw_tos, match.nw_proto,
+          None if nw_src is None else nw_src.toUnsigned(),
+          None if nw_dst is None else nw_dst.toUnsigned(),
+          match.tp_src, match.tp_dst)
+
+
+class MicroflowCache (object):
+  """
+  Exact-match cache of which flow table entry each flow hits
+
+  Flows are keyed by _raw_flow_key() of the packet's bytes, so a hit is
+  a quick parse of the headers and one dict lookup, instead of building
+  an ofp_match and searching the whole table.  Flows which miss the table
+  are cached too.
+
+  Entries are invalidated when the table changes: removing a table entry
+  drops the flows which hit it, and adding one drops the flows it would
+  now win.  Cached flows are indexed by in_port so an added entry with an
+  in_port only looks at that port's flows; if an added entry (or batch of
+  them) would still have to look at more than max_scan flows, the whole
+  cache is flushed instead, so pushing lots of rules stays cheap.  When
+  the cache is full, one is evicted with the CLOCK algorithm (an
+  approximation of LRU).
+  """
+  # Most cached flows to check against added entries before just flushing
+  max_scan = 128
+
+  def __init__ (self, table, size = 4096):
+    self.size = size
+    self.table = None
+    self.hits = 0
+    self.misses = 0
+    self.uncacheable = 0 # Packets _raw_flow_key() doesn't handle
+    self.evictions = 0
+    self.invalidations = 0
+    self.flushes = 0
+    self.reset(table)
+
+  def reset (self, table):
+    """
+    Empties the cache and starts following the given table
+    """
+    if self.table is not None:
+      self.table.removeListener(self._handle_FlowTableModification)
+    self.table = table
+    table.addListener(FlowTableModification,
+                      self._handle_FlowTableModification)
+    self._clear()
+
+  def _clear (self):
+    # key -> [entry, match, referenced, slot, extra]
+    # (extra is for the switch's use; it goes away with the flow)
+    self._flows = {}
+    self._by_entry = {} # TableEntry -> set of keys
+    self._by_port = {} # in_port -> set of keys
+    self._ring = [] # slot -> key (or None)
+    self._holes = [] # Free slots in _ring
+    self._hand = 0
+
+  def __len__ (self):
+    return len(self._flows)
+
+  def entry_for_packet (self, packet, in_port, data):
+    """
+    Like FlowTable.entry_for_packet(), but cached
+
+    data is the packed packet.
+    """
+    key = _raw_flow_key(data, in_port)
+    if key is None:
+      self.uncacheable += 1
+      return self.table.entry_for_packet(packet, in_port)
+    flow = self._flows.get(key)
+    if flow is not None:
+      flow[2] = True
+      self.hits += 1
+      return flow[0]
+    self.misses += 1
+    match = ofp_match.from_packet(packet, in_port, spec_frags = True)
+    entry = self.table.entry_for_match(match)
+    if _match_key(match) == key:
+      # (If our raw parse disagrees with the packet library, don't cache)
+      self._insert(key, entry, match)
+    return entry
+
+  def get (self, key):
+    """
+    Returns the flow record for a _raw_flow_key(), or None
+
+    This doesn't count as a hit or miss; a caller which acts on the
+    record should count it itself.
+    """
+    flow = self._flows.get(key)
+    if flow is not None:
+      flow[2] = True
+    return flow
+
+  def _insert (self, key, entry, match):
+    if self._holes:
+      slot = self._holes.pop()
+    elif len(self._ring) < self.size:
+      slot = len(self._ring)
+      self._ring.append(None)
+    else:
+      slot = self._evict()
+    self._ring[slot] = key
+    self._flows[key] = [entry, match, False, slot, None]
+    keys = self._by_port.get(key[0])
+    if keys is None:
+      keys = self._by_port[key[0]] = set()
+    keys.add(key)
+    if entry is not None:
+      keys = self._by_entry.get(entry)
+      if keys is None:
+        keys = self._by_entry[entry] = set()
+      keys.add(key)
+
+  def _evict (self):
+    """
+    Evicts a flow and returns its (now unused) slot
+
+    Only called when there are no holes in the ring.
+    """
+    ring = self._ring
+    flows = self._flows
+    while True:
+      slot = self._hand
+      self._hand = (slot + 1) % len(ring)
+      flow = flows[ring[slot]]
+      if flow[2]:
+        flow[2] = False # Second chance
+        continue
+      self._unlink(ring[slot], flow)
+      self.evictions += 1
+      return slot
+
+  def _unlink (self, key, flow):
+    del self._flows[key]
+    self._ring[flow[3]] = None
+    keys = self._by_port[key[0]]
+    keys.discard(key)
+    if not keys: del self._by_port[key[0]]
+    entry = flow[0]
+    if entry is not None:
+      keys = self._by_entry[entry]
+      keys.discard(key)
+      if not keys: del self._by_entry[entry]
+
+  def _remove (self, key):
+    flow = self._flows[key]
+    self._unlink(key, flow)
+    self._holes.append(flow[3])
+    self.invalidations += 1
+
+  def _handle_FlowTableModification (self, event):
+    for entry in event.removed:
+      for key in list(self._by_entry.get(entry, ())):
+        self._remove(key)
+    added = event.added
+    if not added or not self._flows: return
+    candidates = []
+    scan = 0
+    for entry in added:
+      in_port = entry.match.in_port
+      if in_port is None:
+        keys = self._flows
+      else:
+        keys = self._by_port.get(in_port, ())
+      scan += len(keys)
+      if scan > self.max_scan:
+        # Cheaper to start over than to check them all
+        self.invalidations += len(self._flows)
+        self.flushes += 1
+        self._clear()
+        return
+      candidates.append((entry, list(keys)))
+
+    flows = self._flows
+    for entry,keys in candidates:
+      # New entries win ties with old ones of the same priority
+      priority = entry.effective_priority
+      match = entry.match
+      for key in keys:
+        flow = flows.get(key)
+        if flow is None: continue # Already removed
+        old = flow[0]
+        if old is not None and old.effective_priority > priority: continue
+        if match.matches_with_wildcards(flow[1],
+                                        consider_other_wildcards=False):
+          self._remove(key)
+
+  def get_stats (self):
+    return dict(size = self.size, flows = len(self), hits = self.hits,
+                misses = self.misses, uncacheable = self.uncacheable,
+                evictions = self.evictions,
+                invalidations = self.invalidations, flushes = self.flushes)
+
+
 class DpPacketOut (Event):
   """
   Event raised when a dataplane packet is sent out a port
@@ -62,15 +345,158 @@ class DpPacketOut (Event):
     self.switch = node # For backwards compatability
 
 
+class PacketBufferPool (object):
+  """
+  A fixed number of slots for packets sent to the controller
+
+  Free slots are kept on a stack, so allocating and releasing are O(1).
+  Each slot has a generation which is bumped whenever it's allocated and
+  is part of the buffer ID, so an ID for a slot which has since been
+  reused (or released) is rejected instead of getting some other packet.
+
+  If max_age is set, buffers older than that are released (the
+  controller is never going to use them) when we run out of slots or
+  when expire() is called.
+  """
+  def __init__ (self, size, max_age = None):
+    self.size = size
+    self.max_age = max_age
+    self._entries = [None] * size # slot -> (packet, in_port)
+    self._generations = [0] * size
+    self._free = range(size-1, -1, -1) # Lowest slot on top
+    self._ages = deque() # (time, slot, generation) in allocation order
+    self._max_generation = (NO_BUFFER - 1) // max(size, 1)
+
+    self.allocated = 0
+    self.released = 0
+    self.expired = 0 # Released because of max_age
+    self.stale = 0 # Lookups with IDs which weren't (any longer) valid
+    self.full = 0 # Allocations which failed
+    self.high_water = 0
+
+  def __len__ (self):
+    """
+    Number of slots in use
+    """
+    return self.size - len(self._free)
+
+  def allocate (self, packet, in_port = None, now = None):
+    """
+    Buffers packet and returns its buffer ID, or None if there's no room
+    """
+    if not self._free and self.max_age is not None:
+      self.expire(now)
+    if not self._free:
+      self.full += 1
+      return None
+    slot = self._free.pop()
+    generation = self._generations[slot] + 1
+    if generation >= self._max_generation: generation = 1
+    self._generations[slot] = generation
+    self._entries[slot] = (packet, in_port)
+    if self.max_age is not None:
+      self._ages.append((now or time.time(), slot, generation))
+      if len(self._ages) > 2 * self.size: self._compact()
+    self.allocated += 1
+    used = self.size - len(self._free)
+    if used > self.high_water: self.high_water = used
+    return generation * self.size + slot
+
+  def _slot_for (self, buffer_id):
+    if buffer_id is None or buffer_id < 0: return None
+    if self.size == 0: return None # No buffering at all
+    generation,slot = divmod(buffer_id, self.size)
+    if (generation != self._generations[slot]
+        or self._entries[slot] is None):
+      return None
+    return slot
+
+  def release (self, buffer_id):
+    """
+    Frees a buffer and returns its (packet, in_port), or None if invalid
+    """
+    slot = self._slot_for(buffer_id)
+    if slot is None:
+      self.stale += 1
+      return None
+    entry = self._entries[slot]
+    self._entries[slot] = None
+    self._free.append(slot)
+    self.released += 1
+    return entry
+
+  def expire (self, now = None):
+    """
+    Releases buffers older than max_age
+
+    Returns the number released.
+    """
+    if self.max_age is None: return 0
+    if now is None: now = time.time()
+    cutoff = now - self.max_age
+    ages = self._ages
+    count = 0
+    while ages and ages[0][0] <= cutoff:
+      _,slot,generation = ages.popleft()
+      if (self._generations[slot] == generation
+          and self._entries[slot] is not None):
+        self._entries[slot] = None
+        self._free.append(slot)
+        count += 1
+    self.expired += count
+    return count
+
+  def _compact (self):
+    """
+    Drops _ages entries for buffers which have already been released
+
+    Those stay in _ages until they're old enough to be popped, so with
+    lots of traffic they'd otherwise pile up.  Since this only happens
+    once per size allocations or so, it's still O(1) amortized.
+    """
+    g = self._generations
+    e = self._entries
+    self._ages = deque(a for a in self._ages
+                       if g[a[1]] == a[2] and e[a[1]] is not None)
+
+  def get_stats (self):
+    return dict(size = self.size, in_use = len(self),
+                high_water = self.high_water, allocated = self.allocated,
+                released = self.released, expired = self.expired,
+                stale = self.stale, full = self.full)
+
+
+def _takes_packet_data (method):
+  """
+  Whether an _output_packet_physical() accepts packet_data as a keyword
+
+  Overrides written before it was added only take (packet, port_no).
+  """
+  try:
+    spec = inspect.getargspec(method)
+  except TypeError:
+    return False
+  return 'packet_data' in spec.args or spec.keywords is not None
+
+
 class SoftwareSwitchBase (object):
+  # Number of flows in the microflow cache (0 to disable it)
+  max_microflows = 4096
+
+  # Whether _output_packet_physical() takes packet_data (None: find out)
+  _physical_takes_data = None
+
   def __init__ (self, dpid, name=None, ports=4, miss_send_len=128,
-                max_buffers=100, max_entries=0x7fFFffFF, features=None):
+                max_buffers=100, max_entries=0x7fFFffFF, features=None,
+                buffer_timeout=5):
     """
     Initialize switch
      - ports is a list of ofp_phy_ports or a number of ports
      - miss_send_len is number of bytes to send to controller on table miss
      - max_buffers is number of buffered packets to store
      - max_entries is max flows entries per table
+     - buffer_timeout is seconds after which a buffered packet may be
+       dropped to make room for another (None to keep them until used)
     """
     if name is None: name = dpid_to_str(dpid)
     self.name = name
@@ -88,6 +514,10 @@ class SoftwareSwitchBase (object):
 
     self.table = FlowTable()
     self.table.addListeners(self)
+    if self.max_microflows:
+      self._microflows = MicroflowCache(self.table, self.max_microflows)
+    else:
+      self._microflows = None
 
     self._lookup_count = 0
     self._matched_count = 0
@@ -96,12 +526,16 @@ class SoftwareSwitchBase (object):
     self._connection = None
 
     # buffer for packets during packet_in
-    self._packet_buffer = []
+    self._buffers = PacketBufferPool(max_buffers, buffer_timeout)
 
     # Map port_no -> openflow.pylibopenflow_01.ofp_phy_ports
     self.ports = {}
     self.port_stats = {}
 
+    # Port numbers for OFPP_FLOOD and OFPP_ALL (see _update_port_sets())
+    self._flood_ports = ()
+    self._all_ports = ()
+
     for port in ports:
       self.add_port(port)
 
@@ -389,6 +823,7 @@ class SoftwareSwitchBase (object):
             msg += " set to "
             msg += "true" if r else "false"
           self.log.debug(msg)
+    self._update_port_sets()
 
   def _rx_vendor (self, vendor, connection):
     # We don't support vendor extensions, so send an OFP_ERROR, per
@@ -446,6 +881,8 @@ class SoftwareSwitchBase (object):
     assert reason in ofp_port_reason_rev_map.values()
     msg = ofp_port_status(desc=port, reason=reason)
     self.send(msg)
+    if reason == OFPPR_MODIFY:
+      self._update_port_sets()
 
   def send_error (self, type, code, ofp=None, data=None, connection=None):
     """
@@ -504,14 +941,19 @@ class SoftwareSwitchBase (object):
           else:
             self.log.warn("Illegal fragment processing mode: %i", frag_mode)
 
+    if packet_data is None:
+      packet_data = packet.pack() # Expensive
     self.port_stats[in_port].rx_packets += 1
-    if packet_data is not None:
-      self.port_stats[in_port].rx_bytes += len(packet_data)
-    else:
-      self.port_stats[in_port].rx_bytes += len(packet.pack()) # Expensive
+    self.port_stats[in_port].rx_bytes += len(packet_data)
 
     self._lookup_count += 1
-    entry = self.table.entry_for_packet(packet, in_port)
+    microflows = self._microflows
+    if microflows is None:
+      entry = self.table.entry_for_packet(packet, in_port)
+    else:
+      if microflows.table is not self.table:
+        microflows.reset(self.table) # Someone swapped the table out
+      entry = microflows.entry_for_packet(packet, in_port, packet_data)
     if entry is not None:
       self._matched_count += 1
       entry.touch_packet(len(packet))
@@ -521,8 +963,6 @@ class SoftwareSwitchBase (object):
       if port.config & OFPPC_NO_PACKET_IN:
         return
       buffer_id = self._buffer_packet(packet, in_port)
-      if packet_data is None:
-        packet_data = packet.pack()
       self.send_packet_in(in_port, buffer_id, packet_data,
                           reason=OFPR_NO_MATCH, data_length=self.miss_send_len)
 
@@ -544,6 +984,7 @@ class SoftwareSwitchBase (object):
       raise RuntimeError("Can't remove nonexistent port " + str(port_no))
     self.send_port_status(port, OFPPR_DELETE)
     del self.ports[port_no]
+    self._update_port_sets()
     return port
 
   def add_port (self, port):
@@ -561,8 +1002,22 @@ class SoftwareSwitchBase (object):
       raise RuntimeError("Port %s already exists" % (port_no,))
     self.ports[port_no] = port
     self.port_stats[port.port_no] = ofp_port_stats(port_no=port.port_no)
+    self._update_port_sets()
     self.send_port_status(port, OFPPR_ADD)
 
+  def _update_port_sets (self):
+    """
+    Recomputes the ports which OFPP_FLOOD and OFPP_ALL go to
+
+    Call this when ports are added or removed or their config changes.
+    (Ports with forwarding disabled or which are down are still in
+    these; those are checked when sending so that they get logged.)
+    """
+    ports = sorted(self.ports.iteritems())
+    self._all_ports = tuple(no for no,port in ports)
+    self._flood_ports = tuple(no for no,port in ports
+                              if not port.config & OFPPC_NO_FLOOD)
+
   def _set_port_config_bit (self, port, bit, value):
     """
     Set a port config bit
@@ -611,11 +1066,12 @@ class SoftwareSwitchBase (object):
     # No change -- no log message.
     return (True, None)
 
-  def _output_packet_physical (self, packet, port_no):
+  def _output_packet_physical (self, packet, port_no, packet_data=None):
     """
     send a packet out a single physical port
 
-    This is called by the more general _output_packet().
+    This is called by the more general _output_packet().  packet_data is
+    the packed packet; when flooding, it's the same bytes for every port.
 
     Override this.
     """
@@ -633,42 +1089,14 @@ class SoftwareSwitchBase (object):
     """
     assert assert_type("packet", packet, ethernet, none_ok=False)
 
-    def real_send (port_no, allow_in_port=False):
-      if type(port_no) == ofp_phy_port:
-        port_no = port_no.port_no
-      if port_no == in_port and not allow_in_port:
-        self.log.warn("Dropping packet sent on port %i: Input port", port_no)
-        return
-      if port_no not in self.ports:
-        self.log.warn("Dropping packet sent on port %i: Invalid port", port_no)
-        return
-      if self.ports[port_no].config & OFPPC_NO_FWD:
-        self.log.warn("Dropping packet sent on port %i: Forwarding disabled",
-                      port_no)
-        return
-      if self.ports[port_no].config & OFPPC_PORT_DOWN:
-        self.log.warn("Dropping packet sent on port %i: Port down", port_no)
-        return
-      if self.ports[port_no].state & OFPPS_LINK_DOWN:
-        self.log.debug("Dropping packet sent on port %i: Link down", port_no)
-        return
-      self.port_stats[port_no].tx_packets += 1
-      self.port_stats[port_no].tx_bytes += len(packet.pack()) #FIXME: Expensive
-      self._output_packet_physical(packet, port_no)
-
     if out_port < OFPP_MAX:
-      real_send(out_port)
+      self._send_physical(packet, [out_port], in_port)
     elif out_port == OFPP_IN_PORT:
-      real_send(in_port, allow_in_port=True)
+      self._send_physical(packet, [in_port], None)
     elif out_port == OFPP_FLOOD:
-      for no,port in self.ports.iteritems():
-        if no == in_port: continue
-        if port.config & OFPPC_NO_FLOOD: continue
-        real_send(port)
+      self._send_physical(packet, self._flood_ports, in_port, True)
     elif out_port == OFPP_ALL:
-      for no,port in self.ports.iteritems():
-        if no == in_port: continue
-        real_send(port)
+      self._send_physical(packet, self._all_ports, in_port, True)
     elif out_port == OFPP_CONTROLLER:
       buffer_id = self._buffer_packet(packet, in_port)
       # Should we honor OFPPC_NO_PACKET_IN here?
@@ -682,24 +1110,59 @@ class SoftwareSwitchBase (object):
     else:
       self.log.warn("Unsupported virtual output port: %d", out_port)
 
+  def _send_physical (self, packet, port_nos, in_port, skip_in_port=False):
+    """
+    Sends a packet out some physical ports
+
+    The packet is only packed once no matter how many ports it goes out.
+    If skip_in_port is set, in_port is quietly left out (as for flooding);
+    otherwise sending to it is an error.
+    """
+    ports = self.ports
+    port_stats = self.port_stats
+    data = None
+    takes_data = self._physical_takes_data
+    if takes_data is None:
+      takes_data = _takes_packet_data(self._output_packet_physical)
+      self._physical_takes_data = takes_data
+    for port_no in port_nos:
+      if port_no == in_port:
+        if not skip_in_port:
+          self.log.warn("Dropping packet sent on port %i: Input port",
+                        port_no)
+        continue
+      port = ports.get(port_no)
+      if port is None:
+        self.log.warn("Dropping packet sent on port %i: Invalid port",
+                      port_no)
+        continue
+      if port.config & OFPPC_NO_FWD:
+        self.log.warn("Dropping packet sent on port %i: Forwarding disabled",
+                      port_no)
+        continue
+      if port.config & OFPPC_PORT_DOWN:
+        self.log.warn("Dropping packet sent on port %i: Port down", port_no)
+        continue
+      if port.state & OFPPS_LINK_DOWN:
+        self.log.debug("Dropping packet sent on port %i: Link down", port_no)
+        continue
+      if data is None:
+        data = packet.pack()
+      stats = port_stats[port_no]
+      stats.tx_packets += 1
+      stats.tx_bytes += len(data)
+      if takes_data:
+        self._output_packet_physical(packet, port_no, packet_data=data)
+      else:
+        self._output_packet_physical(packet, port_no)
+
   def _buffer_packet (self, packet, in_port=None):
     """
     Buffer packet and return buffer ID
 
     If no buffer is available, return None.
     """
-    # Do we have an empty slot?
-    for (i, value) in enumerate(self._packet_buffer):
-      if value is None:
-        # Yes -- use it
-        self._packet_buffer[i] = (packet, in_port)
-        return i + 1
-    # No -- create a new slow
-    if len(self._packet_buffer) >= self.max_buffers:
-      # No buffers available!
-      return None
-    self._packet_buffer.append( (packet, in_port) )
-    return len(self._packet_buffer)
+    return self._buffers.allocate(packet, in_port)
 
   def _process_actions_for_packet_from_buffer (self, actions, buffer_id,
                                                ofp=None):
@@ -709,16 +1172,12 @@ class SoftwareSwitchBase (object):
     ofp is the message which triggered this processing, if any (used for error
     generation)
     """
-    buffer_id = buffer_id - 1
-    if (buffer_id >= len(self._packet_buffer)) or (buffer_id < 0):
-      self.log.warn("Invalid output buffer id: %d", buffer_id + 1)
+    entry = self._buffers.release(buffer_id)
+    if entry is None:
+      self.log.warn("Invalid or expired buffer id: %d", buffer_id)
       return
-    if self._packet_buffer[buffer_id] is None:
-      self.log.warn("Buffer %d has already been flushed", buffer_id + 1)
-      return
-    (packet, in_port) = self._packet_buffer[buffer_id]
+    (packet, in_port) = entry
     self._process_actions_for_packet(actions, packet, in_port, ofp)
-    self._packet_buffer[buffer_id] = None
 
   def _process_actions_for_packet (self, actions, packet, in_port, ofp=None):
     """
@@ -958,19 +1417,31 @@ class SoftwareSwitchBase (object):
 
 
   def _stats_desc (self, ofp, connection):
+    # There's no better place for buffer and microflow cache stats in
+    # OpenFlow 1.0, so they go in the datapath description
+    b = self._buffers
+    dp_desc = ("%s (buffers: %s/%s in use, %s max, %s expired, %s stale, "
+               "%s full)" % (type(self).__name__, len(b), b.size,
+                             b.high_water, b.expired, b.stale, b.full))
+    mf = self._microflows
+    if mf is not None:
+      dp_desc += (" (microflows: %s/%s in use, %s hits, %s misses, "
+                  "%s evicted, %s invalidated)"
+                  % (len(mf), mf.size, mf.hits, mf.misses, mf.evictions,
+                     mf.invalidations))
     try:
       from pox.core import core
       return ofp_desc_stats(mfr_desc="POX",
                             hw_desc=core._get_platform_info(),
                             sw_desc=core.version_string,
                             serial_num=str(self.dpid),
-                            dp_desc=type(self).__name__)
+                            dp_desc=dp_desc)
     except:
       return ofp_desc_stats(mfr_desc="POX",
                             hw_desc="Unknown",
                             sw_desc="Unknown",
                             serial_num=str(self.dpid),
-                            dp_desc=type(self).__name__)
+                            dp_desc=dp_desc)
 
 
   def _stats_flow (self, ofp, connection):
@@ -1030,7 +1501,7 @@ class SoftwareSwitchBase (object):
 class SoftwareSwitch (SoftwareSwitchBase, EventMixin):
   _eventMixin_events = set([DpPacketOut])
 
-  def _output_packet_physical (self, packet, port_no):
+  def _output_packet_physical (self, packet, port_no, packet_data=None):
     """
     send a packet out a single physical port
 
@@ -1053,9 +1524,11 @@ class ExpireMixin (object):
     if not expire_period:
       # Disable
       return
-    self._expire_timer = Timer(expire_period,
-                               self.table.remove_expired_entries,
-                               recurring=True)
+    self._expire_timer = Timer(expire_period, self._expire, recurring=True)
+
+  def _expire (self):
+    self.table.remove_expired_entries()
+    self._buffers.expire()
 
 
 class OFConnection (object):
@@ -1118,58 +1591,78 @@ class OFConnection (object):
 
   def read (self, io_worker):
     #FIXME: Do we need to pass io_worker here?
-    while True:
-      message = io_worker.peek()
-      if len(message) < 4:
-        break
-
-      # Parse head of OpenFlow message by hand
-      ofp_version = ord(message[0])
-      ofp_type = ord(message[1])
-
-      if ofp_version != OFP_VERSION:
-        info = ofp_version
-        r = self._error_handler(self.ERR_BAD_VERSION, info)
-        if r is False: break
-        continue
-
-      message_length = ord(message[2]) << 8 | ord(message[3])
-      if message_length > len(message):
-        break
+    # We look at everything buffered once (as a memoryview, so it's not
+    # copied) and walk through the messages in it by offset, only consuming
+    # at the end (or before calling the error handler, which expects the
+    # problem message at the front).  The unpackers work on memoryviews
+    # and copy out just the variable-length fields (e.g., packet data).
+    message = io_worker.peek_view()
+    offset = 0
+    try:
+      while True:
+        if len(message) - offset < 4:
+          break
+
+        # Parse head of OpenFlow message by hand
+        ofp_version = ord(message[offset])
+        ofp_type = ord(message[offset+1])
+
+        if ofp_version != OFP_VERSION:
+          io_worker.consume_receive_buf(offset)
+          offset = 0
+          info = ofp_version
+          r = self._error_handler(self.ERR_BAD_VERSION, info)
+          if r is False: break
+          message = io_worker.peek_view()
+          continue
 
-      if ofp_type >= 0 and ofp_type < len(self.unpackers):
-        unpacker = self.unpackers[ofp_type]
-      else:
-        unpacker = None
-      if unpacker is None:
-        info = (ofp_type, message_length)
-        r = self._error_handler(self.ERR_NO_UNPACKER, info)
-        if r is False: break
-        io_worker.consume_receive_buf(message_length)
-        continue
+        message_length = ord(message[offset+2]) << 8 | ord(message[offset+3])
+        if message_length > len(message) - offset:
+          break
+
+        if ofp_type >= 0 and ofp_type < len(self.unpackers):
+          unpacker = self.unpackers[ofp_type]
+        else:
+          unpacker = None
+        if unpacker is None:
+          io_worker.consume_receive_buf(offset)
+          offset = 0
+          info = (ofp_type, message_length)
+          r = self._error_handler(self.ERR_NO_UNPACKER, info)
+          if r is False: break
+          io_worker.consume_receive_buf(message_length)
+          message = io_worker.peek_view()
+          continue
 
-      new_offset, msg_obj = self.unpackers[ofp_type](message, 0)
-      if new_offset != message_length:
-        info = (msg_obj, message_length, new_offset)
-        r = self._error_handler(self.ERR_BAD_LENGTH, info)
-        if r is False: break
-        # Assume sender was right and we should skip what it told us to.
-        io_worker.consume_receive_buf(message_length)
-        continue
+        new_offset, msg_obj = unpacker(message, offset)
+        if new_offset - offset != message_length:
+          info = (msg_obj, message_length, new_offset - offset)
+          io_worker.consume_receive_buf(offset)
+          offset = 0
+          r = self._error_handler(self.ERR_BAD_LENGTH, info)
+          if r is False: break
+          # Assume sender was right and we should skip what it told us to.
+          io_worker.consume_receive_buf(message_length)
+          message = io_worker.peek_view()
+          continue
 
-      io_worker.consume_receive_buf(message_length)
-      self.starting = False
+        start = offset
+        offset += message_length
+        self.starting = False
 
-      if self.on_message_received is None:
-        raise RuntimeError("on_message_receieved hasn't been set yet!")
+        if self.on_message_received is None:
+          raise RuntimeError("on_message_receieved hasn't been set yet!")
 
-      try:
-        self.on_message_received(self, msg_obj)
-      except Exception as e:
-        info = (e, message[:message_length], msg_obj)
-        r = self._error_handler(self.ERR_EXCEPTION, info)
-        if r is False: break
-        continue
+        try:
+          self.on_message_received(self, msg_obj)
+        except Exception as e:
+          info = (e, message[start:offset].tobytes(), msg_obj)
+          r = self._error_handler(self.ERR_EXCEPTION, info)
+          if r is False: break
+          continue
+    finally:
+      if offset:
+        io_worker.consume_receive_buf(offset)
 
     return True
 
@@ -13,22 +13,53 @@
 # <https://www.gnu.org/licenses/lgpl-3.0.en.html>.
 
 from pox.core import core
-from pox.lib.util import dpidToStr
+from pox.lib.util import dpidToStr, str_to_bool
+from pox.lib.recoco import Timer
+from pox.lib.rate_detector import RateDetector
 import pox.log.color
+from pox.log.hotpath import HotLogger
 import pox.lib.packet.ethernet as eth
 import pox.openflow.libopenflow_01 as of
 import time
 
+# (dpid, in_port) -> out_port for the traffic we let through
+ROUTES = {
+    # Forth (Verdaguer -> Rodoreda) and back
+    (1, 12): 3, (1, 3): 12,
+    (3, 1): 2, (3, 2): 1,
+    (2, 3): 4, (2, 4): 3,
+    (4, 2): 5, (4, 5): 2,
+    (5, 4): 12, (5, 12): 4,
+}
+
 class FGREFirewall(object):
     """
     Toy example of a super simple OpenFlow-based firewall that
     identifies frequency of traffic from a machine and blocks it
     if it exceeds a given threshold.
+
+    Each (dpid, in_port) -- or (dpid, in_port, source MAC) if per_mac
+    is set -- gets a token bucket of rate packets/sec and burst packets
+    (see pox.lib.rate_detector).  Without an explicit rate, threshold
+    gives the old behaviour: traffic is harmful when a packet arrives
+    less than 4 * threshold seconds after the previous one (rate
+    1/(4 * threshold), with a harmful packet emptying the bucket).
+
+    DROP rules are collected and sent once the current batch of
+    PacketIns has been handled, one write per switch.  If aggregate or
+    more sources on the same port are blocked in a batch, a single rule
+    for the whole port is installed instead.  A rule is not reinstalled
+    for reinstall_time seconds, however many PacketIns arrive before the
+    switch has it.
     """
 
-    def __init__(self, vlan, threshold, *args, **kwargs):
+    def __init__(self, vlan, threshold = None, rate = None, burst = 1,
+                 per_mac = False, max_keys = 4096, aggregate = 4,
+                 *args, **kwargs):
         ## Define logger (defaults to current path)
         self.log = core.getLogger()
+        # Per-packet messages are rate limited so a flood can't swamp the log
+        self.packet_log = HotLogger(self.log, rate=20, burst=100)
         # Disable logger for 'packet' (TLV)
         logger = core.getLogger("packet")
         logger.propagate = False
@@ -36,18 +67,49 @@ class FGREFirewall(object):
         core.openflow.addListeners(self)
         self.vlan = int(vlan)
         ## Firewall-related
-        self.traffic_frequency = {}
-        # Threshold time (in seconds) to determine harmful network conditions (e.g.: 0.2)
-        self.threshold = float(threshold)
+        drain = rate is None
+        if rate is None:
+            if threshold is None:
+                raise RuntimeError("Need a threshold or a rate")
+            # Threshold time (in seconds) to determine harmful network conditions (e.g.: 0.2)
+            # Increasing margin for the detection of potential malicious behaviour
+            rate = 1.0 / (4 * float(threshold))
+        self.threshold = threshold
+        self.per_mac = per_mac
+        self.aggregate = aggregate
+        self.detector = RateDetector(rate, burst, max_keys, drain)
         # Time (in seconds) to maintain the DROP rules for the network traffic deemed harmful
         self.idle_drop_time = 30
         self.hard_drop_time = 30
+        # Time (in seconds) before a DROP rule may be sent again
+        self.reinstall_time = 1
+        # (dpid, in_port, src or None) -> when its DROP rule may be resent
+        self._blocked = {}
+        # dpid -> (connection, set of (in_port, src or None)) to block
+        self._pending = {}
+        self._flush_scheduled = False
+        # dpid -> datapath number (see __dpid_to_int)
+        self._dpid_numbers = {}
+        # Forget quiet sources and old DROP rules now and then
+        self._sweep_timer = Timer(max(5, self.detector.refill_time),
+                                  self.__sweep, recurring = True)
         ## Constants section
         # Define value of protocol number assigned to IP and LLDP traffic
         self.ip_proto = 2048 #0x0800
         self.lldp_proto = 35020 #0x88cc
         self.max_priority = 65535
-        self.log.info("Toy firewall for FGRE 2015 (seconds threshold=%s, vlan=%s)." % (self.threshold, self.vlan))
+        # Rules only differ in VLAN and ports, so the flowmods are packed
+        # once and those are patched in for each rule.
+        # No actions => DROP rule, with the highest priority
+        self.drop_template = of.ofp_flow_mod_template(of.ofp_flow_mod(
+            idle_timeout = self.idle_drop_time,
+            hard_timeout = self.hard_drop_time,
+            priority = self.max_priority))
+        self.forward_template = of.ofp_flow_mod_template(of.ofp_flow_mod(
+            idle_timeout = self.idle_drop_time,
+            hard_timeout = self.hard_drop_time, priority = 40,
+            action = of.ofp_action_output(port = of.OFPP_NONE)))
+        self.log.info("Toy firewall for FGRE 2015 (rate=%s/s, burst=%s, per_mac=%s, vlan=%s)." % (self.detector.rate, self.detector.burst, self.per_mac, self.vlan))
     
     def __dpid_to_int(self, dpid):
         """
@@ -59,93 +121,98 @@ class FGREFirewall(object):
           input   => dpid = 00-00-00-00-00-01|16
           output  => dpid = 1
         """
-        if isinstance(dpid, int):
+        number = self._dpid_numbers.get(dpid)
+        if number is not None:
+            return number
+        key = dpid
+        if isinstance(dpid, (int, long)):
             dpid = dpidToStr(dpid)
         # (Perform operations to convert to integer)
         dpid = dpid.split("|", 1)[0]
         dpid = dpid.replace("-", "")
         dpid = int(dpid)
+        self._dpid_numbers[key] = dpid
         return dpid
     
-    def __identify_harmful_traffic(self, dpid, in_port):
-        """
-        Identifies network conditions. A (dpid, in_port)
-        may be marked as a possible source of harmful
-        traffic and consequently blocked for a while.
-        """
-        harmful_traffic = False
-        current_time = time.time()
-        try:
-            last_time = self.traffic_frequency.get(dpid).get(in_port).get("last_time")
-            # Increasing margin for the detection of potential malicious behaviour
-            if (current_time - last_time) <= 4 * self.threshold:
-                harmful_traffic = True
-        except Exception as e:
-            # When a PacketIn condition appears for the 1st time, create its structure
-            self.traffic_frequency[dpid] = {in_port: {}}
-        return harmful_traffic
-    
-    def __register_frequency(self, dpid, in_port):
-        """
-        Keeps up-to-date the 'traffic_frequency' structure
-        with the number and last time for a received packet
-        from a given dpid and input port
-        """
-        # If structure not already initialised, then add keys
-        try:
-            self.traffic_frequency.get(dpid).get(in_port)
-        except:
-            self.traffic_frequency[dpid] = {in_port: {}}
-        # Attempt to recover count of packets, if it was already present
-        try:
-            count = self.traffic_frequency.get(dpid).get(in_port).get("count")
-            self.traffic_frequency[dpid][in_port].update({"last_time": time.time(), "count": count+1})
-        except:
-            self.traffic_frequency[dpid][in_port].update({"last_time": time.time(), "count": 1})
-    
-    def __define_rules(self, event):
+    def __define_rules(self, event, src):
         # Retrieve dpid (switch ID) and in_port from PacketIn event message
         dpid = self.__dpid_to_int(event.dpid)
         in_port = event.port
         
         # Retrieve port for packet on rule failure
-        self.log.info("Receiving packet from dpid=%s, in_port=%s" % (dpid, in_port))
+        self.packet_log.debug("Receiving packet from dpid=%s, in_port=%s", dpid, in_port)
         
-        is_harmful = self.__identify_harmful_traffic(dpid, in_port)
-        self.__register_frequency(dpid, in_port)
+        if not self.per_mac:
+            src = None
         
         # If traffic is deemed harmful, insert DROP rule
         # Otherwise, send a packet-out to proceed
-        if is_harmful:
-            self.__insert_rule_2_ways(event, self.vlan, in_port)
+        now = time.time()
+        if self.detector.hit((dpid, in_port, src), now):
+            self.__block(event, dpid, in_port, src, now)
         else:
-            if dpid == 1:
-                # Forth (Verdaguer -> Rodoreda)
-                if in_port == 12:
-                    self.__send_packetout(event, self.vlan, in_port, 3)
-                # Back (Rodoreda -> Verdaguer)
-                if in_port == 3:
-                    self.__send_packetout(event, self.vlan, in_port, 12)
-            elif dpid == 3:
-                if in_port == 1:
-                    self.__send_packetout(event, self.vlan, in_port, 2)
-                if in_port == 2:
-                    self.__send_packetout(event, self.vlan, in_port, 1)
-            elif dpid == 2:
-                if in_port == 3:
-                    self.__send_packetout(event, self.vlan, in_port, 4)
-                if in_port == 4:
-                    self.__send_packetout(event, self.vlan, in_port, 3)
-            elif dpid == 4:
-                if in_port == 2:
-                    self.__send_packetout(event, self.vlan, in_port, 5)
-                if in_port == 5:
-                    self.__send_packetout(event, self.vlan, in_port, 2)
-            elif dpid == 5:
-                if in_port == 4:
-                    self.__send_packetout(event, self.vlan, in_port, 12)
-                if in_port == 12:
-                    self.__send_packetout(event, self.vlan, in_port, 4)
+            out_port = ROUTES.get((dpid, in_port))
+            if out_port is not None:
+                self.__send_packetout(event, self.vlan, in_port, out_port)
+    
+    def __block(self, event, dpid, in_port, src, now):
+        """
+        Queues a DROP rule for traffic from in_port (and src, if given),
+        unless one was sent recently.
+        """
+        blocked = self._blocked
+        if blocked.get((dpid, in_port, src), 0) > now:
+            return
+        if src is not None and blocked.get((dpid, in_port, None), 0) > now:
+            return
+        pending = self._pending.get(dpid)
+        if pending is None:
+            pending = (event.connection, set())
+            self._pending[dpid] = pending
+        pending[1].add((in_port, src))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            core.callLater(self.flush)
+    
+    def flush(self):
+        """
+        Sends the queued DROP rules, one write per switch.
+        """
+        self._flush_scheduled = False
+        pending = self._pending
+        self._pending = {}
+        until = time.time() + self.reinstall_time
+        for dpid, (connection, entries) in pending.iteritems():
+            by_port = {}
+            for in_port, src in entries:
+                by_port.setdefault(in_port, set()).add(src)
+            msgs = []
+            for in_port, srcs in by_port.iteritems():
+                if None in srcs or len(srcs) >= self.aggregate:
+                    # Aggregate into a single rule for the whole port
+                    msgs.append(self.__define_match(None, self.vlan, in_port))
+                    self._blocked[(dpid, in_port, None)] = until
+                    srcs = ["*"]
+                else:
+                    for src in srcs:
+                        msgs.append(self.drop_template.pack(
+                            dl_vlan = self.vlan, in_port = in_port,
+                            dl_src = src))
+                        self._blocked[(dpid, in_port, src)] = until
+                self.packet_log.info("Installing DROP rule [dpid=%s]: vlan=%s, in=%s, src=%s",
+                    dpid, self.vlan, in_port, ",".join(str(s) for s in srcs))
+            # Send flowmods
+            connection.send(b"".join(msgs))
+    
+    def __sweep(self):
+        """
+        Forgets quiet sources and DROP rules which may be resent.
+        """
+        now = time.time()
+        self.detector.expire(now)
+        for key, until in self._blocked.items():
+            if until <= now:
+                del self._blocked[key]
     
     def __define_packetout(self, buffer_id, raw_data, vlan, in_port, out_port):
         #Sends a packet out of the specified switch port.
@@ -162,58 +229,14 @@ class FGREFirewall(object):
     def __define_match(self, event, vlan, in_port, out_port=None):
         """
         Given a VLAN, input port and output port,
-        generate a match and actions structure.
+        generate the packed flowmod (match and actions).
         """
-        dpid = self.__dpid_to_int(event.dpid)
-        msg = of.ofp_flow_mod()
         # No out_port => no action => equivalent to DROP rule
-        if out_port is not None:
-            # Action(s) to be performed on match
-            msg.actions.append(of.ofp_action_output(port = out_port))
-        # Match conditions (headers)
-        msg.match.dl_vlan = vlan
-        msg.match.in_port = in_port
-        # Use idle and/or hard timeouts to help cleaning the table
-        msg.idle_timeout = self.idle_drop_time
-        msg.hard_timeout = self.hard_drop_time
-        # Define priority of rule: no actions -> highest priority
-        if len(msg.actions) == 0:
-            msg.priority = self.max_priority
-        else:
-            msg.priority = 40
-        return msg
-
-    def __insert_rule(self, event, vlan, in_port, out_port=None):
-        """
-        Given an event, dpid, and a match+action structures, send 
-        them to the switch in order to set up the flow entry.
-        """
-        dpid = self.__dpid_to_int(event.dpid)
-        msg = self.__define_match(event, vlan, in_port, out_port)
-        # Send flowmod
-        event.connection.send(msg)
         if out_port is None:
-            self.log.info("Installing DROP rule [dpid=%s]: vlan=%s, in=%s" % 
-                (dpid, msg.match.dl_vlan, msg.match.in_port))
-        else:
-            self.log.info("Installing DROP rule [dpid=%s]: vlan=%s, in=%s <-> out=%s" % 
-                (dpid, msg.match.dl_vlan, msg.match.in_port, msg.match.out_port))
-    
-    def __insert_rule_2_ways(self, event, vlan, in_port, out_port=None):
-        """
-        Invokes twice the '__insert_rule' method, 
-        swapping input and output ports.
-        Useful to allow faster communication from
-        source to destination.
-        """
-        if out_port is None:
-            self.__insert_rule(event, vlan, in_port)
-        else:
-            # Forth
-            self.__insert_rule(event, vlan, in_port, out_port)
-            # Back
-            self.__insert_rule(event, vlan, out_port, in_port)
-    
+            return self.drop_template.pack(dl_vlan = vlan, in_port = in_port)
+        return self.forward_template.pack(dl_vlan = vlan, in_port = in_port,
+                                          out_port = out_port)
+
     def __send_packetout(self, event, vlan, in_port, out_port):
         """
         Given an event, dpid, and a match+action structures, send 
@@ -223,8 +246,8 @@ class FGREFirewall(object):
         msg = self.__define_packetout(event.ofp.buffer_id, event.ofp.data, vlan, event.ofp.in_port, out_port)
         # Send packet-out
         event.connection.send(msg)
-        self.log.debug("Sending packet-out [dpid=%s]: vlan=%s, in=%s <-> out=%s" %
-            (dpid, vlan, in_port, out_port))
+        self.packet_log.debug("Sending packet-out [dpid=%s]: vlan=%s, in=%s <-> out=%s",
+            dpid, vlan, in_port, out_port)
     
     def _handle_PacketIn(self, event):
         """
@@ -248,16 +271,24 @@ class FGREFirewall(object):
         # Only pay attention to our tagged traffic
         if packet.next.id != self.vlan:
             return
-        self.__define_rules(event)
+        self.__define_rules(event, packet.src)
 
-def launch(vlan, threshold):
+def launch(vlan, threshold = None, rate = None, burst = 1, per_mac = False,
+           max_keys = 4096, aggregate = 4):
     """
     POX typical function to register listeners on events.
     Arguments:
         Threshold: seconds allowed during output traffic from a machine.
+        Rate: packets/sec allowed instead (overrides threshold).
+        Burst: packets allowed in a row above the rate (default 1).
+        Per_mac: track (and block) each source MAC on a port separately.
+        Max_keys: most sources to track at once.
+        Aggregate: sources on one port to block before blocking the port.
     """
     # Launch log colour app
     pox.log.color.launch()
     pox.log.launch(format="[@@@bold@@@level%(name)-22s@@@reset] " +
                         "@@@bold%(message)s@@@normal")
-    core.registerNew(FGREFirewall, vlan, threshold)
+    core.registerNew(FGREFirewall, vlan, threshold,
+                     None if rate is None else float(rate), float(burst),
+                     str_to_bool(per_mac), int(max_keys), int(aggregate))
@@ -16,6 +16,7 @@ from pox.core import core
 from pox.lib.packet import lldp
 from pox.lib.util import dpidToStr
 import pox.log.color
+from pox.log.hotpath import HotLogger
 import pox.lib.packet.ethernet as eth
 import pox.openflow.libopenflow_01 as of
 
@@ -30,6 +31,8 @@ class L2FGREPing(object):
     def __init__(self, vlan, reactive, *args, **kwargs):
         ## Define logger (defaults to current path)
         self.log = core.getLogger()
+        # Per-packet messages are rate limited so a flood can't swamp the log
+        self.packet_log = HotLogger(self.log, rate=20, burst=100)
         # Disable logger for 'packet' (TLV)
         logger = core.getLogger("packet")
         logger.propagate = False
@@ -37,6 +40,8 @@ class L2FGREPing(object):
 #        core.openflow.addListeners(self)
         self.reactive = reactive
         self.vlan = int(vlan)
+        # Packed flowmods waiting to be sent (only used in proactive mode)
+        self._pending = None
         ## Registers a method based upon the 'reactive' param
         if self.reactive:
             self.ctrl_mode = "reactive"
@@ -49,6 +54,13 @@ class L2FGREPing(object):
         # Define value of protocol number assigned to IP and LLDP traffic
         self.ip_proto = 2048 #0x0800
         self.lldp_proto = 35020 #0x88cc
+        # Rules only differ in VLAN and ports, so the flowmod is packed
+        # once and those are patched in for each rule.
+        # Use idle and/or hard timeouts to help cleaning the table
+        # Hard-timeout should be larger on ConnectionUp...
+        self.rule_template = of.ofp_flow_mod_template(of.ofp_flow_mod(
+            idle_timeout = 10, hard_timeout = 120, priority = 40,
+            action = of.ofp_action_output(port = of.OFPP_NONE)))
     
     def __dpid_to_int(self, dpid):
         """
@@ -74,9 +86,9 @@ class L2FGREPing(object):
         # Retrieve port for packet on rule failure
         if handler_type == "PacketIn":
             in_port = event.port
-            self.log.debug("Receiving packet from dpid=%s, in_port=%s" % (dpid, in_port))
+            self.packet_log.debug("Receiving packet from dpid=%s, in_port=%s", dpid, in_port)
         else:
-            self.log.debug("Detecting dpid=%s" % dpid)
+            self.log.debug("Detecting dpid=%s", dpid)
 
         if dpid == 1:
           if handler_type == "PacketIn":
@@ -124,26 +136,11 @@ class L2FGREPing(object):
     def __define_match(self, event, vlan, in_port, out_port):
         """
         Given a VLAN, input port and output port,
-        generate a match and actions structure.
+        generate the packed flowmod (match and actions).
         """
-        dpid = self.__dpid_to_int(event.dpid)
-        # Note: only for reactive controller
-        if out_port is None:
-          out_port = event.port
-        msg = of.ofp_flow_mod()
-        # Match conditions (headers)
-        msg.match.dl_vlan = vlan
-        msg.match.in_port = in_port
-        msg.match.out_port = out_port
-        # Use idle and/or hard timeouts to help cleaning the table
-        # Hard-timeout should be larger on ConnectionUp...
-        msg.idle_timeout = 10
-        msg.hard_timeout = 120
-        # Define priority of rule
-        msg.priority = 40
-        # Action(s) to be performed on match
-        msg.actions.append(of.ofp_action_output(port = out_port))
-        return msg
+        # Match conditions (headers) and output port of the action
+        return self.rule_template.pack(dl_vlan = vlan, in_port = in_port,
+                                       out_port = out_port)
     
     def __insert_rule(self, event, vlan, in_port, out_port):
         """
@@ -151,11 +148,17 @@ class L2FGREPing(object):
         them to the switch in order to set up the flow entry.
         """
         dpid = self.__dpid_to_int(event.dpid)
+        # Note: only for reactive controller
+        if out_port is None:
+          out_port = event.port
         msg = self.__define_match(event, vlan, in_port, out_port)
-        # Send flowmod
-        event.connection.send(msg)
-        self.log.debug("Installing rule [dpid=%s]: vlan=%s, in=%s <-> out=%s" % 
-            (dpid, msg.match.dl_vlan, msg.match.in_port, msg.match.out_port))
+        # Send flowmod (batched up when rules are set up proactively)
+        if self._pending is not None:
+            self._pending.append(msg)
+        else:
+            event.connection.send(msg)
+        self.packet_log.debug("Installing rule [dpid=%s]: vlan=%s, in=%s <-> out=%s",
+            dpid, vlan, in_port, out_port)
     
     def __insert_rule_2_ways(self, event, vlan, in_port, out_port):
         """
@@ -199,7 +202,14 @@ class L2FGREPing(object):
         switches, this sets up the rules to be used later on.
         """
         packet = event.connection
-        self.__define_rules("ConnectionUp", event)
+        # Pack every rule for this switch first and send them all at once
+        self._pending = []
+        try:
+            self.__define_rules("ConnectionUp", event)
+            if self._pending:
+                core.openflow.sendToDPID(event.dpid, b"".join(self._pending))
+        finally:
+            self._pending = None
 
 def launch(vlan, proactive = False):
     """
@@ -125,7 +125,7 @@ def _handle_PacketIn (event):
     msg.actions.append(of.ofp_action_output(port = dst_port))
     event.connection.send(msg)
 
-    log.debug("Installing %s <-> %s" % (packet.src, packet.dst))
+    log.debug("Installing %s <-> %s", packet.src, packet.dst)
 
 
 def launch ():
@@ -24,9 +24,16 @@ from pox.core import core
 import pox.openflow.libopenflow_01 as of
 from pox.lib.util import dpid_to_str
 from pox.lib.util import str_to_bool
+from pox.log.hotpath import HotLogger
 import time
 
 log = core.getLogger()
+_hot_log = HotLogger(log, rate = 10, burst = 50) # For per-packet warnings
+
+# Packed flow_mod which LearningSwitch patches for each rule it installs
+_install_template = of.ofp_flow_mod_template(of.ofp_flow_mod(
+    idle_timeout = 10, hard_timeout = 30,
+    action = of.ofp_action_output(port = of.OFPP_NONE)))
 
 # We don't want to flood immediately when a switch connects.
 # Can be overriden on commandline.
@@ -158,20 +165,18 @@ class LearningSwitch (object):
         port = self.macToPort[packet.dst]
         if port == event.port: # 5
           # 5a
-          log.warning("Same port for packet from %s -> %s on %s.%s.  Drop."
-              % (packet.src, packet.dst, dpid_to_str(event.dpid), port))
+          _hot_log.warning("Same port for packet from %s -> %s on %s.%s.  "
+                           "Drop.", packet.src, packet.dst,
+                           dpid_to_str(event.dpid), port)
           drop(10)
           return
         # 6
-        log.debug("installing flow for %s.%i -> %s.%i" %
-                  (packet.src, event.port, packet.dst, port))
-        msg = of.ofp_flow_mod()
-        msg.match = of.ofp_match.from_packet(packet, event.port)
-        msg.idle_timeout = 10
-        msg.hard_timeout = 30
-        msg.actions.append(of.ofp_action_output(port = port))
-        msg.data = event.ofp # 6a
-        self.connection.send(msg)
+        log.debug("installing flow for %s.%i -> %s.%i",
+                  packet.src, event.port, packet.dst, port)
+        match = of.ofp_match.from_packet(packet, event.port)
+        self.connection.send(_install_template.pack(match = match,
+                                                    out_port = port,
+                                                    data = event.ofp)) # 6a
 
 
 class l2_learning (object):
@@ -33,10 +33,12 @@ from pox.lib.revent import *
 from pox.lib.recoco import Timer
 from collections import defaultdict
 from pox.openflow.discovery import Discovery
-from pox.lib.util import dpid_to_str
+from pox.lib.util import dpid_to_str, str_to_bool
+from pox.log.hotpath import HotLogger
 import time
 
 log = core.getLogger()
+_hot_log = HotLogger(log, rate = 10, burst = 50) # For per-packet warnings
 
 # Adjacency map.  [sw1][sw2] -> port from sw1 to sw2
 adjacency = defaultdict(lambda:defaultdict(lambda:None))
@@ -63,44 +65,114 @@ FLOW_HARD_TIMEOUT = 30
 # How long is allowable to set up a path?
 PATH_SETUP_TIME = 4
 
+# Calculate paths in another process instead of another thread?
+_paths_in_process = False
 
-def _calc_paths ():
+# Packed flow_mod which Switch._install() patches for each rule
+_install_template = of.ofp_flow_mod_template(of.ofp_flow_mod(
+    idle_timeout = FLOW_IDLE_TIMEOUT, hard_timeout = FLOW_HARD_TIMEOUT,
+    action = of.ofp_action_output(port = of.OFPP_NONE)))
+
+
+def _compute_paths (nodes, adj):
   """
   Essentially Floyd-Warshall algorithm
+
+  adj is [n1][n2] -> port from n1 to n2.  Returns [n1][n2] -> (distance,
+  intermediate) for every pair of nodes with a path between them.  This
+  doesn't touch any global state, so it can run in the background.
+  """
+  paths = {}
+  for k in nodes:
+    row = paths[k] = {k:(0,None)} # distance, intermediate
+    for j,port in adj.get(k, {}).iteritems():
+      if port is None or j == k: continue
+      row[j] = (1,None)
+
+  for k in nodes:
+    row_k = paths[k]
+    for i in nodes:
+      row_i = paths[i]
+      ik = row_i.get(k)
+      if ik is None: continue
+      ik_dist = ik[0]
+      for j,kj in row_k.iteritems():
+        # i -> k -> j exists
+        ikj_dist = ik_dist + kj[0]
+        ij = row_i.get(j)
+        if ij is None or ikj_dist < ij[0]:
+          # i -> k -> j is better than existing
+          row_i[j] = (ikj_dist, k)
+  return paths
+
+
+def _adjacency_snapshot ():
   """
+  Returns a copy of adjacency keyed by DPID (safe to hand to another thread)
+  """
+  adj = {}
+  for sw1,ports in adjacency.iteritems():
+    adj[sw1.dpid] = dict((sw2.dpid,port) for sw2,port in ports.iteritems()
+                         if port is not None)
+  return adj
 
-  def dump ():
-    for i in sws:
-      for j in sws:
-        a = path_map[i][j][0]
-        #a = adjacency[i][j]
-        if a is None: a = "*"
-        print a,
-      print
 
-  sws = switches.values()
+def _set_paths (paths):
+  """
+  Replaces path_map with the result of _compute_paths() over DPIDs
+  """
   path_map.clear()
-  for k in sws:
-    for j,port in adjacency[k].iteritems():
-      if port is None: continue
-      path_map[k][j] = (1,None)
-    path_map[k][k] = (0,None) # distance, intermediate
+  for i,row in paths.iteritems():
+    sw_i = switches.get(i)
+    if sw_i is None: continue
+    out = path_map[sw_i]
+    for j,(dist,k) in row.iteritems():
+      sw_j = switches.get(j)
+      if sw_j is None: continue
+      out[sw_j] = (dist, None if k is None else switches.get(k))
+
 
-  #dump()
+# Background path recalculation we're waiting on (a pox.lib.executor.Work)
+_path_work = None
 
-  for k in sws:
-    for i in sws:
-      for j in sws:
-        if path_map[i][k][0] is not None:
-          if path_map[k][j][0] is not None:
-            # i -> k -> j exists
-            ikj_dist = path_map[i][k][0]+path_map[k][j][0]
-            if path_map[i][j][0] is None or ikj_dist < path_map[i][j][0]:
-              # i -> k -> j is better than existing
-              path_map[i][j] = (ikj_dist, k)
 
-  #print "--------------------"
-  #dump()
+def _calc_paths ():
+  """
+  Recalculates path_map right now
+  """
+  global _path_work
+  if _path_work is not None:
+    _path_work.cancel()
+    _path_work = None
+  _set_paths(_compute_paths(switches.keys(), _adjacency_snapshot()))
+
+
+def _recalc_paths_later ():
+  """
+  Recalculates path_map in the background
+
+  Until it finishes, the old path_map keeps being used (paths it gives
+  which are no longer valid get calculated inline).
+  """
+  global _path_work
+  def done (work):
+    global _path_work
+    if work is not _path_work: return
+    _path_work = None
+    if work.exception is not None:
+      log.error("Couldn't calculate paths: %s", work.exception)
+      path_map.clear() # Will get calculated inline when needed
+      return
+    _set_paths(work.result)
+
+  try:
+    _path_work = core.executor.submit(_compute_paths,
+        args=(switches.keys(), _adjacency_snapshot()), callback=done,
+        process=_paths_in_process, key="l2_multi.paths")
+  except Exception as e:
+    log.warn("Couldn't queue path calculation: %s", e)
+    _path_work = None
+    path_map.clear()
 
 
 def _get_raw_path (src, dst):
@@ -139,6 +211,19 @@ def _get_path (src, dst, first_port, final_port):
   """
   Gets a cooked path -- a list of (node,in_port,out_port)
   """
+  r = _cook_path(src, dst, first_port, final_port)
+  if (r is None or not _check_path(r)) and _path_work is not None:
+    # path_map is out of date and the new one isn't ready; don't wait
+    _calc_paths()
+    r = _cook_path(src, dst, first_port, final_port)
+  if r is None: return None
+
+  assert _check_path(r), "Illegal path!"
+
+  return r
+
+
+def _cook_path (src, dst, first_port, final_port):
   # Start with a raw path...
   if src == dst:
     path = [src]
@@ -155,9 +240,6 @@ def _get_path (src, dst, first_port, final_port):
     r.append((s1,in_port,out_port))
     in_port = adjacency[s2][s1]
   r.append((dst,in_port,final_port))
-
-  assert _check_path(r), "Illegal path!"
-
   return r
 
 
@@ -196,8 +278,8 @@ class WaitingPath (object):
     if len(self.xids) == 0:
       # Done!
       if self.packet:
-        log.debug("Sending delayed packet out %s"
-                  % (dpid_to_str(self.first_switch),))
+        log.debug("Sending delayed packet out %s",
+                  dpid_to_str(self.first_switch))
         msg = of.ofp_packet_out(data=self.packet,
             action=of.ofp_action_output(port=of.OFPP_TABLE))
         core.openflow.sendToDPID(self.first_switch, msg)
@@ -239,14 +321,10 @@ class Switch (EventMixin):
     return dpid_to_str(self.dpid)
 
   def _install (self, switch, in_port, out_port, match, buf = None):
-    msg = of.ofp_flow_mod()
-    msg.match = match
-    msg.match.in_port = in_port
-    msg.idle_timeout = FLOW_IDLE_TIMEOUT
-    msg.hard_timeout = FLOW_HARD_TIMEOUT
-    msg.actions.append(of.ofp_action_output(port = out_port))
-    msg.buffer_id = buf
-    switch.connection.send(msg)
+    switch.connection.send(_install_template.pack(match = match,
+                                                  in_port = in_port,
+                                                  out_port = out_port,
+                                                  buffer_id = buf))
 
   def _install_path (self, p, match, packet_in=None):
     wp = WaitingPath(p, packet_in)
@@ -316,7 +394,7 @@ class Switch (EventMixin):
     def flood ():
       """ Floods the packet """
       if self.is_holding_down:
-        log.warning("Not flooding -- holddown active")
+        _hot_log.warning("Not flooding -- holddown active")
       msg = of.ofp_packet_out()
       # OFPP_FLOOD is optional; some switches may need OFPP_ALL
       msg.actions.append(of.ofp_action_output(port = of.OFPP_FLOOD))
@@ -367,7 +445,7 @@ class Switch (EventMixin):
           # Unfortunately, we know the destination.  It's possible that
           # we learned it while it was in flight, but it's also possible
           # that something has gone wrong.
-          log.warning("Packet from %s to known destination %s arrived "
+          _hot_log.warning("Packet from %s to known destination %s arrived "
                       "at %s.%i without flow", packet.src, packet.dst,
                       dpid_to_str(self.dpid), event.port)
 
@@ -377,7 +455,7 @@ class Switch (EventMixin):
       flood()
     else:
       if packet.dst not in mac_map:
-        log.debug("%s unknown -- flooding" % (packet.dst,))
+        log.debug("%s unknown -- flooding", packet.dst)
         flood()
       else:
         dest = mac_map[packet.dst]
@@ -445,7 +523,6 @@ class l2_multi (EventMixin):
     for sw in switches.itervalues():
       if sw.connection is None: continue
       sw.connection.send(clear)
-    path_map.clear()
 
     if event.removed:
       # This link no longer okay
@@ -453,7 +530,7 @@ class l2_multi (EventMixin):
       if sw1 in adjacency[sw2]: del adjacency[sw2][sw1]
 
       # But maybe there's another way to connect these...
-      for ll in core.openflow_discovery.adjacency:
+      for ll in core.openflow_discovery.links_for_switch(l.dpid1):
         if ll.dpid1 == l.dpid1 and ll.dpid2 == l.dpid2:
           if flip(ll) in core.openflow_discovery.adjacency:
             # Yup, link goes both ways
@@ -483,6 +560,8 @@ class l2_multi (EventMixin):
         log.debug("Unlearned %s", mac)
         del mac_map[mac]
 
+    _recalc_paths_later()
+
   def _handle_ConnectionUp (self, event):
     sw = switches.get(event.dpid)
     if sw is None:
@@ -502,7 +581,16 @@ class l2_multi (EventMixin):
     wp.notify(event)
 
 
-def launch ():
+def launch (paths_in_process = False):
+  """
+  Shortest-path forwarding
+
+  --paths_in_process calculates paths in a separate process rather than a
+  thread, which helps with large topologies on multicore machines.
+  """
+  global _paths_in_process
+  _paths_in_process = str_to_bool(paths_in_process)
+
   core.registerNew(l2_multi)
 
   timeout = min(max(PATH_SETUP_TIME, 5) * 2, 15)
@@ -40,8 +40,12 @@ import pox.openflow.libopenflow_01 as of
 
 from pox.lib.revent import *
 
+from pox.log.hotpath import HotLogger
+import logging
 import time
 
+_hot_log = HotLogger(log, rate = 10, burst = 50) # For per-packet warnings
+
 # Timeout for flows
 FLOW_IDLE_TIMEOUT = 10
 
@@ -140,8 +144,8 @@ class l3_switch (EventMixin):
       # Yup!
       bucket = self.lost_buffers[(dpid,ipaddr)]
       del self.lost_buffers[(dpid,ipaddr)]
-      log.debug("Sending %i buffered packets to %s from %s"
-                % (len(bucket),ipaddr,dpid_to_str(dpid)))
+      log.debug("Sending %i buffered packets to %s from %s",
+                len(bucket), ipaddr, dpid_to_str(dpid))
       for _,buffer_id,in_port in bucket:
         po = of.ofp_packet_out(buffer_id=buffer_id,in_port=in_port)
         po.actions.append(of.ofp_action_dl_addr.set_dst(macaddr))
@@ -157,7 +161,7 @@ class l3_switch (EventMixin):
     inport = event.port
     packet = event.parsed
     if not packet.parsed:
-      log.warning("%i %i ignoring unparsed packet", dpid, inport)
+      _hot_log.warning("%i %i ignoring unparsed packet", dpid, inport)
       return
 
     if dpid not in self.arpTable:
@@ -183,7 +187,7 @@ class l3_switch (EventMixin):
         if self.arpTable[dpid][packet.next.srcip] != (inport, packet.src):
           log.info("%i %i RE-learned %s", dpid,inport,packet.next.srcip)
       else:
-        log.debug("%i %i learned %s", dpid,inport,str(packet.next.srcip))
+        log.debug("%i %i learned %s", dpid,inport,packet.next.srcip)
       self.arpTable[dpid][packet.next.srcip] = Entry(inport, packet.src)
 
       # Try to forward
@@ -194,11 +198,11 @@ class l3_switch (EventMixin):
         prt = self.arpTable[dpid][dstaddr].port
         mac = self.arpTable[dpid][dstaddr].mac
         if prt == inport:
-          log.warning("%i %i not sending packet for %s back out of the " +
-                      "input port" % (dpid, inport, str(dstaddr)))
+          _hot_log.warning("%i %i not sending packet for %s back out of the "
+                           "input port", dpid, inport, dstaddr)
         else:
-          log.debug("%i %i installing flow for %s => %s out port %i"
-                    % (dpid, inport, packet.next.srcip, dstaddr, prt))
+          log.debug("%i %i installing flow for %s => %s out port %i",
+                    dpid, inport, packet.next.srcip, dstaddr, prt)
 
           actions = []
           actions.append(of.ofp_action_dl_addr.set_dst(mac))
@@ -254,8 +258,8 @@ class l3_switch (EventMixin):
         e = ethernet(type=ethernet.ARP_TYPE, src=packet.src,
                      dst=ETHER_BROADCAST)
         e.set_payload(r)
-        log.debug("%i %i ARPing for %s on behalf of %s" % (dpid, inport,
-         str(r.protodst), str(r.protosrc)))
+        log.debug("%i %i ARPing for %s on behalf of %s", dpid, inport,
+                  r.protodst, r.protosrc)
         msg = of.ofp_packet_out()
         msg.data = e.pack()
         msg.actions.append(of.ofp_action_output(port = of.OFPP_FLOOD))
@@ -264,9 +268,10 @@ class l3_switch (EventMixin):
 
     elif isinstance(packet.next, arp):
       a = packet.next
-      log.debug("%i %i ARP %s %s => %s", dpid, inport,
-       {arp.REQUEST:"request",arp.REPLY:"reply"}.get(a.opcode,
-       'op:%i' % (a.opcode,)), str(a.protosrc), str(a.protodst))
+      if log.isEnabledFor(logging.DEBUG):
+        log.debug("%i %i ARP %s %s => %s", dpid, inport,
+         {arp.REQUEST:"request",arp.REPLY:"reply"}.get(a.opcode,
+         'op:%i' % (a.opcode,)), a.protosrc, a.protodst)
 
       if a.prototype == arp.PROTO_TYPE_IP:
         if a.hwtype == arp.HW_TYPE_ETHERNET:
@@ -275,9 +280,9 @@ class l3_switch (EventMixin):
             # Learn or update port/MAC info
             if a.protosrc in self.arpTable[dpid]:
               if self.arpTable[dpid][a.protosrc] != (inport, packet.src):
-                log.info("%i %i RE-learned %s", dpid,inport,str(a.protosrc))
+                log.info("%i %i RE-learned %s", dpid,inport,a.protosrc)
             else:
-              log.debug("%i %i learned %s", dpid,inport,str(a.protosrc))
+              log.debug("%i %i learned %s", dpid,inport,a.protosrc)
             self.arpTable[dpid][a.protosrc] = Entry(inport, packet.src)
 
             # Send any waiting packets...
@@ -305,8 +310,8 @@ class l3_switch (EventMixin):
                   e = ethernet(type=packet.type, src=dpid_to_mac(dpid),
                                dst=a.hwsrc)
                   e.set_payload(r)
-                  log.debug("%i %i answering ARP for %s" % (dpid, inport,
-                   str(r.protosrc)))
+                  log.debug("%i %i answering ARP for %s", dpid, inport,
+                            r.protosrc)
                   msg = of.ofp_packet_out()
                   msg.data = e.pack()
                   msg.actions.append(of.ofp_action_output(port =
@@ -316,9 +321,10 @@ class l3_switch (EventMixin):
                   return
 
       # Didn't know how to answer or otherwise handle this ARP, so just flood it
-      log.debug("%i %i flooding ARP %s %s => %s" % (dpid, inport,
-       {arp.REQUEST:"request",arp.REPLY:"reply"}.get(a.opcode,
-       'op:%i' % (a.opcode,)), str(a.protosrc), str(a.protodst)))
+      if log.isEnabledFor(logging.DEBUG):
+        log.debug("%i %i flooding ARP %s %s => %s", dpid, inport,
+         {arp.REQUEST:"request",arp.REPLY:"reply"}.get(a.opcode,
+         'op:%i' % (a.opcode,)), a.protosrc, a.protodst)
 
       msg = of.ofp_packet_out(in_port = inport, data = event.ofp,
           action = of.ofp_action_output(port = of.OFPP_FLOOD))
@@ -434,7 +434,7 @@ class topo_addressing (object):
       if sw1 in adjacency[sw2]: del adjacency[sw2][sw1]
 
       # But maybe there's another way to connect these...
-      for ll in core.openflow_discovery.adjacency:
+      for ll in core.openflow_discovery.links_for_switch(l.dpid1):
         if ll.dpid1 == l.dpid1 and ll.dpid2 == l.dpid2:
           if flip(ll) in core.openflow_discovery.adjacency:
             # Yup, link goes both ways
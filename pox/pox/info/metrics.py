@@ -0,0 +1,374 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Low-overhead runtime metrics
+
+Keeps track of where the controller's time goes:
+  - latency histograms for each event handler (per event type)
+  - how long recoco tasks run each time they're scheduled
+  - scheduler lag (how late a periodic probe timer fires) and how many
+    tasks are waiting to run
+  - messages and bytes received and sent on each OpenFlow connection
+
+Unlike info.recoco_spy, which traces every line, this only costs a couple
+of clock reads per handler call and task run.
+
+The numbers are available from core.metrics.get_stats(), and if
+web.webcore is running, at /metrics (Prometheus text format) and
+/metrics.json.  core.metrics.dump() (e.g., from the py component) and
+tools/pox-metrics.py print a summary.
+
+Example:
+./pox.py info.metrics web.webcore forwarding.l2_learning
+"""
+
+from pox.core import core
+from pox.lib.recoco import Timer
+import pox.lib.revent.revent as revent
+from pox.lib.util import dpid_to_str
+from pox.openflow import RateSampler
+from pox.info.metrics_format import format_stats
+from pox.web.webcore import SplitRequestHandler
+from math import frexp
+from functools import partial
+from types import CodeType, BuiltinFunctionType, ClassType
+import json
+import time
+
+log = core.getLogger()
+
+
+class Histogram (object):
+  """
+  Counts of durations in power-of-two buckets from 1us to about 8s
+  """
+  BUCKETS = 25
+  # Upper bound in seconds of each bucket (the last is open-ended)
+  bounds = [2**i / 1e6 for i in range(BUCKETS - 1)] + [float("inf")]
+
+  def __init__ (self):
+    self.counts = [0] * self.BUCKETS
+    self.count = 0
+    self.sum = 0.0
+    self.max = 0.0
+
+  def add (self, seconds):
+    us = seconds * 1e6
+    if us <= 1:
+      i = 0
+    else:
+      m,i = frexp(us)
+      if m == 0.5: i -= 1 # Exactly 2**(i-1), which is bucket i-1's bound
+      if i >= self.BUCKETS: i = self.BUCKETS - 1
+    self.counts[i] += 1
+    self.count += 1
+    self.sum += seconds
+    if seconds > self.max: self.max = seconds
+
+  def merge (self, other):
+    for i,c in enumerate(other.counts):
+      self.counts[i] += c
+    self.count += other.count
+    self.sum += other.sum
+    self.max = max(self.max, other.max)
+
+  def percentile (self, p):
+    """
+    Returns the upper bound of the bucket holding the p (0-1) percentile
+    """
+    if not self.count: return None
+    target = p * self.count
+    n = 0
+    for i,c in enumerate(self.counts):
+      n += c
+      if n >= target and c:
+        return min(self.bounds[i], self.max)
+    return self.max
+
+  def as_dict (self):
+    return dict(count = self.count, sum = self.sum,
+                mean = self.sum / self.count if self.count else None,
+                p50 = self.percentile(0.5), p99 = self.percentile(0.99),
+                max = self.max)
+
+
+def _callable_name (f):
+  if isinstance(f, tuple):
+    a,b = f
+    if isinstance(b, CodeType):
+      # A function, as (module, code)
+      return "%s.%s" % (a, b.co_name) if a else b.co_name
+    # A method, as (function, class)
+    return "%s.%s" % (b.__name__, a.__name__)
+  name = getattr(f, "__name__", None)
+  if name is None: return str(f)
+  module = getattr(f, "__module__", None)
+  return "%s.%s" % (module, name) if module else name
+
+
+def _callable_key (f):
+  """
+  Returns something which identifies f without keeping its object alive
+
+  Bound methods of different instances of a class come out the same, so
+  (e.g.) every LearningSwitch's PacketIn handler is counted together.
+  So do closures made by the same code, partials of the same function,
+  and callable instances of the same class.
+  """
+  while isinstance(f, partial):
+    f = f.func
+  func = getattr(f, "im_func", None)
+  if func is not None:
+    return (func, f.im_self.__class__)
+  code = getattr(f, "func_code", None)
+  if code is not None:
+    return (f.__module__, code)
+  if isinstance(f, (type, ClassType)):
+    return f
+  if isinstance(f, BuiltinFunctionType):
+    # (Its __self__ may be some object we shouldn't hold on to)
+    return _callable_name(f)
+  return type(f)
+
+
+def _prom_labels (**labels):
+  return ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\")
+                                        .replace('"', '\\"'))
+                  for k,v in sorted(labels.items()))
+
+
+class Metrics (object):
+  def __init__ (self, probe_interval = 0.1, rate_interval = 5):
+    self.probe_interval = probe_interval
+    self._handlers = {} # (event type, handler key) -> Histogram
+    self._tasks = {} # task key -> Histogram
+    self.lag = Histogram()
+    self.ready = 0
+    self.ready_max = 0
+    self.rates = {} # dpid -> (rx msg/s, rx bytes/s, tx msg/s, tx bytes/s)
+    self._rate_sampler = RateSampler(('rx_messages', 'rx_bytes',
+                                      'tx_messages', 'tx_bytes'))
+    self._probe_due = None
+
+    self._scheduler = core.scheduler
+    revent.handler_timer = self._time_handler
+    self._scheduler.task_timer = self._time_task
+    self._timers = [
+        Timer(probe_interval, self._probe, recurring = True),
+        Timer(rate_interval, self._sample_rates, recurring = True)]
+    core.addListenerByName("UpEvent", self._handle_UpEvent)
+
+  def uninstall (self):
+    """
+    Stops collecting
+    """
+    if revent.handler_timer == self._time_handler:
+      revent.handler_timer = None
+    if self._scheduler.task_timer == self._time_task:
+      self._scheduler.task_timer = None
+    for t in self._timers:
+      t.cancel()
+
+  def _handle_UpEvent (self, event):
+    if core.hasComponent("WebServer"):
+      core.WebServer.set_handler("/metrics", MetricsHandler, self, True)
+      core.WebServer.set_handler("/metrics.json", MetricsHandler, self, True)
+
+  # Hooks
+
+  def _time_handler (self, event_type, handler, seconds):
+    key = (event_type, _callable_key(handler))
+    h = self._handlers.get(key)
+    if h is None:
+      h = self._handlers[key] = Histogram()
+    h.add(seconds)
+
+  def _time_task (self, task, seconds):
+    if isinstance(task, Timer):
+      key = (Timer, _callable_key(task._callback))
+    else:
+      key = task.__class__
+    h = self._tasks.get(key)
+    if h is None:
+      h = self._tasks[key] = Histogram()
+    h.add(seconds)
+    n = len(self._scheduler._ready)
+    if n > self.ready_max: self.ready_max = n
+
+  def _probe (self):
+    now = time.time()
+    if self._probe_due is not None:
+      self.lag.add(max(0, now - self._probe_due))
+    self._probe_due = now + self.probe_interval
+    self.ready = len(self._scheduler._ready)
+
+  def _sample_rates (self):
+    if not core.hasComponent("openflow"): return
+    self.rates = self._rate_sampler.sample(list(core.openflow.connections))
+
+  # Reporting
+
+  def _handler_histograms (self):
+    """
+    Returns {(event name, handler name): Histogram}
+    """
+    r = {}
+    for (event_type,key),h in list(self._handlers.items()):
+      name = (getattr(event_type, "__name__", str(event_type)),
+              _callable_name(key))
+      if name in r:
+        merged = Histogram()
+        merged.merge(r[name])
+        merged.merge(h)
+        h = merged
+      r[name] = h
+    return r
+
+  def _task_histograms (self):
+    r = {}
+    for key,h in list(self._tasks.items()):
+      if isinstance(key, tuple):
+        name = "Timer(%s)" % (_callable_name(key[1]),)
+      else:
+        name = key.__name__
+      if name in r:
+        merged = Histogram()
+        merged.merge(r[name])
+        merged.merge(h)
+        h = merged
+      r[name] = h
+    return r
+
+  def _connections (self):
+    r = []
+    if not core.hasComponent("openflow"): return r
+    for con in list(core.openflow.connections):
+      rates = self.rates.get(con.dpid, (0.0, 0.0, 0.0, 0.0))
+      r.append(dict(dpid = dpid_to_str(con.dpid),
+                    rx_messages = con.rx_messages,
+                    rx_bytes = con.rx_bytes,
+                    tx_messages = con.tx_messages,
+                    tx_bytes = con.tx_bytes,
+                    rx_messages_per_sec = rates[0],
+                    rx_bytes_per_sec = rates[1],
+                    tx_messages_per_sec = rates[2],
+                    tx_bytes_per_sec = rates[3]))
+    r.sort(key = lambda c: c['dpid'])
+    return r
+
+  def get_stats (self):
+    """
+    Returns everything as a JSON-friendly dict
+    """
+    handlers = []
+    events = {}
+    for (event,handler),h in self._handler_histograms().iteritems():
+      d = h.as_dict()
+      d['event'] = event
+      d['handler'] = handler
+      handlers.append(d)
+      events.setdefault(event, Histogram()).merge(h)
+    handlers.sort(key = lambda d: -d['sum'])
+
+    tasks = []
+    for name,h in self._task_histograms().iteritems():
+      d = h.as_dict()
+      d['task'] = name
+      tasks.append(d)
+    tasks.sort(key = lambda d: -d['sum'])
+
+    return dict(
+      time = time.time(),
+      handlers = handlers,
+      events = dict((k,h.as_dict()) for k,h in events.iteritems()),
+      tasks = tasks,
+      scheduler = dict(lag = self.lag.as_dict(), ready = self.ready,
+                       ready_max = self.ready_max),
+      connections = self._connections(),
+    )
+
+  def prometheus_text (self):
+    """
+    Returns everything in the Prometheus text exposition format
+    """
+    lines = []
+    def histogram (name, h, **labels):
+      n = 0
+      for bound,c in zip(h.bounds, h.counts):
+        n += c
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        lines.append("%s_bucket{%s} %i" % (name,
+                     _prom_labels(le = le, **labels), n))
+      l = _prom_labels(**labels)
+      lines.append("%s_sum{%s} %r" % (name, l, h.sum))
+      lines.append("%s_count{%s} %i" % (name, l, h.count))
+
+    lines.append("# TYPE pox_handler_seconds histogram")
+    for (event,handler),h in sorted(self._handler_histograms().items()):
+      histogram("pox_handler_seconds", h, event = event, handler = handler)
+    lines.append("# TYPE pox_task_seconds histogram")
+    for name,h in sorted(self._task_histograms().items()):
+      histogram("pox_task_seconds", h, task = name)
+    lines.append("# TYPE pox_scheduler_lag_seconds histogram")
+    histogram("pox_scheduler_lag_seconds", self.lag)
+    lines.append("# TYPE pox_scheduler_ready_tasks gauge")
+    lines.append("pox_scheduler_ready_tasks %i" % (self.ready,))
+
+    cons = self._connections()
+    for counter in ("rx_messages", "rx_bytes", "tx_messages", "tx_bytes"):
+      name = "pox_openflow_%s_total" % (counter,)
+      lines.append("# TYPE %s counter" % (name,))
+      for c in cons:
+        lines.append("%s{%s} %i" % (name, _prom_labels(dpid = c['dpid']),
+                                    c[counter]))
+    return "\n".join(lines) + "\n"
+
+  def dump (self):
+    """
+    Returns a summary as text
+    """
+    return format_stats(self.get_stats())
+
+
+class MetricsHandler (SplitRequestHandler):
+  """
+  Serves /metrics (Prometheus text) and /metrics.json
+  """
+  def do_GET (self):
+    self.do_content(True)
+
+  def do_HEAD (self):
+    self.do_content(False)
+
+  def do_content (self, is_get):
+    metrics = self.args
+    if self.prefix.endswith(".json"):
+      r = json.dumps(metrics.get_stats(), indent = 2)
+      content_type = "application/json"
+    else:
+      r = metrics.prometheus_text()
+      content_type = "text/plain; version=0.0.4"
+    self.send_response(200)
+    self.send_header("Content-type", content_type)
+    self.send_header("Content-Length", str(len(r)))
+    self.end_headers()
+    if is_get:
+      self.wfile.write(r)
+
+
+def launch (probe_interval = 0.1, rate_interval = 5):
+  """
+  Collect handler, scheduler and connection metrics
+  """
+  core.register("metrics", Metrics(float(probe_interval),
+                                   float(rate_interval)))
@@ -0,0 +1,56 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Text summaries of info.metrics statistics
+
+This doesn't need POX's core, so tools (e.g., tools/pox-metrics.py) can
+format stats fetched from a running POX without starting one.
+"""
+
+
+def _ms (v):
+  return "-" if v is None else "%.3f" % (v * 1000,)
+
+
+def format_stats (stats, top = 20):
+  """
+  Formats the result of Metrics.get_stats() as a text summary
+  """
+  out = []
+  out.append("%-44s %-20s %8s %9s %9s %9s %9s" % ("Handler", "Event",
+             "Count", "Total s", "p50 ms", "p99 ms", "Max ms"))
+  for d in stats['handlers'][:top]:
+    out.append("%-44s %-20s %8i %9.3f %9s %9s %9s" % (d['handler'][-44:],
+               d['event'][-20:], d['count'], d['sum'], _ms(d['p50']),
+               _ms(d['p99']), _ms(d['max'])))
+  out.append("")
+  out.append("%-65s %8s %9s %9s %9s %9s" % ("Task", "Runs", "Total s",
+             "p50 ms", "p99 ms", "Max ms"))
+  for d in stats['tasks'][:top]:
+    out.append("%-65s %8i %9.3f %9s %9s %9s" % (d['task'][-65:], d['count'],
+               d['sum'], _ms(d['p50']), _ms(d['p99']), _ms(d['max'])))
+  out.append("")
+  s = stats['scheduler']
+  out.append("Scheduler lag p50 %s ms, p99 %s ms, max %s ms; "
+             "%i tasks ready (max %i)" % (_ms(s['lag']['p50']),
+             _ms(s['lag']['p99']), _ms(s['lag']['max']), s['ready'],
+             s['ready_max']))
+  if stats['connections']:
+    out.append("")
+    out.append("%-24s %10s %12s %10s %12s" % ("Switch", "rx msg/s",
+               "rx bytes/s", "tx msg/s", "tx bytes/s"))
+    for c in stats['connections']:
+      out.append("%-24s %10.1f %12.1f %10.1f %12.1f" % (c['dpid'],
+                 c['rx_messages_per_sec'], c['rx_bytes_per_sec'],
+                 c['tx_messages_per_sec'], c['tx_bytes_per_sec']))
+  return "\n".join(out)
@@ -0,0 +1,278 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Sampling profiler for the recoco scheduler thread
+
+A sampler thread wakes up every --interval seconds (default 5ms), looks
+at what the scheduler thread is doing with sys._current_frames(), and
+counts the stack.  Nothing runs on the scheduler thread itself, so the
+cost is just the sampler briefly holding the GIL.  (An interval timer
+signal won't do: Python only runs signal handlers on the main thread, and
+recoco runs on another one.)
+
+Each sample is attributed to the recoco Task which was running and, if
+it was inside an event handler, to that handler and its event type.
+Stacks are kept in the "collapsed" format used by flamegraph.pl and
+speedscope, with the task as the root frame:
+  OpenFlow_01_Task;run (pox/openflow/of_01.py:1010);... 42
+
+Sampling can be started and stopped at runtime:
+  - from the py component: core.profiler.start() / stop() / reset()
+  - over the web (with web.webcore): POST /profiler/start, /stop and
+    /reset; GET /profiler for a summary (JSON) and /profiler/collapsed
+    for the stacks
+  - over the messenger: send {"cmd":"start"} (or stop, reset, status or
+    collapsed) on the "profiler" channel
+
+Example:
+./pox.py info.profiler --paused web.webcore forwarding.l2_learning
+curl -X POST localhost:8000/profiler/start
+curl localhost:8000/profiler/collapsed | flamegraph.pl > pox.svg
+"""
+
+from __future__ import with_statement
+from pox.core import core
+from pox.lib.util import str_to_bool
+from pox.lib.recoco import Scheduler
+from pox.lib.revent.revent import EventMixin
+from pox.info.metrics import _callable_name, _callable_key
+from pox.web.webcore import SplitRequestHandler
+from pox.messenger import ChannelBot
+from collections import defaultdict
+import threading
+import json
+import sys
+import os
+import time
+
+log = core.getLogger()
+
+_cycle_code = Scheduler.cycle.im_func.func_code
+_raise_code = EventMixin.raiseEvent.im_func.func_code
+
+# Frame labels are file names relative to the directory with pox in it
+_base_dir = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__)))) + os.sep
+
+
+class Profiler (object):
+  def __init__ (self, interval = 0.005, max_depth = 100):
+    self.interval = interval
+    self.max_depth = max_depth
+    self._lock = threading.Lock()
+    self._thread = None # The current sampler thread, if running
+    self._labels = {} # code -> frame label
+    self.reset()
+
+  @property
+  def running (self):
+    return self._thread is not None
+
+  def start (self):
+    if self._thread is not None: return
+    # A sampler quits as soon as it isn't the current one, so one left
+    # over from a recent stop() never samples alongside this one
+    t = threading.Thread(target = self._sampler, name = "Profiler")
+    t.daemon = True
+    self._thread = t
+    t.start()
+    log.info("Sampling every %s ms", self.interval * 1000)
+
+  def stop (self):
+    if self._thread is None: return
+    self._thread = None
+    log.info("Stopped after %i samples", self.samples)
+
+  def reset (self):
+    with self._lock:
+      self.samples = 0
+      self.idle = 0
+      self.stacks = defaultdict(int) # collapsed stack -> samples
+      self.tasks = defaultdict(int) # task name -> samples
+      self.handlers = defaultdict(int) # (event name, handler) -> samples
+      self.started_at = time.time()
+
+  def _sampler (self):
+    me = threading.current_thread()
+    thread = core.scheduler._thread
+    while core.running:
+      time.sleep(self.interval)
+      if self._thread is not me: return
+      if thread is None or not thread.is_alive():
+        thread = core.scheduler._thread
+        continue
+      frame = sys._current_frames().get(thread.ident)
+      if frame is not None:
+        self.sample(frame)
+    if self._thread is me:
+      self._thread = None
+
+  def _label (self, code):
+    label = self._labels.get(code)
+    if label is None:
+      filename = code.co_filename
+      if filename.startswith(_base_dir):
+        filename = filename[len(_base_dir):]
+      label = "%s (%s:%i)" % (code.co_name, filename, code.co_firstlineno)
+      self._labels[code] = label
+    return label
+
+  def sample (self, frame):
+    """
+    Counts one sample of the scheduler thread, given its current frame
+    """
+    codes = []
+    task = None
+    handler = None
+    f = frame
+    while f is not None:
+      code = f.f_code
+      if code is _cycle_code:
+        task = f.f_locals.get('t')
+        break
+      if code is _raise_code and handler is None:
+        # The innermost event being handled
+        l = f.f_locals
+        handler = (l.get('eventType'), l.get('handler'))
+      codes.append(code)
+      f = f.f_back
+
+    with self._lock:
+      self.samples += 1
+      if task is None:
+        # Waiting for something to do
+        self.idle += 1
+        return
+      task_name = type(task).__name__
+      self.tasks[task_name] += 1
+      if handler is not None and handler[1] is not None:
+        event_name = getattr(handler[0], '__name__', str(handler[0]))
+        self.handlers[(event_name,
+                       _callable_name(_callable_key(handler[1])))] += 1
+      codes.reverse()
+      del codes[self.max_depth:] # Keep the root end so stacks still merge
+      stack = [task_name] + [self._label(c) for c in codes]
+      self.stacks[";".join(stack)] += 1
+
+  def collapsed (self):
+    """
+    Returns stacks in collapsed format (for flamegraph.pl, etc.)
+    """
+    with self._lock:
+      items = sorted(self.stacks.items())
+    return "".join("%s %i\n" % i for i in items)
+
+  def get_stats (self, top = 20):
+    """
+    Returns a summary as a JSON-friendly dict
+    """
+    with self._lock:
+      samples = self.samples
+      tasks = sorted(self.tasks.items(), key = lambda i: -i[1])
+      handlers = sorted(self.handlers.items(), key = lambda i: -i[1])
+      stacks = sorted(self.stacks.items(), key = lambda i: -i[1])[:top]
+      idle = self.idle
+    def pct (n):
+      return 100.0 * n / samples if samples else 0.0
+    return dict(
+      running = self.running,
+      interval = self.interval,
+      seconds = time.time() - self.started_at,
+      samples = samples,
+      idle_percent = pct(idle),
+      tasks = [dict(task = t, samples = n, percent = pct(n))
+               for t,n in tasks],
+      handlers = [dict(event = e, handler = h, samples = n, percent = pct(n))
+                  for (e,h),n in handlers],
+      top_stacks = [dict(stack = s, samples = n) for s,n in stacks],
+    )
+
+  def _handle_UpEvent (self, event):
+    if core.hasComponent("WebServer"):
+      core.WebServer.set_handler("/profiler", ProfilerHandler, self, True)
+    if core.hasComponent("MessengerNexus"):
+      ProfilerBot("profiler", extra = self)
+
+
+class ProfilerHandler (SplitRequestHandler):
+  """
+  Web interface to the profiler
+  """
+  def do_GET (self):
+    profiler = self.args
+    if self.path in ("", "/"):
+      self._send(json.dumps(profiler.get_stats(), indent = 2),
+                 "application/json")
+    elif self.path == "/collapsed":
+      self._send(profiler.collapsed(), "text/plain")
+    else:
+      self.send_error(404, "No such profiler page")
+
+  def do_POST (self):
+    profiler = self.args
+    if self.path == "/start":
+      profiler.start()
+    elif self.path == "/stop":
+      profiler.stop()
+    elif self.path == "/reset":
+      profiler.reset()
+    else:
+      self.send_error(404, "No such profiler command")
+      return
+    self._send(json.dumps({'running':profiler.running}), "application/json")
+
+  def _send (self, r, content_type):
+    self.send_response(200)
+    self.send_header("Content-type", content_type)
+    self.send_header("Content-Length", str(len(r)))
+    self.end_headers()
+    self.wfile.write(r)
+
+
+class ProfilerBot (ChannelBot):
+  """
+  Messenger interface to the profiler
+  """
+  def _init (self, extra):
+    self.profiler = extra
+
+  def _exec_cmd_start (self, event):
+    self.profiler.start()
+    self.reply(event, running = self.profiler.running)
+
+  def _exec_cmd_stop (self, event):
+    self.profiler.stop()
+    self.reply(event, running = self.profiler.running)
+
+  def _exec_cmd_reset (self, event):
+    self.profiler.reset()
+    self.reply(event, running = self.profiler.running)
+
+  def _exec_cmd_status (self, event):
+    self.reply(event, **self.profiler.get_stats())
+
+  def _exec_cmd_collapsed (self, event):
+    self.reply(event, collapsed = self.profiler.collapsed())
+
+
+def launch (interval = 0.005, paused = False):
+  """
+  Sample what the scheduler thread is doing every interval seconds
+
+  --paused waits to be started (from the web, messenger or py component).
+  """
+  profiler = Profiler(float(interval))
+  core.register("profiler", profiler)
+  core.addListenerByName("UpEvent", profiler._handle_UpEvent)
+  if not str_to_bool(paused):
+    profiler.start()
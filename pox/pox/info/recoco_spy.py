@@ -15,37 +15,20 @@
 """
 This is an extremely primitive start at some debugging.
 At the moment, it is really just for recoco (maybe it belongs in there?).
+
+Once a second, it looks at what the scheduler thread is doing (using
+sys._current_frames(), so the scheduler itself runs at full speed) and
+warns if the same task has been stuck in the same place for a while.
+For where the time goes in general, see info.profiler.
 """
 
 from pox.core import core
 log = core.getLogger()
+import sys
 import time
 import traceback
 import pox.lib.recoco
 
-_frames = []
-
-def _tf (frame, event, arg):
-  if _frames is None: return _tf
-  #print " " * len(_frames) + event
-  if event == 'call':
-    _frames.append(frame)
-    return _tf
-  elif event == 'line':
-    return _tf
-  elif event == 'exception':
-    #_frames.pop()
-    return _tf
-  elif event == 'return':
-    _frames.pop()
-  elif event == 'c_call':
-    print "c_call"
-    _frames.append((frame,arg))
-  elif event == 'c_exception':
-    _frames.pop()
-  elif event == 'c_return':
-    _frames.pop()
-
 
 def _trace_thread_proc ():
   last = None
@@ -54,9 +37,10 @@ def _trace_thread_proc ():
   while True:
     try:
       time.sleep(1)
-      c = len(_frames)
-      if c == 0: continue
-      f = _frames[-1]
+      thread = core.scheduler._thread
+      if thread is None: continue
+      f = sys._current_frames().get(thread.ident)
+      if f is None: continue
       stopAt = None
       count = 0
       sf = f
@@ -66,14 +50,10 @@ def _trace_thread_proc ():
           break
         count += 1
         sf = sf.f_back
-      #if stopAt == None: continue
+      if stopAt is None: continue # Not running a task
 
       f = "\n".join([s.strip() for s in
                       traceback.format_stack(f,count)])
-      #f = " / ".join([s.strip() for s in
-      #                traceback.format_stack(f,1)[0].strip().split("\n")])
-      #f = "\n".join([s.strip() for s in
-      #                traceback.format_stack(f)])
 
       if f != last:
         if warned:
@@ -83,25 +63,15 @@ def _trace_thread_proc ():
         last_time = time.time()
       elif f != warned:
         if time.time() - last_time > 3:
-          if stopAt is not None:
-            warned = f
-            log.warning("Stuck at:\n" + f)
-
-      #from pox.core import core
-      #core.f = f
+          warned = f
+          log.warning("Stuck at:\n" + f)
 
     except:
       traceback.print_exc()
       pass
 
 
-
 def launch ():
-  def f ():
-    import sys
-    sys.settrace(_tf)
-  core.callLater(f)
-
   import threading
   _trace_thread = threading.Thread(target=_trace_thread_proc)
   _trace_thread.daemon = True
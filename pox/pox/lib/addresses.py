@@ -26,48 +26,167 @@ if 'long' not in sys.modules['__builtin__'].__dict__:
   long = int
 
 
-"""
-# Unfinished oui name stuff formerly from packet library.
-
-    oui = int(a[0]) << 16 | int(a[1]) << 8 | int(a[2])
+def _parse_oui_txt (f):
+  """
+  Generates (oui, name) pairs from the IEEE oui.txt file f
+  """
+  for line in f:
+    if len(line) < 1:
+      continue
+    if line[0].isspace():
+      continue
+    split = line.split(' ')
+    if not '-' in split[0]:
+      continue
+    # grab 3-byte OUI
+    oui_str  = split[0].replace('-','')
+    # strip off (hex) identifer and keep rest of name
+    end = ' '.join(split[1:]).strip()
+    end = end.split('\t')
+    end.remove('(hex)')
+    oui_name = ' '.join(end)
+    # convert oui to int
+    yield int(oui_str, 16), oui_name.strip()
+
+
+class _OUINames (object):
+  """
+  OUI -> vendor name table which is only loaded when first used
+
+  Acts like a read-only dict keyed by 24 bit OUI.  Parsing oui.txt takes
+  a noticeable part of startup, so lookups go to a compact index file
+  (oui.idx) instead, which is built from oui.txt the first time it's
+  needed and rebuilt whenever oui.txt is newer.  The index is a header,
+  a sorted array of OUIs, an array of offsets and a blob of names.  We
+  mmap it where we can and binary search it in place.
+  """
+  _header = struct.Struct("!8sLL") # magic, count, blob length
+  _magic = b"POXOUI01"
 
-    # check if globally unique
-    if resolve_name and not (a[0] & 0x2):
-        if _ethoui2name.has_key(oui):
-            return "(%s):%02x:%02x:%02x" %( _ethoui2name[oui], a[3],a[4],a[5])
-"""
-_eth_oui_to_name = {}
+  def __init__ (self, txt_file, idx_file):
+    self.txt_file = txt_file
+    self.idx_file = idx_file
+    self._data = None
+    self._count = 0
 
-def _load_oui_names ():
-    import inspect
-    import os.path
-    filename = os.path.join(os.path.dirname(inspect.stack()[0][1]), 'oui.txt')
-    f = None
+  @classmethod
+  def build_index (cls, names):
+    """
+    Returns index bytes for a dict of names
+    """
+    ouis = sorted(names)
+    offsets = [0]
+    blob = []
+    for oui in ouis:
+      name = names[oui]
+      if not isinstance(name, bytes): name = name.encode('utf-8')
+      blob.append(name)
+      offsets.append(offsets[-1] + len(name))
+    blob = b''.join(blob)
+    return b''.join([cls._header.pack(cls._magic, len(ouis), len(blob)),
+                     struct.pack("!%dL" % (len(ouis),), *ouis),
+                     struct.pack("!%dL" % (len(offsets),), *offsets),
+                     blob])
+
+  def _check (self, data):
+    if len(data) < self._header.size: return False
+    magic,count,blob_len = self._header.unpack_from(data, 0)
+    if magic != self._magic: return False
+    if len(data) != self._header.size + count * 8 + 4 + blob_len: return False
+    self._count = count
+    return True
+
+  def _map_index (self):
+    import os
     try:
-        f = open(filename)
-        for line in f.readlines():
-            if len(line) < 1:
-                continue
-            if line[0].isspace():
-                continue
-            split = line.split(' ')
-            if not '-' in split[0]:
-                continue
-            # grab 3-byte OUI
-            oui_str  = split[0].replace('-','')
-            # strip off (hex) identifer and keep rest of name
-            end = ' '.join(split[1:]).strip()
-            end = end.split('\t')
-            end.remove('(hex)')
-            oui_name = ' '.join(end)
-            # convert oui to int
-            oui = int(oui_str, 16)
-            _eth_oui_to_name[oui] = oui_name.strip()
-    except:
+      if os.path.getmtime(self.idx_file) < os.path.getmtime(self.txt_file):
+        return None
+    except OSError:
+      if not os.path.exists(self.idx_file): return None
+    try:
+      with open(self.idx_file, 'rb') as f:
+        try:
+          import mmap
+          data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+          data = f.read()
+    except Exception:
+      return None
+    if not self._check(data): return None
+    return data
+
+  def _build (self):
+    import os
+    import tempfile
+    with open(self.txt_file) as f:
+      data = self.build_index(dict(_parse_oui_txt(f)))
+    # Try to save it for next time, but it's fine if we can't
+    try:
+      fd,tmp = tempfile.mkstemp(dir=os.path.dirname(self.idx_file))
+      try:
+        with os.fdopen(fd, 'wb') as f:
+          f.write(data)
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, self.idx_file)
+      except Exception:
+        os.remove(tmp)
+    except Exception:
+      pass
+    self._check(data)
+    return data
+
+  def _load (self):
+    if self._data is not None: return self._data
+    data = self._map_index()
+    if data is None:
+      try:
+        data = self._build()
+      except Exception:
         import logging
         logging.getLogger().warn("Could not load OUI list")
-    if f: f.close()
-_load_oui_names()
+        data = self.build_index({})
+        self._check(data)
+    self._data = data
+    return data
+
+  def get (self, oui, default = None):
+    data = self._load()
+    base = self._header.size
+    lo = 0
+    hi = self._count
+    while lo < hi:
+      mid = (lo + hi) // 2
+      v = struct.unpack_from("!L", data, base + mid * 4)[0]
+      if v < oui:
+        lo = mid + 1
+      elif v > oui:
+        hi = mid
+      else:
+        base += self._count * 4 + mid * 4
+        start,end = struct.unpack_from("!LL", data, base)
+        base = self._header.size + self._count * 8 + 4
+        return data[base+start:base+end]
+    return default
+
+  def __getitem__ (self, oui):
+    r = self.get(oui)
+    if r is None: raise KeyError(oui)
+    return r
+
+  def __contains__ (self, oui):
+    return self.get(oui) is not None
+
+  def __len__ (self):
+    self._load()
+    return self._count
+
+
+def _make_oui_names ():
+  import os.path
+  d = os.path.dirname(os.path.abspath(__file__))
+  return _OUINames(os.path.join(d, 'oui.txt'), os.path.join(d, 'oui.idx'))
+
+_eth_oui_to_name = _make_oui_names()
 
 
 class EthAddr (object):
@@ -187,9 +306,14 @@ class EthAddr (object):
     Returns the address as string consisting of 12 hex chars separated
     by separator.
     If resolveNames is True, it may return company names based on
-    the OUI. (Currently unimplemented)
-    """
-    #TODO: show OUI info from packet lib ?
+    the OUI, e.g., "(Cisco):12:34:56".
+    """
+    if resolveNames and self.isGlobal():
+      v = self._value
+      name = _eth_oui_to_name.get(ord(v[0]) << 16 | ord(v[1]) << 8 | ord(v[2]))
+      if name:
+        return separator.join(['(%s)' % (name,)] +
+                              ['%02x' % (ord(x),) for x in v[3:]])
     return separator.join(('%02x' % (ord(x),) for x in self._value))
 
   def __str__ (self):
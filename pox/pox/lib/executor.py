@@ -0,0 +1,296 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Runs CPU-heavy work off of the cooperative scheduler
+
+Everything in POX normally runs in the recoco thread, so a long
+computation there holds up all IO until it's done.  An Executor runs
+callables in a few real threads (or, for pure Python code which would
+just fight over the GIL, in a pool of processes), and hands the results
+back within the cooperative context -- the callback and the WorkDone
+event both happen in the scheduler, so they can touch POX state freely.
+
+The function being run must not touch POX state itself; give it a
+snapshot of what it needs and apply the result in the callback.
+
+core.executor is a shared Executor:
+  def done (work):
+    if work.exception is None: use(work.result)
+  core.executor.submit(compute, args=(snapshot,), callback=done,
+                       key="myapp.compute")
+
+Submitting work with the same key as earlier work which hasn't been
+delivered yet cancels the earlier work, so a burst of changes results in
+one delivered recalculation based on the latest snapshot.
+"""
+
+from __future__ import with_statement
+from pox.core import core
+from pox.lib.revent import *
+from collections import deque
+import threading
+import time
+
+log = core.getLogger()
+
+
+class QueueFull (RuntimeError):
+  pass
+
+
+class WorkDone (Event):
+  """
+  Fired (in the cooperative context) when work finishes or fails
+  """
+  def __init__ (self, work):
+    Event.__init__(self)
+    self.work = work
+
+
+class Work (object):
+  """
+  A piece of work submitted to an Executor
+  """
+  QUEUED = "queued"
+  RUNNING = "running"
+  DONE = "done"
+  CANCELLED = "cancelled"
+
+  def __init__ (self, func, args, kw, callback, process, key):
+    self.func = func
+    self.args = args
+    self.kw = kw
+    self.callback = callback
+    self.process = process
+    self.key = key
+    self.state = self.QUEUED
+    self.result = None
+    self.exception = None
+    self.submitted_at = time.time()
+    self.started_at = None
+    self.finished_at = None
+    self._executor = None
+    self._finished = threading.Event()
+
+  @property
+  def done (self):
+    return self.state in (self.DONE, self.CANCELLED)
+
+  @property
+  def cancelled (self):
+    return self.state == self.CANCELLED
+
+  def cancel (self):
+    """
+    Cancels the work
+
+    The callback won't be called after this.  Returns True if the work
+    hadn't started yet (otherwise it runs to completion, but the result
+    is thrown away).
+    """
+    if self.done: return False
+    return self._executor._cancel(self)
+
+  def wait (self, timeout = None):
+    """
+    Waits for the work to run
+
+    Don't call this from the cooperative context; it blocks.  Returns
+    True if it ran (or was cancelled).
+    """
+    self._finished.wait(timeout)
+    return self._finished.is_set()
+
+  def __repr__ (self):
+    name = getattr(self.func, "__name__", self.func)
+    return "<%s %s %s>" % (type(self).__name__, name, self.state)
+
+
+class Executor (EventMixin):
+  """
+  Runs callables in threads or processes, delivering results via recoco
+
+  threads is how many pieces of work can run at once.  Process work is
+  handed to a multiprocessing.Pool with processes workers (default: one
+  per CPU), created the first time it's needed; it still occupies one of
+  the threads while it runs.  At most max_queued pieces of work may be
+  waiting; submit() raises QueueFull past that.
+  """
+  _eventMixin_events = set([WorkDone])
+
+  def __init__ (self, threads = 2, processes = None, max_queued = 1000):
+    self.threads = threads
+    self.processes = processes
+    self.max_queued = max_queued
+    self._queue = deque()
+    self._keys = {} # key -> undelivered Work
+    self._cond = threading.Condition()
+    self._workers = []
+    self._pool = None
+    self._running = 0
+    self._stopping = False
+
+    self.submitted = 0
+    self.completed = 0
+    self.failed = 0
+    self.cancelled = 0
+    self.rejected = 0
+    self.queued_high_water = 0
+    self.wait_time = 0.0 # Total seconds spent queued
+    self.run_time = 0.0 # Total seconds spent running
+
+    core.addListenerByName("DownEvent", self._handle_DownEvent)
+
+  def submit (self, func, args = (), kw = {}, callback = None,
+              process = False, key = None):
+    """
+    Queues func(*args, **kw) to run, and returns a Work
+
+    callback(work) is called in the cooperative context when it finishes
+    (check work.exception before using work.result).  If process is True,
+    it runs in another process, so func, its arguments and result must be
+    picklable.
+    """
+    work = Work(func, args, kw, callback, process, key)
+    work._executor = self
+    with self._cond:
+      if self._stopping:
+        raise RuntimeError("Executor is shut down")
+      if len(self._queue) >= self.max_queued:
+        self.rejected += 1
+        raise QueueFull("%i pieces of work already waiting"
+                        % (len(self._queue),))
+      if key is not None:
+        old = self._keys.get(key)
+        if old is not None:
+          self._cancel(old)
+        self._keys[key] = work
+      self._queue.append(work)
+      self.submitted += 1
+      self.queued_high_water = max(self.queued_high_water, len(self._queue))
+      if len(self._workers) < self.threads:
+        self._start_worker()
+      self._cond.notify()
+    return work
+
+  def get_stats (self):
+    with self._cond:
+      return dict(
+        submitted = self.submitted,
+        completed = self.completed,
+        failed = self.failed,
+        cancelled = self.cancelled,
+        rejected = self.rejected,
+        queued = len(self._queue),
+        running = self._running,
+        queued_high_water = self.queued_high_water,
+        wait_time = self.wait_time,
+        run_time = self.run_time,
+      )
+
+  def shutdown (self):
+    """
+    Cancels waiting work and stops the threads and processes
+    """
+    with self._cond:
+      self._stopping = True
+      for work in list(self._queue):
+        self._cancel(work)
+      self._cond.notifyAll()
+    if self._pool is not None:
+      self._pool.terminate()
+      self._pool = None
+
+  def _handle_DownEvent (self, event):
+    self.shutdown()
+
+  def _start_worker (self):
+    t = threading.Thread(target=self._worker_loop,
+                         name="Executor-%i" % (len(self._workers),))
+    t.daemon = True
+    self._workers.append(t)
+    t.start()
+
+  def _get_pool (self):
+    with self._cond:
+      if self._pool is None:
+        import multiprocessing
+        self._pool = multiprocessing.Pool(self.processes)
+      return self._pool
+
+  def _cancel (self, work):
+    with self._cond:
+      if work.done: return False
+      started = work.state != Work.QUEUED
+      if not started:
+        self._queue.remove(work)
+      work.state = Work.CANCELLED
+      if self._keys.get(work.key) is work:
+        del self._keys[work.key]
+      self.cancelled += 1
+    work._finished.set()
+    return not started
+
+  def _worker_loop (self):
+    while True:
+      with self._cond:
+        while not self._queue and not self._stopping:
+          self._cond.wait()
+        if self._stopping: return
+        work = self._queue.popleft()
+        work.state = Work.RUNNING
+        work.started_at = time.time()
+        self._running += 1
+
+      try:
+        if work.process:
+          work.result = self._get_pool().apply(work.func, work.args, work.kw)
+        else:
+          work.result = work.func(*work.args, **work.kw)
+      except Exception as e:
+        work.exception = e
+      work.finished_at = time.time()
+
+      with self._cond:
+        self._running -= 1
+        self.wait_time += work.started_at - work.submitted_at
+        self.run_time += work.finished_at - work.started_at
+      if core.running:
+        core.callLater(self._deliver, work)
+      else:
+        # Nobody to deliver it to, but don't leave it looking unfinished
+        self._cancel(work)
+
+  def _deliver (self, work):
+    """
+    Hands a finished piece of work back (in the cooperative context)
+    """
+    with self._cond:
+      if work.done: return # Cancelled while it ran
+      work.state = Work.DONE
+      if self._keys.get(work.key) is work:
+        del self._keys[work.key]
+      if work.exception is None:
+        self.completed += 1
+      else:
+        self.failed += 1
+
+    if work.exception is not None and work.callback is None:
+      log.error("%s failed: %s", work, work.exception)
+    if work.callback is not None:
+      try:
+        work.callback(work)
+      except Exception:
+        log.exception("While handling result of %s", work)
+    self.raiseEventNoErrors(WorkDone, work)
+    work._finished.set()
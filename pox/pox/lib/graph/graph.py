@@ -125,6 +125,22 @@ class Operator (object):
   def __repr__ (self):
     return "<%s>" % (self.__class__.__name__)
 
+  def _key (self):
+    """
+    Returns a hashable description of this query, or None
+
+    Queries with equal keys always give the same results on the same
+    graph, which is what lets Graph cache them.
+    """
+    return (type(self),)
+
+def _literal_key (v):
+  try:
+    hash(v)
+  except TypeError:
+    return None
+  return (Literal, type(v), v)
+
 class Literal (Operator):
   def __init__ (self, v):
     self._v = v
@@ -132,6 +148,8 @@ class Literal (Operator):
     return self._v
   def __repr__ (self):
     return repr(self._v)
+  def _key (self):
+    return _literal_key(self._v)
 
 class Anything (Operator):
   def __call__ (self, n, li):
@@ -202,6 +220,9 @@ class Call (Operator):
     func = arglist.pop(0)
     return func(*arglist, **kws)
 
+  def _key (self):
+    return None # Calls may not give the same answer twice
+
   def __repr__ (self):
     r = str(self._arg[0])
     args = [str(s) for s in self._arg[1:]]
@@ -222,6 +243,18 @@ class UnaryOp (Operator):
   def _apply (self, attr):
     raise RuntimeError("Unimplemented")
 
+  def _key (self):
+    k = self._operand._key()
+    if k is None: return None
+    return (type(self), k)
+
+def _binary_key (op, *extra):
+  l = op._left._key()
+  if l is None: return None
+  r = op._right._key()
+  if r is None: return None
+  return (type(op), l, r) + extra
+
 class BinaryOp (Operator):
   def __init__ (self, left, right):
     if isinstance(left, Operator):
@@ -241,6 +274,9 @@ class BinaryOp (Operator):
   def _apply (self, l, r):
     raise RuntimeError("Unimplemented")
 
+  def _key (self):
+    return _binary_key(self)
+
   def __repr__ (self):
     if hasattr(self, '_symbol'):
       return "%s %s %s" % (self._left, self._symbol, self._right)
@@ -326,6 +362,9 @@ class NodeOp (Operator):
   def _apply (self, l, r):
     raise RuntimeError("Unimplemented")
 
+  def _key (self):
+    return _binary_key(self)
+
   def __repr__ (self):
     if hasattr(self, '_symbol'):
       return "%s %s %s" % (self._left, self._symbol, self._right)
@@ -348,6 +387,9 @@ class Field (NodeOp):
     NodeOp.__init__(self, left, right)
     self._optional = optional
 
+  def _key (self):
+    return _binary_key(self, self._optional)
+
   def _apply (self, l, r):
     #print ">>",self._attr_name,hasattr(n, self._attr_name)
     do_call = r.endswith("()")
@@ -398,26 +440,134 @@ class Member (BinaryOp):
     super(Member, self).__init__(left, right)
     self._optional = optional
 
+  def _key (self):
+    return _binary_key(self, self._optional)
+
   def _apply (self, l, r):
     if not hasattr(l, r) and self._optional:
       raise LeaveException
     return getattr(l, r)
 
 
+def _smaller (a, b):
+  """
+  Returns the smaller of two candidate sets (where None means everything)
+  """
+  if a is None: return b
+  if b is None: return a
+  return a if len(a) <= len(b) else b
+
+
 class Graph (object):
-  def __init__ (self):
+  """
+  A graph of nodes connected by links between their ports
+
+  Queries (find(), get(), find_links(), etc.) normally have to look at
+  every node or link.  To speed them up:
+
+  * Nodes are always indexed by type, so queries using type=, is_a=,
+    IsType(...) or IsInstance(...) only look at nodes of the right type.
+  * add_index(name) indexes nodes by the value of an attribute, so that
+    queries like find(name=value) or find(Equal(F(name), value)) only
+    look at nodes with that value.  Since we can't tell when a node's
+    attribute changes, call reindex(node) after changing an indexed one.
+  * If cache_queries is True, results are remembered until the graph
+    changes (which bumps the version).  Changing attributes of nodes
+    doesn't count as a change unless you call reindex(), so only turn
+    this on if you do that.
+  """
+  _max_cached_queries = 256
+
+  def __init__ (self, cache_queries = False):
     self._g = nx.MultiGraph()
     self.node_port = {}
+    self.version = 0 # Bumped whenever the graph changes
+
+    self._by_type = {} # type -> set of nodes
+    self._indexes = {} # attribute name -> value -> set of nodes
+    self._indexed = {} # attribute name -> node -> value it's indexed under
+    self._unhashable = {} # attribute name -> nodes with unhashable values
+    self._free_port_hint = {} # node -> port to start looking for free ones
+
+    self._query_cache = {} if cache_queries else None
 
   def __contains__ (self, n):
     return n in self._g
 
+  def _changed (self):
+    self.version += 1
+
+  def _index_node (self, node):
+    t = type(node)
+    nodes = self._by_type.get(t)
+    if nodes is None:
+      nodes = self._by_type[t] = set()
+    nodes.add(node)
+    for name in self._indexes:
+      self._index_attr(name, node)
+
+  def _unindex_node (self, node):
+    nodes = self._by_type.get(type(node))
+    if nodes is not None:
+      nodes.discard(node)
+      if not nodes: del self._by_type[type(node)]
+    for name in self._indexes:
+      self._unindex_attr(name, node)
+
+  def _index_attr (self, name, node):
+    if not hasattr(node, name): return
+    value = getattr(node, name)
+    try:
+      nodes = self._indexes[name].get(value)
+    except TypeError:
+      self._unhashable[name].add(node)
+      return
+    if nodes is None:
+      nodes = self._indexes[name][value] = set()
+    nodes.add(node)
+    self._indexed[name][node] = value
+
+  def _unindex_attr (self, name, node):
+    self._unhashable[name].discard(node)
+    indexed = self._indexed[name]
+    if node not in indexed: return
+    value = indexed.pop(node)
+    nodes = self._indexes[name][value]
+    nodes.discard(node)
+    if not nodes: del self._indexes[name][value]
+
+  def add_index (self, name):
+    """
+    Index nodes by the value of the given attribute
+    """
+    if name in self._indexes: return
+    self._indexes[name] = {}
+    self._indexed[name] = {}
+    self._unhashable[name] = set()
+    for node in self._g.nodes():
+      self._index_attr(name, node)
+    self._changed()
+
+  def reindex (self, node):
+    """
+    Call after changing indexed attributes of node
+    """
+    for name in self._indexes:
+      self._unindex_attr(name, node)
+      self._index_attr(name, node)
+    self._changed()
+
   def add (self, node):
     self._g.add_node(node)
     self.node_port[node] = {}
+    self._index_node(node)
+    self._changed()
 
   def remove (self, node):
     self._g.remove_node(node)
+    self._unindex_node(node)
+    self._free_port_hint.pop(node, None)
+    self._changed()
 
   def neighbors (self, n):
     return self._g.neighbors(n)
@@ -446,22 +596,36 @@ class Graph (object):
     for e in remove:
       #print "remove",e
       self._g.remove_edge(*e)
+    if remove: self._changed()
     return len(remove)
 
   def unlink (self, np1, np2):
     count = 0
     if isinstance(np1, tuple):
-      count = disconnect_port(np1)
+      count = self.disconnect_port(np1)
     elif isinstance(np2, tuple):
-      count = disconnect_port(np2)
+      count = self.disconnect_port(np2)
     else:
       for n1, n2, k, d in self._g.edges([np1, np2], data=True, keys=True):
         self._g.remove_edge(n1,n2,k)
         del self.node_port[n1][d[LINK][n1][1]]
         del self.node_port[n2][d[LINK][n2][1]]
         count = count + 1
+      if count: self._changed()
     return count
 
+  def _free_port (self, node):
+    """
+    Picks an unused port number on node (for portless links)
+    """
+    used = self.node_port.get(node, {})
+    ports = getattr(node, "ports", ())
+    free = self._free_port_hint.get(node, 0)
+    while free in used or free in ports:
+      free += 1
+    self._free_port_hint[node] = free + 1
+    return free
+
   def link (self, np1, np2):
     """
     Links two nodes on given ports
@@ -474,33 +638,160 @@ class Graph (object):
       _ = np1[0]
     except:
       # portless (hacky)
-      for free in xrange(1000):
-        if free not in np1.ports:
-          np1 = (np1,free)
-          break
+      np1 = (np1,self._free_port(np1))
     try:
       _ = np2[0]
     except:
       # portless (hacky)
-      for free in xrange(1000):
-        if free not in np2.ports:
-          np2 = (np2,free)
-          break
-    self._g.add_node(np1[0])
-    self._g.add_node(np2[0])
+      np2 = (np2,self._free_port(np2))
+    for n in (np1[0], np2[0]):
+      if n not in self._g:
+        self._g.add_node(n)
+        self._index_node(n)
     self.disconnect_port(np1)
     self.disconnect_port(np2)
     self._g.add_edge(np1[0],np2[0],link=Link(np1,np2))
     self.node_port[np1[0]][np1[1]] = np2
     self.node_port[np2[0]][np2[1]] = np1
+    self._changed()
+
+  def _cached (self, key, func):
+    """
+    Returns func() or a remembered result of it from this graph version
+    """
+    cache = self._query_cache
+    if cache is None or key is None:
+      return func()
+    hit = cache.get(key)
+    if hit is not None and hit[0] == self.version:
+      return list(hit[1])
+    r = func()
+    if len(cache) >= self._max_cached_queries:
+      cache.clear()
+    cache[key] = (self.version, r)
+    return list(r)
+
+  @staticmethod
+  def _query_key (kind, args, kw = {}):
+    keys = [kind]
+    for a in args:
+      if a is None:
+        keys.append(None)
+        continue
+      if not isinstance(a, Operator): return None
+      k = a._key()
+      if k is None: return None
+      keys.append(k)
+    for name,v in sorted(kw.iteritems()):
+      k = _literal_key(v)
+      if k is None: return None
+      keys.append((name, k))
+    return tuple(keys)
+
+  def _type_candidates (self, t, exact):
+    if exact:
+      if isinstance(t, str):
+        r = set()
+        for typ,nodes in self._by_type.iteritems():
+          if typ.__name__ == t: r.update(nodes)
+        return r
+      return self._by_type.get(t, set())
+    r = set()
+    for typ,nodes in self._by_type.iteritems():
+      try:
+        if issubclass(typ, t): r.update(nodes)
+      except TypeError:
+        return None # isinstance() would raise too; let it
+    return r
+
+  def _attr_candidates (self, name, value):
+    if name not in self._indexes: return None
+    try:
+      nodes = self._indexes[name].get(value, ())
+    except TypeError:
+      return None
+    unhashable = self._unhashable[name]
+    if unhashable:
+      return set(nodes) | unhashable
+    return nodes
+
+  def _op_candidates (self, op):
+    """
+    Returns a set of nodes which includes every node op can be true for
+
+    Returns None if op gives us no hints.
+    """
+    if isinstance(op, And):
+      return _smaller(self._op_candidates(op._left),
+                      self._op_candidates(op._right))
+    if not isinstance(op, NodeOp): return None
+    if not isinstance(op._right, Literal):
+      if isinstance(op, Equal) and isinstance(op._left, Literal):
+        # value == F(name)
+        l,r = op._right,op._left
+      else:
+        return None
+    else:
+      l,r = op._left,op._right
+    if isinstance(op, IsType) and isinstance(l, Self):
+      return self._type_candidates(r._v, True)
+    if isinstance(op, IsInstance) and isinstance(l, Self):
+      return self._type_candidates(r._v, False)
+    if (isinstance(op, Equal) and type(l) is Field and l._optional
+        and isinstance(l._left, Self) and isinstance(l._right, Literal)):
+      return self._attr_candidates(l._right._v, r._v)
+    return None
+
+  def _candidates (self, args, kw):
+    """
+    Picks the smallest set of nodes which must contain all matches
+
+    Returns None if every node needs to be looked at.
+    """
+    best = None
+    for k,v in kw.iteritems():
+      if k == "is_a":
+        c = self._type_candidates(v, False)
+      elif k == "type":
+        c = self._by_type.get(v, set())
+      else:
+        c = self._attr_candidates(k, v)
+      best = _smaller(best, c)
+    for a in args:
+      best = _smaller(best, self._op_candidates(a))
+    return best
 
   def find_links (self, query1=None, query2=()):
     # No idea if new link query stuff works.
     if query2 is None: query2 = query1
     if query1 == (): query1 = None
     if query2 == (): query2 = None
+    return self._cached(self._query_key("links", (query1, query2)),
+                        lambda: self._find_links(query1, query2))
+
+  def _edges_for (self, query1, query2):
+    """
+    Returns the edges which could possibly match
+    """
+    # A match has a node matching query1 or query2 on at least one end,
+    # so if we can narrow either down, we only need the edges of those.
+    c1 = None if query1 is None else self._op_candidates(query1)
+    c2 = None if query2 is None else self._op_candidates(query2)
+    nodes = _smaller(c1, c2)
+    if nodes is None:
+      return self._g.edges(data=True, keys=True)
+    r = []
+    seen = set()
+    for n in nodes:
+      for n1,n2,k,d in self._g.edges_of(n, data=True, keys=True):
+        if k in seen: continue
+        seen.add(k)
+        r.append((n1,n2,k,d))
+    return r
+
+  def _find_links (self, query1, query2):
     o = set()
-    for n1,n2,k,d in self._g.edges(data=True, keys=True):
+    for n1,n2,k,d in self._edges_for(query1, query2):
       l = d[LINK]
       ok = False
       if query1 is None or self._test_node(l[0][0], args=(query1,), link=l):
@@ -596,10 +887,17 @@ class Graph (object):
     return True
 
   def find (self, *args, **kw):
+    return self._cached(self._query_key("nodes", args, kw),
+                        lambda: self._find(args, kw))
+
+  def _find (self, args, kw):
     r = []
     def test (n):
       return self._test_node(n, args, kw)
-    for n in self._g.nodes():
+    nodes = self._candidates(args, kw)
+    if nodes is None:
+      nodes = self._g.nodes()
+    for n in nodes:
       if test(n):
         r.append(n)
     return r
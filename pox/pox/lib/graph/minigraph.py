@@ -78,6 +78,30 @@ class MultiGraph (object):
 
     return r
 
+  def __contains__ (self, node):
+    return node in self._nodes
+
+  def __len__ (self):
+    return len(self._nodes)
+
+  def edges_of (self, node, data = False, keys = False):
+    """
+    Like edges([node]), but only looks at node's own edges
+    """
+    r = []
+    if node not in self._edges: return r
+    for other,edgelist in self._edges[node].iteritems():
+      for k,d in edgelist.iteritems():
+        if data and keys:
+          r.append((node,other,k,d))
+        elif data:
+          r.append((node,other,d))
+        elif keys:
+          r.append((node,other,k))
+        else:
+          r.append((node,other))
+    return r
+
   def neighbors (self, node):
     assert node in self._nodes
     return list(set(self._edges[node].keys()))
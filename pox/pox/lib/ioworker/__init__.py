@@ -24,6 +24,7 @@ import sys
 import errno
 from collections import deque
 import socket
+import select
 
 from pox.lib.util import assert_type, makePinger
 from pox.lib.recoco import Select, Task
@@ -42,6 +43,131 @@ def _call_safe (f, socket=None):
     log.exception(e)
 
 
+def _tobytes (chunk):
+  if type(chunk) is memoryview:
+    return chunk.tobytes()
+  return chunk
+
+
+class ChunkedBuffer (object):
+  """
+  A FIFO byte buffer which avoids copying
+
+  Data is kept as a queue of chunks (bytes or memoryviews) plus a read
+  offset into the first one.  Appending never touches data already in the
+  buffer, and consuming from the front just drops chunks and moves the
+  offset, so neither is proportional to the amount of data buffered.
+  Chunks are only joined together when someone asks to look at more data
+  than the first chunk holds.
+  """
+  def __init__ (self, data = None):
+    self._chunks = deque()
+    self._offset = 0 # Read offset into _chunks[0]
+    self._len = 0
+    if data: self.append(data)
+
+  def __len__ (self):
+    return self._len
+
+  def append (self, data):
+    if len(data) == 0: return
+    self._chunks.append(data)
+    self._len += len(data)
+
+  def _coalesce (self, length):
+    """
+    Makes sure the first chunk holds at least length bytes past the offset
+    """
+    chunks = self._chunks
+    first = chunks[0]
+    if len(first) - self._offset >= length: return
+    joined = bytearray(memoryview(first)[self._offset:])
+    chunks.popleft()
+    while len(joined) < length:
+      joined += chunks.popleft()
+    chunks.appendleft(bytes(joined))
+    self._offset = 0
+
+  def _prepare (self, length):
+    if length is None or length > self._len:
+      length = self._len
+    if length: self._coalesce(length)
+    return length
+
+  def peek (self, length = None):
+    """
+    Returns (up to) the first length bytes (default all) as bytes
+
+    If the data is held as memoryviews (e.g., it came from recv_into()),
+    this copies it.  Use peek_view() where a memoryview will do.
+    """
+    length = self._prepare(length)
+    if length == 0: return b""
+    first = self._chunks[0]
+    if self._offset == 0 and length == len(first):
+      return _tobytes(first)
+    return _tobytes(first[self._offset:self._offset+length])
+
+  def peek_view (self, length = None):
+    """
+    Returns (up to) the first length bytes (default all) as a memoryview
+
+    The view is only valid until the buffer is next modified.
+    """
+    length = self._prepare(length)
+    if length == 0: return memoryview(b"")
+    return memoryview(self._chunks[0])[self._offset:self._offset+length]
+
+  def views (self, max_count = 64, max_bytes = None):
+    """
+    Returns a list of memoryviews of the chunks at the front of the buffer
+
+    Suitable for scatter/gather IO (e.g., socket.sendmsg()).
+    """
+    r = []
+    total = 0
+    offset = self._offset
+    for chunk in self._chunks:
+      v = memoryview(chunk)[offset:]
+      offset = 0
+      r.append(v)
+      total += len(v)
+      if len(r) >= max_count: break
+      if max_bytes is not None and total >= max_bytes: break
+    return r
+
+  def consume (self, length):
+    """
+    Throws away the first length bytes
+    """
+    if length > self._len:
+      raise RuntimeError("Buffer underrun")
+    self._len -= length
+    chunks = self._chunks
+    while length:
+      remaining = len(chunks[0]) - self._offset
+      if length < remaining:
+        self._offset += length
+        break
+      length -= remaining
+      chunks.popleft()
+      self._offset = 0
+    if not chunks: self._offset = 0
+
+  def read (self, length = None):
+    """
+    Removes and returns (up to) the first length bytes (default all)
+    """
+    r = self.peek(length)
+    self.consume(len(r))
+    return r
+
+  def clear (self):
+    self._chunks.clear()
+    self._offset = 0
+    self._len = 0
+
+
 class IOWorker (object):
   """
   Generic IOWorker class.
@@ -50,8 +176,10 @@ class IOWorker (object):
   """
   def __init__(self):
     super(IOWorker,self).__init__()
-    self.send_buf = b""
-    self.receive_buf = b""
+    self._send_buffer = ChunkedBuffer()
+    self._receive_buffer = ChunkedBuffer()
+    self._recv_space = None # bytearray being filled by recv_into()
+    self._recv_fill = 0
     self.closed = False
 
     self._custom_rx_handler = None
@@ -81,9 +209,19 @@ class IOWorker (object):
     self.close()
     loop._workers.discard(self)
 
+  def _send_state_changed (self):
+    """
+    Called when _ready_to_send may have changed
+
+    That's when the send buffer goes from empty to non-empty or back, or
+    when we stop connecting.
+    """
+    pass
+
   def _try_connect (self, loop):
     if not self._connecting: return False
     self._connecting = False
+    self._send_state_changed()
     try:
       self.socket.recv(0)
     except socket.error as (s_errno, strerror):
@@ -103,10 +241,32 @@ class IOWorker (object):
     _call_safe(self._handle_connect)
     return False
 
+  def _recv (self, size):
+    """
+    Receives up to size bytes from the socket
+
+    Where the socket supports it, this receives straight into a shared
+    bytearray and returns a memoryview of the new data, which the receive
+    buffer then holds onto without copying.
+    """
+    recv_into = getattr(self.socket, "recv_into", None)
+    if recv_into is None:
+      return self.socket.recv(size)
+    space = self._recv_space
+    if space is None or len(space) - self._recv_fill < size // 4:
+      # Start a new one (chunks still refer to the old one)
+      space = self._recv_space = bytearray(max(size, 4096))
+      self._recv_fill = 0
+    start = self._recv_fill
+    view = memoryview(space)[start:start+size]
+    l = recv_into(view, len(view))
+    self._recv_fill += l
+    return view[:l]
+
   def _do_recv (self, loop):
     if self._connecting and self._try_connect(loop): return
     try:
-      data = self.socket.recv(loop._BUF_SIZE)
+      data = self._recv(loop._BUF_SIZE)
       if len(data) == 0:
         self.close()
         loop._workers.discard(self)
@@ -125,11 +285,17 @@ class IOWorker (object):
   def _do_send (self, loop):
     if self._connecting and self._try_connect(loop): return
     try:
-      if len(self.send_buf):
-        l = self.socket.send(self.send_buf)
+      if len(self._send_buffer):
+        sendmsg = getattr(self.socket, "sendmsg", None)
+        if sendmsg is not None:
+          # Scatter/gather straight from the chunks.  Only Python 3 sockets
+          # have sendmsg(); elsewhere, we copy up to _SEND_SIZE bytes below.
+          l = sendmsg(self._send_buffer.views(max_bytes=loop._SEND_SIZE))
+        else:
+          l = self.socket.send(self._send_buffer.peek(loop._SEND_SIZE))
         if l > 0:
           self._consume_send_buf(l)
-          if self._shutdown_send and len(self.send_buf) == 0:
+          if self._shutdown_send and len(self._send_buffer) == 0:
             self.socket.shutdown(socket.SHUT_WR)
     except socket.error as (s_errno, strerror):
       if s_errno != errno.EAGAIN:
@@ -143,7 +309,21 @@ class IOWorker (object):
     """
     Number of available bytes to read()
     """
-    return len(self.receive_buf)
+    return len(self._receive_buffer)
+
+  @property
+  def send_buf (self):
+    """
+    Data waiting to be sent (as bytes)
+    """
+    return self._send_buffer.peek()
+
+  @property
+  def receive_buf (self):
+    """
+    Data waiting to be read (as bytes)
+    """
+    return self._receive_buffer.peek()
 
   @property
   def connect_handler (self):
@@ -202,48 +382,55 @@ class IOWorker (object):
   def send (self, data):
     """ Send data.  Fire and forget. """
     assert assert_type("data", data, [bytes], none_ok=False)
-    self.send_buf += data
+    was_empty = len(self._send_buffer) == 0
+    self._send_buffer.append(data)
+    if was_empty and len(self._send_buffer):
+      self._send_state_changed()
 
   def _push_receive_data (self, new_data):
     # notify client of new received data. called by a Select loop
-    self.receive_buf += new_data
+    self._receive_buffer.append(new_data)
     self._handle_rx()
 
   def peek (self, length = None):
     """ Peek up to length bytes from receive buffer. """
-    if length is None:
-      return self.receive_buf
-    else:
-      return self.receive_buf[:length]
+    return self._receive_buffer.peek(length)
+
+  def peek_view (self, length = None):
+    """
+    Peek up to length bytes from receive buffer as a memoryview
+
+    The view is only good until the buffer is next changed (e.g., by
+    consume_receive_buf()).
+    """
+    return self._receive_buffer.peek_view(length)
 
   def consume_receive_buf (self, l):
     """ Consume receive buffer """
     # called from the client
-    if len(self.receive_buf) < l:
+    if len(self._receive_buffer) < l:
       raise RuntimeError("Receive buffer underrun")
-    self.receive_buf = self.receive_buf[l:]
+    self._receive_buffer.consume(l)
 
   def read (self, length = None):
     """
     Read up to length bytes from receive buffer
     (defaults to all)
     """
-    if length is None:
-      length = len(self.receive_buf)
-    r = self.receive_buf[:length]
-    self.receive_buf = self.receive_buf[length:]
-    return r
+    return self._receive_buffer.read(length)
 
   @property
   def _ready_to_send (self):
     # called by Select loop
-    return len(self.send_buf) > 0 or self._connecting
+    return len(self._send_buffer) > 0 or self._connecting
 
   def _consume_send_buf (self, l):
     # Throw out the first l bytes of the send buffer
     # Called by Select loop
-    assert(len(self.send_buf)>=l)
-    self.send_buf = self.send_buf[l:]
+    assert(len(self._send_buffer)>=l)
+    self._send_buffer.consume(l)
+    if len(self._send_buffer) == 0:
+      self._send_state_changed()
 
   def close (self):
     """ Close this socket """
@@ -269,6 +456,7 @@ class RecocoIOWorker (IOWorker):
 
   # Set by register
   on_close = None
+  on_send_state = None
   pinger = None
 
   def __init__ (self, socket):
@@ -289,12 +477,12 @@ class RecocoIOWorker (IOWorker):
     Must only be called from the same cooperative context as the
     IOWorker.
     """
-    if len(self.send_buf)==0 and not self._connecting and not self.closed:
+    if len(self._send_buffer)==0 and not self._connecting and not self.closed:
       try:
         l = self.socket.send(data, socket.MSG_DONTWAIT)
-        if l == len(self.send_buf):
+        if l == len(data):
           return
-        data = data[l]
+        data = data[l:]
       except socket.error as (s_errno, strerror):
         if s_errno != errno.EAGAIN:
           log.error("Socket error: " + strerror)
@@ -308,6 +496,10 @@ class RecocoIOWorker (IOWorker):
     IOWorker.send(self, data)
     self.pinger.ping()
 
+  def _send_state_changed (self):
+    if self.on_send_state is not None:
+      self.on_send_state(self)
+
   def close (self):
     """ Register this socket to be closed. fire and forget """
     # (don't close until Select loop is ready)
@@ -353,6 +545,7 @@ class RecocoIOLoop (Task):
   """
   _select_timeout = 5
   _BUF_SIZE = 8192
+  _SEND_SIZE = 65536 # Most we try to send at once
   more_debugging = False
 
   def __init__ (self, worker_type = RecocoIOWorker):
@@ -396,8 +589,8 @@ class RecocoIOLoop (Task):
     def on_close (worker):
       def close_worker (worker):
         # Actually close the worker (called by Select loop)
+        self._remove_worker(worker)
         worker.socket.close()
-        self._workers.discard(worker)
       # schedule close_worker to be called by Select loop
       self._pending_commands.append(lambda: close_worker(worker))
       self.pinger.ping()
@@ -406,9 +599,15 @@ class RecocoIOLoop (Task):
     worker.pinger = self.pinger
 
     # Don't add immediately, since we may be in the wrong thread
-    self._pending_commands.append(lambda: self._workers.add(worker))
+    self._pending_commands.append(lambda: self._add_worker(worker))
     self.pinger.ping()
 
+  def _add_worker (self, worker):
+    self._workers.add(worker)
+
+  def _remove_worker (self, worker):
+    self._workers.discard(worker)
+
   def stop (self):
     self.running = False
     self.pinger.ping()
@@ -461,3 +660,142 @@ class RecocoIOLoop (Task):
       except BaseException as e:
         log.exception(e)
         break
+
+
+if hasattr(select, "epoll"):
+  _EPOLL_READ = select.EPOLLIN | select.EPOLLPRI
+  _EPOLL_WRITE = select.EPOLLOUT
+
+
+class EpollIOLoop (RecocoIOLoop):
+  """
+  A RecocoIOLoop which keeps its workers registered with epoll
+
+  RecocoIOLoop builds read, write, and exception lists out of every
+  worker on every trip around its loop.  This one registers each worker
+  with an epoll object once and only changes the registration when a
+  worker's write interest changes (i.e., its send buffer becomes empty or
+  non-empty).  The loop then just selects on the epoll object itself,
+  so the work per trip depends on the number of busy workers rather than
+  the total number of workers.
+
+  Only available where select.epoll is (i.e., Linux).
+  """
+  def __init__ (self, worker_type = RecocoIOWorker):
+    super(EpollIOLoop,self).__init__(worker_type)
+    self._epoll = select.epoll()
+    self._fds = {} # Worker -> fd
+    self._fd_workers = {} # fd -> worker
+    self._masks = {} # fd -> registered epoll mask
+    self._interest_changed = set() # Workers to check write interest of
+
+  def register_worker (self, worker):
+    worker.on_send_state = self._interest_changed.add
+    super(EpollIOLoop,self).register_worker(worker)
+
+  def _add_worker (self, worker):
+    if worker.closed: return
+    fd = worker.fileno()
+    mask = _EPOLL_READ
+    if worker._ready_to_send: mask |= _EPOLL_WRITE
+    self._epoll.register(fd, mask)
+    self._fds[worker] = fd
+    self._fd_workers[fd] = worker
+    self._masks[fd] = mask
+    self._workers.add(worker)
+
+  def _remove_worker (self, worker):
+    self._workers.discard(worker)
+    self._interest_changed.discard(worker)
+    fd = self._fds.pop(worker, None)
+    if fd is None: return
+    del self._fd_workers[fd]
+    del self._masks[fd]
+    try:
+      self._epoll.unregister(fd)
+    except Exception:
+      pass
+
+  def _update_interest (self):
+    changed = self._interest_changed
+    while changed:
+      worker = changed.pop()
+      fd = self._fds.get(worker)
+      if fd is None: continue
+      mask = _EPOLL_READ
+      if worker._ready_to_send: mask |= _EPOLL_WRITE
+      if self._masks[fd] != mask:
+        self._masks[fd] = mask
+        self._epoll.modify(fd, mask)
+
+  def poll (self):
+    """
+    Returns the sets of workers which are readable, writable, and broken
+    """
+    readable = set()
+    writable = set()
+    broken = set()
+    fd_workers = self._fd_workers
+    for fd,event in self._epoll.poll(0):
+      worker = fd_workers.get(fd)
+      if worker is None: continue
+      if event & select.EPOLLERR:
+        broken.add(worker)
+        continue
+      # A hangup looks like a read of zero bytes, as with select()
+      if event & (_EPOLL_READ | select.EPOLLHUP): readable.add(worker)
+      if event & _EPOLL_WRITE: writable.add(worker)
+    return readable, writable, broken
+
+  def run (self):
+    self.running = True
+
+    while self.running and core.running:
+      try:
+        # First, execute pending commands
+        while len(self._pending_commands) > 0:
+          self._pending_commands.popleft()()
+        self._update_interest()
+
+        # The epoll object is readable when any of its fds are ready
+        rlist, wlist, elist = yield Select([self._epoll, self.pinger], [],
+                                           [], self._select_timeout)
+
+        if self.pinger in rlist:
+          self.pinger.pongAll()
+
+        readable, writable, broken = self.poll()
+
+        if self.more_debugging:
+          log.debug("Select Out: " + _format_lists(readable, writable,
+                                                   broken))
+
+        for worker in broken:
+          worker._do_exception(self)
+          self._remove_worker(worker)
+
+        for worker in readable:
+          if worker not in broken:
+            worker._do_recv(self)
+
+        for worker in writable:
+          if worker not in broken:
+            worker._do_send(self)
+
+      except GeneratorExit:
+        # Must be shutting down
+        break
+      except BaseException as e:
+        log.exception(e)
+        break
+
+    self._epoll.close()
+
+
+def new_ioloop (*args, **kw):
+  """
+  Returns an EpollIOLoop if possible, otherwise a RecocoIOLoop
+  """
+  if hasattr(select, "epoll"):
+    return EpollIOLoop(*args, **kw)
+  return RecocoIOLoop(*args, **kw)
@@ -0,0 +1,184 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Detects keys (ports, hosts, ...) which send faster than a given rate
+
+A RateDetector keeps a token bucket for each key it has seen, but instead
+of an object per key, the buckets live in flat arrays indexed by a slot
+number, with one dict mapping keys to slots.  Memory is bounded by
+max_keys:
+ * A bucket which has refilled completely is no different from a new one,
+   so expire() frees its slot without changing any result.  Call it now
+   and then (e.g., from a Timer); it scans every slot.
+ * If all slots are in use, a new key evicts an old one, picked with the
+   CLOCK algorithm (an approximation of least recently used), so a flood
+   of new keys costs O(1) per key.
+
+  d = RateDetector(rate=100, burst=200)
+  if d.hit((dpid, port)):
+    # Over 100/sec (after a burst of 200)
+
+Normally an event over the rate leaves the bucket as it was, so a key
+sending steadily faster than the rate still gets the rate through.  With
+drain=True, an event over the rate empties the bucket instead, so a key
+only gets through again after being quiet for 1/rate seconds.  (With
+burst 1, that's "over if less than 1/rate seconds since the last event".)
+"""
+
+from array import array
+import time
+
+
+class RateDetector (object):
+  """
+  Token buckets for many keys, in compact arrays
+  """
+  def __init__ (self, rate, burst = 1, max_keys = 4096, drain = False):
+    if rate <= 0:
+      raise ValueError("rate must be positive")
+    if burst < 1:
+      raise ValueError("burst must be at least 1")
+    if max_keys < 1:
+      raise ValueError("max_keys must be at least 1")
+    self.rate = float(rate)
+    self.burst = float(burst)
+    self.max_keys = max_keys
+    self.drain = drain
+
+    self._slots = {} # key -> slot
+    self._keys = [] # slot -> key (None if free)
+    self._free = [] # Free slots
+    self._tokens = array('d')
+    self._last = array('d') # When the slot's bucket was last updated
+    self._hits = array('L') # Events for the key
+    self._over = array('L') # Events over the rate
+    self._referenced = bytearray() # Hit since the clock hand last passed
+    self._hand = 0
+
+    self.evicted = 0 # Keys forgotten early to make room
+    self.expired = 0 # Keys forgotten because they'd gone quiet
+
+  def __len__ (self):
+    return len(self._slots)
+
+  def __contains__ (self, key):
+    return key in self._slots
+
+  @property
+  def refill_time (self):
+    """
+    Seconds a key must be quiet before its bucket is full again
+    """
+    return self.burst / self.rate
+
+  def hit (self, key, now = None):
+    """
+    Counts an event for key; returns True if it's over the rate
+    """
+    if now is None: now = time.time()
+    slot = self._slots.get(key)
+    if slot is None:
+      slot = self._new_slot(key, now)
+    else:
+      self._referenced[slot] = 1
+    tokens = self._tokens[slot] + (now - self._last[slot]) * self.rate
+    if tokens > self.burst: tokens = self.burst
+    self._last[slot] = now
+    self._hits[slot] += 1
+    if tokens < 1:
+      self._tokens[slot] = 0 if self.drain else tokens
+      self._over[slot] += 1
+      return True
+    self._tokens[slot] = tokens - 1
+    return False
+
+  def _new_slot (self, key, now):
+    if not self._free and len(self._keys) >= self.max_keys:
+      self._evict()
+    if self._free:
+      slot = self._free.pop()
+      self._keys[slot] = key
+      self._tokens[slot] = self.burst
+      self._last[slot] = now
+      self._hits[slot] = 0
+      self._over[slot] = 0
+      self._referenced[slot] = 0
+    else:
+      slot = len(self._keys)
+      self._keys.append(key)
+      self._tokens.append(self.burst)
+      self._last.append(now)
+      self._hits.append(0)
+      self._over.append(0)
+      self._referenced.append(0)
+    self._slots[key] = slot
+    return slot
+
+  def _release (self, slot):
+    del self._slots[self._keys[slot]]
+    self._keys[slot] = None
+    self._free.append(slot)
+
+  def _evict (self):
+    """
+    Frees a slot by evicting a key
+
+    Only called when every slot is in use.
+    """
+    referenced = self._referenced
+    size = len(self._keys)
+    while True:
+      slot = self._hand
+      self._hand = (slot + 1) % size
+      if referenced[slot]:
+        referenced[slot] = 0 # Second chance
+        continue
+      self._release(slot)
+      self.evicted += 1
+      return
+
+  def expire (self, now = None):
+    """
+    Forgets keys whose buckets have refilled; returns how many
+    """
+    if now is None: now = time.time()
+    cutoff = now - self.refill_time
+    last = self._last
+    keys = self._keys
+    count = 0
+    for slot in xrange(len(keys)):
+      if keys[slot] is not None and last[slot] <= cutoff:
+        self._release(slot)
+        count += 1
+    self.expired += count
+    return count
+
+  def forget (self, key):
+    """
+    Forgets a key (e.g., because it's been dealt with some other way)
+    """
+    slot = self._slots.get(key)
+    if slot is not None:
+      self._release(slot)
+
+  def get (self, key):
+    """
+    Returns (events, events over the rate) for key, or None if unknown
+    """
+    slot = self._slots.get(key)
+    if slot is None: return None
+    return (self._hits[slot], self._over[slot])
+
+  def get_stats (self):
+    return dict(keys = len(self._slots), slots = len(self._keys),
+                evicted = self.evicted, expired = self.expired)
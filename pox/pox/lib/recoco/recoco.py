@@ -142,6 +142,10 @@ class Scheduler (object):
     self._callLaterTask = None
     self._allDone = False
 
+    # If set, this is called as task_timer(task, seconds) each time a
+    # task runs (see pox.info.metrics)
+    self.task_timer = None
+
     global defaultScheduler
     if isDefaultScheduler or (isDefaultScheduler is None and
                               defaultScheduler is None):
@@ -269,6 +273,8 @@ class Scheduler (object):
 
     #print(len(self._ready), "tasks")
 
+    timer = self.task_timer
+    if timer is not None: start = time.time()
     try:
       rv = t.execute()
     except StopIteration:
@@ -280,6 +286,8 @@ class Scheduler (object):
       except:
         pass
       return True
+    finally:
+      if timer is not None: timer(t, time.time() - start)
 
     if isinstance(rv, BlockingOperation):
       try:
@@ -100,6 +100,12 @@ import operator
 # handler set will not keep the source (publisher) alive.
 import weakref
 
+from time import time as _time
+
+# If set, this is called as handler_timer(event_type, handler, seconds)
+# after each event handler runs (see pox.info.metrics).
+handler_timer = None
+
 
 _nextEventID = 0
 def _generateEventID ():
@@ -273,11 +279,14 @@ class EventMixin (object):
     # Create a copy so that it can be modified freely during event
     # processing.  It might make sense to change this.
     handlers = self._eventMixin_handlers.get(eventType, [])
+    timer = handler_timer
     for (priority, handler, once, eid) in handlers:
+      if timer is not None: start = _time()
       if classCall:
         rv = event._invoke(handler, *args, **kw)
       else:
         rv = handler(event, *args, **kw)
+      if timer is not None: timer(eventType, handler, _time() - start)
       if once: self.removeListener(eid)
       if rv is None: continue
       if rv is False:
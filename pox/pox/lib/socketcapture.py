@@ -14,8 +14,11 @@
 
 from pox.lib.addresses import *
 import pox.lib.packet as pkt
+from pox.lib.packet.packet_utils import checksum
 
-from struct import pack
+from struct import pack, pack_into, unpack
+from threading import Thread
+from Queue import Queue
 import time
 
 
@@ -128,6 +131,193 @@ class PCapWriter (object):
     e.next.next.seq += l
     e2.next.next.ack += l
 
+  def flush (self):
+    self._out.flush()
+
+  def close (self):
+    self._out.close()
+
+
+# Offsets into the synthetic Ethernet/IPv4/TCP header
+_IP_LEN_OFF = 14 + 2
+_IP_CSUM_OFF = 14 + 10
+_TCP_SEQ_OFF = 34 + 4
+_TCP_CSUM_OFF = 34 + 16
+_HDR_LEN = 54
+
+
+class BufferedPCapWriter (PCapWriter):
+  """
+  A lower-overhead PCapWriter
+
+  Rather than re-packing a packet object for every write, this packs the
+  synthetic Ethernet/IP/TCP header for each direction once and then just
+  patches the length, sequence/ack numbers, and checksums in place.
+  Records are collected in memory and written out in chunks of around
+  buffer_size bytes, optionally from a background thread.
+
+  Additional options over PCapWriter:
+  buffer_size is roughly how many bytes to collect before writing.
+  threaded does the actual file writes in a separate thread.
+  sample writes only one of every sample messages.  Skipped messages still
+    advance the TCP sequence numbers, so tools see them as missing data.
+  tcp_checksum computes real TCP checksums (they're left as zero
+    otherwise, which most tools don't complain about by default).
+  """
+  def __init__ (self, outstream, socket = None, flush = False,
+                local_addrs = (None,None,None),
+                remote_addrs = (None,None,None),
+                buffer_size = 1 << 20, threaded = False, sample = 1,
+                tcp_checksum = False):
+    super(BufferedPCapWriter,self).__init__(outstream, socket=socket,
+                                            flush=flush,
+                                            local_addrs=local_addrs,
+                                            remote_addrs=remote_addrs)
+    self.buffer_size = buffer_size
+    self.sample = max(1, int(sample))
+    self.tcp_checksum = tcp_checksum
+
+    self.written = 0 # Messages written
+    self.skipped = 0 # Messages skipped due to sampling
+
+    self._count = 0
+    self._buf = []
+    self._buf_len = 0
+
+    # [header template, IP checksum base, pseudo-header, seq, ack]
+    self._dirs = {}
+    for outgoing,e in ((True,self._c_to_s),(False,self._s_to_c)):
+      e.payload.payload.payload = b''
+      hdr = bytearray(e.pack())
+      assert len(hdr) == _HDR_LEN
+      hdr[_IP_LEN_OFF:_IP_LEN_OFF+2] = b'\0\0'
+      hdr[_IP_CSUM_OFF:_IP_CSUM_OFF+2] = b'\0\0'
+      hdr[_TCP_CSUM_OFF:_TCP_CSUM_OFF+2] = b'\0\0'
+      # Sum of the IP header with zeroed length and checksum
+      base = sum(unpack("!10H", bytes(hdr[14:34])))
+      pseudo = bytes(hdr[26:34]) + pack("!BB", 0, pkt.ipv4.TCP_PROTOCOL)
+      self._dirs[outgoing] = [hdr, base, pseudo, 0, 0]
+
+    self._q = None
+    if threaded:
+      self._q = Queue()
+      self._thread = Thread(target=self._writer_threadproc)
+      self._thread.daemon = True
+      self._thread.start()
+
+  def write (self, outgoing, buf):
+    l = len(buf)
+    if l == 0: return
+    d = self._dirs[outgoing]
+    other = self._dirs[not outgoing]
+    seq = d[3]
+    d[3] = (seq + l) & 0xffffffff
+    other[4] = (other[4] + l) & 0xffffffff
+
+    self._count += 1
+    if self._count % self.sample:
+      self.skipped += 1
+      return
+    self.written += 1
+
+    hdr = d[0]
+    iplen = (l + 40) & 0xffff
+    s = d[1] + iplen
+    s = (s >> 16) + (s & 0xffff)
+    s += s >> 16
+    pack_into("!H", hdr, _IP_LEN_OFF, iplen)
+    pack_into("!H", hdr, _IP_CSUM_OFF, ~s & 0xffff)
+    pack_into("!II", hdr, _TCP_SEQ_OFF, seq, d[4])
+    if self.tcp_checksum:
+      hdr[_TCP_CSUM_OFF:_TCP_CSUM_OFF+2] = b'\0\0'
+      csum = checksum(d[2] + pack("!H", l + 20) + bytes(hdr[34:]) + buf)
+      pack_into("!H", hdr, _TCP_CSUM_OFF, csum)
+
+    t = time.time()
+    ut = int((t - int(t)) * 1000000)
+    size = l + _HDR_LEN
+    self._buf.append(pack("IIII", int(t), ut, size, size))
+    self._buf.append(bytes(hdr))
+    self._buf.append(buf)
+    self._buf_len += size + 16
+    if self._buf_len >= self.buffer_size or self._flush:
+      self.flush()
+
+  def flush (self):
+    """
+    Hands everything buffered so far to the output stream
+    """
+    if self._buf:
+      data = b''.join(self._buf)
+      self._buf = []
+      self._buf_len = 0
+      if self._q is not None:
+        self._q.put(data)
+        return
+      self._out.write(data)
+    if self._q is None:
+      self._out.flush()
+
+  def close (self):
+    self.flush()
+    if self._q is not None:
+      self._q.put(None)
+      self._thread.join()
+      self._q = None
+    self._out.close()
+
+  def _writer_threadproc (self):
+    while True:
+      data = self._q.get()
+      if data is None: break
+      self._out.write(data)
+      self._out.flush()
+
+
+class PCapRingFile (object):
+  """
+  A file-like object which rotates between several files
+
+  Writes go to filename until it grows beyond max_bytes, at which point
+  it moves on to filename.1, filename.2, ... and wraps back to filename
+  after max_files files.  The first thing written (a pcap file header, when
+  used with a PCapWriter) is repeated at the start of every file so that
+  each one can be opened on its own.
+  """
+  def __init__ (self, filename, max_bytes = 64 << 20, max_files = 4):
+    self.filename = filename
+    self.max_bytes = max_bytes
+    self.max_files = max(1, max_files)
+    self._header = None
+    self._index = 0
+    self._size = 0
+    self._f = open(self._name(0), "wb")
+
+  def _name (self, index):
+    if index == 0: return self.filename
+    return "%s.%i" % (self.filename, index)
+
+  def write (self, data):
+    if self._header is None:
+      self._header = data
+    elif self._size + len(data) > self.max_bytes and self._size:
+      self._rotate()
+    self._f.write(data)
+    self._size += len(data)
+
+  def _rotate (self):
+    self._f.close()
+    self._index = (self._index + 1) % self.max_files
+    self._f = open(self._name(self._index), "wb")
+    self._f.write(self._header)
+    self._size = len(self._header)
+
+  def flush (self):
+    self._f.flush()
+
+  def close (self):
+    self._f.close()
+
 
 class CaptureSocket (SocketWedge):
   """
@@ -135,7 +325,8 @@ class CaptureSocket (SocketWedge):
   """
   def __init__ (self, socket, outstream, close = True,
                 local_addrs = (None,None,None),
-                remote_addrs = (None,None,None)):
+                remote_addrs = (None,None,None),
+                writer_class = PCapWriter, **writer_kw):
     """
     socket is the socket to be wrapped.
     outstream is the stream to write the PCAP trace to.
@@ -143,12 +334,14 @@ class CaptureSocket (SocketWedge):
     fake IP and TCP addresses as well.  Thus, you can specify local_addrs
     or remote_addrs.  These are tuples of (EthAddr, IPAddr, TCPPort).
     Any item that is None gets a default value.
+    writer_class is the PCapWriter (sub)class to use; extra keyword
+    arguments are passed along to it.
     """
     super(CaptureSocket, self).__init__(socket)
     self._close = close
-    self._writer = PCapWriter(outstream, socket=socket,
-                              local_addrs=local_addrs,
-                              remote_addrs=remote_addrs)
+    self._writer = writer_class(outstream, socket=socket,
+                                local_addrs=local_addrs,
+                                remote_addrs=remote_addrs, **writer_kw)
 
 
   def _recv_out (self, buf):
@@ -166,7 +359,7 @@ class CaptureSocket (SocketWedge):
   def close (self, *args, **kw):
     if self._close:
       try:
-        self._writer._out.close()
+        self._writer.close()
       except Exception:
         pass
     return self._socket.close(*args, **kw)
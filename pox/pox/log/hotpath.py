@@ -0,0 +1,244 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Logging for code that runs for every packet
+
+Formatting a log message takes time even if nobody ever sees it, and a
+flood of PacketIns easily turns into a flood of log lines (and blocking
+writes to a terminal or file).  This module has a few helpers for that:
+
+ * lazy(func, *args) is a log argument which only calls func (e.g., to
+   stringify a whole OpenFlow message) if the message is actually emitted.
+ * HotLogger wraps a logger.  It checks whether the level is enabled before
+   doing anything else, can rate limit and/or sample messages, and keeps
+   counters of what it emitted and what it suppressed.
+ * AsyncHandler queues records and writes them from a background thread.
+   If the queue fills up, records are dropped (and counted) rather than
+   blocking the caller.
+
+You can send all logging through an AsyncHandler from the commandline:
+  ./pox.py log --file=pox.log log.hotpath --async
+
+Put log.hotpath after any other log components, since it wraps whatever
+handlers are there when it launches.  get_counters() returns the counters
+of all HotLoggers and AsyncHandlers.
+"""
+
+import logging
+import threading
+import time
+import weakref
+import Queue
+
+
+class lazy (object):
+  """
+  A log argument which is only formatted if the message is emitted
+
+  log.debug("Got %s", lazy(msg.show))
+  """
+  __slots__ = ('func', 'args')
+
+  def __init__ (self, func, *args):
+    self.func = func
+    self.args = args
+
+  def __str__ (self):
+    return str(self.func(*self.args))
+
+  __repr__ = __str__
+
+
+_hot_loggers = weakref.WeakSet()
+_async_handlers = weakref.WeakSet()
+
+
+class HotLogger (object):
+  """
+  Wraps a logger for use on hot paths
+
+  rate and burst give a token bucket (messages/sec) shared by all levels.
+  If sample is N, only every Nth message is considered.  When messages
+  have been dropped by the rate limit, the next one emitted says how many.
+  """
+  def __init__ (self, logger, rate = None, burst = None, sample = None):
+    if isinstance(logger, basestring):
+      logger = logging.getLogger(logger)
+    self.logger = logger
+    self.rate = rate
+    self.burst = burst if burst is not None else (rate or 0)
+    self.sample = sample
+    self._tokens = self.burst
+    self._last = time.time()
+    self._seen = 0
+    self._unreported = 0 # Suppressed since we last emitted
+
+    self.emitted = 0
+    self.suppressed = 0 # Dropped by rate limiting or sampling
+    self.disabled = 0 # Below the logger's level
+
+    _hot_loggers.add(self)
+
+  @property
+  def name (self):
+    return self.logger.name
+
+  def isEnabledFor (self, level):
+    return self.logger.isEnabledFor(level)
+
+  def log (self, level, msg, *args, **kw):
+    if not self.logger.isEnabledFor(level):
+      self.disabled += 1
+      return
+    if self.sample:
+      self._seen += 1
+      if self._seen % self.sample:
+        self.suppressed += 1
+        return
+    if self.rate:
+      now = time.time()
+      self._tokens = min(self.burst,
+                         self._tokens + (now - self._last) * self.rate)
+      self._last = now
+      if self._tokens < 1:
+        self.suppressed += 1
+        self._unreported += 1
+        return
+      self._tokens -= 1
+    if self._unreported:
+      if args:
+        msg += " (%s similar messages suppressed)"
+        args += (self._unreported,)
+      else:
+        msg += " (%s similar messages suppressed)" % (self._unreported,)
+      self._unreported = 0
+    self.emitted += 1
+    self.logger.log(level, msg, *args, **kw)
+
+  def debug (self, msg, *args, **kw):
+    self.log(logging.DEBUG, msg, *args, **kw)
+
+  def info (self, msg, *args, **kw):
+    self.log(logging.INFO, msg, *args, **kw)
+
+  def warning (self, msg, *args, **kw):
+    self.log(logging.WARNING, msg, *args, **kw)
+
+  warn = warning
+
+  def error (self, msg, *args, **kw):
+    self.log(logging.ERROR, msg, *args, **kw)
+
+  def critical (self, msg, *args, **kw):
+    self.log(logging.CRITICAL, msg, *args, **kw)
+
+  def exception (self, msg, *args, **kw):
+    kw['exc_info'] = 1
+    self.log(logging.ERROR, msg, *args, **kw)
+
+  def get_counters (self):
+    return dict(emitted = self.emitted, suppressed = self.suppressed,
+                disabled = self.disabled)
+
+
+class AsyncHandler (logging.Handler):
+  """
+  Hands records off to other handlers on a background thread
+
+  The message (and any traceback) is formatted before queueing, since the
+  arguments may change or go away by the time the thread gets to it.
+  """
+  def __init__ (self, targets, queue_size = 10000):
+    logging.Handler.__init__(self)
+    if isinstance(targets, logging.Handler): targets = [targets]
+    self.targets = list(targets)
+    self.queue = Queue.Queue(queue_size)
+    self.queued = 0
+    self.dropped = 0
+    self._thread = threading.Thread(target = self._run,
+                                    name = "AsyncHandler")
+    self._thread.daemon = True
+    self._thread.start()
+    _async_handlers.add(self)
+
+  def emit (self, record):
+    try:
+      record.msg = record.getMessage()
+      record.args = None
+      if record.exc_info:
+        record.exc_text = logging._defaultFormatter.formatException(
+            record.exc_info)
+        record.exc_info = None
+      self.queue.put_nowait(record)
+      self.queued += 1
+    except Queue.Full:
+      self.dropped += 1
+    except Exception:
+      self.handleError(record)
+
+  def _run (self):
+    while True:
+      record = self.queue.get()
+      if record is None: break
+      for h in self.targets:
+        if record.levelno >= h.level:
+          h.handle(record)
+
+  def flush (self):
+    #NOTE: Only waits if the queue is nonempty; the record in progress on
+    #      the thread may still be being written.
+    while not self.queue.empty() and self._thread.is_alive():
+      time.sleep(0.001)
+    for h in self.targets:
+      h.flush()
+
+  def close (self):
+    try:
+      self.queue.put(None, timeout=1)
+    except Queue.Full:
+      pass
+    self._thread.join(1)
+    logging.Handler.close(self)
+
+  def get_counters (self):
+    return dict(queued = self.queued, dropped = self.dropped,
+                backlog = self.queue.qsize())
+
+
+def get_counters ():
+  """
+  Returns counters for all HotLoggers (by name) and AsyncHandlers
+  """
+  loggers = {}
+  for hl in list(_hot_loggers):
+    c = loggers.setdefault(hl.name, dict(emitted=0, suppressed=0, disabled=0))
+    for k,v in hl.get_counters().iteritems():
+      c[k] += v
+  handlers = [h.get_counters() for h in list(_async_handlers)]
+  return dict(loggers = loggers, handlers = handlers)
+
+
+def launch (__INSTANCE__ = None, queue_size = 10000, **kw):
+  """
+  Moves the root logger's handlers behind an AsyncHandler
+
+  Use --async to turn it on.
+  """
+  if not kw.pop("async", False): return
+  if kw:
+    raise TypeError("Invalid argument: " + kw.keys()[0])
+  root = logging.getLogger()
+  targets = list(root.handlers)
+  for h in targets:
+    root.removeHandler(h)
+  root.addHandler(AsyncHandler(targets, int(queue_size)))
@@ -1513,7 +1513,7 @@ class TelnetServer (EventMixin):
 
     global _ioloop
     if _ioloop is None:
-      _ioloop = RecocoIOLoop()
+      _ioloop = new_ioloop()
       #_ioloop.more_debugging = True
       _ioloop.start()
 
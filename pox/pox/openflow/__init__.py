@@ -29,6 +29,8 @@ difficult, really, but that hasn't stopped it from beind handled wrong
 wrong more than once).  In POX, the raw events are available, but you will
 generally just want to listen to the aggregate stats events which take
 care of this for you and are only fired when all data is available.
+For very large replies, Connection.stream_stats() lets you get the parts
+as they arrive instead (see StatsChunk).
 
 NOTE: This module is usually automatically loaded by pox.py
 """
@@ -37,6 +39,8 @@ from pox.lib.revent import *
 from pox.lib.util import dpidToStr
 import libopenflow_01 as of
 from pox.lib.packet.ethernet import ethernet
+import struct
+import time
 
 class ConnectionUp (Event):
   """
@@ -158,6 +162,37 @@ class PortStatsReceived (StatsReply):
 class QueueStatsReceived (StatsReply):
   pass
 
+class StatsChunk (Event):
+  """
+  One part of a streamed stats reply
+
+  Raised for each part of the reply to a request made with
+  Connection.stream_stats() instead of the aggregate *StatsReceived event.
+  stats is either a list of libopenflow stats objects or, for columnar
+  streams, a FlowStatsColumns/PortStatsColumns (see
+  pox.openflow.columnar_stats).  last is True for the final part.
+  ofp is the ofp_stats_reply, or None for columnar streams (which are
+  decoded straight from the wire).
+  """
+  def __init__ (self, connection, xid, stats_type, stats, last, ofp = None):
+    Event.__init__(self)
+    self.connection = connection
+    self.xid = xid
+    self.type = stats_type
+    self.stats = stats
+    self.last = last
+    self.ofp = ofp
+
+  @property
+  def dpid (self):
+    return self.connection.dpid
+
+class FlowStatsChunk (StatsChunk):
+  pass
+
+class PortStatsChunk (StatsChunk):
+  pass
+
 class PacketIn (Event):
   """
   Fired in response to PacketIn events
@@ -240,6 +275,10 @@ class BarrierIn (Event):
     self.dpid = connection.dpid
     self.xid = ofp.xid
 
+# Used to patch the xid of an already packed message
+_xid_struct = struct.Struct("!L")
+
+
 class ConnectionIn (Event):
   def __init__ (self, connection):
     super(ConnectionIn,self).__init__()
@@ -295,6 +334,43 @@ class ConnectionDict (dict):
     return self.iterkeys()
 
 
+class RateSampler (object):
+  """
+  Turns connections' counters into rates
+
+  Each call to sample() gives the rates since the previous call (or since
+  the connection came up).  The samples are kept here rather than on the
+  connections, so each user should have its own RateSampler and they won't
+  disturb each other's intervals.
+  """
+  def __init__ (self, counters = ('tx_messages', 'tx_bytes')):
+    self.counters = tuple(counters)
+    self._samples = {} # Connection -> (time, counter values)
+
+  def sample (self, connections):
+    """
+    Returns {dpid:(rate for each counter)} for the given connections
+    """
+    now = time.time()
+    samples = {}
+    r = {}
+    for con in connections:
+      values = tuple(getattr(con, c, 0) for c in self.counters)
+      samples[con] = (now, values)
+      last = self._samples.get(con)
+      if last is None:
+        last = (getattr(con, 'connect_time', None) or now,
+                (0,) * len(values))
+      t,old = last
+      elapsed = now - t
+      if elapsed <= 0:
+        r[con.dpid] = (0.0,) * len(values)
+      else:
+        r[con.dpid] = tuple((v - o) / elapsed for v,o in zip(values, old))
+    self._samples = samples
+    return r
+
+
 class OpenFlowNexus (EventMixin):
   """
   Main point of OpenFlow interaction.
@@ -319,6 +395,9 @@ class OpenFlowNexus (EventMixin):
     TableStatsReceived,
     PortStatsReceived,
     QueueStatsReceived,
+    StatsChunk,
+    FlowStatsChunk,
+    PortStatsChunk,
     FlowRemoved,
   ])
 
@@ -328,6 +407,9 @@ class OpenFlowNexus (EventMixin):
   # Enable/Disable clearing of flows on switch connect
   clear_flows_on_connect = True
 
+  # If set, decides which PacketIns raise events (see openflow.admission)
+  packet_in_admission = None
+
   def __init__ (self):
     self._connections = ConnectionDict() # DPID -> Connection
 
@@ -355,10 +437,66 @@ class OpenFlowNexus (EventMixin):
     else:
       import logging
       log = logging.getLogger("openflow")
-      log.warn("Couldn't send to %s because we're not connected to it!" %
-               (dpidToStr(dpid),))
+      log.warn("Couldn't send to %s because we're not connected to it!",
+               dpidToStr(dpid))
       return False
 
+  def send_to_dpids (self, data, dpids = None, new_xids = True):
+    """
+    Send the same message to many switches
+
+    data is packed only once.  If new_xids is True (the default), each
+    switch gets a copy with its own freshly generated xid patched into the
+    header; otherwise they all get exactly the same bytes.  dpids is an
+    iterable of DPIDs, or None for all connected switches.
+
+    Returns the number of switches the message was sent to.
+    """
+    if type(data) is not bytes:
+      data = data.pack()
+    if dpids is None:
+      cons = self._connections.values()
+    else:
+      cons = []
+      for dpid in dpids:
+        con = self._connections.get(dpid)
+        if con is None:
+          import logging
+          log = logging.getLogger("openflow")
+          log.warn("Couldn't send to %s because we're not connected to it!",
+                   dpidToStr(dpid))
+          continue
+        cons.append(con)
+
+    if new_xids:
+      head = data[:4]
+      tail = data[8:]
+      pack_xid = _xid_struct.pack
+      for con in cons:
+        con.send(head + pack_xid(of.generate_xid()) + tail)
+    else:
+      for con in cons:
+        con.send(data)
+    return len(cons)
+
+  def broadcast (self, data, new_xids = True):
+    """
+    Send the same message to all connected switches
+    """
+    return self.send_to_dpids(data, None, new_xids=new_xids)
+
+  def get_send_rates (self, sampler = None):
+    """
+    Returns rates at which we've been sending to each switch
+
+    The result maps DPIDs to (messages/sec, bytes/sec) over the time since
+    the sampler's previous call (or since the switch connected).  Keep a
+    RateSampler and pass it in each time to get recent rates; without one,
+    the rates are averages since each switch connected.
+    """
+    if sampler is None: sampler = RateSampler()
+    return sampler.sample(self._connections.values())
+
   def _handle_DownEvent (self, event):
     for c in self._connections.values():
       try:
@@ -0,0 +1,270 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+PacketIn admission control
+
+Without this, a single switch (or a single port on one) can push PacketIns
+at the controller as fast as it likes, and since they're all handled in
+the one scheduler thread, everyone else waits.  When this component is
+running, each PacketIn has to get past two token buckets -- one for its
+switch and one for its (switch, port) -- before PacketIn events are
+raised for it.
+
+ * A PacketIn which exceeds its port's budget is dropped.
+ * A PacketIn which exceeds its switch's budget is deferred (up to a limit
+   per switch; beyond that it is dropped).  Deferred PacketIns are
+   released later, with deficit round robin across switches so that one
+   backlogged switch can't hog the release either.
+ * Optionally, when a port keeps exceeding its budget, a temporary drop
+   flow is installed on the switch so the traffic stops at the source.
+
+It supports the following commandline options:
+ --switch_rate=X    PacketIns/sec allowed per switch (default 1000)
+ --switch_burst=X   Switch bucket size (default 2 * switch_rate)
+ --port_rate=X      PacketIns/sec allowed per switch port (default 200)
+ --port_burst=X     Port bucket size (default 2 * port_rate)
+ --max_deferred=X   Deferred PacketIns to hold per switch (default 1000)
+ --quantum=X        Bytes a switch may release per round (default 1500)
+ --interval=X       Seconds between releases of deferred PacketIns
+                    (default 0.01)
+ --drop_flows       Install temporary drop flows for misbehaving ports
+ --drop_threshold=X Drops in a row before installing one (default 100)
+ --drop_timeout=X   Hard timeout of the drop flow in seconds (default 10)
+"""
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from pox.lib.recoco import Timer
+from pox.lib.util import dpid_to_str, str_to_bool
+from collections import deque
+import time
+
+log = core.getLogger()
+
+
+class TokenBucket (object):
+  """
+  A simple token bucket which refills lazily
+  """
+  def __init__ (self, rate, burst = None):
+    self.rate = float(rate)
+    self.burst = float(burst if burst is not None else rate)
+    self.tokens = self.burst
+    self._last = time.time()
+
+  def refill (self, now = None):
+    if now is None: now = time.time()
+    elapsed = now - self._last
+    if elapsed > 0:
+      self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+    self._last = now
+
+  def take (self, now = None):
+    """
+    Takes a token if one is available; returns whether it did
+    """
+    self.refill(now)
+    if self.tokens >= 1:
+      self.tokens -= 1
+      return True
+    return False
+
+  def put_back (self):
+    self.tokens += 1
+
+
+class _SwitchState (object):
+  """
+  Admission state for one connection
+  """
+  def __init__ (self, connection, rate, burst):
+    self.connection = connection
+    self.bucket = TokenBucket(rate, burst)
+    self.ports = {} # port -> _PortState
+    self.deferred = deque()
+    self.deficit = 0
+    self.admitted = 0
+    self.deferred_count = 0
+    self.dropped = 0
+    self.drop_flows = 0
+
+
+class _PortState (object):
+  def __init__ (self, rate, burst):
+    self.bucket = TokenBucket(rate, burst)
+    self.over = 0 # Drops since the last admitted PacketIn
+    self.blocked_until = 0 # When our drop flow expires
+
+
+class PacketInAdmission (object):
+  """
+  Decides which PacketIns get raised as events
+
+  An instance is installed as the nexus's packet_in_admission.  of_01
+  then calls admit() on each PacketIn instead of raising events for it
+  directly.
+  """
+  def __init__ (self, switch_rate = 1000, switch_burst = None,
+                port_rate = 200, port_burst = None, max_deferred = 1000,
+                quantum = 1500, interval = 0.01, drop_flows = False,
+                drop_threshold = 100, drop_timeout = 10,
+                drop_priority = 0xffff):
+    self.switch_rate = switch_rate
+    self.switch_burst = switch_burst or 2 * switch_rate
+    self.port_rate = port_rate
+    self.port_burst = port_burst or 2 * port_rate
+    self.max_deferred = max_deferred
+    self.quantum = quantum
+    self.interval = interval
+    self.drop_flows = drop_flows
+    self.drop_threshold = drop_threshold
+    self.drop_timeout = drop_timeout
+    self.drop_priority = drop_priority
+
+    self._switches = {} # Connection -> _SwitchState
+    self._backlogged = deque() # _SwitchStates with deferred PacketIns
+    self._timer = None
+
+  def _state_for (self, con):
+    s = self._switches.get(con)
+    if s is None:
+      s = _SwitchState(con, self.switch_rate, self.switch_burst)
+      self._switches[con] = s
+    return s
+
+  def admit (self, con, msg):
+    """
+    Called by the connection for each PacketIn
+
+    Returns True if events should be raised for it right away.
+    """
+    s = self._state_for(con)
+    port = s.ports.get(msg.in_port)
+    if port is None:
+      port = _PortState(self.port_rate, self.port_burst)
+      s.ports[msg.in_port] = port
+
+    now = time.time()
+    if not port.bucket.take(now):
+      s.dropped += 1
+      port.over += 1
+      if (self.drop_flows and port.over >= self.drop_threshold
+          and now >= port.blocked_until):
+        self._install_drop_flow(s, msg.in_port, port, now)
+      return False
+    port.over = 0
+
+    if not s.deferred and s.bucket.take(now):
+      s.admitted += 1
+      return True
+
+    # Over the switch budget (or already backlogged -- keep the order)
+    if len(s.deferred) >= self.max_deferred:
+      port.bucket.put_back()
+      s.dropped += 1
+      return False
+    if not s.deferred:
+      self._backlogged.append(s)
+      s.deficit = 0
+    s.deferred.append(msg)
+    s.deferred_count += 1
+    self._start_timer()
+    return False
+
+  def _install_drop_flow (self, s, in_port, port, now):
+    port.blocked_until = now + self.drop_timeout
+    port.over = 0
+    s.drop_flows += 1
+    log.warn("Too many PacketIns from %s port %s; dropping for %s seconds",
+             dpid_to_str(s.connection.dpid), in_port, self.drop_timeout)
+    fm = of.ofp_flow_mod()
+    fm.match.in_port = in_port
+    fm.priority = self.drop_priority
+    fm.hard_timeout = self.drop_timeout
+    s.connection.send(fm)
+
+  def _start_timer (self):
+    if self._timer is None:
+      self._timer = Timer(self.interval, self._release, recurring=True)
+
+  def _release (self):
+    """
+    Releases deferred PacketIns with deficit round robin across switches
+    """
+    from pox.openflow.of_01 import raise_packet_in
+    now = time.time()
+    for _ in range(len(self._backlogged)):
+      s = self._backlogged.popleft()
+      if s.connection not in self._switches:
+        continue # Went away
+      s.deficit += self.quantum
+      while s.deferred:
+        msg = s.deferred[0]
+        cost = len(msg.data) or 1
+        if cost > s.deficit or not s.bucket.take(now):
+          break
+        s.deficit -= cost
+        s.deferred.popleft()
+        s.admitted += 1
+        raise_packet_in(s.connection, msg)
+      if s.deferred:
+        self._backlogged.append(s)
+      else:
+        s.deficit = 0
+
+    if not self._backlogged and self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
+
+  def forget (self, con):
+    """
+    Discards state (including deferred PacketIns) for a connection
+    """
+    self._switches.pop(con, None)
+
+  def get_stats (self):
+    """
+    Returns a dict of counters for each connected DPID
+    """
+    r = {}
+    for con,s in self._switches.iteritems():
+      r[con.dpid] = dict(admitted = s.admitted, deferred = s.deferred_count,
+                         dropped = s.dropped, drop_flows = s.drop_flows,
+                         backlog = len(s.deferred))
+    return r
+
+
+def launch (switch_rate = 1000, switch_burst = None, port_rate = 200,
+            port_burst = None, max_deferred = 1000, quantum = 1500,
+            interval = 0.01, drop_flows = False, drop_threshold = 100,
+            drop_timeout = 10):
+  def num (v, t = float):
+    return None if v is None else t(v)
+
+  admission = PacketInAdmission(switch_rate = num(switch_rate),
+                                switch_burst = num(switch_burst),
+                                port_rate = num(port_rate),
+                                port_burst = num(port_burst),
+                                max_deferred = num(max_deferred, int),
+                                quantum = num(quantum, int),
+                                interval = num(interval),
+                                drop_flows = str_to_bool(drop_flows),
+                                drop_threshold = num(drop_threshold, int),
+                                drop_timeout = num(drop_timeout, int))
+
+  def start ():
+    core.openflow.packet_in_admission = admission
+    def _handle_ConnectionDown (event):
+      admission.forget(event.connection)
+    core.openflow.addListenerByName("ConnectionDown", _handle_ConnectionDown)
+  core.call_when_ready(start, "openflow", __name__)
@@ -0,0 +1,242 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compact, column-oriented containers for flow and port stats
+
+A switch with a lot of flows can send back an enormous flow stats reply.
+Turning every entry into an ofp_flow_stats (with its ofp_match and list of
+action objects) takes a lot of time and memory.  The classes here instead
+keep each field in its own array, decoded straight from the wire format.
+Matches and actions are kept packed and only unpacked when you ask for
+them.
+
+Indexing or iterating one of these gives you the usual libopenflow
+objects, built on demand, so code like of_json.flow_stats_to_list() works
+on them unchanged.
+
+You usually get these from FlowStatsChunk/PortStatsChunk events after
+calling Connection.stream_stats(..., columnar=True).
+"""
+
+import struct
+from array import array
+import pox.openflow.libopenflow_01 as of
+
+
+# array doesn't do 64 bit integers everywhere in Python 2; fall back to
+# plain lists where unsigned long isn't big enough.
+if array('L').itemsize >= 8:
+  def _u64 ():
+    return array('L')
+else:
+  def _u64 ():
+    return []
+
+
+class FlowStatsColumns (object):
+  """
+  Flow stats entries stored as columns
+  """
+  _struct = struct.Struct("!HBB40sIIHHH6xQQQ")
+
+  def __init__ (self):
+    self.table_id = array('B')
+    self.duration_sec = array('I')
+    self.duration_nsec = array('I')
+    self.priority = array('H')
+    self.idle_timeout = array('H')
+    self.hard_timeout = array('H')
+    self.cookie = _u64()
+    self.packet_count = _u64()
+    self.byte_count = _u64()
+    self.matches = bytearray() # Packed ofp_matches, 40 bytes each
+    self._actions = bytearray() # Packed actions for all entries
+    self._action_offsets = array('I', [0])
+
+  def append_raw (self, raw, offset = 0, end = None):
+    """
+    Appends packed ofp_flow_stats entries from raw[offset:end]
+
+    Returns the number of entries added.
+    """
+    if end is None: end = len(raw)
+    s = self._struct
+    size = s.size
+    count = 0
+    while offset < end:
+      if end - offset < size:
+        raise RuntimeError("Truncated flow stats entry")
+      (length, table_id, _, match, dsec, dnsec, priority, idle, hard,
+          cookie, packets, nbytes) = s.unpack_from(raw, offset)
+      if length < size or offset + length > end:
+        raise RuntimeError("Bad flow stats entry length %s" % (length,))
+      self.table_id.append(table_id)
+      self.duration_sec.append(dsec)
+      self.duration_nsec.append(dnsec)
+      self.priority.append(priority)
+      self.idle_timeout.append(idle)
+      self.hard_timeout.append(hard)
+      self.cookie.append(cookie)
+      self.packet_count.append(packets)
+      self.byte_count.append(nbytes)
+      self.matches += match
+      self._actions += raw[offset+size:offset+length]
+      self._action_offsets.append(len(self._actions))
+      offset += length
+      count += 1
+    return count
+
+  def append (self, stats):
+    """
+    Appends an ofp_flow_stats
+    """
+    data = stats.pack()
+    self.append_raw(data, 0, len(data))
+
+  def extend (self, other):
+    """
+    Appends all the entries of another FlowStatsColumns
+    """
+    for name in ('table_id', 'duration_sec', 'duration_nsec', 'priority',
+                 'idle_timeout', 'hard_timeout', 'cookie', 'packet_count',
+                 'byte_count'):
+      getattr(self, name).extend(getattr(other, name))
+    self.matches += other.matches
+    base = len(self._actions)
+    self._actions += other._actions
+    self._action_offsets.extend(base + o for o in other._action_offsets[1:])
+
+  def match (self, index):
+    """
+    Returns the ofp_match of an entry
+    """
+    m = of.ofp_match()
+    m.unpack(bytes(self.matches[index*40:index*40+40]))
+    return m
+
+  def packed_actions (self, index):
+    """
+    Returns the packed actions of an entry
+    """
+    return bytes(self._actions[self._action_offsets[index]:
+                               self._action_offsets[index+1]])
+
+  def actions (self, index):
+    """
+    Returns the list of action objects of an entry
+    """
+    data = self.packed_actions(index)
+    return of._unpack_actions(data, len(data), 0)[1]
+
+  def __len__ (self):
+    return len(self.priority)
+
+  def __getitem__ (self, index):
+    if index < 0: index += len(self)
+    if index < 0 or index >= len(self):
+      raise IndexError("flow stats index out of range")
+    return of.ofp_flow_stats(table_id = self.table_id[index],
+                             match = self.match(index),
+                             duration_sec = self.duration_sec[index],
+                             duration_nsec = self.duration_nsec[index],
+                             priority = self.priority[index],
+                             idle_timeout = self.idle_timeout[index],
+                             hard_timeout = self.hard_timeout[index],
+                             cookie = self.cookie[index],
+                             packet_count = self.packet_count[index],
+                             byte_count = self.byte_count[index],
+                             actions = self.actions(index))
+
+  def __iter__ (self):
+    for i in xrange(len(self)):
+      yield self[i]
+
+  def __repr__ (self):
+    return "<%s: %s entries>" % (type(self).__name__, len(self))
+
+
+class PortStatsColumns (object):
+  """
+  Port stats entries stored as columns
+  """
+  _struct = struct.Struct("!H6x12Q")
+  _fields = ('rx_packets', 'tx_packets', 'rx_bytes', 'tx_bytes',
+             'rx_dropped', 'tx_dropped', 'rx_errors', 'tx_errors',
+             'rx_frame_err', 'rx_over_err', 'rx_crc_err', 'collisions')
+
+  def __init__ (self):
+    self.port_no = array('H')
+    for name in self._fields:
+      setattr(self, name, _u64())
+
+  def append_raw (self, raw, offset = 0, end = None):
+    """
+    Appends packed ofp_port_stats entries from raw[offset:end]
+
+    Returns the number of entries added.
+    """
+    if end is None: end = len(raw)
+    s = self._struct
+    size = s.size
+    if (end - offset) % size:
+      raise RuntimeError("Bad port stats length %s" % (end - offset,))
+    columns = [getattr(self, name) for name in self._fields]
+    count = 0
+    while offset < end:
+      values = s.unpack_from(raw, offset)
+      self.port_no.append(values[0])
+      for column,value in zip(columns, values[1:]):
+        column.append(value)
+      offset += size
+      count += 1
+    return count
+
+  def append (self, stats):
+    """
+    Appends an ofp_port_stats
+    """
+    self.append_raw(stats.pack())
+
+  def extend (self, other):
+    """
+    Appends all the entries of another PortStatsColumns
+    """
+    self.port_no.extend(other.port_no)
+    for name in self._fields:
+      getattr(self, name).extend(getattr(other, name))
+
+  def __len__ (self):
+    return len(self.port_no)
+
+  def __getitem__ (self, index):
+    if index < 0: index += len(self)
+    if index < 0 or index >= len(self):
+      raise IndexError("port stats index out of range")
+    s = of.ofp_port_stats(port_no = self.port_no[index])
+    for name in self._fields:
+      setattr(s, name, getattr(self, name)[index])
+    return s
+
+  def __iter__ (self):
+    for i in xrange(len(self)):
+      yield self[i]
+
+  def __repr__ (self):
+    return "<%s: %s entries>" % (type(self).__name__, len(self))
+
+
+# OFPST_xxx -> column class
+columns_for_type = {
+  of.OFPST_FLOW : FlowStatsColumns,
+  of.OFPST_PORT : PortStatsColumns,
+}
@@ -12,8 +12,44 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from pox.lib.util import str_to_bool
+
 pcap_traces = False
 
-def launch ():
+# Options for the capture writer (see of_01.wrap_socket())
+pcap_options = {}
+
+def launch (buffered = False, buffer_size = None, threaded = False,
+            sample = None, tcp_checksum = False, max_bytes = None,
+            max_files = None):
+  """
+  Write a pcap trace of each OpenFlow connection
+
+  --buffered uses the lower-overhead writer, which patches precomputed
+  headers and writes in chunks of --buffer_size bytes (from a separate
+  thread with --threaded).  --sample=N only writes every Nth message.
+  --max_bytes rotates between --max_files files of about that size.
+  """
   global pcap_traces
   pcap_traces = True
+
+  buffered = str_to_bool(buffered)
+  threaded = str_to_bool(threaded)
+  tcp_checksum = str_to_bool(tcp_checksum)
+  if sample is not None:
+    sample = int(sample)
+
+  if buffered or threaded or sample or tcp_checksum:
+    pcap_options['buffered'] = True
+  if buffer_size is not None:
+    pcap_options['buffer_size'] = int(buffer_size)
+  if threaded:
+    pcap_options['threaded'] = True
+  if sample is not None:
+    pcap_options['sample'] = sample
+  if tcp_checksum:
+    pcap_options['tcp_checksum'] = True
+  if max_bytes is not None:
+    pcap_options['max_bytes'] = int(max_bytes)
+  if max_files is not None:
+    pcap_options['max_files'] = int(max_files)
@@ -227,6 +227,13 @@ class Link (namedtuple("LinkBase",("dpid1","port1","dpid2","port2"))):
   def end (self):
     return ((self[0],self[1]),(self[2],self[3]))
 
+  @property
+  def flipped (self):
+    """
+    Returns the link in the other direction
+    """
+    return Link(self[2],self[3],self[0],self[1])
+
   def __str__ (self):
     return "%s.%s -> %s.%s" % (dpid_to_str(self[0]),self[1],
                                dpid_to_str(self[2]),self[3])
@@ -263,6 +270,15 @@ class Discovery (EventMixin):
     if link_timeout: self._link_timeout = link_timeout
 
     self.adjacency = {} # From Link to time.time() stamp
+
+    # With openflow.shard, links from switches connected to other shards.
+    # These only go in the shared links table (not in adjacency, and no
+    # LinkEvents), since local components only deal with local switches.
+    self.remote_links = {} # From Link to time.time() stamp
+
+    # Indexes into adjacency; kept up to date by _add_link()/_delete_links()
+    self._switch_links = {} # DPID -> set of Links to or from it
+    self._port_links = {} # (DPID,port) -> set of Links to or from it
     self._sender = LLDPSender(self.send_cycle_time)
 
     # Listen with a high priority (mostly so we get PacketIns early)
@@ -286,14 +302,32 @@ class Discovery (EventMixin):
     else:
       con = con_or_dpid
 
+    con.send(self._lldp_flow_mod(priority))
+    return True
+
+  def install_flows (self, dpids = None, priority = None):
+    """
+    Installs the LLDP flow on many switches (default: all connected ones)
+
+    The flow_mod is only packed once.  Returns the number of switches.
+    """
+    if priority is None:
+      priority = self._flow_priority
+    return core.openflow.send_to_dpids(self._lldp_flow_mod(priority), dpids)
+
+  def _lldp_flow_mod (self, priority):
     match = of.ofp_match(dl_type = pkt.ethernet.LLDP_TYPE,
                           dl_dst = pkt.ETHERNET.NDP_MULTICAST)
     msg = of.ofp_flow_mod()
     msg.priority = priority
     msg.match = match
     msg.actions.append(of.ofp_action_output(port = of.OFPP_CONTROLLER))
-    con.send(msg)
-    return True
+    return msg
+
+  def _all_dependencies_met (self):
+    # Catch switches which connected before we were listening
+    if self._install_flow and core.openflow.connections:
+      self.install_flows()
 
   def _handle_openflow_ConnectionUp (self, event):
     if self._install_flow:
@@ -303,9 +337,9 @@ class Discovery (EventMixin):
 
   def _handle_openflow_ConnectionDown (self, event):
     # Delete all links on this switch
-    self._delete_links([link for link in self.adjacency
-                        if link.dpid1 == event.dpid
-                        or link.dpid2 == event.dpid])
+    self._delete_links(list(self._switch_links.get(event.dpid, ())))
+    self._delete_remote_links([link for link in self.remote_links
+                               if link.dpid2 == event.dpid])
 
   def _expire_links (self):
     """
@@ -321,6 +355,14 @@ class Discovery (EventMixin):
 
       self._delete_links(expired)
 
+    expired = [link for link,timestamp in self.remote_links.iteritems()
+               if timestamp + self._link_timeout < now]
+    if expired:
+      for link in expired:
+        log.info('link timeout: %s', link)
+
+      self._delete_remote_links(expired)
+
   def _handle_openflow_PacketIn (self, event):
     """
     Receive and process LLDP packets
@@ -408,9 +450,13 @@ class Discovery (EventMixin):
       log.warning("Couldn't find a DPID in the LLDP packet")
       return EventHalt
 
-    if originatorDPID not in core.openflow.connections:
-      log.info('Received LLDP packet from unknown switch')
-      return EventHalt
+    remote = originatorDPID not in core.openflow.connections
+    if remote:
+      # With openflow.shard, it may be connected to another process
+      shard = core.components.get('openflow_shard')
+      if shard is None or shard.owner_of(originatorDPID) is None:
+        log.info('Received LLDP packet from unknown switch')
+        return EventHalt
 
     # Get port number from port TLV
     if lldph.tlvs[1].subtype != pkt.port_id.SUB_PORT:
@@ -438,32 +484,97 @@ class Discovery (EventMixin):
     link = Discovery.Link(originatorDPID, originatorPort, event.dpid,
                           event.port)
 
+    if remote:
+      self._add_remote_link(link)
+    else:
+      self._add_link(link)
+
+    return EventHalt # Probably nobody else needs this event
+
+  def _add_link (self, link):
     if link not in self.adjacency:
       self.adjacency[link] = time.time()
+      for k,index in ((link.dpid1,self._switch_links),
+                      (link.dpid2,self._switch_links),
+                      (link.end[0],self._port_links),
+                      (link.end[1],self._port_links)):
+        indexed = index.get(k)
+        if indexed is None:
+          indexed = index[k] = set()
+        indexed.add(link)
       log.info('link detected: %s', link)
       self.raiseEventNoErrors(LinkEvent, True, link)
     else:
       # Just update timestamp
       self.adjacency[link] = time.time()
 
-    return EventHalt # Probably nobody else needs this event
-
   def _delete_links (self, links):
     for link in links:
       self.raiseEventNoErrors(LinkEvent, False, link)
     for link in links:
-      self.adjacency.pop(link, None)
+      if self.adjacency.pop(link, None) is None: continue
+      for k,index in ((link.dpid1,self._switch_links),
+                      (link.dpid2,self._switch_links),
+                      (link.end[0],self._port_links),
+                      (link.end[1],self._port_links)):
+        indexed = index.get(k)
+        if indexed is None: continue
+        indexed.discard(link)
+        if not indexed: del index[k]
+
+  def _add_remote_link (self, link):
+    if link not in self.remote_links:
+      log.info('link detected: %s (from another shard)', link)
+      core.openflow_shard.set('links', link, core.openflow_shard.shard_id)
+    self.remote_links[link] = time.time()
+
+  def _delete_remote_links (self, links):
+    shard = core.components.get('openflow_shard')
+    for link in links:
+      if self.remote_links.pop(link, None) is None: continue
+      if shard is not None:
+        shard.remove('links', link)
 
   def is_edge_port (self, dpid, port):
     """
     Return True if given port does not connect to another switch
     """
-    for link in self.adjacency:
+    return (dpid,port) not in self._port_links
+
+  def links_for_switch (self, dpid):
+    """
+    Returns the set of links to or from the given switch
+    """
+    return frozenset(self._switch_links.get(dpid, ()))
+
+  def links_for_port (self, dpid, port):
+    """
+    Returns the set of links to or from the given switch port
+    """
+    return frozenset(self._port_links.get((dpid,port), ()))
+
+  def peer_of (self, dpid, port):
+    """
+    Returns the (dpid,port) at the other end of a link, or None
+
+    Links out of the given port are preferred over links into it.
+    """
+    links = self._port_links.get((dpid,port))
+    if not links: return None
+    for link in links:
       if link.dpid1 == dpid and link.port1 == port:
-        return False
-      if link.dpid2 == dpid and link.port2 == port:
-        return False
-    return True
+        return link.end[1]
+    for link in links:
+      return link.end[0]
+
+  def reverse_link (self, link):
+    """
+    Returns the link going the other way if we know about it, else None
+    """
+    flipped = link.flipped
+    if flipped in self.adjacency:
+      return flipped
+    return None
 
 
 def launch (no_flow = False, explicit_drop = True, link_timeout = None,
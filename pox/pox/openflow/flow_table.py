@@ -318,7 +318,14 @@ class FlowTable (EventMixin):
     on the given in_port, or None if no matching entry is found.
     """
     packet_match = ofp_match.from_packet(packet, in_port, spec_frags = True)
+    return self.entry_for_match(packet_match)
 
+  def entry_for_match (self, packet_match):
+    """
+    Finds the flow table entry for an exact match built from a packet.
+
+    Returns the highest priority flow table entry that matches, or None.
+    """
     for entry in self._table:
       if entry.match.matches_with_wildcards(packet_match,
                                             consider_other_wildcards=False):
@@ -101,12 +101,18 @@ def _read (data, offset, length):
   if (len(data)-offset) < length:
     raise UnderrunError("wanted %s bytes but only have %s"
                         % (length, len(data)-offset))
-  return (offset+length, data[offset:offset+length])
+  d = data[offset:offset+length]
+  if type(d) is memoryview: d = d.tobytes()
+  return (offset+length, d)
+
+_structs = {} # Format -> compiled struct.Struct, for _unpack()
 
 def _unpack (fmt, data, offset):
-  size = struct.calcsize(fmt)
-  if (len(data)-offset) < size: raise UnderrunError()
-  return (offset+size, struct.unpack_from(fmt, data, offset))
+  s = _structs.get(fmt)
+  if s is None:
+    s = _structs[fmt] = struct.Struct(fmt)
+  if (len(data)-offset) < s.size: raise UnderrunError()
+  return (offset+s.size, s.unpack_from(data, offset))
 
 def _skip (data, offset, num):
   offset += num
@@ -134,6 +140,51 @@ def _readip (data, offset, networkOrder = True):
   (offset, d) = _read(data, offset, 4)
   return (offset, IPAddr(d, networkOrder = networkOrder))
 
+
+class _Schema (object):
+  """
+  A run of fixed-size fields, compiled into a single struct.Struct
+
+  Fields are (name, format) pairs in wire order.  Padding has a name of
+  None and a format which takes no value (e.g., "2x").  Schemas can be
+  added together, so a message's whole fixed part (header, match and
+  body) can be packed or unpacked with one call.
+
+  unpack_from() works on anything with the buffer interface, including
+  memoryviews.
+  """
+  def __init__ (self, *fields):
+    self.fields = fields
+    self.names = tuple(n for n,f in fields if n is not None)
+    self.struct = struct.Struct("!" + "".join(f for n,f in fields))
+    self.size = self.struct.size
+    self.pack = self.struct.pack
+    self.pack_into = self.struct.pack_into
+
+  def __add__ (self, other):
+    return _Schema(*(self.fields + other.fields))
+
+  def unpack_from (self, data, offset = 0):
+    """
+    Returns (new_offset, values)
+    """
+    if len(data) - offset < self.size:
+      raise UnderrunError("wanted %s bytes but only have %s"
+                          % (self.size, len(data)-offset))
+    return offset + self.size, self.struct.unpack_from(data, offset)
+
+
+def _ensure_room (buf, offset, length):
+  """
+  Grows bytearray buf so that length bytes fit at offset
+  """
+  short = offset + length - len(buf)
+  if short > 0: buf.extend(b"\x00" * short)
+
+
+_header_schema = _Schema(("version", "B"), ("header_type", "B"),
+                         ("length", "H"), ("xid", "L"))
+
 # ----------------------------------------------------------------------
 
 
@@ -185,6 +236,17 @@ class ofp_base (object):
   def __ne__ (self, other):
     return not self.__eq__(other)
 
+  def pack_into (self, buf, offset=0):
+    """
+    Packs into bytearray buf at offset (growing it if needed)
+
+    Returns the offset just past what was written.  Messages on hot paths
+    override this to write their fixed part directly.
+    """
+    packed = self.pack()
+    buf[offset:offset+len(packed)] = packed
+    return offset + len(packed)
+
   @classmethod
   def unpack_new (cls, raw, offset=0):
     """
@@ -565,10 +627,8 @@ class ofp_header (ofp_base):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!BBHL", self.version, self.header_type,
+    return _header_schema.pack(self.version, self.header_type,
         len(self), self.xid)
-    return packed
 
   def unpack (self, raw, offset=0):
     offset,length = self._unpack_header(raw, offset)
@@ -576,7 +636,7 @@ class ofp_header (ofp_base):
 
   def _unpack_header (self, raw, offset):
     offset,(self.version, self.header_type, length, self.xid) = \
-        _unpack("!BBHL", raw, offset)
+        _header_schema.unpack_from(raw, offset)
     return offset,length
 
   def __eq__ (self, other):
@@ -917,6 +977,24 @@ class ofp_queue_prop_min_rate (ofp_base):
 
 
 ##2.3 Flow Match Structures
+_match_schema = _Schema(("wildcards", "L"), ("in_port", "H"),
+                        ("dl_src", "6s"), ("dl_dst", "6s"),
+                        ("dl_vlan", "H"), ("dl_vlan_pcp", "B"), (None, "x"),
+                        ("dl_type", "H"), ("nw_tos", "B"), ("nw_proto", "B"),
+                        (None, "2x"), ("nw_src", "L"), ("nw_dst", "L"),
+                        ("tp_src", "H"), ("tp_dst", "H"))
+
+def _raw_ether (addr):
+  if addr is None: return EMPTY_ETH.toRaw()
+  if type(addr) is bytes: return addr
+  return addr.toRaw()
+
+def _unsigned_ip (addr):
+  if addr is None: return 0
+  if type(addr) is int: return addr & 0xffFFffFF
+  if type(addr) is long: return addr & 0xffFFffFF
+  return addr.toUnsigned()
+
 class ofp_match (ofp_base):
   adjust_wildcards = True # Set to true to "fix" outgoing wildcards
 
@@ -1016,8 +1094,8 @@ class ofp_match (ofp_base):
   def __init__ (self, **kw):
     self._locked = False
 
-    for k,v in ofp_match_data.iteritems():
-      setattr(self, '_' + k, v[0])
+    # Same as setattr()ing each, but quicker
+    self.__dict__.update(_match_defaults)
 
     self.wildcards = self._normalize_wildcards(OFPFW_ALL)
 
@@ -1139,19 +1217,21 @@ class ofp_match (ofp_base):
   def _prereq_warning (self):
     # Only checked when assertions are on
     if not _logger: return True
-    om = self.clone()
-    om.fix()
 
-    if om == self: return True
+    # These are the fields fix() would clear
+    dl_type = self.dl_type
+    if dl_type == 0x0800:
+      if self.nw_proto in (1,6,17): return True
+      unmatchable = ('tp_src', 'tp_dst')
+    elif dl_type == 0x0806:
+      unmatchable = ('tp_src', 'tp_dst', 'nw_tos')
+    else:
+      unmatchable = ('nw_tos', 'nw_proto', 'nw_src', 'nw_dst',
+                     'tp_src', 'tp_dst')
+    wcs = [name for name in unmatchable if getattr(self, name) is not None]
+    if not wcs: return True
 
     msg = "Fields ignored due to unspecified prerequisites: "
-    wcs = []
-
-    for name in ofp_match_data.keys():
-      if getattr(self,name) is None: continue
-      if getattr(om,name) is not None: continue
-      wcs.append(name)
-
     msg = msg + " ".join(wcs)
 
     _log(warn = msg)
@@ -1160,53 +1240,79 @@ class ofp_match (ofp_base):
     return True # Always; we don't actually want an assertion error
 
   def pack (self, flow_mod=False):
+    return _match_schema.pack(*self._pack_values(flow_mod))
+
+  def pack_into (self, buf, offset=0, flow_mod=False):
+    _ensure_room(buf, offset, 40)
+    _match_schema.pack_into(buf, offset, *self._pack_values(flow_mod))
+    return offset + 40
+
+  def _pack_values (self, flow_mod=False):
+    """
+    Returns the values for _match_schema
+    """
     assert self._assert()
 
-    packed = b""
     if self.adjust_wildcards and flow_mod:
       wc = self._wire_wildcards(self.wildcards)
       assert self._prereq_warning()
     else:
       wc = self.wildcards
-    packed += struct.pack("!LH", wc, self.in_port or 0)
-    if self.dl_src is None:
-      packed += EMPTY_ETH.toRaw()
-    elif type(self.dl_src) is bytes:
-      packed += self.dl_src
+
+    # This is what going through __getattr__ for each field would give,
+    # but without the overhead.
+    d = self.__dict__
+    w = d['wildcards']
+    dl_type = 0 if w & OFPFW_DL_TYPE else (d['_dl_type'] or 0)
+    is_ip = dl_type == 0x0800
+    is_ip_or_arp = is_ip or dl_type == 0x0806
+    if is_ip_or_arp:
+      nw_proto = 0 if w & OFPFW_NW_PROTO else (d['_nw_proto'] or 0)
+      nw_src = (0 if (w & OFPFW_NW_SRC_ALL) == OFPFW_NW_SRC_ALL
+                else _unsigned_ip(d['_nw_src']))
+      nw_dst = (0 if (w & OFPFW_NW_DST_ALL) == OFPFW_NW_DST_ALL
+                else _unsigned_ip(d['_nw_dst']))
     else:
-      packed += self.dl_src.toRaw()
-    if self.dl_dst is None:
-      packed += EMPTY_ETH.toRaw()
-    elif type(self.dl_dst) is bytes:
-      packed += self.dl_dst
+      nw_proto = nw_src = nw_dst = 0
+    if is_ip and nw_proto in (1,6,17):
+      tp_src = 0 if w & OFPFW_TP_SRC else (d['_tp_src'] or 0)
+      tp_dst = 0 if w & OFPFW_TP_DST else (d['_tp_dst'] or 0)
     else:
-      packed += self.dl_dst.toRaw()
-
-    def check_ip(val):
-      return (val or 0) if self.dl_type == 0x0800 else 0
-    def check_ip_or_arp(val):
-      return (val or 0) if self.dl_type == 0x0800 \
-                           or self.dl_type == 0x0806 else 0
-    def check_tp(val):
-      return (val or 0) if self.dl_type == 0x0800 \
-                           and self.nw_proto in (1,6,17) else 0
-
-    packed += struct.pack("!HB", self.dl_vlan or 0, self.dl_vlan_pcp or 0)
-    packed += _PAD # Hardcode padding
-    packed += struct.pack("!HBB", self.dl_type or 0,
-        check_ip(self.nw_tos), check_ip_or_arp(self.nw_proto))
-    packed += _PAD2 # Hardcode padding
-    def fix (addr):
-      if addr is None: return 0
-      if type(addr) is int: return addr & 0xffFFffFF
-      if type(addr) is long: return addr & 0xffFFffFF
-      return addr.toUnsigned()
-
-    packed += struct.pack("!LLHH", check_ip_or_arp(fix(self.nw_src)),
-        check_ip_or_arp(fix(self.nw_dst)),
-        check_tp(self.tp_src), check_tp(self.tp_dst))
+      tp_src = tp_dst = 0
+    nw_tos = 0 if (w & OFPFW_NW_TOS or not is_ip) else (d['_nw_tos'] or 0)
 
-    return packed
+    return (wc, 0 if w & OFPFW_IN_PORT else (d['_in_port'] or 0),
+            _raw_ether(None if w & OFPFW_DL_SRC else d['_dl_src']),
+            _raw_ether(None if w & OFPFW_DL_DST else d['_dl_dst']),
+            0 if w & OFPFW_DL_VLAN else (d['_dl_vlan'] or 0),
+            0 if w & OFPFW_DL_VLAN_PCP else (d['_dl_vlan_pcp'] or 0),
+            dl_type, nw_tos, nw_proto, nw_src, nw_dst, tp_src, tp_dst)
+
+  def _unpack_values (self, values, flow_mod=False):
+    """
+    Sets our fields from values unpacked with _match_schema
+    """
+    if self._locked:
+      raise AttributeError('match object is locked')
+    (wildcards, in_port, dl_src, dl_dst, dl_vlan, dl_vlan_pcp, dl_type,
+     nw_tos, nw_proto, nw_src, nw_dst, tp_src, tp_dst) = values
+    d = self.__dict__
+    d['_in_port'] = in_port
+    d['_dl_src'] = EthAddr(dl_src)
+    d['_dl_dst'] = EthAddr(dl_dst)
+    d['_dl_vlan'] = dl_vlan
+    d['_dl_vlan_pcp'] = dl_vlan_pcp
+    d['_dl_type'] = dl_type
+    d['_nw_tos'] = nw_tos
+    d['_nw_proto'] = nw_proto
+    d['_nw_src'] = IPAddr(nw_src)
+    d['_nw_dst'] = IPAddr(nw_dst)
+    d['_tp_src'] = tp_src
+    d['_tp_dst'] = tp_dst
+
+    # Only unwire wildcards for flow_mod
+    d['wildcards'] = self._normalize_wildcards(
+        self._unwire_wildcards(wildcards) if flow_mod else wildcards)
 
   def _normalize_wildcards (self, wildcards):
     """
@@ -1324,25 +1430,8 @@ class ofp_match (ofp_base):
     return not self.is_wildcarded
 
   def unpack (self, raw, offset=0, flow_mod=False):
-    _offset = offset
-    offset,(wildcards, self._in_port) = _unpack("!LH",raw, offset)
-    offset,self._dl_src = _readether(raw, offset)
-    offset,self._dl_dst = _readether(raw, offset)
-    offset,(self._dl_vlan, self._dl_vlan_pcp) = \
-        _unpack("!HB", raw, offset)
-    offset = _skip(raw, offset, 1)
-    offset,(self._dl_type, self._nw_tos, self._nw_proto) = \
-        _unpack("!HBB", raw, offset)
-    offset = _skip(raw, offset, 2)
-    offset,self._nw_src = _readip(raw, offset)
-    offset,self._nw_dst = _readip(raw, offset)
-    offset,(self._tp_src, self._tp_dst) = _unpack("!HH", raw, offset)
-
-    # Only unwire wildcards for flow_mod
-    self.wildcards = self._normalize_wildcards(
-        self._unwire_wildcards(wildcards) if flow_mod else wildcards)
-
-    assert offset - _offset == len(self)
+    offset,values = _match_schema.unpack_from(raw, offset)
+    self._unpack_values(values, flow_mod)
     return offset
 
   @staticmethod
@@ -2237,6 +2326,11 @@ class ofp_set_config (ofp_header): # uses ofp_switch_config
 
 
 ##3.3 Modify State Messages
+_flow_mod_schema = _header_schema + _match_schema + _Schema(
+    ("cookie", "Q"), ("command", "H"), ("idle_timeout", "H"),
+    ("hard_timeout", "H"), ("priority", "H"), ("buffer_id", "L"),
+    ("out_port", "H"), ("flags", "H"))
+
 @openflow_c_message("OFPT_FLOW_MOD", 14)
 class ofp_flow_mod (ofp_header):
   _MIN_LENGTH = 72
@@ -2311,30 +2405,43 @@ class ofp_flow_mod (ofp_header):
       buffer_id = NO_BUFFER
 
     assert self._assert()
-    packed = b""
-    packed += ofp_header.pack(self)
-    packed += self.match.pack(flow_mod=True)
-    packed += struct.pack("!QHHHHLHH", self.cookie, self.command,
-                          self.idle_timeout, self.hard_timeout,
-                          self.priority, buffer_id, self.out_port,
-                          self.flags)
-    for i in self.actions:
-      packed += i.pack()
-
+    actions = b"".join([i.pack() for i in self.actions])
+    packed = _flow_mod_schema.pack(*self._fixed_values(buffer_id,
+                                                       len(actions)))
     if po:
-      packed += ofp_barrier_request().pack()
-      packed += po.pack()
-    return packed
+      return b"".join((packed, actions, ofp_barrier_request().pack(),
+                       po.pack()))
+    return packed + actions
+
+  def pack_into (self, buf, offset=0):
+    if self.data:
+      return ofp_base.pack_into(self, buf, offset) # Rare; do it the slow way
+    assert self._assert()
+    actions_len = sum(len(a) for a in self.actions)
+    _ensure_room(buf, offset, 72 + actions_len)
+    _flow_mod_schema.pack_into(buf, offset,
+                               *self._fixed_values(self._buffer_id,
+                                                   actions_len))
+    offset += 72
+    for a in self.actions:
+      offset = a.pack_into(buf, offset)
+    return offset
+
+  def _fixed_values (self, buffer_id, actions_len):
+    return ((self.version, self.header_type, 72 + actions_len, self.xid)
+            + self.match._pack_values(flow_mod=True)
+            + (self.cookie, self.command, self.idle_timeout,
+               self.hard_timeout, self.priority, buffer_id, self.out_port,
+               self.flags))
 
   def unpack (self, raw, offset=0):
-    offset,length = self._unpack_header(raw, offset)
-    offset = self.match.unpack(raw, offset, flow_mod=True)
-    offset,(self.cookie, self.command, self.idle_timeout,
-            self.hard_timeout, self.priority, self._buffer_id,
-            self.out_port, self.flags) = \
-            _unpack("!QHHHHLHH", raw, offset)
-    offset,self.actions = _unpack_actions(raw,
-        length-(32 + len(self.match)), offset)
+    _offset = offset
+    offset,values = _flow_mod_schema.unpack_from(raw, offset)
+    (self.version, self.header_type, length, self.xid) = values[:4]
+    self.match._unpack_values(values[4:17], flow_mod=True)
+    (self.cookie, self.command, self.idle_timeout, self.hard_timeout,
+     self.priority, self._buffer_id, self.out_port, self.flags) = values[17:]
+    offset,self.actions = _unpack_actions(raw, length - 72, offset)
     assert length == len(self)
     return offset,length
 
@@ -2380,6 +2487,121 @@ class ofp_flow_mod (ofp_header):
     return outstr
 
 
+class ofp_flow_mod_template (object):
+  """
+  A flow_mod which is packed once and then stamped out with a few changes
+
+  Modules which install lots of rules which only differ in a few fields
+  can build a prototype ofp_flow_mod once, and then have pack() patch
+  the differing fields into the prototype's packed values.  This skips
+  building and packing the flow_mod, match and action objects each time;
+  a pack() is one struct.pack() call.
+
+  The fields which can be changed are:
+   xid        A new one is generated for each pack() if not given
+   buffer_id  None means no buffer
+   match      A whole ofp_match (replaces the prototype's)
+   in_port, dl_src, dl_dst, dl_vlan
+              Match fields; setting one also clears its wildcard bit
+   out_port   Port of the prototype's first ofp_action_output (not the
+              flow_mod's out_port field)
+
+  data works as for ofp_flow_mod: if the packet_in it refers to isn't
+  buffered, a barrier and a packet_out are packed after the flow_mod.
+  """
+  # name -> (index into _flow_mod_schema values, wildcard bit)
+  _fields = {
+    'in_port'   : (5, ofp_flow_wildcards_rev_map['OFPFW_IN_PORT']),
+    'dl_src'    : (6, ofp_flow_wildcards_rev_map['OFPFW_DL_SRC']),
+    'dl_dst'    : (7, ofp_flow_wildcards_rev_map['OFPFW_DL_DST']),
+    'dl_vlan'   : (8, ofp_flow_wildcards_rev_map['OFPFW_DL_VLAN']),
+    'buffer_id' : (22, 0),
+  }
+
+  def __init__ (self, flow_mod):
+    if flow_mod.data:
+      raise ValueError("prototype flow_mod can't have data")
+    self.prototype = flow_mod
+    raw = flow_mod.pack()
+    values = list(_flow_mod_schema.unpack_from(raw)[1])
+    fmt = _flow_mod_schema.struct.format
+
+    # The actions are packed as they are, except for the output port
+    self._out_port_index = None
+    offset = 72
+    for a in flow_mod.actions:
+      if isinstance(a, ofp_action_output):
+        offset += 4
+        fmt += "%dsH%ds" % (offset - 72, len(raw) - offset - 2)
+        values += [raw[72:offset], a.port, raw[offset+2:]]
+        self._out_port_index = len(values) - 2
+        break
+      offset += len(a)
+    else:
+      fmt += "%ds" % (len(raw) - 72,)
+      values.append(raw[72:])
+
+    self._struct = struct.Struct(fmt)
+    self._values = values
+
+  def __len__ (self):
+    return self._struct.size
+
+  def pack (self, xid = None, match = None, out_port = None, data = None,
+            **fields):
+    """
+    Returns the packed flow_mod with the given fields changed
+    """
+    values = self._values[:]
+    values[3] = generate_xid() if xid is None else xid
+    if match is not None:
+      values[4:17] = match._pack_values(flow_mod=True)
+
+    if out_port is not None:
+      if self._out_port_index is None:
+        raise TypeError("prototype flow_mod has no output action")
+      values[self._out_port_index] = out_port
+
+    po = None
+    if data:
+      if not data.is_complete:
+        _log(warn="flow_mod is trying to include incomplete data")
+      elif data.buffer_id is None:
+        po = ofp_packet_out(data=data, in_port=data.in_port,
+                            action=ofp_action_output(port = OFPP_TABLE))
+      else:
+        fields['buffer_id'] = data.buffer_id
+
+    for name,value in fields.iteritems():
+      try:
+        index,bit = self._fields[name]
+      except KeyError:
+        raise TypeError("%s is not a template field" % (name,))
+      if value is None:
+        if bit:
+          raise TypeError("%s can't be None" % (name,))
+        value = NO_BUFFER
+      elif index == 6 or index == 7:
+        value = _raw_ether(value)
+      values[index] = value
+      values[4] &= ~bit
+
+    if po:
+      return b"".join((self._struct.pack(*values),
+                       ofp_barrier_request().pack(), po.pack()))
+    return self._struct.pack(*values)
+
+  def unpack (self, **kw):
+    """
+    Returns an ofp_flow_mod like the one pack() would give
+
+    Mostly useful for debugging and tests.
+    """
+    fm = ofp_flow_mod()
+    fm.unpack(self.pack(**kw))
+    return fm
+
+
 @openflow_c_message("OFPT_PORT_MOD", 15)
 class ofp_port_mod (ofp_header):
   def __init__ (self, **kw):
@@ -2935,6 +3157,16 @@ class ofp_flow_stats_request (ofp_stats_body_base):
     return outstr
 
 
+_flow_stats_schema = (_Schema(("length", "H"), ("table_id", "B"),
+                               (None, "x"))
+                      + _match_schema
+                      + _Schema(("duration_sec", "L"),
+                                ("duration_nsec", "L"), ("priority", "H"),
+                                ("idle_timeout", "H"),
+                                ("hard_timeout", "H"), (None, "6x"),
+                                ("cookie", "Q"), ("packet_count", "Q"),
+                                ("byte_count", "Q")))
+
 @openflow_stats_reply('OFPST_FLOW', is_list = True)
 class ofp_flow_stats (ofp_stats_body_base):
   _MIN_LENGTH = 88
@@ -2961,33 +3193,36 @@ class ofp_flow_stats (ofp_stats_body_base):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += struct.pack("!HBB", len(self), self.table_id, 0)
-    packed += self.match.pack()
-    packed += struct.pack("!LLHHH", self.duration_sec,
-                          self.duration_nsec, self.priority,
-                          self.idle_timeout, self.hard_timeout)
-    packed += _PAD6 # Pad
-    packed += struct.pack("!QQQ", self.cookie, self.packet_count,
-                          self.byte_count)
-    for i in self.actions:
-      packed += i.pack()
-    return packed
+    actions = b"".join([i.pack() for i in self.actions])
+    return (_flow_stats_schema.pack(*self._fixed_values(len(actions)))
+            + actions)
+
+  def pack_into (self, buf, offset=0):
+    assert self._assert()
+    actions_len = sum(len(a) for a in self.actions)
+    _ensure_room(buf, offset, 88 + actions_len)
+    _flow_stats_schema.pack_into(buf, offset,
+                                 *self._fixed_values(actions_len))
+    offset += 88
+    for a in self.actions:
+      offset = a.pack_into(buf, offset)
+    return offset
+
+  def _fixed_values (self, actions_len):
+    return ((88 + actions_len, self.table_id) + self.match._pack_values()
+            + (self.duration_sec, self.duration_nsec, self.priority,
+               self.idle_timeout, self.hard_timeout, self.cookie,
+               self.packet_count, self.byte_count))
 
   def unpack (self, raw, offset, avail):
     _offset = offset
-    offset,(length, self.table_id, pad) = _unpack("!HBB", raw, offset)
-    assert pad == 0
-    offset = self.match.unpack(raw, offset)
-    offset,(self.duration_sec, self.duration_nsec, self.priority,
-            self.idle_timeout, self.hard_timeout) = \
-            _unpack("!LLHHH", raw, offset)
-    offset = _skip(raw, offset, 6)
-    offset,(self.cookie, self.packet_count, self.byte_count) = \
-        _unpack("!QQQ", raw, offset)
-    assert (offset - _offset) == 48 + len(self.match)
-    offset,self.actions = _unpack_actions(raw,
-        length - (48 + len(self.match)), offset)
+    offset,values = _flow_stats_schema.unpack_from(raw, offset)
+    length,self.table_id = values[:2]
+    self.match._unpack_values(values[2:15])
+    (self.duration_sec, self.duration_nsec, self.priority,
+     self.idle_timeout, self.hard_timeout, self.cookie, self.packet_count,
+     self.byte_count) = values[15:]
+    offset,self.actions = _unpack_actions(raw, length - 88, offset)
     assert offset - _offset == len(self)
     return offset
 
@@ -3524,6 +3759,9 @@ class ofp_generic_stats_body (ofp_stats_body_base):
     return outstr
 
 
+_packet_out_schema = _header_schema + _Schema(
+    ("buffer_id", "L"), ("in_port", "H"), ("actions_len", "H"))
+
 @openflow_c_message("OFPT_PACKET_OUT", 13)
 class ofp_packet_out (ofp_header):
   _MIN_LENGTH = 16
@@ -3587,23 +3825,37 @@ class ofp_packet_out (ofp_header):
   def pack (self):
     assert self._assert()
 
-    actions = b''.join((i.pack() for i in self.actions))
+    actions = b''.join([i.pack() for i in self.actions])
     actions_len = len(actions)
+    data = self._data
 
-    if self.data is not None:
-      return b''.join((ofp_header.pack(self),
-        struct.pack("!LHH", self._buffer_id, self.in_port, actions_len),
-        actions, self.data))
-    else:
-      return b''.join((ofp_header.pack(self),
-      struct.pack("!LHH", self._buffer_id, self.in_port, actions_len),
-      actions))
+    return b''.join((_packet_out_schema.pack(self.version,
+                                             self.header_type,
+                                             16 + actions_len + len(data),
+                                             self.xid, self._buffer_id,
+                                             self.in_port, actions_len),
+                     actions, data))
+
+  def pack_into (self, buf, offset=0):
+    assert self._assert()
+    actions_len = sum(len(a) for a in self.actions)
+    data = self._data
+    length = 16 + actions_len + len(data)
+    _ensure_room(buf, offset, length)
+    _packet_out_schema.pack_into(buf, offset, self.version,
+                                 self.header_type, length, self.xid,
+                                 self._buffer_id, self.in_port, actions_len)
+    offset += 16
+    for a in self.actions:
+      offset = a.pack_into(buf, offset)
+    buf[offset:offset+len(data)] = data
+    return offset + len(data)
 
   def unpack (self, raw, offset=0):
     _offset = offset
-    offset,length = self._unpack_header(raw, offset)
-    offset,(self._buffer_id, self.in_port, actions_len) = \
-        _unpack("!LHH", raw, offset)
+    offset,(self.version, self.header_type, length, self.xid,
+            self._buffer_id, self.in_port, actions_len) = \
+        _packet_out_schema.unpack_from(raw, offset)
     offset,self.actions = _unpack_actions(raw, actions_len, offset)
 
     remaining = length - (offset - _offset)
@@ -3716,6 +3968,10 @@ class ofp_barrier_request (ofp_header):
 
 
 #4 Asynchronous Messages
+_packet_in_schema = _header_schema + _Schema(
+    ("buffer_id", "L"), ("total_len", "H"), ("in_port", "H"),
+    ("reason", "B"), (None, "x"))
+
 @openflow_s_message("OFPT_PACKET_IN", 10)
 class ofp_packet_in (ofp_header):
   _MIN_LENGTH = 18
@@ -3772,13 +4028,23 @@ class ofp_packet_in (ofp_header):
   def pack (self):
     assert self._assert()
 
-    packed = b""
-    packed += ofp_header.pack(self)
-    packed += struct.pack("!LHHBB", self._buffer_id, self.total_len,
-                          self.in_port, self.reason, 0)
-    packed += self.data
+    data = self._data
     #TODO: Padding?  See __len__
-    return packed
+    return _packet_in_schema.pack(self.version, self.header_type,
+                                  18 + len(data), self.xid,
+                                  self._buffer_id, self.total_len,
+                                  self.in_port, self.reason) + data
+
+  def pack_into (self, buf, offset=0):
+    assert self._assert()
+    data = self._data
+    _ensure_room(buf, offset, 18 + len(data))
+    _packet_in_schema.pack_into(buf, offset, self.version, self.header_type,
+                                18 + len(data), self.xid, self._buffer_id,
+                                self.total_len, self.in_port, self.reason)
+    offset += 18
+    buf[offset:offset+len(data)] = data
+    return offset + len(data)
 
   @property
   def is_complete (self):
@@ -3786,9 +4052,9 @@ class ofp_packet_in (ofp_header):
     return len(self.data) == self.total_len
 
   def unpack (self, raw, offset=0):
-    offset,length = self._unpack_header(raw, offset)
-    offset,(self._buffer_id, self._total_len, self.in_port, self.reason,
-            pad) = _unpack("!LHHBB", raw, offset)
+    offset,(self.version, self.header_type, length, self.xid,
+            self._buffer_id, self._total_len, self.in_port, self.reason) = \
+        _packet_in_schema.unpack_from(raw, offset)
     offset,self.data = _read(raw, offset, length-18)
     assert length == len(self)
     return offset,length
@@ -4452,3 +4718,5 @@ ofp_match_data = {
   'tp_src' : (0, OFPFW_TP_SRC),
   'tp_dst' : (0, OFPFW_TP_DST),
 }
+
+_match_defaults = dict(('_' + k, v[0]) for k,v in ofp_match_data.iteritems())
@@ -25,13 +25,19 @@ from pox.lib.addresses import EthAddr
 from pox.lib.revent.revent import EventMixin
 import datetime
 import time
-from pox.lib.socketcapture import CaptureSocket
+from pox.lib.socketcapture import CaptureSocket, BufferedPCapWriter
+from pox.lib.socketcapture import PCapRingFile
 import pox.openflow.debug
 from pox.openflow.util import make_type_to_unpacker_table
+from pox.openflow.columnar_stats import columns_for_type
 from pox.openflow import *
+from pox.log.hotpath import HotLogger, lazy
 
 log = core.getLogger()
 
+# For things which can happen once per message (and so flood the log)
+_hot_log = HotLogger(log, rate = 10, burst = 50)
+
 import socket
 import select
 
@@ -56,6 +62,7 @@ import pox.openflow.libopenflow_01 as of
 import threading
 import os
 import sys
+import struct
 import exceptions
 from errno import EAGAIN, ECONNRESET, EADDRINUSE, EADDRNOTAVAIL
 
@@ -173,18 +180,27 @@ def handle_PORT_STATUS (con, msg): #A
     con.raiseEventNoErrors(PortStatus, con, msg)
 
 def handle_PACKET_IN (con, msg): #A
+  admission = con.ofnexus.packet_in_admission
+  if admission is not None and not admission.admit(con, msg):
+    return
+  raise_packet_in(con, msg)
+
+def raise_packet_in (con, msg):
   e = con.ofnexus.raiseEventNoErrors(PacketIn, con, msg)
   if e is None or e.halt != True:
     con.raiseEventNoErrors(PacketIn, con, msg)
 
+def _indent_msg (con, msg):
+  return ("\n" + str(con) + " ").join(str(msg).split('\n'))
+
 def handle_ERROR_MSG (con, msg): #A
   err = ErrorIn(con, msg)
   e = con.ofnexus.raiseEventNoErrors(err)
   if e is None or e.halt != True:
     con.raiseEventNoErrors(err)
   if err.should_log:
-    log.error(str(con) + " OpenFlow Error:\n" +
-              msg.show(str(con) + " Error: ").strip())
+    _hot_log.error("%s OpenFlow Error:\n%s", con,
+                   lazy(lambda: msg.show(str(con) + " Error: ").strip()))
 
 def handle_BARRIER (con, msg):
   e = con.ofnexus.raiseEventNoErrors(BarrierIn, con, msg)
@@ -238,7 +254,17 @@ def handle_OFPST_QUEUE (con, parts):
     con.raiseEventNoErrors(QueueStatsReceived, con, parts, msg)
 
 def handle_VENDOR (con, msg):
-  log.info("Vendor msg: " + str(msg))
+  _hot_log.info("Vendor msg: %s", msg)
+
+def raise_stats_chunk (con, xid, stats_type, stats, last, ofp = None):
+  """
+  Raises a StatsChunk (or a more specific subclass) for a streamed reply
+  """
+  cls = statsChunkEventMap.get(stats_type, StatsChunk)
+  e = con.ofnexus.raiseEventNoErrors(cls, con, xid, stats_type, stats, last,
+                                     ofp)
+  if e is None or e.halt != True:
+    con.raiseEventNoErrors(cls, con, xid, stats_type, stats, last, ofp)
 
 
 # A list, where the index is an OFPT, and the value is a function to
@@ -270,6 +296,15 @@ statsHandlerMap = {
   of.OFPST_QUEUE : handle_OFPST_QUEUE,
 }
 
+# Events for streamed stats replies (anything else gets a plain StatsChunk)
+statsChunkEventMap = {
+  of.OFPST_FLOW : FlowStatsChunk,
+  of.OFPST_PORT : PortStatsChunk,
+}
+
+# Unpacks the xid, stats type and flags of an ofp_stats_reply
+_stats_reply_header = struct.Struct("!4xLHH")
+
 # Deferred sending should be unusual, so don't worry too much about
 # efficiency
 class DeferredSender (threading.Thread):
@@ -423,41 +458,33 @@ class OFCaptureSocket (CaptureSocket):
 
   def _recv_out (self, buf):
     if not self._enabled: return
-    self._rbuf += buf
-    l = len(self._rbuf)
-    while l > 4:
-      if ord(self._rbuf[0]) != of.OFP_VERSION:
-        log.error("Bad OpenFlow version while trying to capture trace")
-        self._enabled = False
-        break
-      packet_length = ord(self._rbuf[2]) << 8 | ord(self._rbuf[3])
-      if packet_length > l: break
-      try:
-        self._writer.write(False, self._rbuf[:packet_length])
-      except Exception:
-        log.exception("Exception while writing controller trace")
-        self._enabled = False
-      self._rbuf = self._rbuf[packet_length:]
-      l = len(self._rbuf)
+    self._rbuf = self._capture(False, self._rbuf + buf)
 
   def _send_out (self, buf, r):
     if not self._enabled: return
-    self._sbuf += buf
-    l = len(self._sbuf)
-    while l > 4:
-      if ord(self._sbuf[0]) != of.OFP_VERSION:
+    self._sbuf = self._capture(True, self._sbuf + buf[:r])
+
+  def _capture (self, outgoing, data):
+    """
+    Writes each complete OpenFlow message in data and returns the rest
+    """
+    offset = 0
+    l = len(data)
+    while l - offset >= 4:
+      if ord(data[offset]) != of.OFP_VERSION:
         log.error("Bad OpenFlow version while trying to capture trace")
         self._enabled = False
         break
-      packet_length = ord(self._sbuf[2]) << 8 | ord(self._sbuf[3])
-      if packet_length > l: break
+      packet_length = ord(data[offset+2]) << 8 | ord(data[offset+3])
+      if packet_length > l - offset: break
       try:
-        self._writer.write(True, self._sbuf[:packet_length])
+        self._writer.write(outgoing, data[offset:offset+packet_length])
       except Exception:
         log.exception("Exception while writing controller trace")
         self._enabled = False
-      self._sbuf = self._sbuf[packet_length:]
-      l = len(self._sbuf)
+      offset += packet_length
+    if offset == 0: return data
+    return data[offset:]
 
 
 class PortCollection (object):
@@ -583,6 +610,9 @@ class Connection (EventMixin):
     TableStatsReceived,
     PortStatsReceived,
     QueueStatsReceived,
+    StatsChunk,
+    FlowStatsChunk,
+    PortStatsChunk,
     FlowRemoved,
   ])
 
@@ -591,21 +621,29 @@ class Connection (EventMixin):
 
   def msg (self, m):
     #print str(self), m
-    log.debug(str(self) + " " + str(m))
+    log.debug("%s %s", self, m)
   def err (self, m):
     #print str(self), m
-    log.error(str(self) + " " + str(m))
+    log.error("%s %s", self, m)
   def info (self, m):
     pass
     #print str(self), m
-    log.info(str(self) + " " + str(m))
+    log.info("%s %s", self, m)
 
   def __init__ (self, sock):
-    self._previous_stats = []
+    # Parts of multipart stats replies we're still waiting on (xid -> list)
+    self._previous_stats = {}
+    # Requests made with stream_stats() (xid -> True if columnar)
+    self._stats_streams = {}
 
     self.ofnexus = _dummyOFNexus
     self.sock = sock
     self.buf = ''
+    # Data received since buf was last parsed, and how long buf needs to
+    # be before there's a whole message in it (see read())
+    self._rx_chunks = []
+    self._rx_pending = 0
+    self._rx_need = 8
     Connection.ID += 1
     self.ID = Connection.ID
     # TODO: dpid and features don't belong here; they should be eventually
@@ -617,6 +655,13 @@ class Connection (EventMixin):
     self.connect_time = None
     self.idle_time = time.time()
 
+    # Counts of sends and bytes sent (see OpenFlowNexus.get_send_rates())
+    self.tx_messages = 0
+    self.tx_bytes = 0
+    # ...and of messages and bytes received
+    self.rx_messages = 0
+    self.rx_bytes = 0
+
     self.send(of.ofp_hello())
 
     self.original_ports = PortCollection()
@@ -691,6 +736,9 @@ class Connection (EventMixin):
       assert isinstance(data, of.ofp_header)
       data = data.pack()
 
+    self.tx_messages += 1
+    self.tx_bytes += len(data)
+
     if deferredSender.sending:
       log.debug("deferred sender is sending!")
       deferredSender.send(self, data)
@@ -723,6 +771,18 @@ class Connection (EventMixin):
       return False
     if len(d) == 0:
       return False
+    self.rx_bytes += len(d)
+    if len(self.buf) + self._rx_pending + len(d) < self._rx_need:
+      # Still not a whole message (e.g., part of a big stats reply).  Just
+      # hold on to it rather than growing buf a piece at a time.
+      self._rx_chunks.append(d)
+      self._rx_pending += len(d)
+      return True
+    if self._rx_chunks:
+      self._rx_chunks.append(d)
+      d = b''.join(self._rx_chunks)
+      self._rx_chunks = []
+      self._rx_pending = 0
     self.buf += d
     buf_len = len(self.buf)
 
@@ -748,58 +808,122 @@ class Connection (EventMixin):
 
       if buf_len - offset < msg_length: break
 
+      if ofp_type == of.OFPT_STATS_REPLY and self._stats_streams:
+        if self._incoming_raw_stats_reply(self.buf, offset, msg_length):
+          offset += msg_length
+          self.rx_messages += 1
+          continue
+
       new_offset,msg = unpackers[ofp_type](self.buf, offset)
       assert new_offset - offset == msg_length
       offset = new_offset
+      self.rx_messages += 1
 
       try:
         h = handlers[ofp_type]
         h(self, msg)
       except:
-        log.exception("%s: Exception while handling OpenFlow message:\n" +
-                      "%s %s", self,self,
-                      ("\n" + str(self) + " ").join(str(msg).split('\n')))
+        _hot_log.exception("%s: Exception while handling OpenFlow message:\n"
+                           + "%s %s", self, self,
+                           lazy(_indent_msg, self, msg))
         continue
 
     if offset != 0:
       self.buf = self.buf[offset:]
 
+    if len(self.buf) >= 4:
+      self._rx_need = max(8, ord(self.buf[2]) << 8 | ord(self.buf[3]))
+    else:
+      self._rx_need = 8
+
+    return True
+
+  def stream_stats (self, request, columnar = False):
+    """
+    Sends a stats request whose reply is delivered part by part
+
+    Rather than collecting every part of a (possibly huge) multipart reply
+    and then raising, e.g., FlowStatsReceived, each part is handed out as
+    soon as it arrives in a StatsChunk event (FlowStatsChunk or
+    PortStatsChunk for flow and port stats) with the request's xid.
+
+    request is an ofp_stats_request or just its body (e.g., an
+    ofp_flow_stats_request).  If columnar is True, flow and port stats
+    are decoded straight into a FlowStatsColumns/PortStatsColumns without
+    building a message object for each entry (RawStatsReply is not raised
+    for these).
+
+    Several requests can be outstanding at once.  Returns the xid.
+    """
+    if not isinstance(request, of.ofp_stats_request):
+      request = of.ofp_stats_request(body=request)
+    self._stats_streams[request.xid] = bool(columnar)
+    self.send(request)
+    return request.xid
+
+  def _incoming_raw_stats_reply (self, buf, offset, length):
+    """
+    Handles a stats reply for a columnar stream without unpacking it
+
+    Returns False if the reply isn't for one.
+    """
+    xid,stats_type,flags = _stats_reply_header.unpack_from(buf, offset)
+    if not self._stats_streams.get(xid): return False
+    cls = columns_for_type.get(stats_type)
+    if cls is None: return False
+    last = (flags & 1) == 0
+    if last:
+      del self._stats_streams[xid]
+    stats = cls()
+    try:
+      stats.append_raw(buf, offset + 12, offset + length)
+    except Exception:
+      log.exception("%s: Bad stats reply for xid %s", self, xid)
+      self._stats_streams.pop(xid, None)
+      return True
+    raise_stats_chunk(self, xid, stats_type, stats, last)
     return True
 
   def _incoming_stats_reply (self, ofp):
-    # This assumes that you don't receive multiple stats replies
-    # to different requests out of order/interspersed.
+    if ofp.xid in self._stats_streams:
+      if ofp.is_last_reply:
+        del self._stats_streams[ofp.xid]
+      body = ofp.body
+      if not isinstance(body, list): body = [body]
+      raise_stats_chunk(self, ofp.xid, ofp.type, body, ofp.is_last_reply,
+                        ofp)
+      return
+
     if not ofp.is_last_reply:
       if ofp.type not in [of.OFPST_FLOW, of.OFPST_TABLE,
                                 of.OFPST_PORT, of.OFPST_QUEUE]:
         log.error("Don't know how to aggregate stats message of type " +
                   str(ofp.type))
-        self._previous_stats = []
+        self._previous_stats.pop(ofp.xid, None)
         return
 
-    if len(self._previous_stats) != 0:
-      if ((ofp.xid == self._previous_stats[0].xid) and
-          (ofp.type == self._previous_stats[0].type)):
-        self._previous_stats.append(ofp)
-      else:
-        log.error("Was expecting continued stats of type %i with xid %i, " +
-                  "but got type %i with xid %i" %
-                  (self._previous_stats_reply.xid,
-                    self._previous_stats_reply.type,
-                    ofp.xid, ofp.type))
-        self._previous_stats = [ofp]
+    # Replies to different requests may be interleaved, so parts are kept
+    # per xid.
+    parts = self._previous_stats.get(ofp.xid)
+    if parts is None:
+      parts = [ofp]
+      if not ofp.is_last_reply:
+        self._previous_stats[ofp.xid] = parts
+    elif ofp.type != parts[0].type:
+      log.error("Was expecting continued stats of type %i with xid %i, "
+                "but got type %i", parts[0].type, ofp.xid, ofp.type)
+      parts = [ofp]
+      self._previous_stats[ofp.xid] = parts
     else:
-      self._previous_stats = [ofp]
+      parts.append(ofp)
 
     if ofp.is_last_reply:
-      handler = statsHandlerMap.get(self._previous_stats[0].type, None)
-      s = self._previous_stats
-      self._previous_stats = []
+      self._previous_stats.pop(ofp.xid, None)
+      handler = statsHandlerMap.get(parts[0].type, None)
       if handler is None:
-        log.warn("No handler for stats of type " +
-                 str(self._previous_stats[0].type))
+        log.warn("No handler for stats of type " + str(parts[0].type))
         return
-      handler(self, s)
+      handler(self, parts)
 
   def __str__ (self):
     #return "[Con " + str(self.ID) + "/" + str(self.dpid) + "]"
@@ -814,10 +938,20 @@ def wrap_socket (new_sock):
   fname = datetime.datetime.now().strftime("%Y-%m-%d-%I%M%p")
   fname += "_" + new_sock.getpeername()[0].replace(".", "_")
   fname += "_" + `new_sock.getpeername()[1]` + ".pcap"
-  pcapfile = file(fname, "w")
+  opts = pox.openflow.debug.pcap_options
+  kw = {}
+  if opts.get('buffered'):
+    kw['writer_class'] = BufferedPCapWriter
+    for k in ('buffer_size', 'threaded', 'sample', 'tcp_checksum'):
+      if k in opts: kw[k] = opts[k]
+  if opts.get('max_bytes'):
+    pcapfile = PCapRingFile(fname, max_bytes=opts['max_bytes'],
+                            max_files=opts.get('max_files', 4))
+  else:
+    pcapfile = file(fname, "w")
   try:
     new_sock = OFCaptureSocket(new_sock, pcapfile,
-                               local_addrs=(None,None,6633))
+                               local_addrs=(None,None,6633), **kw)
   except Exception:
     import traceback
     traceback.print_exc()
@@ -826,16 +960,24 @@ def wrap_socket (new_sock):
 
 
 from pox.lib.recoco.recoco import *
+from pox.lib.util import str_to_bool
+
+# Python 2 doesn't have the constant, but Linux has had the option since 3.9
+_SO_REUSEPORT = getattr(socket, "SO_REUSEPORT",
+                        15 if sys.platform.startswith("linux") else None)
 
 class OpenFlow_01_Task (Task):
   """
   The main recoco thread for listening to openflow messages
   """
-  def __init__ (self, port = 6633, address = '0.0.0.0'):
+  def __init__ (self, port = 6633, address = '0.0.0.0', reuse_port = False):
     Task.__init__(self)
     self.port = int(port)
     self.address = address
     self.started = False
+    # With SO_REUSEPORT, several processes can listen on the same port and
+    # the kernel spreads connections among them (see openflow.shard).
+    self.reuse_port = reuse_port
 
     core.addListener(pox.core.GoingUpEvent, self._handle_GoingUpEvent)
 
@@ -854,6 +996,11 @@ class OpenFlow_01_Task (Task):
 
     listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if self.reuse_port:
+      if _SO_REUSEPORT is None:
+        log.error("SO_REUSEPORT is not available on this platform")
+        return
+      listener.setsockopt(socket.SOL_SOCKET, _SO_REUSEPORT, 1)
     try:
       listener.bind((self.address, self.port))
     except socket.error as (errno, strerror):
@@ -922,7 +1069,7 @@ class OpenFlow_01_Task (Task):
             doTraceback = False
 
         if doTraceback:
-          log.exception("Exception reading connection " + str(con))
+          log.exception("Exception reading connection %s", con)
 
         if con is listener:
           log.error("Exception on OpenFlow listener.  Aborting.")
@@ -952,7 +1099,7 @@ _set_handlers()
 # Used by the Connection class
 deferredSender = None
 
-def launch (port = 6633, address = "0.0.0.0"):
+def launch (port = 6633, address = "0.0.0.0", reuse_port = False):
   if core.hasComponent('of_01'):
     return None
 
@@ -962,6 +1109,7 @@ def launch (port = 6633, address = "0.0.0.0"):
   if of._logger is None:
     of._logger = core.getLogger('libopenflow_01')
 
-  l = OpenFlow_01_Task(port = int(port), address = address)
+  l = OpenFlow_01_Task(port = int(port), address = address,
+                       reuse_port = str_to_bool(reuse_port))
   core.register("of_01", l)
   return l
@@ -0,0 +1,366 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Spreads OpenFlow switches across several POX processes
+
+All OpenFlow processing normally happens in one recoco thread, so one
+POX process can only use one core no matter how many switches there are.
+This component starts extra copies of POX with the same commandline, and
+every copy listens on the OpenFlow port with SO_REUSEPORT so that the
+kernel spreads switch connections among them.  Each process (shard) runs
+its own scheduler and component stack for the switches connected to it.
+
+Shards share a bit of state over a local Unix socket, using the same
+framing as the messenger (a stream of JSON objects with a CHANNEL key).
+The first process is the hub; it relays updates between the others and
+sends the current state to each one as it joins.  Shared tables are on
+core.openflow_shard:
+  switches: dpid -> shard the switch is connected to
+  links:    discovery Link -> shard that detected it
+  hosts:    EthAddr -> (dpid, port), from host_tracker
+Changes (local or remote) fire ShardStateEvent.  Discovery uses the
+switches table to accept LLDPs from switches connected to other shards.
+Links like that only go in the links table; discovery doesn't raise
+LinkEvents for them, so local components only ever see local switches.
+
+Example:
+./pox.py openflow.shard --workers=4 openflow.discovery forwarding.l2_learning
+
+Requires SO_REUSEPORT (Linux 3.9+).
+"""
+
+from pox.core import core
+from pox.lib.revent import *
+from pox.lib.ioworker import RecocoIOWorker, new_ioloop
+from pox.lib.addresses import EthAddr
+from pox.messenger import defaultDecoder
+import json
+import os
+import sys
+import socket
+import subprocess
+import tempfile
+import shutil
+
+log = core.getLogger()
+
+_WORKER_ENV = "POX_SHARD_WORKER"
+_HUB_ENV = "POX_SHARD_HUB"
+
+_CHANNEL = "openflow_shard"
+
+
+class ShardStateEvent (Event):
+  """
+  Fired when an entry in one of the shared tables changes
+
+  table is the name of the table ("switches", "links" or "hosts").  value
+  is None if the entry was removed.  shard is the shard which made the
+  change, and remote is True if that was some other process.
+  """
+  def __init__ (self, table, key, value, shard, remote):
+    Event.__init__(self)
+    self.table = table
+    self.key = key
+    self.value = value
+    self.shard = shard
+    self.remote = remote
+
+  @property
+  def added (self):
+    return self.value is not None
+
+
+def _link_from_json (l):
+  from pox.openflow.discovery import Link
+  return Link(*l)
+
+# table -> (encode key, decode key, encode value, decode value)
+_codecs = {
+  'switches': (int, int, int, int),
+  'links': (list, _link_from_json, int, int),
+  'hosts': (str, EthAddr, list, tuple),
+}
+
+
+class ShardPeer (RecocoIOWorker):
+  """
+  One end of the connection between the hub and a worker shard
+  """
+  def __init__ (self, socket, nexus = None):
+    super(ShardPeer, self).__init__(socket)
+    self.nexus = nexus
+    self.shard = None
+    self._buf = b''
+
+  def send_message (self, msg):
+    msg['CHANNEL'] = _CHANNEL
+    self.send(json.dumps(msg, default=str) + "\n")
+
+  def _handle_rx (self):
+    # Same framing as messenger.Connection._rx_raw()
+    self._buf = (self._buf + self.read()).lstrip()
+    while self._buf:
+      try:
+        msg, l = defaultDecoder.raw_decode(self._buf)
+      except ValueError:
+        # Need more data
+        return
+      self._buf = self._buf[l:].lstrip()
+      if msg.get('CHANNEL') != _CHANNEL: continue
+      self.nexus._rx_message(self, msg)
+
+  def _handle_close (self):
+    self.nexus._peer_closed(self)
+
+  def __repr__ (self):
+    return "<%s %s>" % (type(self).__name__, self.shard)
+
+
+class _HubListener (RecocoIOWorker):
+  """
+  Accepts connections from worker shards on the hub's Unix socket
+  """
+  def __init__ (self, socket, nexus = None):
+    super(_HubListener, self).__init__(socket)
+    self.nexus = nexus
+
+  def _do_recv (self, loop):
+    s,addr = self.socket.accept()
+    s.setblocking(0)
+    peer = loop.new_worker(socket = s, nexus = self.nexus,
+                           _worker_type = ShardPeer)
+    self.nexus._peers.add(peer)
+
+  def _handle_close (self):
+    pass
+
+
+class ShardNexus (EventMixin):
+  """
+  Keeps the state shared between shards and talks to the other shards
+
+  Shard 0 is the hub; it spawns the others and relays their updates.
+  """
+  _eventMixin_events = set([ShardStateEvent])
+
+  def __init__ (self, shard_id, workers, hub_path):
+    self.shard_id = shard_id
+    self.workers = workers
+    self.hub_path = hub_path
+    self.switches = {}
+    self.links = {}
+    self.hosts = {}
+    self._owners = dict((t, {}) for t in _codecs)
+    self._peers = set()
+    self._processes = []
+    self._tmpdir = None
+    self._loop = None
+    self._hub_socket = None
+
+    if self.is_hub:
+      self._tmpdir = tempfile.mkdtemp(prefix="pox-shard-")
+      self.hub_path = os.path.join(self._tmpdir, "hub")
+      s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      s.bind(self.hub_path)
+      s.listen(max(16, workers))
+      s.setblocking(0)
+      self._hub_socket = s
+    else:
+      # Connect now so we fail early if the hub isn't there
+      s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      s.connect(self.hub_path)
+      s.setblocking(0)
+      self._hub_socket = s
+
+    core.addListeners(self)
+    core.call_when_ready(self._of_01_ready, 'of_01')
+
+  @property
+  def is_hub (self):
+    return self.shard_id == 0
+
+  def owner_of (self, dpid):
+    """
+    Returns the shard a switch is connected to, or None
+    """
+    return self.switches.get(dpid)
+
+  def _of_01_ready (self):
+    core.of_01.reuse_port = True
+
+  def _handle_GoingUpEvent (self, event):
+    self._loop = new_ioloop()
+    self._loop.start()
+    if self.is_hub:
+      self._loop.new_worker(socket = self._hub_socket, nexus = self,
+                            _worker_type = _HubListener)
+      self._spawn_workers()
+    else:
+      hub = self._loop.new_worker(socket = self._hub_socket, nexus = self,
+                                  _worker_type = ShardPeer)
+      hub.shard = 0
+      self._peers.add(hub)
+      hub.send_message({'cmd':'hello', 'shard':self.shard_id})
+
+    if core.hasComponent('openflow'):
+      self.listenTo(core.openflow)
+    if core.hasComponent('openflow_discovery'):
+      self.listenTo(core.openflow_discovery)
+    if core.hasComponent('host_tracker'):
+      self.listenTo(core.host_tracker)
+
+  def _spawn_workers (self):
+    cmd = [sys.executable]
+    if sys.flags.optimize: cmd.append("-O")
+    cmd += sys.argv
+    for i in range(1, self.workers):
+      env = dict(os.environ)
+      env[_WORKER_ENV] = str(i)
+      env[_HUB_ENV] = self.hub_path
+      self._processes.append(subprocess.Popen(cmd, env=env))
+    log.info("Started %i worker shard(s)", self.workers - 1)
+
+  def _handle_DownEvent (self, event):
+    for p in self._processes:
+      try:
+        p.terminate()
+        p.wait()
+      except Exception:
+        pass
+    del self._processes[:]
+    if self._tmpdir:
+      shutil.rmtree(self._tmpdir, ignore_errors = True)
+      self._tmpdir = None
+
+  # Local changes
+
+  def _handle_ConnectionUp (self, event):
+    self.set('switches', event.dpid, self.shard_id)
+
+  def _handle_ConnectionDown (self, event):
+    self.remove('switches', event.dpid)
+
+  def _handle_LinkEvent (self, event):
+    if event.added:
+      self.set('links', event.link, self.shard_id)
+    else:
+      self.remove('links', event.link)
+
+  def _handle_HostEvent (self, event):
+    mac = event.entry.macaddr
+    if event.leave:
+      self.remove('hosts', mac)
+    elif event.move:
+      self.set('hosts', mac, (event.new_dpid, event.new_port))
+    else:
+      self.set('hosts', mac, (event.entry.dpid, event.entry.port))
+
+  def set (self, table, key, value):
+    """
+    Sets an entry in a shared table and tells the other shards
+    """
+    if self._apply(table, key, value, self.shard_id):
+      self._send(self._encode(table, key, value, self.shard_id))
+
+  def remove (self, table, key):
+    """
+    Removes an entry we set from a shared table and tells the other shards
+    """
+    if self._apply(table, key, None, self.shard_id):
+      self._send(self._encode(table, key, None, self.shard_id))
+
+  def _apply (self, table, key, value, shard):
+    """
+    Updates a table, returning True if something changed
+
+    Entries can only be removed by the shard that set them last, so a
+    slow removal from one shard doesn't undo a newer update from another
+    (e.g., a host which moved).
+    """
+    entries = getattr(self, table)
+    owners = self._owners[table]
+    if value is None:
+      if owners.get(key) != shard: return False
+      del entries[key]
+      del owners[key]
+    else:
+      if owners.get(key) == shard and entries[key] == value: return False
+      entries[key] = value
+      owners[key] = shard
+    if shard != self.shard_id:
+      log.debug("%s[%s] = %s from shard %s", table, key, value, shard)
+    self.raiseEventNoErrors(ShardStateEvent, table, key, value, shard,
+                            shard != self.shard_id)
+    return True
+
+  # Talking to other shards
+
+  @staticmethod
+  def _encode (table, key, value, shard):
+    enc_key,_,enc_value,_ = _codecs[table]
+    msg = {'cmd':'set', 'table':table, 'key':enc_key(key), 'shard':shard}
+    if value is None:
+      msg['cmd'] = 'del'
+    else:
+      msg['value'] = enc_value(value)
+    return msg
+
+  def _send (self, msg, exclude = None):
+    for peer in self._peers:
+      if peer is exclude: continue
+      peer.send_message(dict(msg))
+
+  def _rx_message (self, peer, msg):
+    cmd = msg.get('cmd')
+    if cmd == 'hello':
+      peer.shard = msg['shard']
+      log.debug("Shard %s joined", peer.shard)
+      # Catch it up on everything so far
+      for table in _codecs:
+        for key,value in getattr(self, table).items():
+          peer.send_message(self._encode(table, key, value,
+                                         self._owners[table][key]))
+    elif cmd in ('set', 'del'):
+      table = str(msg['table'])
+      _,dec_key,_,dec_value = _codecs[table]
+      value = dec_value(msg['value']) if cmd == 'set' else None
+      if self._apply(table, dec_key(msg['key']), value, msg['shard']):
+        if self.is_hub:
+          self._send(msg, exclude = peer)
+    else:
+      log.warn("Unknown message from shard %s: %s", peer.shard, cmd)
+
+  def _peer_closed (self, peer):
+    self._peers.discard(peer)
+    if not core.running: return
+    if not self.is_hub:
+      log.error("Lost connection to hub shard; quitting")
+      core.quit()
+      return
+    log.warn("Lost shard %s", peer.shard)
+    # Whatever it owned is gone
+    for table in _codecs:
+      for key,owner in self._owners[table].items():
+        if owner != peer.shard: continue
+        if self._apply(table, key, None, owner):
+          self._send(self._encode(table, key, None, owner))
+
+
+def launch (workers = 2):
+  """
+  Spread switch connections across workers processes (including this one)
+  """
+  shard_id = int(os.environ.get(_WORKER_ENV, 0))
+  nexus = ShardNexus(shard_id, int(workers), os.environ.get(_HUB_ENV))
+  core.register("openflow_shard", nexus)
@@ -33,7 +33,7 @@ of going about it.
 from pox.core import core
 import pox.openflow.libopenflow_01 as of
 from pox.lib.revent import *
-from collections import defaultdict
+from collections import defaultdict, deque
 from pox.openflow.discovery import Discovery
 from pox.lib.util import dpidToStr
 from pox.lib.recoco import Timer
@@ -41,8 +41,231 @@ import time
 
 log = core.getLogger()
 
-# Might be nice if we made this accessible on core...
-#_adj = defaultdict(lambda:defaultdict(lambda:[]))
+class _TreeState (object):
+  """
+  Spanning tree which is updated incrementally as links come and go
+
+  links maps (dpid1,dpid2) to the set of (port1,port2) pairs which discovery
+  has seen in both directions.  adj maps dpid1 to {dpid2:port1} using one
+  of those links for each neighbor, and tree is the subset of adj which is
+  on the spanning tree.  Every switch with a link is in a component (of
+  switches connected by adj), and a link change only ever touches the
+  component(s) of the switches on the link.
+
+  link_up() should only be called once a link has been seen in both
+  directions.  It and link_down() return the set of switches whose tree
+  ports changed.
+  """
+  def __init__ (self):
+    self.clear()
+
+  def clear (self):
+    self.links = defaultdict(set)
+    self.adj = defaultdict(dict)
+    self.tree = defaultdict(dict)
+    self.component = {} # DPID -> component id
+    self.members = {} # Component id -> set of DPIDs
+    self._next_component = 1
+
+  def rebuild (self, adjacency):
+    """
+    Recalculates everything from a Discovery adjacency table
+    """
+    self.clear()
+    for l in adjacency:
+      if l.dpid1 == l.dpid2: continue
+      if Discovery.Link(l.dpid2,l.port2,l.dpid1,l.port1) in adjacency:
+        self.links[(l.dpid1,l.dpid2)].add((l.port1,l.port2))
+    for (s1,s2),pairs in self.links.iteritems():
+      if s1 > s2: continue
+      # Both ends have to use the same link
+      port1,port2 = min(pairs)
+      self.adj[s1][s2] = port1
+      self.adj[s2][s1] = port2
+    self._span(self.adj.keys())
+
+  def tree_ports (self, dpid):
+    t = self.tree.get(dpid)
+    if not t: return set()
+    return set(t.itervalues())
+
+  def as_dict (self):
+    """
+    Returns the tree in the format of _calc_spanning_tree()
+    """
+    tree = defaultdict(set)
+    for s1,neighbors in self.tree.iteritems():
+      if neighbors:
+        tree[s1] = set(neighbors.iteritems())
+    return tree
+
+  def link_up (self, dpid1, port1, dpid2, port2):
+    if dpid1 == dpid2: return set()
+    pairs = self.links[(dpid1,dpid2)]
+    if (port1,port2) in pairs: return set()
+    pairs.add((port1,port2))
+    self.links[(dpid2,dpid1)].add((port2,port1))
+    if dpid2 in self.adj[dpid1]:
+      return set() # Just another link between the same switches
+
+    self.adj[dpid1][dpid2] = port1
+    self.adj[dpid2][dpid1] = port2
+    c1 = self._component_of(dpid1)
+    c2 = self._component_of(dpid2)
+    if c1 == c2:
+      return set() # Makes a loop; not on the tree
+
+    # Joins two components, so it goes on the tree
+    self._merge(c1, c2)
+    self.tree[dpid1][dpid2] = port1
+    self.tree[dpid2][dpid1] = port2
+    return set([dpid1, dpid2])
+
+  def link_down (self, dpid1, port1, dpid2, port2):
+    pairs = self.links.get((dpid1,dpid2))
+    if not pairs or (port1,port2) not in pairs: return set()
+    pairs.discard((port1,port2))
+    self.links[(dpid2,dpid1)].discard((port2,port1))
+    if (self.adj[dpid1].get(dpid2) != port1
+        or self.adj[dpid2].get(dpid1) != port2):
+      return set() # Wasn't the link we were using
+
+    on_tree = dpid2 in self.tree.get(dpid1, ())
+    if pairs:
+      # Switch to another link between the same two switches
+      port1,port2 = min(pairs)
+      self.adj[dpid1][dpid2] = port1
+      self.adj[dpid2][dpid1] = port2
+      if not on_tree: return set()
+      self.tree[dpid1][dpid2] = port1
+      self.tree[dpid2][dpid1] = port2
+      return set([dpid1, dpid2])
+
+    del self.links[(dpid1,dpid2)]
+    del self.links[(dpid2,dpid1)]
+    del self.adj[dpid1][dpid2]
+    del self.adj[dpid2][dpid1]
+    if not on_tree:
+      return set() # Component is still connected through the tree
+
+    # Lost a tree link, so the component may have split; redo just it
+    return self._respan(self.component[dpid1])
+
+  def respan_size (self, dpid1, port1, dpid2, port2):
+    """
+    Returns how many switches link_down() would have to recalculate
+    """
+    if self.links.get((dpid1,dpid2)) != set([(port1,port2)]): return 0
+    if self.tree.get(dpid1, {}).get(dpid2) != port1: return 0
+    return len(self.members[self.component[dpid1]])
+
+  def _component_of (self, dpid):
+    c = self.component.get(dpid)
+    if c is None:
+      c = self._next_component
+      self._next_component += 1
+      self.component[dpid] = c
+      self.members[c] = set([dpid])
+    return c
+
+  def _merge (self, c1, c2):
+    if len(self.members[c1]) < len(self.members[c2]):
+      c1,c2 = c2,c1
+    moving = self.members.pop(c2)
+    for dpid in moving:
+      self.component[dpid] = c1
+    self.members[c1].update(moving)
+
+  def _respan (self, c):
+    """
+    Recalculates the tree for one component
+    """
+    nodes = self.members.pop(c)
+    old = {}
+    for dpid in nodes:
+      old[dpid] = self.tree.pop(dpid, {})
+      del self.component[dpid]
+      if not self.adj.get(dpid):
+        self.adj.pop(dpid, None)
+    self._span(nodes)
+    return set(dpid for dpid in nodes if self.tree.get(dpid,{}) != old[dpid])
+
+  def _span (self, nodes):
+    """
+    Builds trees (breadth first) covering the given switches
+    """
+    for root in sorted(nodes):
+      if root in self.component: continue
+      if not self.adj.get(root): continue
+      c = self._component_of(root)
+      members = self.members[c]
+      q = deque([root])
+      while q:
+        v = q.popleft()
+        for w,p in sorted(self.adj[v].iteritems()):
+          if w in self.component: continue
+          self.component[w] = c
+          members.add(w)
+          self.tree[v][w] = p
+          self.tree[w][v] = self.adj[w][v]
+          q.append(w)
+
+
+_tree = _TreeState()
+
+# When losing a tree link means recalculating at least this many switches,
+# the whole tree gets rebuilt on core.executor instead of inline
+_offload_size = 64
+
+# The background rebuild we're waiting on (a pox.lib.executor.Work)
+_rebuild_work = None
+
+
+def _build_tree (adjacency):
+  """
+  Returns a new _TreeState for a Discovery adjacency table
+
+  This doesn't touch any global state, so it can run in the background.
+  """
+  t = _TreeState()
+  t.rebuild(adjacency)
+  return t
+
+
+def _rebuild_later ():
+  """
+  Rebuilds the tree in the background, then updates the switches
+
+  Link changes which happen meanwhile just restart the rebuild, and port
+  updates wait for it to finish.
+  """
+  global _rebuild_work
+  def done (work):
+    global _rebuild_work, _tree
+    if work is not _rebuild_work: return
+    _rebuild_work = None
+    if work.exception is not None:
+      log.error("Couldn't rebuild spanning tree: %s", work.exception)
+      new = _build_tree(core.openflow_discovery.adjacency)
+    else:
+      new = work.result
+    for dpid in set(_tree.tree).union(new.tree):
+      if _tree.tree_ports(dpid) != new.tree_ports(dpid):
+        _pending.add(dpid)
+    _tree = new
+    _schedule_update()
+
+  adjacency = frozenset(core.openflow_discovery.adjacency)
+  try:
+    _rebuild_work = core.executor.submit(_build_tree, args=(adjacency,),
+                                         callback=done,
+                                         key="spanning_tree.rebuild")
+  except Exception as e:
+    log.warn("Couldn't queue spanning tree rebuild: %s", e)
+    _rebuild_work = None
+    _calc_spanning_tree()
+    _pending.update(_tree.tree.keys())
+
 
 def _calc_spanning_tree ():
   """
@@ -51,65 +274,20 @@ def _calc_spanning_tree ():
   Returns it as dictionary where the keys are DPID1, and the
   values are tuples of (DPID2, port-num), where port-num
   is the port on DPID1 connecting to DPID2.
+
+  This recalculates from scratch.  After that, LinkEvents keep it updated
+  incrementally.
   """
-  def flip (link):
-    return Discovery.Link(link[2],link[3], link[0],link[1])
-
-  adj = defaultdict(lambda:defaultdict(lambda:[]))
-  switches = set()
-  # Add all links and switches
-  for l in core.openflow_discovery.adjacency:
-    adj[l.dpid1][l.dpid2].append(l)
-    switches.add(l.dpid1)
-    switches.add(l.dpid2)
-
-  # Cull links -- we want a single symmetric link connecting nodes
-  for s1 in switches:
-    for s2 in switches:
-      if s2 not in adj[s1]:
-        continue
-      if not isinstance(adj[s1][s2], list):
-        continue
-      assert s1 is not s2
-      good = False
-      for l in adj[s1][s2]:
-        if flip(l) in core.openflow_discovery.adjacency:
-          # This is a good one
-          adj[s1][s2] = l.port1
-          adj[s2][s1] = l.port2
-          good = True
-          break
-      if not good:
-        del adj[s1][s2]
-        if s1 in adj[s2]:
-          # Delete the other way too
-          del adj[s2][s1]
-
-  q = []
-  more = set(switches)
-
-  done = set()
-
-  tree = defaultdict(set)
-
-  while True:
-    q = sorted(list(more)) + q
-    more.clear()
-    if len(q) == 0: break
-    v = q.pop(False)
-    if v in done: continue
-    done.add(v)
-    for w,p in adj[v].iteritems():
-      if w in tree: continue
-      more.add(w)
-      tree[v].add((w,p))
-      tree[w].add((v,adj[w][v]))
+  global _rebuild_work
+  if _rebuild_work is not None:
+    _rebuild_work.cancel()
+    _rebuild_work = None
+  _tree.rebuild(core.openflow_discovery.adjacency)
+  tree = _tree.as_dict()
 
   if False:
     log.debug("*** SPANNING TREE ***")
     for sw,ports in tree.iteritems():
-      #print " ", dpidToStr(sw), ":", sorted(list(ports))
-      #print " ", sw, ":", [l[0] for l in sorted(list(ports))]
       log.debug((" %i : " % sw) + " ".join([str(l[0]) for l in
                                            sorted(list(ports))]))
     log.debug("*********************")
@@ -155,40 +333,72 @@ def _handle_ConnectionUp (event):
 
 def _handle_LinkEvent (event):
   # When links change, update spanning tree
+  l = event.link
+  if _rebuild_work is not None:
+    # Already rebuilding; start over so it includes this change
+    _rebuild_later()
+  elif event.added:
+    if core.openflow_discovery.reverse_link(l) is not None:
+      _pending.update(_tree.link_up(*l))
+  elif _tree.respan_size(*l) >= _offload_size:
+    _rebuild_later()
+  else:
+    _pending.update(_tree.link_down(*l))
+
+  # Whether the ports on the link are edge ports may have changed too
+  _pending.add(l.dpid1)
+  _pending.add(l.dpid2)
+
+  _schedule_update()
 
-  (dp1,p1),(dp2,p2) = event.link.end
-  if _prev[dp1][p1] is False:
-    if _prev[dp2][p2] is False:
-      # We're disabling this link; who cares if it's up or down?
-      #log.debug("Ignoring link status for %s", event.link)
-      return
 
-  _update_tree()
+def _schedule_update ():
+  # Wait a moment so that a burst of link changes results in one set of
+  # port mods per switch
+  global _update_timer
+  if _update_timer is None:
+    _update_timer = Timer(_link_coalesce_period, _update_tree)
+
+
+# Switches whose ports need looking at, and the Timer which will do it
+_pending = set()
+_update_timer = None
+_link_coalesce_period = 0.1 # Seconds
 
 
 def _update_tree (force_dpid = None):
   """
   Update spanning tree
 
+  Sets the flood bits on the ports of switches which may have changed.
+
   force_dpid specifies a switch we want to update even if we are supposed
   to be holding down changes.
   """
+  global _update_timer
+  if force_dpid is None:
+    _update_timer = None
 
-  # Get a spanning tree
-  tree = _calc_spanning_tree()
-  log.debug("Spanning tree updated")
+  if _rebuild_work is not None and force_dpid is None:
+    return # The tree is about to change; we'll be called again
 
   # Connections born before this time are old enough that a complete
   # discovery cycle should have completed (and, thus, all of their
   # links should have been discovered).
   enable_time = time.time() - core.openflow_discovery.send_cycle_time - 1
 
+  switches = set(_pending)
+  if force_dpid is not None:
+    switches.add(force_dpid)
+
   # Now modify ports as needed
   try:
     change_count = 0
-    for sw, ports in tree.iteritems():
+    for sw in switches:
       con = core.openflow.getConnection(sw)
-      if con is None: continue # Must have disconnected
+      if con is None:
+        _pending.discard(sw)
+        continue # Must have disconnected
       if con.connect_time is None: continue # Not fully connected
 
       if _hold_down:
@@ -200,7 +410,9 @@ def _update_tree (force_dpid = None):
           else:
             continue
 
-      tree_ports = [p[1] for p in ports]
+      _pending.discard(sw)
+      tree_ports = _tree.tree_ports(sw)
+      pms = []
       for p in con.ports.itervalues():
         if p.port_no < of.OFPP_MAX:
           flood = p.port_no in tree_ports
@@ -208,24 +420,26 @@ def _update_tree (force_dpid = None):
             if core.openflow_discovery.is_edge_port(sw, p.port_no):
               flood = True
           if _prev[sw][p.port_no] is flood:
-            #print sw,p.port_no,"skip","(",flood,")"
             continue # Skip
-          change_count += 1
           _prev[sw][p.port_no] = flood
-          #print sw,p.port_no,flood
           #TODO: Check results
 
           pm = of.ofp_port_mod(port_no=p.port_no,
                                hw_addr=p.hw_addr,
                                config = 0 if flood else of.OFPPC_NO_FLOOD,
                                mask = of.OFPPC_NO_FLOOD)
-          con.send(pm)
+          pms.append(pm.pack())
 
-          _invalidate_ports(con.dpid)
+      if pms:
+        change_count += len(pms)
+        con.send(b''.join(pms))
+        _invalidate_ports(con.dpid)
     if change_count:
       log.info("%i ports changed", change_count)
   except:
+    # Forget what we think we know, and look at everything next time
     _prev.clear()
+    _pending.update(_tree.tree.keys())
     log.exception("Couldn't push spanning tree")
 
 
@@ -272,6 +486,7 @@ def launch (no_flood = False, hold_down = False):
     _hold_down = True
 
   def start_spanning_tree ():
+    _calc_spanning_tree()
     core.openflow.addListenerByName("ConnectionUp", _handle_ConnectionUp)
     core.openflow_discovery.addListenerByName("LinkEvent", _handle_LinkEvent)
     log.debug("Spanning tree component ready")
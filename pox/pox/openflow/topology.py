@@ -278,6 +278,37 @@ class OpenFlowSwitch (EventMixin, Switch):
     serializable = OpenFlowSwitch(self.dpid)
     return pickle.dumps(serializable, protocol = 0)
 
+  def snapshot_state (self):
+    # Connections, timers and the flow table aren't saved
+    return dict(dpid = self.dpid, capabilities = self.capabilities,
+                ports = [p.to_ofp_phy_port().pack()
+                         for p in self.ports.itervalues()])
+
+  def restore_state (self, state):
+    if not hasattr(self, "flow_table"):
+      # Fresh from a snapshot -- do what __init__ would have done
+      EventMixin.__init__(self)
+      self.ports = {}
+      self.flow_table = OFSyncFlowTable(self)
+      self._connection = None
+      self._listeners = []
+      self._reconnectTimeout = None
+      self._xid_generator = xid_generator(((state['dpid'] & 0x7FFF) << 16)
+                                          + 1)
+    self.dpid = state['dpid']
+    self.capabilities = state['capabilities']
+    if self._connection is not None: return # Live state is better
+    ports = {}
+    for raw in state['ports']:
+      p = of.ofp_phy_port()
+      p.unpack(raw)
+      if p.port_no in self.ports:
+        self.ports[p.port_no]._update(p)
+        ports[p.port_no] = self.ports[p.port_no]
+      else:
+        ports[p.port_no] = OpenFlowPort(p)
+    self.ports = ports
+
   def send(self, *args, **kw):
     return self._connection.send(*args, **kw)
 
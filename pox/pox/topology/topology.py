@@ -20,14 +20,50 @@ with OpenFlow switches.
 
 Note that this means that you often want to invoke something like:
    $ ./pox.py topology openflow.discovery openflow.topology
+
+The whole topology can be saved with Topology.snapshot() and loaded into
+another Topology (e.g., in an external consumer or after a controller
+restart) with Topology.restore().  Topology.delta() gives just what has
+changed since an earlier snapshot.  Snapshots hold only plain data (entity
+types are saved by name), but restore() still shouldn't be given data from
+untrusted sources.
 """
 
 from pox.lib.revent import *
 from pox.core import core
 from pox.lib.addresses import *
 import traceback
+import struct
+from collections import deque
 
 import pickle
+import marshal
+
+# Snapshot header: magic, format version, kind, base version, version
+_snapshot_header = struct.Struct("!4sBBQQ")
+_SNAPSHOT_MAGIC = "POXT"
+_SNAPSHOT_FORMAT = 2
+
+SNAPSHOT_FULL = 0
+SNAPSHOT_DELTA = 1
+
+
+def _entity_type_name (cls):
+  return cls.__module__ + "." + cls.__name__
+
+def _entity_types ():
+  """
+  Returns {name:class} for Entity and all its loaded subclasses
+
+  These are the only types restore() will create.
+  """
+  types = {}
+  pending = [Entity]
+  while pending:
+    cls = pending.pop()
+    types[_entity_type_name(cls)] = cls
+    pending.extend(cls.__subclasses__())
+  return types
 
 
 class EntityEvent (Event):
@@ -136,8 +172,40 @@ class Entity (object):
     return pickle.dumps(self, protocol = 0)
 
   @classmethod
-  def deserialize(cls):
-    return pickle.loads(cls, protocol = 0)
+  def deserialize(cls, data):
+    return pickle.loads(data)
+
+  def snapshot_state (self):
+    """
+    Returns the state saved for this entity in a snapshot
+
+    This must be plain data which the marshal module can handle (numbers,
+    strings, and lists, tuples, sets and dicts of them).  By default, this
+    is all the public attributes.  Entities which hold anything else
+    (addresses, connections, timers, listeners) should override this and
+    restore_state().
+    """
+    return dict((k,v) for k,v in self.__dict__.iteritems()
+                if not k.startswith("_"))
+
+  def restore_state (self, state):
+    """
+    Sets this entity up from the output of snapshot_state()
+
+    This is called on existing entities too, so should update in place.
+    """
+    self.__dict__.update(state)
+
+  @classmethod
+  def from_snapshot (cls, id, state):
+    """
+    Creates an entity from a snapshot without calling its constructor
+    """
+    self = cls.__new__(cls)
+    self.id = id
+    Entity._all_ids.add(id)
+    self.restore_state(state)
+    return self
 
 class Host (Entity):
   """
@@ -190,7 +258,16 @@ class Topology (EventMixin):
   def __init__ (self, name="topology"):
     EventMixin.__init__(self)
     self._entities = {}
+    self._by_type = {} # type -> {id:entity} for entities of exactly that type
+    self._by_class = {} # class -> {id:entity} for entities of it or subtypes
     self.name = name
+
+    # Incremented whenever an entity is added, removed, or touch()ed
+    self.version = 0
+    # (version, id) of recent changes, for delta()
+    self._journal = deque()
+    self._journal_start = 0 # Oldest version delta() can work from
+    self.max_journal = 100000
     self.log = core.getLogger(name)
 
     # If a client registers a handler for these events after they have
@@ -210,8 +287,37 @@ class Topology (EventMixin):
     else:
       return self._entities.get(ID, None)
 
+  def _index (self, entity):
+    self._by_type.setdefault(type(entity), {})[entity.id] = entity
+    for cls in type(entity).__mro__:
+      self._by_class.setdefault(cls, {})[entity.id] = entity
+
+  def _unindex (self, entity):
+    for index,classes in ((self._by_type, (type(entity),)),
+                          (self._by_class, type(entity).__mro__)):
+      for cls in classes:
+        entities = index.get(cls)
+        if entities is None: continue
+        entities.pop(entity.id, None)
+        if not entities: del index[cls]
+
+  def _changed (self, entity_id):
+    self.version += 1
+    self._journal.append((self.version, entity_id))
+    while len(self._journal) > self.max_journal:
+      self._journal_start = self._journal.popleft()[0]
+
+  def touch (self, entity):
+    """
+    Notes that an entity has been modified so it's included in deltas
+    """
+    if entity.id in self._entities:
+      self._changed(entity.id)
+
   def removeEntity (self, entity):
     del self._entities[entity.id]
+    self._unindex(entity)
+    self._changed(entity.id)
     self.log.info(str(entity) + " left")
     if isinstance(entity, Switch):
       self.raiseEvent(SwitchLeave, entity)
@@ -225,6 +331,8 @@ class Topology (EventMixin):
     if entity.id in self._entities:
       raise RuntimeError("Entity exists")
     self._entities[entity.id] = entity
+    self._index(entity)
+    self._changed(entity.id)
     self.log.debug(str(entity) + " (id: " + str(entity.id) + ") joined")
     if isinstance(entity, Switch):
       self.raiseEvent(SwitchJoin, entity)
@@ -234,10 +342,13 @@ class Topology (EventMixin):
       self.raiseEvent(EntityJoin, entity)
 
   def getEntitiesOfType (self, t=Entity, subtypes=True):
-    if subtypes is False:
-      return [x for x in self._entities.itervalues() if type(x) is t]
-    else:
-      return [x for x in self._entities.itervalues() if isinstance(x, t)]
+    index = self._by_class if subtypes else self._by_type
+    if isinstance(t, tuple):
+      r = {}
+      for tt in t:
+        r.update(index.get(tt, {}))
+      return r.values()
+    return index.get(t, {}).values()
 
   def addListener(self, eventType, handler, once=False, weak=False,
                   priority=None, byName=False):
@@ -298,6 +409,94 @@ class Topology (EventMixin):
       else:
         self.addEntity(entity)
 
+  def snapshot (self):
+    """
+    Returns a compact binary snapshot of all entities
+
+    Load it into another Topology with restore().
+    """
+    return self._pack(SNAPSHOT_FULL, 0, self._entities.itervalues(), ())
+
+  def delta (self, since):
+    """
+    Returns a binary delta of what changed since version "since"
+
+    Applying it with restore() to a Topology restored from the snapshot
+    taken at that version brings it up to date.  Entities which are changed
+    in place are only included if they've been touch()ed.  If we no longer
+    remember that far back, this returns a full snapshot instead.
+    """
+    if since < self._journal_start or since > self.version:
+      return self.snapshot()
+    changed = set()
+    for version,entity_id in reversed(self._journal):
+      if version <= since: break
+      changed.add(entity_id)
+    entities = [self._entities[i] for i in changed if i in self._entities]
+    removed = [i for i in changed if i not in self._entities]
+    return self._pack(SNAPSHOT_DELTA, since, entities, removed)
+
+  def _pack (self, kind, base, entities, removed):
+    records = [(_entity_type_name(type(e)), e.id, e.snapshot_state())
+               for e in entities]
+    body = marshal.dumps((records, list(removed)))
+    return _snapshot_header.pack(_SNAPSHOT_MAGIC, _SNAPSHOT_FORMAT, kind,
+                                 base, self.version) + body
+
+  def restore (self, data):
+    """
+    Loads the output of snapshot() or delta()
+
+    Entities are added, updated in place (if the existing one has the same
+    type), or removed, with the usual events raised.  Afterwards, our
+    version is that of the snapshot, so later deltas from the same source
+    can be applied.
+
+    Entities are only created as Entity subclasses which are already
+    loaded, and no code is run from the data itself.  Even so, only pass
+    snapshots from trusted sources; the marshal format isn't hardened
+    against maliciously constructed data.
+    """
+    if len(data) < _snapshot_header.size:
+      raise ValueError("Truncated topology snapshot")
+    magic,fmt,kind,base,version = _snapshot_header.unpack_from(data)
+    if magic != _SNAPSHOT_MAGIC or fmt != _SNAPSHOT_FORMAT:
+      raise ValueError("Not a topology snapshot (or unsupported format)")
+    if kind == SNAPSHOT_DELTA and base != self.version:
+      raise ValueError("Delta is from version %s but we have version %s"
+                       % (base, self.version))
+    try:
+      records,removed = marshal.loads(data[_snapshot_header.size:])
+      types = _entity_types()
+      records = [(types[name], entity_id, state)
+                 for name,entity_id,state in records]
+    except KeyError as e:
+      raise ValueError("Unknown entity type in topology snapshot: %s"
+                       % (e.args[0],))
+    except (ValueError, TypeError, EOFError):
+      raise ValueError("Corrupt topology snapshot")
+
+    if kind == SNAPSHOT_FULL:
+      keep = set(r[1] for r in records)
+      removed = [i for i in self._entities if i not in keep]
+    for entity_id in removed:
+      entity = self._entities.get(entity_id)
+      if entity is not None:
+        self.removeEntity(entity)
+    for cls,entity_id,state in records:
+      entity = self._entities.get(entity_id)
+      if entity is not None and type(entity) is cls:
+        entity.restore_state(state)
+        self._changed(entity_id)
+        continue
+      if entity is not None:
+        self.removeEntity(entity)
+      self.addEntity(cls.from_snapshot(entity_id, state))
+
+    self.version = version
+    self._journal.clear()
+    self._journal_start = version
+
   def _fulfill_SwitchJoin_promise(self, handler):
     """ Trigger the SwitchJoin handler for all pre-existing switches """
     for switch in self.getEntitiesOfType(Switch, True):
@@ -0,0 +1,59 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os
+import shutil
+import tempfile
+
+sys.path.append(os.path.dirname(__file__) + "/../..")
+
+from pox.boot import BootProfiler
+
+
+class BootProfilerTest (unittest.TestCase):
+  def setUp (self):
+    self.dir = tempfile.mkdtemp()
+    sys.path.insert(0, self.dir)
+    with open(os.path.join(self.dir, "_boot_test_a.py"), "w") as f:
+      f.write("import _boot_test_b\n")
+    with open(os.path.join(self.dir, "_boot_test_b.py"), "w") as f:
+      f.write("import time\ntime.sleep(0.01)\n")
+
+  def tearDown (self):
+    sys.path.remove(self.dir)
+    shutil.rmtree(self.dir)
+    for m in ("_boot_test_a", "_boot_test_b"):
+      sys.modules.pop(m, None)
+
+  def test_imports (self):
+    p = BootProfiler()
+    p.install()
+    try:
+      import _boot_test_a
+      import _boot_test_a # Already loaded; not timed again
+    finally:
+      p.uninstall()
+
+    a_total,a_self = p.imports["_boot_test_a"]
+    b_total,b_self = p.imports["_boot_test_b"]
+    self.assertTrue(b_self >= 0.01)
+    self.assertTrue(a_total >= b_total)
+    self.assertTrue(a_self < b_self)
+    self.assertTrue("_boot_test_b" in p.format())
+
+  def test_launch (self):
+    p = BootProfiler()
+    self.assertEqual(p.time_launch("x", lambda v: v, 5), 5)
+    self.assertEqual(p.launches[0][0], "x")
+    self.assertTrue("x" in p.format())
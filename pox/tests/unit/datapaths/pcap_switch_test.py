@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.openflow.libopenflow_01 import *
+from pox.openflow.flow_table import TableEntry
+from pox.datapaths.pcap_switch import PCapSwitch, RxRing
+from pox.lib.packet import *
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+class MockPCap (object):
+  def __init__ (self):
+    self.injected = []
+  def inject (self, data):
+    self.injected.append(data)
+
+class MockConnection (object):
+  def __init__ (self):
+    self.received = []
+  def set_message_handler (self, handler):
+    pass
+  def send (self, msg):
+    self.received.append(msg)
+
+
+class PCapSwitchTest (unittest.TestCase):
+  def setUp (self):
+    self.switches = []
+
+  def tearDown (self):
+    for s in self.switches:
+      s._handle_GoingDownEvent(None)
+      s.t.join(5)
+
+  def make_switch (self, **kw):
+    s = PCapSwitch(dpid=1, expire_period=0, **kw)
+    self.switches.append(s)
+    s.set_connection(MockConnection())
+    for no in range(1, 5):
+      s.add_port(s.generate_port(no))
+      s.px[no] = MockPCap()
+    s.ports[3].config |= OFPPC_NO_FWD
+
+    def add (actions, priority=1, **match):
+      s.table.add_entry(TableEntry.from_flow_mod(ofp_flow_mod(
+          priority=priority, match=ofp_match(**match), actions=actions)))
+    add([ofp_action_output(port=2)], in_port=1)
+    add([ofp_action_output(port=1)], priority=2, in_port=1,
+        dl_dst=EthAddr("00:00:00:00:00:09")) # Back out the input port
+    add([ofp_action_output(port=OFPP_FLOOD)], in_port=2)
+    add([ofp_action_vlan_vid(vlan_vid=7), ofp_action_output(port=1)],
+        in_port=3)
+    add([ofp_action_output(port=OFPP_IN_PORT),
+         ofp_action_output(port=OFPP_ALL)], priority=3, in_port=1,
+        dl_type=0x800, nw_proto=ipv4.UDP_PROTOCOL)
+    return s
+
+  def frames (self):
+    frames = []
+    for in_port in range(1, 5):
+      for dst in ("00:00:00:00:00:02", "00:00:00:00:00:09"):
+        for proto in (ipv4.UDP_PROTOCOL, ipv4.TCP_PROTOCOL):
+          if proto == ipv4.UDP_PROTOCOL:
+            l4 = udp(srcport=1, dstport=2, payload="x" * in_port)
+          else:
+            l4 = tcp(srcport=1, dstport=2, off=5)
+          e = ethernet(src=EthAddr("00:00:00:00:00:01"), dst=EthAddr(dst),
+                       type=ethernet.IP_TYPE,
+                       payload=ipv4(srcip=IPAddr("10.0.0.1"),
+                                    dstip=IPAddr("10.0.0.2"),
+                                    protocol=proto, payload=l4))
+          frames.append((e.pack(), in_port))
+    return frames * 3 # So later copies hit the cache
+
+  def results (self, s):
+    r = {}
+    for no,px in s.px.items():
+      r['out%s' % (no,)] = px.injected
+      ps = s.port_stats[no]
+      r['stats%s' % (no,)] = (ps.rx_packets, ps.rx_bytes,
+                              ps.tx_packets, ps.tx_bytes)
+    r['entries'] = [(e.packet_count, e.byte_count) for e in s.table.entries]
+    r['packet_ins'] = [m.pack() for m in s._connection.received
+                       if isinstance(m, ofp_packet_in)]
+    r['lookups'] = (s._lookup_count, s._matched_count)
+    return r
+
+  def test_raw_matches_slow_path (self):
+    frames = self.frames()
+    slow = self.make_switch()
+    for data,in_port in frames:
+      slow.rx_packet(ethernet(data), in_port, packet_data=data)
+
+    fast = self.make_switch(batch_size=8)
+    for i in range(0, len(frames), 8):
+      fast.rx_raw_batch(frames[i:i+8])
+
+    self.assertEqual(self.results(fast), self.results(slow))
+    stats = fast.rx_stats
+    self.assertTrue(stats['fast_path'] > 0)
+    self.assertTrue(stats['slow_path'] > 0)
+    self.assertEqual(stats['fast_path'] + stats['slow_path'], len(frames))
+
+  def test_raw_after_table_change (self):
+    s = self.make_switch(batch_size=8)
+    data,in_port = self.frames()[1] # TCP, so out port 2
+    s.rx_raw_batch([(data, in_port)] * 2)
+    self.assertEqual(len(s.px[2].injected), 2)
+    # A higher priority entry takes over the cached flow
+    s.table.add_entry(TableEntry.from_flow_mod(ofp_flow_mod(priority=9,
+        match=ofp_match(in_port=1), actions=[ofp_action_output(port=4)])))
+    s.rx_raw_batch([(data, in_port)] * 2)
+    self.assertEqual(len(s.px[2].injected), 2)
+    self.assertEqual(len(s.px[4].injected), 2)
+    # So do replaced actions
+    s.table.entries[0].actions = [ofp_action_output(port=2)]
+    s.rx_raw_batch([(data, in_port)])
+    self.assertEqual(len(s.px[2].injected), 3)
+
+
+class RxRingTest (unittest.TestCase):
+  def test_bounded (self):
+    r = RxRing(2)
+    self.assertTrue(r.put("a"))
+    self.assertTrue(r.put("b"))
+    self.assertFalse(r.put("c"))
+    out = []
+    self.assertEqual(r.drain(5, 10, out), 2)
+    self.assertEqual(out, [("a", 5), ("b", 5)])
+    self.assertEqual((r.enqueued, r.dropped, len(r)), (2, 1, 0))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -24,7 +24,7 @@ from copy import copy
 sys.path.append(os.path.dirname(__file__) + "/../../..")
 
 from pox.openflow.libopenflow_01 import *
-from pox.openflow.flow_table import FlowTable
+from pox.openflow.flow_table import FlowTable, TableEntry
 from pox.datapaths.switch import *
 
 class MockConnection(object):
@@ -225,6 +225,45 @@ class SwitchImplTest (unittest.TestCase):
     self.assertEqual(len(c.received), 1)
     self.assertTrue(isinstance(c.last, ofp_port_status))
 
+  def test_flood(self):
+    c = self.conn
+    s = self.switch
+    received = []
+    s.addListener(DpPacketOut, lambda(event): received.append(event))
+
+    msg = ofp_port_mod(port_no=2, hw_addr=s.ports[2].hw_addr,
+                       mask=OFPPC_NO_FLOOD, config=OFPPC_NO_FLOOD)
+    c.to_switch(msg)
+    s.add_port(s.delete_port(4))
+    c.to_switch(ofp_packet_out(data=self.packet, in_port=1,
+                               action=ofp_action_output(port=OFPP_FLOOD)))
+    self.assertEqual([e.port.port_no for e in received], [3, 4])
+
+    del received[:]
+    c.to_switch(ofp_packet_out(data=self.packet, in_port=1,
+                               action=ofp_action_output(port=OFPP_ALL)))
+    self.assertEqual([e.port.port_no for e in received], [2, 3, 4])
+    size = len(self.packet.pack())
+    self.assertEqual(s.port_stats[3].tx_bytes, 2 * size)
+    self.assertEqual(s.port_stats[2].tx_bytes, size)
+
+  def test_output_overrides(self):
+    sent = []
+    class OldSwitch (SoftwareSwitch):
+      def _output_packet_physical (self, packet, port_no):
+        sent.append((port_no, None))
+    class NewSwitch (SoftwareSwitch):
+      def _output_packet_physical (self, packet, port_no, packet_data=None):
+        sent.append((port_no, packet_data))
+    data = self.packet.pack()
+    for cls,expected in ((OldSwitch, None), (NewSwitch, data)):
+      del sent[:]
+      s = cls(1, name="sw1")
+      s.set_connection(self.conn)
+      self.conn.to_switch(ofp_packet_out(data=self.packet, in_port=1,
+                                         action=ofp_action_output(port=2)))
+      self.assertEqual(sent, [(2, expected)])
+
 
 # Do tests with packing independently to make it easier to spot
 # packing-related bugs.  (Maybe?)
@@ -324,6 +363,194 @@ class ProcessFlowModTest(unittest.TestCase):
     self.assertEquals(len(t.entries), 3)
 
 
+class PacketBufferPoolTest (unittest.TestCase):
+  def test_allocate_release(self):
+    b = PacketBufferPool(2)
+    id1 = b.allocate("p1", 1)
+    id2 = b.allocate("p2", 2)
+    self.assertEqual(b.allocate("p3", 3), None)
+    self.assertEqual(b.full, 1)
+    self.assertEqual(b.release(id1), ("p1", 1))
+    self.assertEqual(b.release(id1), None)
+
+    # The slot is reused, but the old ID doesn't get the new packet
+    id3 = b.allocate("p3", 3)
+    self.assertNotEqual(id3, id1)
+    self.assertEqual(b.release(id1), None)
+    self.assertEqual(b.release(id3), ("p3", 3))
+    self.assertEqual(b.release(12345), None)
+    self.assertEqual(b.stale, 3)
+    self.assertEqual(len(b), 1)
+    self.assertEqual(b.high_water, 2)
+
+  def test_expire(self):
+    b = PacketBufferPool(2, max_age=5)
+    id1 = b.allocate("p1", now=100)
+    id2 = b.allocate("p2", now=103)
+    # Full, so the oldest one goes if it's old enough
+    self.assertEqual(b.allocate("p3", now=104), None)
+    id3 = b.allocate("p3", now=105)
+    self.assertNotEqual(id3, None)
+    self.assertEqual(b.release(id1), None)
+    self.assertEqual(b.expire(now=110), 2)
+    self.assertEqual(len(b), 0)
+    self.assertEqual(b.expired, 3)
+
+    # Lots of normal use doesn't leave _ages growing
+    for i in range(100):
+      b.release(b.allocate("p", now=200))
+    self.assertTrue(len(b._ages) <= 4)
+
+  def test_no_buffers(self):
+    b = PacketBufferPool(0)
+    self.assertEqual(b.allocate("p1", 1), None)
+    self.assertEqual(b.release(1), None)
+    self.assertEqual(b.stale, 1)
+
+  def test_switch_buffers(self):
+    s = SoftwareSwitch(dpid=1, ports=2, max_buffers=1)
+    packet = ethernet(src=EthAddr("00:00:00:00:00:01"),
+                      dst=EthAddr("00:00:00:00:00:02"))
+    buffer_id = s._buffer_packet(packet, 1)
+    self.assertEqual(s._buffer_packet(packet, 1), None)
+    s._process_actions_for_packet_from_buffer([], buffer_id)
+    self.assertNotEqual(s._buffer_packet(packet, 1), None)
+    self.assertTrue("1/1 in use" in s._stats_desc(None, None).dp_desc)
+
+class MicroflowCacheTest (unittest.TestCase):
+  def setUp(self):
+    self.conn = MockConnection(False)
+    self.switch = SoftwareSwitch(1, name="sw1")
+    self.switch.set_connection(self.conn)
+    self.out = []
+    self.switch.addListener(DpPacketOut, lambda event: self.out.append(event))
+
+  def packet(self, src="1.2.3.4"):
+    return ethernet(
+        src=EthAddr("00:00:00:00:00:01"),
+        dst=EthAddr("00:00:00:00:00:02"), type=ethernet.IP_TYPE,
+        payload=ipv4(srcip=IPAddr(src),
+        dstip=IPAddr("1.2.3.5"), protocol=ipv4.UDP_PROTOCOL,
+        payload=udp(srcport=1234, dstport=53, payload="haha")))
+
+  def test_invalidation(self):
+    c = self.conn
+    s = self.switch
+    mf = s._microflows
+    s.rx_packet(self.packet(), in_port=1)
+    s.rx_packet(self.packet(), in_port=1)
+    self.assertEqual(len(c.received), 2) # Both table misses
+    self.assertEqual((mf.hits, mf.misses), (1, 1))
+
+    # A new entry replaces the cached miss
+    c.to_switch(ofp_flow_mod(priority=1, match=ofp_match(in_port=1),
+                             actions=[ofp_action_output(port=3)]))
+    self.assertEqual(len(mf), 0)
+    s.rx_packet(self.packet(), in_port=1)
+    s.rx_packet(self.packet(), in_port=1)
+    self.assertEqual(len(self.out), 2)
+    self.assertEqual((mf.hits, mf.misses), (2, 2))
+
+    # A lower priority entry doesn't affect it; a higher one does
+    c.to_switch(ofp_flow_mod(priority=0, match=ofp_match(in_port=1)))
+    self.assertEqual(len(mf), 1)
+    c.to_switch(ofp_flow_mod(priority=2, match=ofp_match(dl_type=0x800,
+                             nw_src="1.2.3.4")))
+    self.assertEqual(len(mf), 0)
+    s.rx_packet(self.packet(), in_port=1)
+    self.assertEqual(len(self.out), 2) # Dropped
+
+    # Removing the entry drops the flows that hit it
+    s.rx_packet(self.packet("1.2.3.9"), in_port=1)
+    self.assertEqual(len(mf), 2)
+    s.table.remove_matching_entries(ofp_match(dl_type=0x800,
+                                              nw_src="1.2.3.4"), 2, True)
+    self.assertEqual(len(mf), 1)
+    s.rx_packet(self.packet(), in_port=1)
+    self.assertEqual(len(self.out), 4)
+
+    # Table 0 counts lookups whether or not the cache answered them
+    stats = s._stats_table(None, None)
+    self.assertEqual(stats.table_id, 0)
+    self.assertEqual(stats.lookup_count, mf.hits + mf.misses)
+    self.assertEqual(stats.matched_count, 5) # Including the drop
+    desc = s._stats_desc(None, None).dp_desc
+    self.assertTrue("microflows: %s/4096 in use, %s hits, %s misses"
+                    % (len(mf), mf.hits, mf.misses) in desc)
+
+  def test_adds_with_full_cache(self):
+    s = self.switch
+    mf = MicroflowCache(s.table, size=1000)
+    for i in range(1000):
+      p = self.packet("1.0.%i.%i" % (i // 256, i % 256))
+      in_port = 2 if i < 50 else 1
+      mf.entry_for_packet(p, in_port, p.pack())
+    self.assertEqual(len(mf), 1000)
+
+    def add(priority, **kw):
+      s.table.add_entry(TableEntry.from_flow_mod(ofp_flow_mod(
+          priority=priority, match=ofp_match(**kw))))
+    # Only port 2's flows are looked at (and all of them lose)
+    add(1, in_port=2)
+    self.assertEqual(len(mf), 950)
+    self.assertEqual(mf.flushes, 0)
+    # Too many to look at, so everything goes
+    add(1, dl_type=0x806)
+    self.assertEqual(len(mf), 0)
+    self.assertEqual(mf.flushes, 1)
+    self.assertEqual(mf.invalidations, 1000)
+    # Pushing lots of rules now costs nothing
+    for i in range(1000):
+      add(2, in_port=1, dl_type=0x800, nw_src="2.0.%i.%i" % (i//256, i%256))
+    self.assertEqual(mf.flushes, 1)
+    # And it still works
+    p = self.packet("1.0.0.1")
+    self.assertEqual(mf.entry_for_packet(p, 2, p.pack()),
+                     s.table.entry_for_packet(p, 2))
+    self.assertEqual(len(mf), 1)
+
+  def test_eviction(self):
+    s = self.switch
+    mf = MicroflowCache(s.table, size=2)
+    for src in ("1.0.0.1", "1.0.0.2", "1.0.0.1", "1.0.0.3", "1.0.0.1"):
+      p = self.packet(src)
+      mf.entry_for_packet(p, 1, p.pack())
+    self.assertEqual(len(mf), 2)
+    self.assertEqual(mf.evictions, 1)
+    # 1.0.0.1 was referenced, so 1.0.0.2 went instead
+    self.assertEqual(mf.hits, 2)
+
+
+class MockSocket (object):
+  def getpeername (self):
+    return ("127.0.0.1", 6633)
+
+class OFConnectionTest (unittest.TestCase):
+  def test_read_views (self):
+    from pox.lib.ioworker import IOWorker
+    worker = IOWorker()
+    worker.socket = MockSocket()
+    con = OFConnection(worker)
+    received = []
+    con.set_message_handler(lambda con, msg: received.append(msg))
+
+    po = ofp_packet_out(data="p" * 60, actions=[ofp_action_output(port=2)])
+    data = ofp_echo_request(body="hi").pack() + po.pack()
+    data += ofp_barrier_request().pack()
+    # Received as views of a bigger buffer, with a message split across two
+    space = bytearray("x" + data + "x")
+    worker._push_receive_data(memoryview(space)[1:len(data) - 3])
+    self.assertEqual(len(received), 2)
+    self.assertEqual(worker.available, 4)
+    worker._push_receive_data(memoryview(space)[len(data) - 3:len(data) + 1])
+    self.assertEqual(len(received), 3)
+    self.assertEqual(worker.available, 0)
+
+    echo,out,barrier = received
+    self.assertEqual(echo.body, "hi")
+    self.assertEqual(out, po)
+    self.assertEqual(type(out.data), bytes)
+    self.assertEqual(type(barrier), ofp_barrier_request)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import weakref
+from functools import partial
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.core import core
+from pox.lib.revent import *
+from pox.info.metrics import *
+from pox.info.metrics import _callable_key, _callable_name
+
+
+class Ping (Event):
+  pass
+
+class Source (EventMixin):
+  _eventMixin_events = set([Ping])
+
+class Sink (object):
+  def __init__ (self, source):
+    self.pings = 0
+    source.addListenerByName("Ping", self._handle_Ping)
+  def _handle_Ping (self, event):
+    self.pings += 1
+
+class Thing (object):
+  def __call__ (self):
+    pass
+
+def make_handler (thing):
+  def handler (event):
+    return thing
+  return handler
+
+def plain (event, extra = None):
+  pass
+
+
+class HistogramTest (unittest.TestCase):
+  def test_buckets (self):
+    h = Histogram()
+    for i in range(98): h.add(0.0000015) # 1.5us -> the 2us bucket
+    h.add(0.003)
+    h.add(20) # Past the last bound
+    self.assertEqual(h.count, 100)
+    self.assertEqual(h.counts[1], 98)
+    self.assertEqual(h.counts[-1], 1)
+    self.assertEqual(h.percentile(0.5), 2e-6)
+    self.assertTrue(0.003 <= h.percentile(0.99) < 0.006)
+    self.assertEqual(h.percentile(1), 20)
+
+  def test_bucket_bounds (self):
+    # Bounds are inclusive, as with Prometheus' "le"
+    h = Histogram()
+    for bound in h.bounds[:-1]:
+      h.add(bound)
+    self.assertEqual(h.counts, [1] * (h.BUCKETS - 1) + [0])
+    h.add(h.bounds[-2] * 1.001)
+    self.assertEqual(h.counts[-1], 1)
+
+  def test_merge (self):
+    a,b = Histogram(),Histogram()
+    a.add(0.001)
+    b.add(0.002)
+    a.merge(b)
+    self.assertEqual(a.count, 2)
+    self.assertEqual(a.max, 0.002)
+
+
+class CallableKeyTest (unittest.TestCase):
+  def assertSameKey (self, f1, f2, name):
+    self.assertEqual(_callable_key(f1), _callable_key(f2))
+    self.assertEqual(hash(_callable_key(f1)), hash(_callable_key(f2)))
+    self.assertEqual(_callable_name(_callable_key(f1)), name)
+
+  def test_grouping (self):
+    module = __name__
+    self.assertSameKey(make_handler(Thing()), make_handler(Thing()),
+                       module + ".handler")
+    self.assertSameKey(partial(plain, extra=1), partial(plain, extra=2),
+                       module + ".plain")
+    self.assertSameKey(plain, partial(plain), module + ".plain")
+    self.assertSameKey(Thing(), Thing(), module + ".Thing")
+    self.assertSameKey(Sink(Source())._handle_Ping,
+                       Sink(Source())._handle_Ping, "Sink._handle_Ping")
+    self.assertSameKey([].append, [].append, "append")
+    self.assertNotEqual(_callable_key(plain), _callable_key(make_handler(1)))
+
+  def test_no_references (self):
+    for f in (make_handler, lambda t: partial(make_handler(t), 1),
+              lambda t: t, lambda t: t.__call__):
+      thing = Thing()
+      ref = weakref.ref(thing)
+      key = _callable_key(f(thing))
+      del thing
+      self.assertEqual(ref(), None)
+
+
+class MetricsTest (unittest.TestCase):
+  def setUp (self):
+    self.metrics = Metrics(probe_interval = 60, rate_interval = 60)
+
+  def tearDown (self):
+    self.metrics.uninstall()
+
+  def test_handlers (self):
+    source = Source()
+    sinks = [Sink(source), Sink(source)]
+    for i in range(5):
+      source.raiseEvent(Ping)
+    stats = self.metrics.get_stats()
+    handlers = [h for h in stats['handlers'] if h['event'] == 'Ping']
+    # Both sinks' handlers are counted together
+    self.assertEqual(len(handlers), 1)
+    self.assertEqual(handlers[0]['handler'], 'Sink._handle_Ping')
+    self.assertEqual(handlers[0]['count'], 10)
+    self.assertEqual(stats['events']['Ping']['count'], 10)
+
+    text = self.metrics.prometheus_text()
+    self.assertTrue('pox_handler_seconds_count{event="Ping",'
+                    'handler="Sink._handle_Ping"} 10' in text)
+    self.assertTrue("Sink._handle_Ping" in self.metrics.dump())
+
+  def test_uninstall (self):
+    self.metrics.uninstall()
+    source = Source()
+    Sink(source)
+    source.raiseEvent(Ping)
+    self.assertEqual(self.metrics.get_stats()['handlers'], [])
+
+
+if __name__ == '__main__':
+  unittest.main()
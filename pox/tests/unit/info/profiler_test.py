@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import threading
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.core import core
+from pox.lib.revent import *
+from pox.lib.recoco import Scheduler, BaseTask
+from pox.info.profiler import *
+
+
+class Ping (Event):
+  pass
+
+class Source (EventMixin):
+  _eventMixin_events = set([Ping])
+
+class Sink (object):
+  def __init__ (self, source):
+    self.entered = threading.Event()
+    self.release = threading.Event()
+    source.addListenerByName("Ping", self._handle_Ping)
+  def _handle_Ping (self, event):
+    self.entered.set()
+    self.release.wait(5)
+
+class PingTask (BaseTask):
+  def __init__ (self, source):
+    BaseTask.__init__(self)
+    self.source = source
+  def run (self):
+    self.source.raiseEvent(Ping)
+    yield False
+
+
+class ProfilerTest (unittest.TestCase):
+  def test_sample_task_and_handler (self):
+    source = Source()
+    sink = Sink(source)
+    sched = Scheduler(isDefaultScheduler=False, daemon=True)
+    try:
+      PingTask(source).start(sched)
+      self.assertTrue(sink.entered.wait(5))
+      p = Profiler()
+      for i in range(3):
+        p.sample(sys._current_frames()[sched._thread.ident])
+    finally:
+      sink.release.set()
+      sched.quit()
+
+    self.assertEqual(p.samples, 3)
+    self.assertEqual(p.idle, 0)
+    self.assertEqual(dict(p.tasks), {'PingTask':3})
+    self.assertEqual(dict(p.handlers),
+                     {('Ping', 'Sink._handle_Ping'):3})
+    (stack,count), = p.stacks.items()
+    self.assertEqual(count, 3)
+    frames = stack.split(";")
+    self.assertEqual(frames[0], "PingTask")
+    self.assertTrue(frames[1].startswith("execute "))
+    self.assertTrue(frames[-1].startswith("wait "))
+    self.assertTrue(any(f.startswith("_handle_Ping ") for f in frames))
+    self.assertEqual(p.collapsed(), stack + " 3\n")
+
+  def test_idle (self):
+    p = Profiler()
+    p.sample(sys._getframe())
+    self.assertEqual(p.samples, 1)
+    self.assertEqual(p.idle, 1)
+    self.assertEqual(p.collapsed(), "")
+    self.assertEqual(p.get_stats()['idle_percent'], 100.0)
+
+  def test_max_depth (self):
+    source = Source()
+    sink = Sink(source)
+    sched = Scheduler(isDefaultScheduler=False, daemon=True)
+    try:
+      PingTask(source).start(sched)
+      self.assertTrue(sink.entered.wait(5))
+      p = Profiler(max_depth = 2)
+      p.sample(sys._current_frames()[sched._thread.ident])
+    finally:
+      sink.release.set()
+      sched.quit()
+    (stack,count), = p.stacks.items()
+    # The task plus the two outermost frames
+    self.assertEqual(len(stack.split(";")), 3)
+    self.assertTrue(stack.split(";")[1].startswith("execute "))
+
+  def test_restart (self):
+    p = Profiler(interval = 0.05)
+    p.start()
+    first = p._thread
+    p.stop()
+    p.start() # Before the first sampler has woken up again
+    second = p._thread
+    try:
+      self.assertTrue(first is not second)
+      first.join(1)
+      self.assertFalse(first.is_alive())
+      self.assertTrue(second.is_alive())
+      self.assertTrue(p.running)
+    finally:
+      p.stop()
+    second.join(1)
+    self.assertFalse(second.is_alive())
+
+  def test_reset (self):
+    p = Profiler()
+    p.sample(sys._getframe())
+    p.reset()
+    self.assertEqual(p.samples, 0)
+    self.assertEqual(p.get_stats()['tasks'], [])
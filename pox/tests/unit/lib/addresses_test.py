@@ -31,6 +31,13 @@ class MockEthAddrTest(unittest.TestCase):
     self.assertEqual("00:11:22:33:44:55", str(EthAddr("00:11:22:33:44:55")),
         "str(eth) doesn't match original string")
 
+  def test_resolve_names (self):
+    self.assertEqual(EthAddr("00:00:0c:12:34:56").toStr(resolveNames=True),
+                     "(CISCO SYSTEMS, INC.):12:34:56")
+    # Locally administered addresses have no vendor
+    self.assertEqual(EthAddr("02:00:0c:12:34:56").toStr(resolveNames=True),
+                     "02:00:0c:12:34:56")
+
 #  def test_int_ctor(self):
 #    int_val = EthAddr("00:00:00:00:01:00").toInt()
 #    self.assertEqual(int_val, 1<<8)
@@ -38,6 +45,53 @@ class MockEthAddrTest(unittest.TestCase):
 #    self.assertEqual(int_val, with_int_ctor.toInt())
 #    self.assertEqual(str(with_int_ctor), "00:00:00:00:01:00")
 
+class OUINamesTest (unittest.TestCase):
+  def setUp (self):
+    import tempfile
+    self.dir = tempfile.mkdtemp()
+    self.txt = os.path.join(self.dir, "oui.txt")
+    self.idx = os.path.join(self.dir, "oui.idx")
+    with open(self.txt, "w") as f:
+      f.write("  OUI\t\t\t\tOrganization\n"
+              "00-00-0C   (hex)\t\tCISCO SYSTEMS, INC.\n"
+              "00000C     (base 16)\t\tCISCO SYSTEMS, INC.\n"
+              "\t\t\t\t170 WEST TASMAN DRIVE\n"
+              "\n"
+              "00-00-01   (hex)\t\tXEROX CORPORATION\n"
+              "AC-DE-48   (hex)\t\tPRIVATE\n")
+
+  def tearDown (self):
+    import shutil
+    shutil.rmtree(self.dir)
+
+  def test_lookup (self):
+    from pox.lib.addresses import _OUINames
+    names = _OUINames(self.txt, self.idx)
+    self.assertFalse(os.path.exists(self.idx), "index built too early")
+    self.assertEqual(names[0x00000c], "CISCO SYSTEMS, INC.")
+    self.assertEqual(names.get(0x000001), "XEROX CORPORATION")
+    self.assertEqual(names.get(0xacde48), "PRIVATE")
+    self.assertEqual(len(names), 3)
+    self.assertTrue(0x000001 in names)
+    self.assertFalse(0x000002 in names)
+    self.assertEqual(names.get(0xffffff, "none"), "none")
+    self.assertRaises(KeyError, lambda: names[0x000000])
+
+    # A fresh table should use the index even without oui.txt
+    self.assertTrue(os.path.exists(self.idx))
+    os.remove(self.txt)
+    names = _OUINames(self.txt, self.idx)
+    self.assertEqual(names[0x00000c], "CISCO SYSTEMS, INC.")
+
+  def test_bad_index (self):
+    from pox.lib.addresses import _OUINames
+    with open(self.idx, "wb") as f:
+      f.write(b"garbage")
+    os.utime(self.txt, (0, 0))
+    names = _OUINames(self.txt, self.idx)
+    self.assertEqual(names[0x000001], "XEROX CORPORATION")
+
+
 class MockIPAddrTest (unittest.TestCase):
   def test_in_network (self):
     self.assertTrue(IPAddr("192.168.1.1").inNetwork("192.168.1.0/24"))
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import threading
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.core import core
+from pox.lib.executor import *
+
+
+def square (x):
+  return x * x
+
+def fail ():
+  raise ValueError("nope")
+
+
+class ExecutorTest (unittest.TestCase):
+  def setUp (self):
+    self.ex = Executor(threads = 1, max_queued = 2)
+    self.results = []
+    self.delivered = threading.Event()
+
+  def tearDown (self):
+    self.ex.shutdown()
+
+  def callback (self, work):
+    # Called in the cooperative context
+    self.results.append((work.result, work.exception))
+    self.delivered.set()
+
+  def block (self):
+    """
+    Occupies the executor's one thread until the returned Event is set
+    """
+    go = threading.Event()
+    started = threading.Event()
+    def wait ():
+      started.set()
+      go.wait()
+    self.ex.submit(wait)
+    started.wait(5)
+    return go
+
+  def test_callback (self):
+    work = self.ex.submit(square, args=(7,), callback=self.callback)
+    self.assertTrue(work.wait(5))
+    self.assertTrue(self.delivered.wait(5))
+    self.assertEqual(self.results, [(49, None)])
+    self.assertEqual(work.state, Work.DONE)
+    self.assertEqual(self.ex.get_stats()['completed'], 1)
+
+  def test_exception (self):
+    work = self.ex.submit(fail, callback=self.callback)
+    self.assertTrue(work.wait(5))
+    self.assertTrue(isinstance(self.results[0][1], ValueError))
+    self.assertEqual(self.ex.get_stats()['failed'], 1)
+
+  def test_cancel_and_key (self):
+    go = self.block()
+    first = self.ex.submit(square, args=(2,), key="k")
+    second = self.ex.submit(square, args=(3,), key="k",
+                            callback=self.callback)
+    self.assertTrue(first.cancelled) # Replaced by the second
+    third = self.ex.submit(square, args=(4,), callback=self.callback)
+    self.assertTrue(third.cancel())
+    go.set()
+    self.assertTrue(second.wait(5))
+    self.assertEqual(self.results, [(9, None)])
+    stats = self.ex.get_stats()
+    self.assertEqual(stats['cancelled'], 2)
+    self.assertEqual(stats['submitted'], 4)
+
+  def test_not_running (self):
+    go = self.block()
+    work = self.ex.submit(square, args=(2,), key="k",
+                          callback=self.callback)
+    core.running = False
+    try:
+      go.set()
+      self.assertTrue(work.wait(5))
+    finally:
+      core.running = True
+    # Finished, but there was nowhere to deliver it
+    self.assertTrue(work.cancelled)
+    self.assertEqual(self.results, [])
+    self.assertFalse("k" in self.ex._keys)
+    # A later submit with the same key doesn't cancel anything
+    again = self.ex.submit(square, args=(3,), key="k",
+                           callback=self.callback)
+    self.assertTrue(again.wait(5))
+    self.assertEqual(self.results, [(9, None)])
+    # (The blocking work finished while stopped too)
+    self.assertEqual(self.ex.get_stats()['cancelled'], 2)
+
+  def test_bounded (self):
+    go = self.block()
+    self.ex.submit(square, args=(1,))
+    self.ex.submit(square, args=(2,))
+    self.assertRaises(QueueFull, self.ex.submit, square, args=(3,))
+    self.assertEqual(self.ex.get_stats()['rejected'], 1)
+    go.set()
+
+  def test_process (self):
+    work = self.ex.submit(square, args=(5,), process=True,
+                          callback=self.callback)
+    self.assertTrue(work.wait(10))
+    self.assertEqual(self.results, [(25, None)])
+
+
+if __name__ == '__main__':
+  unittest.main()
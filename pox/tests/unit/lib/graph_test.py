@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.lib.graph.graph import Graph, Node, F, Equal, And, IsType, IsInstance
+
+class Switch (Node):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+  def __repr__ (self):
+    return "Switch %s" % (self.dpid,)
+
+class FancySwitch (Switch):
+  pass
+
+class Host (Node):
+  def __init__ (self, mac):
+    self.mac = mac
+  def __repr__ (self):
+    return "Host %s" % (self.mac,)
+
+class GraphQueryTest (unittest.TestCase):
+  def setUp (self):
+    self.g = Graph()
+    self.switches = [Switch(i) for i in range(5)] + [FancySwitch(5)]
+    self.hosts = [Host(i) for i in range(5)]
+    for n in self.switches + self.hosts:
+      self.g.add(n)
+    for i in range(5):
+      self.g.link((self.switches[i], 1), (self.hosts[i], 0))
+      self.g.link((self.switches[i], 2), (self.switches[i+1], 3))
+
+  def test_types (self):
+    g = self.g
+    self.assertEqual(len(g.find(is_a=Switch)), 6)
+    self.assertEqual(len(g.find(type=Switch)), 5)
+    self.assertEqual(g.find(IsType("FancySwitch")), [self.switches[5]])
+    self.assertEqual(len(g.find(IsInstance(Host))), 5)
+    g.remove(self.hosts[0])
+    self.assertEqual(len(g.find(is_a=Host)), 4)
+
+  def test_attr_index (self):
+    g = self.g
+    g.add_index("dpid")
+    s = self.switches[3]
+    self.assertEqual(g.find(dpid=3), [s])
+    self.assertEqual(g.find(Equal(F("dpid"), 3)), [s])
+    self.assertEqual(g.find(And(IsInstance(Switch), Equal(4, F("dpid")))),
+                     [self.switches[4]])
+    s.dpid = 42
+    g.reindex(s)
+    self.assertEqual(g.find(dpid=3), [])
+    self.assertEqual(g.get(dpid=42), s)
+    # Hosts don't have a dpid at all
+    self.assertEqual(g.find(Equal(F("mac"), 2)), [self.hosts[2]])
+
+  def test_cache (self):
+    g = Graph(cache_queries=True)
+    g.add_index("dpid")
+    a = Switch(1)
+    g.add(a)
+    self.assertEqual(g.find(Equal(F("dpid"), 1)), [a])
+    v = g.version
+    self.assertEqual(g.find(Equal(F("dpid"), 1)), [a])
+    b = Switch(1)
+    g.add(b)
+    self.assertTrue(g.version > v)
+    self.assertEqual(set(g.find(Equal(F("dpid"), 1))), set([a, b]))
+
+  def test_links (self):
+    g = self.g
+    g.add_index("dpid")
+    links = g.find_links(Equal(F("dpid"), 2), IsInstance(Host))
+    self.assertEqual(len(links), 1)
+    self.assertEqual(links[0][0], (self.switches[2], 1))
+    self.assertEqual(links[0][1], (self.hosts[2], 0))
+    self.assertEqual(len(g.find_links(IsInstance(Switch),
+                                      IsInstance(Switch))), 5)
+    self.assertEqual(len(g.find_links()), 10)
+
+  def test_portless (self):
+    g = Graph()
+    a = Switch(1)
+    b = Switch(2)
+    g.add(a)
+    g.add(b)
+    g.link(a, b)
+    g.link(a, (b, 1))
+    self.assertEqual(sorted(g.ports_for_node(a).keys()), [0, 1])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -20,12 +20,15 @@ import itertools
 import os.path
 import sys
 import unittest
+import socket
+import select
 
 sys.path.append(os.path.join(os.path.dirname(__file__),
     *itertools.repeat("..", 3)))
 
 from pox.lib.mock_socket import MockSocket
-from pox.lib.ioworker import IOWorker, RecocoIOLoop
+from pox.lib.ioworker import IOWorker, RecocoIOLoop, ChunkedBuffer
+from pox.lib.ioworker import EpollIOLoop
 from nose.tools import eq_
 
 class IOWorkerTest(unittest.TestCase):
@@ -63,6 +66,44 @@ class IOWorkerTest(unittest.TestCase):
     self.assertEqual(self.data, "hepp")
 
 
+  def test_partial_consume(self):
+    i = IOWorker()
+    i._push_receive_data("abc")
+    i._push_receive_data(memoryview(bytearray("defg"))[1:])
+    self.assertEqual(i.available, 6)
+    self.assertEqual(i.peek(4), "abce")
+    i.consume_receive_buf(2)
+    self.assertEqual(i.peek_view(3).tobytes(), "cef")
+    self.assertEqual(i.read(), "cefg")
+    self.assertEqual(i.available, 0)
+
+
+class ChunkedBufferTest(unittest.TestCase):
+  def test_append_consume(self):
+    b = ChunkedBuffer()
+    for piece in ("ab", "", "cde", "f"):
+      b.append(piece)
+    self.assertEqual(len(b), 6)
+    b.consume(1)
+    self.assertEqual(b.peek(), "bcdef")
+    b.consume(3)
+    self.assertEqual(b.peek(), "ef")
+    self.assertRaises(RuntimeError, b.consume, 3)
+    self.assertEqual(b.read(5), "ef")
+    self.assertEqual(len(b), 0)
+    self.assertEqual(b.peek(), "")
+
+  def test_views(self):
+    b = ChunkedBuffer("hello")
+    b.append(" world")
+    b.consume(2)
+    self.assertEqual([v.tobytes() for v in b.views()], ["llo", " world"])
+    self.assertEqual(len(b.views(max_bytes=2)), 1)
+    # Peeking past the first chunk joins them
+    self.assertEqual(b.peek_view(5).tobytes(), "llo w")
+    self.assertEqual(len(b.views()), 1)
+
+
 class RecocoIOLoopTest(unittest.TestCase):
   def test_basic(self):
     loop = RecocoIOLoop()
@@ -134,3 +175,45 @@ class RecocoIOLoopTest(unittest.TestCase):
 
     # that should result in the stuff being sent on the socket
     self.assertEqual(right.recv(), "heppo")
+
+
+@unittest.skipUnless(hasattr(select, "epoll"), "epoll not available")
+class EpollIOLoopTest(unittest.TestCase):
+  def setUp(self):
+    self.loop = EpollIOLoop()
+    self.left, self.right = socket.socketpair()
+    self.left.setblocking(0)
+    self.worker = self.loop.new_worker(self.left)
+    self.g = self.loop.run()
+    self.g.next() # Registers the worker and waits on epoll
+
+  def tearDown(self):
+    self.left.close()
+    self.right.close()
+
+  def _mask(self):
+    return self.loop._masks[self.loop._fds[self.worker]]
+
+  def test_read(self):
+    self.received = None
+    def r(worker):
+      self.received = worker.read()
+    self.worker.rx_handler = r
+    self.right.send("hallo")
+    self.g.send(([self.loop._epoll], [], []))
+    self.assertEqual(self.received, "hallo")
+
+  def test_write_interest(self):
+    self.assertFalse(self._mask() & select.EPOLLOUT)
+    self.worker.send("heppo")
+    self.g.send(([], [], [])) # Loop picks up the change
+    self.assertTrue(self._mask() & select.EPOLLOUT)
+    self.g.send(([self.loop._epoll], [], []))
+    self.assertEqual(self.right.recv(100), "heppo")
+    self.assertFalse(self._mask() & select.EPOLLOUT)
+
+  def test_close(self):
+    self.worker.close()
+    self.g.send(([], [], []))
+    self.assertFalse(self.worker in self.loop._fds)
+    self.assertFalse(self.worker in self.loop._workers)
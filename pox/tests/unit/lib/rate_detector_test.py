@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.lib.rate_detector import RateDetector
+
+
+class RateDetectorTest (unittest.TestCase):
+  def test_rate_and_burst (self):
+    d = RateDetector(rate=10, burst=3)
+    # The burst goes through, then one per 0.1 seconds
+    self.assertEqual([d.hit('a', 0) for i in range(4)],
+                     [False, False, False, True])
+    self.assertTrue(d.hit('a', 0.05))
+    self.assertFalse(d.hit('a', 0.15))
+    self.assertTrue(d.hit('a', 0.16))
+    self.assertEqual(d.get('a'), (7, 3))
+    # Other keys have their own buckets
+    self.assertFalse(d.hit('b', 0.16))
+
+  def test_bad_args (self):
+    self.assertRaises(ValueError, RateDetector, rate=0)
+    self.assertRaises(ValueError, RateDetector, rate=1, burst=0)
+    self.assertRaises(ValueError, RateDetector, rate=1, max_keys=0)
+
+  def test_interval (self):
+    # burst 1 is "harmful if less than 1/rate seconds since the last one"
+    d = RateDetector(rate=1/0.8)
+    self.assertFalse(d.hit('a', 100))
+    self.assertTrue(d.hit('a', 100.5))
+    self.assertFalse(d.hit('a', 101.3))
+    self.assertFalse(d.hit('a', 102.2))
+
+  def test_drain (self):
+    # Every 0.6 seconds against a rate of one per 0.8 seconds
+    times = [0.6 * i for i in range(6)]
+    # Without draining, every other one gets through
+    d = RateDetector(rate=1/0.8)
+    self.assertEqual([d.hit('a', t) for t in times],
+                     [False, True, False, True, False, True])
+    # Draining restarts the wait on every packet, so only the first
+    # gets through
+    d = RateDetector(rate=1/0.8, drain=True)
+    self.assertEqual([d.hit('a', t) for t in times],
+                     [False, True, True, True, True, True])
+
+  def test_expire (self):
+    d = RateDetector(rate=10, burst=2)
+    d.hit('a', 0)
+    d.hit('a', 0)
+    d.hit('b', 0.15)
+    self.assertEqual(d.refill_time, 0.2)
+    self.assertEqual(d.expire(0.25), 1) # 'a' is full again; 'b' isn't
+    self.assertFalse('a' in d)
+    self.assertTrue('b' in d)
+    # The freed slot is reused
+    d.hit('c', 0.3)
+    self.assertEqual(d.get_stats()['slots'], 2)
+    self.assertEqual(d.get('c'), (1, 0))
+
+  def test_bounded (self):
+    d = RateDetector(rate=0.1, burst=1, max_keys=3)
+    d.hit('a', 0)
+    d.hit('b', 1)
+    d.hit('c', 2)
+    d.hit('a', 2.5) # Now 'a' gets a second chance
+    d.hit('d', 2.6) # So 'b' is evicted
+    self.assertEqual(len(d), 3)
+    self.assertFalse('b' in d)
+    self.assertEqual(d.evicted, 1)
+    # New keys don't expire anything themselves, even if they could
+    d.hit('e', 12.55)
+    self.assertEqual(sorted(d._slots), ['a', 'd', 'e'])
+    self.assertEqual(d.evicted, 2)
+    self.assertEqual(d.expired, 0)
+    self.assertEqual(d.expire(12.55), 1) # 'a' has refilled
+    self.assertEqual(sorted(d._slots), ['d', 'e'])
+
+  def test_flood (self):
+    d = RateDetector(rate=1, max_keys=100)
+    for i in range(1000):
+      d.hit(i, 0)
+    self.assertEqual(len(d), 100)
+    self.assertEqual(d.evicted, 900)
+    self.assertEqual(d.get_stats()['slots'], 100)
+
+  def test_forget (self):
+    d = RateDetector(rate=1)
+    d.hit('a', 0)
+    self.assertTrue(d.hit('a', 0))
+    d.forget('a')
+    self.assertEqual(d.get('a'), None)
+    self.assertFalse(d.hit('a', 0))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import shutil
+import tempfile
+from struct import unpack_from
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.lib.socketcapture import *
+from pox.lib.addresses import EthAddr, IPAddr
+from pox.lib.packet.packet_utils import checksum
+
+
+class Sink (object):
+  """
+  An output stream which keeps what was written even after close()
+  """
+  def __init__ (self):
+    self.data = []
+  def write (self, data):
+    self.data.append(data)
+  def flush (self):
+    pass
+  def close (self):
+    pass
+  def getvalue (self):
+    return b''.join(self.data)
+
+
+def read_pcap (data):
+  """
+  Returns the pcap header and a list of (record header, frame)
+  """
+  records = []
+  offset = 24
+  while offset < len(data):
+    caplen, = unpack_from("I", data, offset + 8)
+    records.append((data[offset:offset+16],
+                    data[offset+16:offset+16+caplen]))
+    offset += 16 + caplen
+  assert offset == len(data), "Truncated record"
+  return data[:24], records
+
+
+def without_ip_id (frame):
+  """
+  Blanks the IP ID and checksum (the ID differs between ipv4 objects)
+  """
+  assert checksum(frame[14:34]) == 0, "Bad IP checksum"
+  return frame[:18] + "\0\0" + frame[20:24] + "\0\0" + frame[26:]
+
+
+ADDRS = dict(local_addrs=(EthAddr("02:00:00:00:00:01"),
+                          IPAddr("10.0.0.1"), 6633),
+             remote_addrs=(EthAddr("02:00:00:00:00:02"),
+                           IPAddr("10.0.0.2"), 40000))
+
+
+class BufferedPCapWriterTest (unittest.TestCase):
+  def messages (self):
+    return [(i % 3 != 0, chr(ord('a') + i) * (10 + i * 7))
+            for i in range(12)]
+
+  def test_same_as_pcap_writer (self):
+    expected = Sink()
+    w = PCapWriter(expected, **ADDRS)
+    for outgoing,buf in self.messages():
+      w.write(outgoing, buf)
+    expected = read_pcap(expected.getvalue())[1]
+
+    for threaded in (False, True):
+      out = Sink()
+      w = BufferedPCapWriter(out, buffer_size=100, threaded=threaded,
+                             tcp_checksum=True, **ADDRS)
+      for outgoing,buf in self.messages():
+        w.write(outgoing, buf)
+      w.close()
+      records = read_pcap(out.getvalue())[1]
+      # Everything but the timestamps and IP ID
+      self.assertEqual([(h[8:],without_ip_id(f)) for h,f in records],
+                       [(h[8:],without_ip_id(f)) for h,f in expected])
+
+  def test_sample (self):
+    out = Sink()
+    w = BufferedPCapWriter(out, sample=3, **ADDRS)
+    for outgoing,buf in self.messages():
+      w.write(outgoing, buf)
+    w.close()
+    records = read_pcap(out.getvalue())[1]
+    self.assertEqual((w.written, w.skipped), (4, 8))
+    self.assertEqual([f[54:] for h,f in records],
+                     [buf for o,buf in self.messages()[2::3]])
+
+
+class PCapRingFileTest (unittest.TestCase):
+  def setUp (self):
+    self.dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.dir, "of.pcap")
+
+  def tearDown (self):
+    shutil.rmtree(self.dir)
+
+  def read (self, name):
+    with open(name, "rb") as f:
+      return f.read()
+
+  def test_rollover (self):
+    ring = PCapRingFile(self.path, max_bytes=400, max_files=3)
+    w = BufferedPCapWriter(ring, buffer_size=0, **ADDRS)
+    # Each record is 16 + 54 + 50 bytes, so three fit in a file
+    for i in range(20):
+      w.write(True, "%02i" % (i,) * 25)
+    w.close()
+
+    self.assertEqual(sorted(os.listdir(self.dir)),
+                     ["of.pcap", "of.pcap.1", "of.pcap.2"])
+    # Groups of three records went to files 0,1,2,0,1,2,0, so the last
+    # three groups are what's left
+    expected = {self.path:[18,19], self.path + ".1":[12,13,14],
+                self.path + ".2":[15,16,17]}
+    header = None
+    for name,numbers in expected.items():
+      data = self.read(name)
+      self.assertTrue(len(data) <= 400)
+      h,records = read_pcap(data)
+      self.assertEqual(unpack_from("I", h)[0], 0xa1b2c3d4)
+      if header is None: header = h
+      self.assertEqual(h, header) # Every file starts with the same header
+      self.assertEqual([f[54:] for rh,f in records],
+                       ["%02i" % (i,) * 25 for i in numbers])
+
+  def test_big_write (self):
+    # A write bigger than max_bytes still goes in (alone) rather than
+    # rotating forever
+    ring = PCapRingFile(self.path, max_bytes=100, max_files=2)
+    ring.write("H" * 24)
+    ring.write("x" * 200)
+    ring.write("y" * 10)
+    ring.close()
+    self.assertEqual(self.read(self.path + ".1"), "H" * 24 + "x" * 200)
+    self.assertEqual(self.read(self.path), "H" * 24 + "y" * 10) # Wrapped
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import logging
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.log.hotpath import *
+
+class ListHandler (logging.Handler):
+  def __init__ (self):
+    logging.Handler.__init__(self)
+    self.records = []
+  def emit (self, record):
+    self.records.append(record)
+
+class HotPathTest (unittest.TestCase):
+  def setUp (self):
+    self.logger = logging.getLogger("hotpath_test.%s" % (id(self),))
+    self.logger.propagate = False
+    self.logger.setLevel(logging.INFO)
+    self.handler = ListHandler()
+    self.logger.addHandler(self.handler)
+
+  def test_lazy (self):
+    calls = []
+    def expensive ():
+      calls.append(1)
+      return "x"
+    hl = HotLogger(self.logger)
+    hl.debug("%s", lazy(expensive))
+    self.assertEqual(calls, [])
+    self.assertEqual(hl.disabled, 1)
+    hl.info("%s", lazy(expensive))
+    self.assertEqual(self.handler.records[0].getMessage(), "x")
+    self.assertEqual(calls, [1])
+
+  def test_rate (self):
+    hl = HotLogger(self.logger, rate=1e-6, burst=2)
+    for i in range(5):
+      hl.info("n=%s", i)
+    self.assertEqual(hl.emitted, 2)
+    self.assertEqual(hl.suppressed, 3)
+    hl._tokens = 1
+    hl.info("n=%s", 5)
+    self.assertEqual(self.handler.records[-1].getMessage(),
+                     "n=5 (3 similar messages suppressed)")
+    counters = get_counters()['loggers'][self.logger.name]
+    self.assertEqual(counters['emitted'], 3)
+
+  def test_sample (self):
+    hl = HotLogger(self.logger, sample=3)
+    for i in range(9):
+      hl.warning("%d%% done", i)
+    self.assertEqual(hl.emitted, 3)
+    self.assertEqual(self.handler.records[0].getMessage(), "2% done")
+
+  def test_async (self):
+    ah = AsyncHandler(self.handler)
+    self.logger.removeHandler(self.handler)
+    self.logger.addHandler(ah)
+    try:
+      raise RuntimeError("oops")
+    except RuntimeError:
+      self.logger.exception("failed %s", 1)
+    ah.flush()
+    ah.close()
+    self.assertEqual(len(self.handler.records), 1)
+    r = self.handler.records[0]
+    self.assertEqual(r.getMessage(), "failed 1")
+    self.assertTrue("oops" in r.exc_text)
+    self.assertEqual(ah.get_counters()['queued'], 1)
+
+if __name__ == '__main__':
+  unittest.main()
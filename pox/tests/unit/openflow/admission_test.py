@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.openflow.libopenflow_01 import *
+from pox.openflow.admission import *
+
+class MockNexus (object):
+  def raiseEventNoErrors (self, event, *args):
+    return None
+
+class MockConnection (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+    self.ofnexus = MockNexus()
+    self.sent = []
+    self.raised = []
+  def send (self, msg):
+    self.sent.append(msg)
+  def raiseEventNoErrors (self, event, con, msg):
+    self.raised.append(msg)
+
+class ManualAdmission (PacketInAdmission):
+  def _start_timer (self):
+    pass
+
+def packet_in (port, size = 100):
+  return ofp_packet_in(in_port=port, data='x' * size)
+
+class PacketInAdmissionTest (unittest.TestCase):
+  def test_port_limit (self):
+    a = ManualAdmission(switch_rate=1000, port_rate=1e-6, port_burst=2,
+                        drop_flows=True, drop_threshold=3)
+    con = MockConnection(1)
+    results = [a.admit(con, packet_in(1)) for i in range(5)]
+    self.assertEqual(results, [True, True, False, False, False])
+    # Another port is unaffected
+    self.assertTrue(a.admit(con, packet_in(2)))
+    stats = a.get_stats()[1]
+    self.assertEqual(stats['dropped'], 3)
+    self.assertEqual(stats['drop_flows'], 1)
+    self.assertEqual(len(con.sent), 1)
+    self.assertEqual(con.sent[0].match.in_port, 1)
+    self.assertEqual(con.sent[0].actions, [])
+
+  def test_defer_and_release (self):
+    a = ManualAdmission(switch_rate=1e-6, switch_burst=1, port_rate=1000,
+                        max_deferred=2, quantum=150)
+    c1 = MockConnection(1)
+    c2 = MockConnection(2)
+    self.assertTrue(a.admit(c1, packet_in(1)))
+    self.assertFalse(a.admit(c1, packet_in(1)))
+    self.assertFalse(a.admit(c1, packet_in(2)))
+    self.assertFalse(a.admit(c1, packet_in(3))) # Queue full
+    self.assertEqual(a.get_stats()[1]['backlog'], 2)
+    self.assertEqual(a.get_stats()[1]['dropped'], 1)
+    self.assertTrue(a.admit(c2, packet_in(1)))
+
+    # Refill switch 1's bucket; the quantum lets out one PacketIn per round
+    a._switches[c1].bucket.burst = a._switches[c1].bucket.tokens = 5
+    a._release()
+    self.assertEqual([m.in_port for m in c1.raised], [1])
+    a._release()
+    self.assertEqual([m.in_port for m in c1.raised], [1, 2])
+    self.assertEqual(len(a._backlogged), 0)
+
+  def test_forget (self):
+    a = ManualAdmission(switch_rate=1e-6, switch_burst=1)
+    con = MockConnection(1)
+    a.admit(con, packet_in(1))
+    a.admit(con, packet_in(1))
+    a.forget(con)
+    a._release()
+    self.assertEqual(con.raised, [])
+    self.assertEqual(a.get_stats(), {})
+
+if __name__ == '__main__':
+  unittest.main()
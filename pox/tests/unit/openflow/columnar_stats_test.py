@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.openflow.libopenflow_01 import *
+from pox.openflow.columnar_stats import *
+
+class FlowStatsColumnsTest(unittest.TestCase):
+  def _stats (self, n):
+    return [ofp_flow_stats(match=ofp_match(in_port=i, dl_type=0x800,
+                                           nw_src="10.0.0.%i" % (i,)),
+                           priority=i, cookie=0xF00000000 + i,
+                           packet_count=i << 40, byte_count=i << 50,
+                           actions=[ofp_action_output(port=i)] * (i % 3))
+            for i in range(1, n+1)]
+
+  def test_append_raw(self):
+    stats = self._stats(5)
+    data = b''.join(s.pack() for s in stats)
+    c = FlowStatsColumns()
+    self.assertEqual(c.append_raw(data), 5)
+    self.assertEqual(len(c), 5)
+    self.assertEqual(list(c.priority), [1,2,3,4,5])
+    self.assertEqual(list(c.cookie), [s.cookie for s in stats])
+    self.assertEqual(list(c.byte_count), [s.byte_count for s in stats])
+    self.assertEqual(c.match(2), stats[2].match)
+    self.assertEqual(c.actions(4), stats[4].actions)
+    self.assertEqual(list(c), stats)
+
+  def test_extend(self):
+    stats = self._stats(4)
+    a = FlowStatsColumns()
+    b = FlowStatsColumns()
+    for s in stats[:2]: a.append(s)
+    for s in stats[2:]: b.append(s)
+    a.extend(b)
+    self.assertEqual(list(a), stats)
+    self.assertEqual(a[-1], stats[-1])
+
+  def test_bad_length(self):
+    data = self._stats(1)[0].pack()
+    c = FlowStatsColumns()
+    self.assertRaises(RuntimeError, c.append_raw, data + data[:10])
+
+class PortStatsColumnsTest(unittest.TestCase):
+  def test_append_raw(self):
+    stats = [ofp_port_stats(port_no=i, rx_packets=i, tx_bytes=i << 40,
+                            collisions=7) for i in range(1,4)]
+    c = PortStatsColumns()
+    c.append_raw(b''.join(s.pack() for s in stats))
+    self.assertEqual(list(c.port_no), [1,2,3])
+    self.assertEqual(list(c.tx_bytes), [1 << 40, 2 << 40, 3 << 40])
+    self.assertEqual(list(c), stats)
+
+if __name__ == '__main__':
+  unittest.main()
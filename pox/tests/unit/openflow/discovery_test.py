@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.core import core
+from pox.openflow.discovery import Discovery, Link
+import pox.openflow.libopenflow_01 as of
+from pox.lib.packet.ethernet import ethernet
+from pox.lib.addresses import EthAddr
+
+
+class MockNexus (object):
+  def __init__ (self, dpids):
+    self.connections = dict((dpid, None) for dpid in dpids)
+
+class MockShard (object):
+  shard_id = 1
+  def __init__ (self, switches):
+    self.switches = switches
+    self.links = {}
+  def owner_of (self, dpid):
+    return self.switches.get(dpid)
+  def set (self, table, key, value):
+    getattr(self, table)[key] = value
+  def remove (self, table, key):
+    del getattr(self, table)[key]
+
+class MockEvent (object):
+  def __init__ (self, dpid, port, data):
+    self.dpid = dpid
+    self.port = port
+    self.parsed = ethernet(data)
+    self.connection = None
+    self.ofp = None
+
+class MockConnectionDown (object):
+  def __init__ (self, dpid):
+    self.dpid = dpid
+
+
+class DiscoveryTest (unittest.TestCase):
+  def setUp (self):
+    core.components['openflow'] = MockNexus([1, 2])
+    self.shard = MockShard({1:1, 2:1, 3:2})
+    core.components['openflow_shard'] = self.shard
+    self.d = Discovery(install_flow = False, explicit_drop = False)
+    self.events = []
+    self.d.addListenerByName("LinkEvent", self.events.append)
+
+  def tearDown (self):
+    core.components.pop('openflow', None)
+    core.components.pop('openflow_shard', None)
+
+  def lldp (self, from_dpid, from_port, to_dpid, to_port):
+    """
+    Hands discovery an LLDP sent by one switch and received by another
+    """
+    po = of.ofp_packet_out()
+    po.unpack(self.d._sender.create_discovery_packet(
+        from_dpid, from_port, EthAddr("02:00:00:00:00:01")))
+    self.d._handle_openflow_PacketIn(MockEvent(to_dpid, to_port, po.data))
+
+  def test_cross_shard_links (self):
+    self.lldp(1, 1, 2, 1) # Both local
+    self.lldp(3, 1, 2, 2) # From a switch on shard 2
+    self.assertEqual(self.d.adjacency.keys(), [Link(1,1,2,1)])
+    self.assertEqual([e.link for e in self.events], [Link(1,1,2,1)])
+    self.assertEqual(self.shard.links, {Link(3,1,2,2):1})
+    self.assertTrue(self.d.is_edge_port(2, 2))
+
+    # Gone when the local end goes down
+    self.d._handle_openflow_ConnectionDown(MockConnectionDown(2))
+    self.assertEqual(self.shard.links, {})
+    self.assertEqual(self.d.remote_links, {})
+
+    # Or when it times out
+    self.lldp(3, 1, 1, 3)
+    self.d.remote_links[Link(3,1,1,3)] -= self.d._link_timeout + 1
+    self.d._expire_links()
+    self.assertEqual(self.shard.links, {})
+
+  def check_indexes (self):
+    """
+    Checks the lookup methods against a search of every link
+    """
+    d = self.d
+    links = d.adjacency.keys()
+    for dpid in range(1, 6):
+      self.assertEqual(d.links_for_switch(dpid),
+                       frozenset(l for l in links
+                                 if dpid in (l.dpid1,l.dpid2)))
+      for port in range(1, 5):
+        end = (dpid,port)
+        found = frozenset(l for l in links if end in l.end)
+        self.assertEqual(d.links_for_port(dpid, port), found)
+        self.assertEqual(d.is_edge_port(dpid, port), not found)
+        peers = [l.end[1] for l in found if l.end[0] == end]
+        if not peers: peers = [l.end[0] for l in found]
+        if peers:
+          self.assertTrue(d.peer_of(dpid, port) in peers)
+        else:
+          self.assertEqual(d.peer_of(dpid, port), None)
+    # Nothing is left behind in the indexes
+    for index in (d._switch_links, d._port_links):
+      self.assertTrue(all(index.values()))
+
+  def test_indexes (self):
+    core.openflow.connections[4] = None
+    for link in ((1,1, 2,1), (2,1, 1,1), (1,2, 4,1), (4,1, 1,2),
+                 (2,2, 4,2), (1,3, 2,3)):
+      self.lldp(*link)
+    self.assertEqual(len(self.d.adjacency), 6)
+    self.check_indexes()
+    self.assertEqual(self.d.peer_of(4, 2), (2,2)) # Only a link into it
+    self.lldp(1,1, 2,1) # Seen again
+    self.check_indexes()
+
+    # One direction times out
+    self.d.adjacency[Link(1,2,4,1)] -= self.d._link_timeout + 1
+    self.d._expire_links()
+    self.assertEqual(len(self.d.adjacency), 5)
+    self.check_indexes()
+    self.assertEqual(self.d.peer_of(1, 2), (4,1))
+    self.assertFalse(self.d.is_edge_port(1, 2))
+
+    # A switch goes away
+    self.d._handle_openflow_ConnectionDown(MockConnectionDown(2))
+    self.assertEqual(self.d.adjacency.keys(), [Link(4,1,1,2)])
+    self.check_indexes()
+    self.assertEqual(self.d.links_for_switch(2), frozenset())
+    self.assertEqual(sorted(self.d._switch_links), [1, 4])
+
+  def test_unknown_switch (self):
+    self.lldp(4, 1, 2, 1) # Not connected anywhere
+    self.assertEqual(self.d.adjacency, {})
+    self.assertEqual(self.shard.links, {})
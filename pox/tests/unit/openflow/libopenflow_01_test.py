@@ -312,6 +312,76 @@ class ofp_command_test(unittest.TestCase):
             for (check_attr,val) in attrs.iteritems():
               self.assertEqual(getattr(unpacked, check_attr), val)
 
+  def test_pack_into_and_memoryview(self):
+    match = ofp_match(in_port=1, dl_type=0x0800, nw_proto=17,
+                      dl_src=EthAddr("00:00:00:00:00:01"),
+                      nw_src="10.0.0.0/8", tp_dst=53)
+    msgs = [ofp_flow_mod(xid=1, match=match, actions=self.some_actions[1]),
+            ofp_packet_out(xid=2, in_port=3, data="x"*50,
+                           action=ofp_action_output(port=4)),
+            ofp_packet_in(xid=3, in_port=5, data="y"*60, reason=1),
+            ofp_flow_mod(xid=4, command=OFPFC_DELETE)]
+    buf = bytearray()
+    offset = 0
+    for m in msgs:
+      offset = m.pack_into(buf, offset)
+    self.assertEqual(bytes(buf), b"".join(m.pack() for m in msgs))
+
+    view = memoryview(buf)
+    offset = 0
+    for m in msgs:
+      o = type(m)()
+      offset,length = o.unpack(view, offset)
+      self.assertEqual(o, m)
+    self.assertEqual(offset, len(buf))
+    self.assertRaises(UnderrunError, ofp_flow_mod().unpack, view[:50])
+
+  def test_pack_wildcarded_values(self):
+    # Fields which are wildcarded pack as zero even if they have a value
+    m = ofp_match(dl_type=0x0800, nw_proto=6, tp_src=80, in_port=7)
+    m.wildcards |= OFPFW_TP_SRC | OFPFW_IN_PORT
+    packed = m.pack()
+    self.assertEqual(extract_num(packed, 4, 2), 0)
+    self.assertEqual(extract_num(packed, 36, 2), 0)
+    o = ofp_match()
+    o.unpack(packed)
+    self.assertEqual(o, m)
+
+  def test_flow_mod_template(self):
+    proto = ofp_flow_mod(idle_timeout=10, hard_timeout=30, priority=40,
+                         actions=[ofp_action_vlan_vid(vlan_vid=7),
+                                  ofp_action_output(port=OFPP_NONE)])
+    t = ofp_flow_mod_template(proto)
+    dst = EthAddr("00:00:00:00:00:02")
+
+    expected = ofp_flow_mod(xid=5, idle_timeout=10, hard_timeout=30,
+                            priority=40, buffer_id=9,
+                            actions=[ofp_action_vlan_vid(vlan_vid=7),
+                                     ofp_action_output(port=3)])
+    expected.match.in_port = 1
+    expected.match.dl_dst = dst
+    self.assertEqual(t.pack(xid=5, in_port=1, dl_dst=dst, out_port=3,
+                            buffer_id=9), expected.pack())
+
+    # A whole match, with in_port overriding the one in it
+    match = ofp_match(in_port=2, dl_type=0x0800, nw_proto=6, tp_dst=80)
+    expected.match = match.clone()
+    expected.match.in_port = 1
+    expected.buffer_id = None
+    self.assertEqual(t.pack(xid=5, match=match, in_port=1, out_port=3),
+                     expected.pack())
+    self.assertEqual(match.in_port, 2)
+
+    # Untouched fields come from the prototype, with a new xid each time
+    a = t.unpack()
+    self.assertEqual(a.match, ofp_match())
+    self.assertEqual(a.actions, proto.actions)
+    self.assertNotEqual(a.xid, t.unpack().xid)
+
+    self.assertRaises(TypeError, t.pack, priority=1)
+    self.assertRaises(TypeError, ofp_flow_mod_template(ofp_flow_mod()).pack,
+                      out_port=1)
+
 class ofp_action_test(unittest.TestCase):
   def assert_packed_action(self, cls, packed, a_type, length):
     self.assertEqual(extract_num(packed, 0,2), a_type, "Action %s: expected type %d (but is %d)" % (cls, a_type, extract_num(packed, 0,2)))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import struct
+import time
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+import pox.openflow
+from pox.openflow import OpenFlowNexus, RateSampler
+from pox.openflow.libopenflow_01 import *
+
+
+class MockConnection (object):
+  def __init__ (self, dpid, connect_time = 100.0):
+    self.dpid = dpid
+    self.connect_time = connect_time
+    self.sent = []
+    self.tx_messages = 0
+    self.tx_bytes = 0
+  def send (self, data):
+    self.sent.append(data)
+    self.tx_messages += 1
+    self.tx_bytes += len(data)
+
+class Clock (object):
+  def __init__ (self, now):
+    self.now = now
+  def time (self):
+    return self.now
+
+
+class OpenFlowNexusTest (unittest.TestCase):
+  def setUp (self):
+    self.nexus = OpenFlowNexus()
+    self.cons = [MockConnection(dpid) for dpid in (1, 2, 3)]
+    for con in self.cons:
+      self.nexus._connect(con)
+
+  def tearDown (self):
+    pox.openflow.time = time
+
+  def xids (self, con):
+    return [struct.unpack("!L", data[4:8])[0] for data in con.sent]
+
+  def test_new_xids (self):
+    fm = ofp_flow_mod(xid=1234, match=ofp_match(in_port=1), priority=5)
+    data = fm.pack()
+    self.assertEqual(self.nexus.send_to_dpids(fm, [1, 3, 9]), 2)
+    self.assertEqual(self.nexus.broadcast(data), 3)
+
+    sent = self.cons[0].sent + self.cons[1].sent + self.cons[2].sent
+    self.assertEqual(len(sent), 5)
+    xids = self.xids(self.cons[0]) + self.xids(self.cons[1]) \
+         + self.xids(self.cons[2])
+    self.assertEqual(len(set(xids)), 5) # Every copy got its own
+    self.assertFalse(1234 in xids)
+    # Only the xid was changed
+    for d in sent:
+      self.assertEqual(d[:4] + d[8:], data[:4] + data[8:])
+      m = ofp_flow_mod()
+      m.unpack(d)
+      self.assertEqual((m.match, m.priority), (fm.match, fm.priority))
+
+  def test_same_xids (self):
+    data = ofp_barrier_request(xid=77).pack()
+    self.assertEqual(self.nexus.broadcast(data, new_xids=False), 3)
+    for con in self.cons:
+      self.assertEqual(con.sent, [data])
+
+  def test_send_rates (self):
+    clock = Clock(110.0)
+    pox.openflow.time = clock
+    for i in range(20):
+      self.nexus.send_to_dpids(ofp_barrier_request(), [1])
+    sampler = RateSampler()
+    rates = self.nexus.get_send_rates(sampler)
+    # Since connecting, ten seconds ago
+    self.assertEqual(rates[1], (2.0, 2.0 * 8))
+    self.assertEqual(rates[2], (0.0, 0.0))
+
+    clock.now = 112.0
+    self.nexus.broadcast(ofp_barrier_request())
+    other = RateSampler()
+    self.assertEqual(self.nexus.get_send_rates(other)[3], (1/12.0, 8/12.0))
+    rates = self.nexus.get_send_rates(sampler)
+    # Since the sampler's last call (the other sampler doesn't matter)
+    self.assertEqual(rates[1], (0.5, 0.5 * 8))
+    self.assertEqual(rates[3], (0.5, 0.5 * 8))
+    self.assertEqual(self.nexus.get_send_rates(sampler)[1], (0.0, 0.0))
+    # Without a sampler, it's since connecting
+    self.assertEqual(self.nexus.get_send_rates()[1], (21/12.0, 21*8/12.0))
+
+
+if __name__ == '__main__':
+  unittest.main()
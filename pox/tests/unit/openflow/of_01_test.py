@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.openflow.libopenflow_01 import *
+import pox.openflow.of_01 as of_01
+from pox.openflow.of_01 import Connection
+
+
+class MockSocket (object):
+  def __init__ (self):
+    self.sent = []
+    self.incoming = []
+  def send (self, data):
+    self.sent.append(data)
+    return len(data)
+  def recv (self, size):
+    return self.incoming.pop(0)
+
+class MockDeferredSender (object):
+  sending = False
+
+class MockNexus (object):
+  def raiseEventNoErrors (self, *args, **kw):
+    return None
+
+
+class ConnectionStatsTest (unittest.TestCase):
+  def setUp (self):
+    self._deferred_sender = of_01.deferredSender
+    of_01.deferredSender = MockDeferredSender()
+    self.sock = MockSocket()
+    self.con = Connection(self.sock)
+    self.con.ofnexus = MockNexus()
+    self.events = []
+    for name in ("FlowStatsReceived", "PortStatsReceived",
+                 "FlowStatsChunk", "PortStatsChunk"):
+      self.con.addListenerByName(name, self.events.append)
+
+  def tearDown (self):
+    of_01.deferredSender = self._deferred_sender
+
+  def feed (self, *msgs):
+    """
+    Has the connection read the given messages in one go
+    """
+    self.sock.incoming.append(b''.join(m.pack() for m in msgs))
+    self.assertTrue(self.con.read())
+
+  def flow_reply (self, xid, ports, more):
+    r = ofp_stats_reply(xid=xid, type=OFPST_FLOW,
+        body=[ofp_flow_stats(match=ofp_match(in_port=p), priority=p)
+              for p in ports])
+    r.is_last_reply = not more
+    return r
+
+  def port_reply (self, xid, ports, more):
+    r = ofp_stats_reply(xid=xid, type=OFPST_PORT,
+        body=[ofp_port_stats(port_no=p, rx_packets=p) for p in ports])
+    r.is_last_reply = not more
+    return r
+
+  def test_interleaved_replies (self):
+    # Two multipart replies, with the parts alternating
+    self.feed(self.flow_reply(10, [1, 2], True),
+              self.port_reply(11, [1], True))
+    self.assertEqual(sorted(self.con._previous_stats), [10, 11])
+    self.assertEqual(self.events, [])
+    self.feed(self.flow_reply(10, [3], False),
+              self.port_reply(11, [2, 3], False))
+    self.assertEqual(self.con._previous_stats, {})
+
+    flows,ports = self.events
+    self.assertEqual(type(flows).__name__, "FlowStatsReceived")
+    self.assertEqual([s.priority for s in flows.stats], [1, 2, 3])
+    self.assertEqual(len(flows.ofp), 2)
+    self.assertEqual(type(ports).__name__, "PortStatsReceived")
+    self.assertEqual([s.port_no for s in ports.stats], [1, 2, 3])
+
+  def test_interleaved_streams (self):
+    con = self.con
+    flow_xid = con.stream_stats(ofp_flow_stats_request(), columnar=True)
+    port_xid = con.stream_stats(ofp_port_stats_request())
+    self.assertEqual(sorted(con._stats_streams),
+                     sorted([flow_xid, port_xid]))
+
+    # Streamed parts are raised as they come, even with an ordinary
+    # multipart reply mixed in
+    self.feed(self.flow_reply(flow_xid, [1, 2], True),
+              self.port_reply(port_xid, [1], True),
+              self.flow_reply(5, [9], True),
+              self.flow_reply(flow_xid, [3], False))
+    self.assertEqual(con._previous_stats.keys(), [5])
+    self.assertEqual(con._stats_streams.keys(), [port_xid])
+    self.feed(self.port_reply(port_xid, [2], False),
+              self.flow_reply(5, [8], False))
+    self.assertEqual(con._stats_streams, {})
+    self.assertEqual(con._previous_stats, {})
+
+    names = [type(e).__name__ for e in self.events]
+    self.assertEqual(names, ["FlowStatsChunk", "PortStatsChunk",
+                             "FlowStatsChunk", "PortStatsChunk",
+                             "FlowStatsReceived"])
+    chunks = self.events[:4]
+    self.assertEqual([e.xid for e in chunks],
+                     [flow_xid, port_xid, flow_xid, port_xid])
+    self.assertEqual([e.last for e in chunks], [False, False, True, True])
+    # The columnar stream is decoded without an ofp_stats_reply
+    self.assertEqual(list(chunks[0].stats.priority), [1, 2])
+    self.assertEqual(chunks[0].ofp, None)
+    self.assertEqual([s.port_no for s in chunks[1].stats], [1])
+    self.assertEqual(chunks[1].ofp.xid, port_xid)
+    self.assertEqual([s.priority for s in self.events[4].stats], [9, 8])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import json
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.openflow.shard import *
+from pox.openflow.discovery import Link
+from pox.lib.addresses import EthAddr
+
+
+class MockPeer (object):
+  """
+  Stands in for a ShardPeer, queueing messages for the other end
+  """
+  def __init__ (self, shard, queue):
+    self.shard = shard
+    self.queue = queue
+  def send_message (self, msg):
+    msg['CHANNEL'] = 'openflow_shard'
+    self.queue.append(json.loads(json.dumps(msg, default=str)))
+
+
+class ShardNexusTest (unittest.TestCase):
+  def setUp (self):
+    self.hub = ShardNexus(0, 3, None)
+    self.workers = [ShardNexus(i, 3, self.hub.hub_path) for i in (1,2)]
+    # For each worker: messages to the hub, messages to the worker
+    self.queues = []
+    self.hub_peers = []
+    for w in self.workers:
+      up,down = [],[]
+      hub_side = MockPeer(w.shard_id, down)
+      self.hub._peers.add(hub_side)
+      self.hub_peers.append(hub_side)
+      w._peers.add(MockPeer(0, up))
+      self.queues.append((up,down))
+    self.events = []
+    self.workers[1].addListenerByName("ShardStateEvent", self.events.append)
+
+  def tearDown (self):
+    for w in self.workers:
+      w._hub_socket.close()
+    self.hub._hub_socket.close()
+    self.hub._handle_DownEvent(None)
+
+  def deliver (self):
+    busy = True
+    while busy:
+      busy = False
+      for w,hub_side,(up,down) in zip(self.workers, self.hub_peers,
+                                      self.queues):
+        while up:
+          self.hub._rx_message(hub_side, up.pop(0))
+          busy = True
+        while down:
+          w._rx_message(None, down.pop(0))
+          busy = True
+
+  def test_relay (self):
+    link = Link(1, 2, 3, 4)
+    self.workers[0].set('links', link, 1)
+    self.workers[0].set('hosts', EthAddr("00:00:00:00:00:01"), (1, 3))
+    self.hub.set('switches', 7, 0)
+    self.deliver()
+    for n in [self.hub] + self.workers:
+      self.assertEqual(n.links, {link:1})
+      self.assertEqual(n.hosts, {EthAddr("00:00:00:00:00:01"):(1, 3)})
+      self.assertEqual(n.owner_of(7), 0)
+    self.assertEqual(sorted((e.table, e.shard, e.remote)
+                            for e in self.events),
+                     [('hosts', 1, True), ('links', 1, True),
+                      ('switches', 0, True)])
+
+  def test_owner (self):
+    mac = EthAddr("00:00:00:00:00:01")
+    self.workers[0].set('hosts', mac, (1, 3))
+    self.deliver()
+    # It moves to the other shard, and then the first one times it out
+    self.workers[1].set('hosts', mac, (5, 1))
+    self.deliver()
+    self.workers[0].remove('hosts', mac)
+    self.deliver()
+    for n in [self.hub] + self.workers:
+      self.assertEqual(n.hosts, {mac:(5, 1)})
+
+  def test_hello_and_close (self):
+    self.workers[0].set('switches', 1, 1)
+    self.hub.set('switches', 2, 0)
+    self.deliver()
+
+    # A new worker gets caught up
+    queue = []
+    late = MockPeer(None, queue)
+    self.hub._rx_message(late, {'cmd':'hello', 'shard':3})
+    self.assertEqual(sorted(m['key'] for m in queue), [1, 2])
+
+    # Losing a worker drops what it owned
+    self.hub._peer_closed(self.hub_peers[0])
+    self.deliver()
+    self.assertEqual(self.hub.switches, {2:0})
+    self.assertEqual(self.workers[1].switches, {2:0})
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import random
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.openflow.discovery import Link
+from pox.openflow.spanning_tree import _TreeState
+
+def tree_edges (state):
+  return set((a,b) for a in state.tree for b in state.tree[a])
+
+def is_spanning_forest (state, links):
+  """
+  Checks that the tree has no loops and connects all linked switches
+  """
+  edges = tree_edges(state)
+  for a,b in edges:
+    if (b,a) not in edges: return False
+  # Union-find over the symmetric links
+  parent = {}
+  def find (x):
+    while parent.setdefault(x,x) != x:
+      x = parent[x]
+    return x
+  for l in links:
+    parent[find(l.dpid1)] = find(l.dpid2)
+  groups = {}
+  for l in links:
+    groups.setdefault(find(l.dpid1), set()).update((l.dpid1,l.dpid2))
+  tree_edge_count = len(edges) / 2
+  return tree_edge_count == sum(len(g) - 1 for g in groups.values())
+
+def ends_agree (state):
+  """
+  Checks that both ends of each adjacency use the same link
+  """
+  for a,neighbors in state.adj.iteritems():
+    for b,port in neighbors.iteritems():
+      if (port, state.adj[b][a]) not in state.links[(a,b)]: return False
+  return True
+
+class TreeStateTest (unittest.TestCase):
+  def _both (self, state, a, pa, b, pb, up = True):
+    f = state.link_up if up else state.link_down
+    return f(a,pa,b,pb) | f(b,pb,a,pa)
+
+  def test_ring (self):
+    s = _TreeState()
+    self._both(s, 1,1, 2,1)
+    self._both(s, 2,2, 3,1)
+    self.assertEqual(self._both(s, 3,2, 1,2), set()) # Closes the loop
+    self.assertEqual(s.tree_ports(1), set([1]))
+    self.assertEqual(s.tree_ports(3), set([1]))
+    # Breaking a tree link brings the loop link into the tree
+    changed = self._both(s, 1,1, 2,1, up=False)
+    self.assertEqual(s.tree_ports(1), set([2]))
+    self.assertEqual(s.tree_ports(2), set([2]))
+    self.assertTrue(1 in changed and 2 in changed)
+
+  def test_parallel_links (self):
+    s = _TreeState()
+    self._both(s, 1,1, 2,1)
+    self._both(s, 1,2, 2,2)
+    self.assertEqual(s.tree_ports(1), set([1]))
+    self.assertEqual(self._both(s, 1,1, 2,1, up=False), set([1,2]))
+    self.assertEqual(s.tree_ports(1), set([2]))
+
+  def test_rebuild_parallel_links (self):
+    links = set([Link(1,1,2,5), Link(2,5,1,1), Link(1,2,2,3), Link(2,3,1,2)])
+    s = _TreeState()
+    s.rebuild(links)
+    self.assertTrue(ends_agree(s))
+    self.assertEqual(s.tree_ports(1), set([1]))
+    self.assertEqual(s.tree_ports(2), set([5]))
+    # Taking down the link in use moves both ends to the other one
+    self.assertEqual(self._both(s, 1,1, 2,5, up=False), set([1,2]))
+    self.assertEqual(s.tree_ports(1), set([2]))
+    self.assertEqual(s.tree_ports(2), set([3]))
+
+  def test_split (self):
+    s = _TreeState()
+    self._both(s, 1,1, 2,1)
+    self._both(s, 2,2, 3,1)
+    self._both(s, 2,2, 3,1, up=False)
+    self.assertNotEqual(s.component[1], s.component.get(3))
+    self.assertEqual(s.tree_ports(3), set())
+    self.assertEqual(s.tree_ports(2), set([1]))
+
+  def test_respan_size (self):
+    s = _TreeState()
+    self._both(s, 1,1, 2,1)
+    self._both(s, 2,2, 3,1)
+    self._both(s, 3,2, 1,2) # Not on the tree
+    self.assertEqual(s.respan_size(1,1, 2,1), 3)
+    self.assertEqual(s.respan_size(3,2, 1,2), 0)
+    self._both(s, 1,3, 2,3) # Parallel link, so no respan needed
+    self.assertEqual(s.respan_size(1,1, 2,1), 0)
+
+  def test_random_against_rebuild (self):
+    r = random.Random(4)
+    s = _TreeState()
+    links = set()
+    for i in range(300):
+      a,b = r.sample(range(1,15), 2)
+      # Up to two parallel links between neighbors, numbered differently
+      # at each end
+      n = r.randint(0,1)
+      pa,pb = b + 20 * n,a + 40 * n
+      l = Link(a,pa,b,pb)
+      flip = Link(b,pb,a,pa)
+      if l in links:
+        links.discard(l)
+        links.discard(flip)
+        self._both(s, a,pa, b,pb, up=False)
+      else:
+        links.add(l)
+        links.add(flip)
+        self._both(s, a,pa, b,pb)
+      self.assertTrue(is_spanning_forest(s, links))
+      self.assertTrue(ends_agree(s))
+    fresh = _TreeState()
+    fresh.rebuild(links)
+    self.assertTrue(ends_agree(fresh))
+    self.assertTrue(is_spanning_forest(fresh, links))
+    self.assertEqual(len(tree_edges(fresh)), len(tree_edges(s)))
+
+if __name__ == '__main__':
+  unittest.main()
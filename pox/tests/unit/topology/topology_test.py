@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import sys
+import os.path
+import marshal
+
+sys.path.append(os.path.dirname(__file__) + "/../../..")
+from pox.topology.topology import *
+from pox.topology.topology import _snapshot_header
+
+class TestSwitch (Switch):
+  def __init__ (self, id, name):
+    Switch.__init__(self, id)
+    self.name = name
+    self._scratch = object() # Not saved
+
+class TopologyTest (unittest.TestCase):
+  def setUp (self):
+    self.t = Topology()
+    self.joins = []
+    self.t.addListenerByName("SwitchJoin", self.joins.append)
+    self.switches = [TestSwitch("sw_%s_%s" % (id(self), i), "s%s" % (i,))
+                     for i in range(3)]
+    self.hosts = [Host() for i in range(2)]
+    for e in self.switches + self.hosts:
+      self.t.addEntity(e)
+
+  def test_types (self):
+    t = self.t
+    self.assertEqual(set(t.getEntitiesOfType(Switch)), set(self.switches))
+    self.assertEqual(t.getEntitiesOfType(Switch, False), [])
+    self.assertEqual(len(t.getEntitiesOfType(TestSwitch, False)), 3)
+    self.assertEqual(len(t.getEntitiesOfType()), 5)
+    self.assertEqual(len(t.getEntitiesOfType((Host, TestSwitch))), 5)
+    t.removeEntity(self.hosts[0])
+    self.assertEqual(t.getEntitiesOfType(Host), [self.hosts[1]])
+    t.removeEntity(self.hosts[1])
+    self.assertEqual(t.getEntitiesOfType(Host), [])
+
+  def test_snapshot (self):
+    data = self.t.snapshot()
+    t2 = Topology()
+    t2.restore(data)
+    self.assertEqual(t2.version, self.t.version)
+    self.assertEqual(len(t2), 5)
+    s = t2.getEntityByID(self.switches[1].id)
+    self.assertTrue(isinstance(s, TestSwitch))
+    self.assertEqual(s.name, "s1")
+    self.assertFalse(hasattr(s, "_scratch"))
+    self.assertRaises(ValueError, t2.restore, "junk" * 10)
+
+  def test_snapshot_types (self):
+    # Only loaded Entity types can be named in a snapshot
+    data = self.t.snapshot()
+    header = data[:_snapshot_header.size]
+    records,removed = marshal.loads(data[_snapshot_header.size:])
+    for name in ("os.system", "pox.topology.topology.Topology"):
+      bad = [(name, "x", {})]
+      t2 = Topology()
+      self.assertRaises(ValueError, t2.restore,
+                        header + marshal.dumps((bad, removed)))
+      self.assertEqual(len(t2), 0)
+
+  def test_delta (self):
+    t = self.t
+    t2 = Topology()
+    t2.restore(t.snapshot())
+    joins = []
+    t2.addListenerByName("SwitchJoin", joins.append)
+    v = t.version
+
+    t.removeEntity(self.hosts[0])
+    new = TestSwitch("sw_%s_new" % (id(self),), "new")
+    t.addEntity(new)
+    self.switches[0].name = "renamed"
+    t.touch(self.switches[0])
+
+    t2.restore(t.delta(v))
+    self.assertEqual(len(t2), 5)
+    self.assertEqual(t2.getEntityByID(self.hosts[0].id), None)
+    self.assertEqual(t2.getEntityByID(new.id).name, "new")
+    self.assertEqual(t2.getEntityByID(self.switches[0].id).name, "renamed")
+    self.assertEqual(len(joins), 1)
+    # Out of order deltas are refused
+    self.assertRaises(ValueError, t2.restore, t.delta(v))
+
+if __name__ == '__main__':
+  unittest.main()
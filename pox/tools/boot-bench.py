@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark of POX startup time
+
+Runs a few short-lived POX processes (importing pox.lib.addresses,
+initializing core, and "pox.py --version") a number of times each and
+reports the fastest and mean wall clock time.  Use --tree to point it at
+another POX checkout to compare against.
+"""
+
+import sys
+import os
+import time
+import argparse
+import subprocess
+
+
+def main ():
+  parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+  parser.add_argument("--count", type=int, default=20)
+  parser.add_argument("--python", default=sys.executable)
+  parser.add_argument("--tree", default=os.path.join(
+                      os.path.dirname(os.path.abspath(__file__)), ".."),
+                      help="POX directory to time")
+  args = parser.parse_args()
+  tree = os.path.abspath(args.tree)
+
+  cases = [
+    ("python", ["-c", "pass"]),
+    ("addresses", ["-c", "import pox.lib.addresses"]),
+    ("core", ["-c", "import pox.core; pox.core.initialize()"]),
+    ("--version", [os.path.join(tree, "pox.py"), "--version"]),
+  ]
+
+  devnull = open(os.devnull, "w")
+  print "%-10s %10s %10s" % ("case", "min ms", "mean ms")
+  for name,cmd in cases:
+    times = []
+    for i in range(args.count):
+      start = time.time()
+      subprocess.check_call([args.python] + cmd, cwd=tree, stdout=devnull,
+                            stderr=devnull)
+      times.append(time.time() - start)
+    print "%-10s %10.1f %10.1f" % (name, min(times) * 1000,
+                                   sum(times) / len(times) * 1000)
+
+
+if __name__ == '__main__':
+  main()
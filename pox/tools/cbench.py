@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Controller load generator in the style of oflops cbench
+
+Starts POX running each forwarding app under test, connects a number of
+emulated switches (SoftwareSwitchBase over local sockets) and has them
+send table-miss packet_ins, like cbench does:
+  throughput: every switch keeps --window packet_ins outstanding
+  latency:    every switch waits for each answer before the next one
+A packet_in is answered by a flow_mod or packet_out for it.  The apps
+which use buffers (l2_learning, l2_multi) are matched up by buffer ID;
+the fgre ones answer in order.  The emulated switches don't install
+flows or forward anything, so every packet keeps missing.
+
+Reports flows (answers) per second, p50/p99 setup latency, how many
+packet_ins got no answer, and the controller's CPU time per flow.
+--json saves the results, and --baseline compares against saved ones.
+"""
+
+import sys
+import os
+import time
+import json
+import socket
+import select
+import random
+import argparse
+import platform
+import subprocess
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import pox.core
+pox.core.initialize()
+import pox.openflow.libopenflow_01 as of
+from pox.datapaths.switch import SoftwareSwitchBase, OFConnection
+from pox.lib.ioworker import IOWorker
+from pox.lib.packet import ethernet, vlan, ipv4, udp
+from pox.lib.addresses import EthAddr, IPAddr
+import logging
+
+POX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# The fgre apps only handle this topology: dpid -> ports traffic enters on
+FGRE_PORTS = {1:[12,3], 2:[3,4], 3:[1,2], 4:[2,5], 5:[4,12]}
+
+# name -> (components, answers matched by buffer ID?, fixed ports or None)
+APPS = OrderedDict([
+  ("l2_learning", (["forwarding.l2_learning"], True, None)),
+  ("l2_multi", (["openflow.discovery", "forwarding.l2_multi"], True, None)),
+  ("fgre_topo", (["forwarding.fgre_topo", "--vlan=%(vlan)s"], False,
+                 FGRE_PORTS)),
+  ("fgre_fw", (["forwarding.fgre_fw", "--vlan=%(vlan)s",
+                "--rate=1000000"], False, FGRE_PORTS)),
+])
+
+
+class BenchSwitch (SoftwareSwitchBase):
+  """
+  A switch which sends packet_ins and times the answers to them
+  """
+  def __init__ (self, dpid, ports, packets, match_buffers, timeout):
+    SoftwareSwitchBase.__init__(self, dpid, ports=ports)
+    self.packets = packets # (in_port, data) to send
+    self.match_buffers = match_buffers
+    self.timeout = timeout
+    self.ready = False
+    self.outstanding = OrderedDict() # buffer_id -> time sent
+    self._next_buffer = 0
+    self.latencies = []
+    self.answered = 0
+    self.lost = 0
+
+  def rx_message (self, connection, msg):
+    t = msg.header_type
+    if t == of.OFPT_PACKET_OUT:
+      self._answer(msg.buffer_id)
+    elif t == of.OFPT_FLOW_MOD:
+      if msg.command == of.OFPFC_ADD:
+        self._answer(msg.buffer_id)
+    else:
+      SoftwareSwitchBase.rx_message(self, connection, msg)
+      if t == of.OFPT_BARRIER_REQUEST:
+        self.ready = True
+
+  def _answer (self, buffer_id):
+    if self.match_buffers:
+      sent = self.outstanding.pop(buffer_id, None)
+    elif self.outstanding:
+      sent = self.outstanding.popitem(last=False)[1]
+    else:
+      sent = None
+    if sent is None: return
+    self.answered += 1
+    self.latencies.append(time.time() - sent)
+
+  def fill (self, window, now):
+    while len(self.outstanding) < window:
+      in_port,data = random.choice(self.packets)
+      buffer_id = self._next_buffer
+      self._next_buffer = (buffer_id + 1) & 0x7fffffff
+      self.outstanding[buffer_id] = now
+      self.send_packet_in(in_port, buffer_id, data)
+
+  def expire (self, now):
+    while self.outstanding:
+      buffer_id,sent = next(self.outstanding.iteritems())
+      if now - sent < self.timeout: break
+      del self.outstanding[buffer_id]
+      self.lost += 1
+
+  def reset_counts (self):
+    self.latencies = []
+    self.answered = 0
+    self.lost = 0
+
+
+class SocketWorker (IOWorker):
+  def __init__ (self, sock):
+    IOWorker.__init__(self)
+    self.socket = sock
+
+  def send (self, data):
+    self.socket.sendall(data)
+
+
+def make_packets (dpid, ports, hosts, vlan_id):
+  """
+  Returns (in_port, data) for traffic between hosts on one switch
+
+  Every host has a fixed port, so the learning apps learn the hosts and
+  then set up flows between them.  With vlan_id, packets are tagged.
+  """
+  if isinstance(ports, dict):
+    in_ports = ports[dpid]
+  else:
+    in_ports = range(1, ports + 1)
+  macs = [EthAddr("02:%02x:%02x:%02x:%02x:%02x" % (
+          (dpid >> 16) & 0xff, (dpid >> 8) & 0xff, dpid & 0xff,
+          h >> 8, h & 0xff)) for h in range(hosts)]
+  packets = []
+  for i in range(1000):
+    s = random.randrange(hosts)
+    d = random.randrange(hosts - 1)
+    if d >= s: d += 1
+    ip = ipv4(srcip=IPAddr("10.0.%i.%i" % divmod(s, 250)),
+              dstip=IPAddr("10.0.%i.%i" % divmod(d, 250)),
+              protocol=ipv4.UDP_PROTOCOL,
+              payload=udp(srcport=1234, dstport=5678, payload="x" * 64))
+    e = ethernet(src=macs[s], dst=macs[d])
+    if vlan_id is None:
+      e.type = ethernet.IP_TYPE
+      e.payload = ip
+    else:
+      e.type = ethernet.VLAN_TYPE
+      e.payload = vlan(id=vlan_id, eth_type=ethernet.IP_TYPE, payload=ip)
+    # Like a switch with the default miss_send_len would send
+    packets.append((in_ports[s % len(in_ports)], e.pack()[:128]))
+  return packets
+
+
+def cpu_seconds (pid):
+  """
+  Returns user+system CPU seconds used by a process (Linux only)
+  """
+  try:
+    with open("/proc/%i/stat" % (pid,)) as f:
+      fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / float(
+        os.sysconf("SC_CLK_TCK"))
+  except Exception:
+    return None
+
+
+def percentile (values, p):
+  if not values: return None
+  values = sorted(values)
+  return values[int(round(p * (len(values) - 1)))]
+
+
+def wait_for_port (port, timeout = 15):
+  end = time.time() + timeout
+  while time.time() < end:
+    try:
+      socket.create_connection(("127.0.0.1", port)).close()
+      return True
+    except socket.error:
+      time.sleep(0.1)
+  return False
+
+
+def run_one (args, app, mode):
+  components,match_buffers,fixed_ports = APPS[app]
+  components = [c % dict(vlan=args.vlan) for c in components]
+  cmd = [sys.executable, "pox.py", "log.level", "--WARNING",
+         "openflow.of_01", "--port=%i" % (args.port,)] + components
+  out = None if args.verbose else open(os.devnull, "w")
+  controller = subprocess.Popen(cmd, cwd=POX_DIR, stdout=out, stderr=out)
+  sockets = {}
+  try:
+    if not wait_for_port(args.port):
+      raise RuntimeError("Controller didn't start")
+
+    if fixed_ports:
+      dpids = sorted(fixed_ports)[:args.switches]
+      ports = fixed_ports
+    else:
+      dpids = range(1, args.switches + 1)
+      ports = args.ports
+    for dpid in dpids:
+      if fixed_ports:
+        sw = BenchSwitch(dpid, max(ports[dpid]),
+                         make_packets(dpid, ports, args.hosts, args.vlan),
+                         match_buffers, args.timeout)
+      else:
+        sw = BenchSwitch(dpid, ports,
+                         make_packets(dpid, ports, args.hosts, None),
+                         match_buffers, args.timeout)
+      s = socket.create_connection(("127.0.0.1", args.port))
+      w = SocketWorker(s)
+      con = OFConnection(w)
+      w.rx_handler = con.read
+      sw.set_connection(con)
+      sw.send_hello()
+      sockets[s] = (w, sw)
+
+    switches = [sw for _,sw in sockets.values()]
+    window = args.window if mode == "throughput" else 1
+    end = time.time() + 10 # Time to get connected
+    measure_at = None
+    cpu_start = loader_start = None
+    next_expire = 0
+    while True:
+      now = time.time()
+      if measure_at is None:
+        if all(sw.ready for sw in switches):
+          measure_at = now + args.warmup
+          end = measure_at + args.duration
+        elif now > end:
+          raise RuntimeError("Switches didn't connect")
+      elif cpu_start is None and now >= measure_at:
+        for sw in switches: sw.reset_counts()
+        cpu_start = cpu_seconds(controller.pid)
+        loader_start = sum(os.times()[:2])
+      if now >= end and measure_at is not None: break
+
+      r,_,_ = select.select(list(sockets), [], [], 0.01)
+      for s in r:
+        data = s.recv(65536)
+        if not data:
+          raise RuntimeError("Controller disconnected")
+        w,sw = sockets[s]
+        w._push_receive_data(data)
+      now = time.time()
+      if now >= next_expire:
+        for sw in switches: sw.expire(now)
+        next_expire = now + 0.1
+      for sw in switches:
+        if sw.ready: sw.fill(window, now)
+
+    cpu_end = cpu_seconds(controller.pid)
+    loader_cpu = sum(os.times()[:2]) - loader_start
+  finally:
+    for s in sockets: s.close()
+    controller.terminate()
+    controller.wait()
+
+  answered = sum(sw.answered for sw in switches)
+  latencies = []
+  for sw in switches: latencies.extend(sw.latencies)
+  result = OrderedDict([
+    ("app", app),
+    ("mode", mode),
+    ("switches", len(switches)),
+    ("window", window),
+    ("duration", args.duration),
+    ("flows", answered),
+    ("flows_per_sec", answered / float(args.duration)),
+    ("lost", sum(sw.lost for sw in switches)),
+    ("p50_ms", None),
+    ("p99_ms", None),
+    ("controller_cpu", None),
+    ("cpu_us_per_flow", None),
+    ("loader_cpu", loader_cpu),
+  ])
+  if latencies:
+    result["p50_ms"] = percentile(latencies, 0.5) * 1000
+    result["p99_ms"] = percentile(latencies, 0.99) * 1000
+  if cpu_start is not None and cpu_end is not None:
+    result["controller_cpu"] = cpu_end - cpu_start
+    if answered:
+      result["cpu_us_per_flow"] = (cpu_end - cpu_start) * 1e6 / answered
+  return result
+
+
+def fmt (v, f):
+  return "-" if v is None else f % (v,)
+
+
+def main ():
+  parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+  parser.add_argument("--apps", default=",".join(APPS),
+                      help="comma-separated apps to test")
+  parser.add_argument("--modes", default="throughput,latency")
+  parser.add_argument("--switches", type=int, default=16,
+                      help="(the fgre apps use at most 5)")
+  parser.add_argument("--ports", type=int, default=4)
+  parser.add_argument("--hosts", type=int, default=64,
+                      help="MACs per switch")
+  parser.add_argument("--window", type=int, default=16,
+                      help="packet_ins outstanding per switch in "
+                           "throughput mode")
+  parser.add_argument("--duration", type=float, default=5)
+  parser.add_argument("--warmup", type=float, default=2)
+  parser.add_argument("--timeout", type=float, default=1,
+                      help="seconds before a packet_in counts as lost")
+  parser.add_argument("--vlan", type=int, default=100,
+                      help="VLAN the fgre apps are started with")
+  parser.add_argument("--port", type=int, default=6699)
+  parser.add_argument("--verbose", "-v", action="store_true",
+                      help="show the controller's output")
+  parser.add_argument("--json", metavar="FILE", help="save results here")
+  parser.add_argument("--baseline", metavar="FILE",
+                      help="compare against results saved with --json")
+  args = parser.parse_args()
+  logging.getLogger().setLevel(logging.ERROR)
+
+  baseline = {}
+  if args.baseline:
+    with open(args.baseline) as f:
+      for r in json.load(f)["results"]:
+        baseline[(r["app"], r["mode"])] = r
+
+  print "%-12s %-10s %10s %8s %8s %6s %9s %8s" % ("app", "mode", "flows/s",
+      "p50 ms", "p99 ms", "lost", "us/flow", "change")
+  results = []
+  for app in args.apps.split(","):
+    if app not in APPS:
+      parser.error("Unknown app: " + app)
+    for mode in args.modes.split(","):
+      r = run_one(args, app, mode)
+      results.append(r)
+      old = baseline.get((app, mode))
+      change = None
+      if old and old["flows_per_sec"]:
+        change = (r["flows_per_sec"] / old["flows_per_sec"] - 1) * 100
+      print "%-12s %-10s %10.1f %8s %8s %6i %9s %8s" % (app, mode,
+          r["flows_per_sec"], fmt(r["p50_ms"], "%.2f"),
+          fmt(r["p99_ms"], "%.2f"), r["lost"],
+          fmt(r["cpu_us_per_flow"], "%.0f"), fmt(change, "%+.1f%%"))
+      sys.stdout.flush()
+      time.sleep(0.5) # Let the port free up
+
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump(OrderedDict([
+        ("time", time.time()),
+        ("python", platform.python_version()),
+        ("args", vars(args)),
+        ("results", results),
+      ]), f, indent=2)
+
+  # Skip waiting on the scheduler thread; we're done
+  sys.stdout.flush()
+  os._exit(0)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark for the link tables in openflow.discovery
+
+Builds a random fabric, then replays a trace of what discovery sees: every
+link is seen once per LLDP cycle, some links flap, and after each cycle
+every port on every switch is asked about (as spanning_tree and the
+forwarding components do).  Reports the time spent in link bookkeeping
+and in queries, and compares the queries against a scan of the adjacency
+table (which is what is_edge_port() used to do).
+"""
+
+import sys
+import os
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import pox.core
+pox.core.initialize()
+from pox.openflow.discovery import Discovery, Link
+
+
+def scan_is_edge_port (adjacency, dpid, port):
+  for link in adjacency:
+    if link.dpid1 == dpid and link.port1 == port:
+      return False
+    if link.dpid2 == dpid and link.port2 == port:
+      return False
+  return True
+
+
+def make_fabric (switches, degree, rng):
+  """
+  Returns a list of bidirectional links
+  """
+  next_port = dict((dpid,1) for dpid in range(1, switches+1))
+  links = []
+  for dpid1 in range(1, switches+1):
+    for _ in range(degree // 2):
+      dpid2 = rng.randint(1, switches)
+      if dpid2 == dpid1: continue
+      p1 = next_port[dpid1]
+      p2 = next_port[dpid2]
+      next_port[dpid1] += 1
+      next_port[dpid2] += 1
+      links.append(Link(dpid1,p1,dpid2,p2))
+      links.append(Link(dpid2,p2,dpid1,p1))
+  return links, next_port
+
+
+def main ():
+  parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+  parser.add_argument("--switches", type=int, default=500)
+  parser.add_argument("--degree", type=int, default=4)
+  parser.add_argument("--cycles", type=int, default=5)
+  parser.add_argument("--flap", type=float, default=0.01,
+                      help="Fraction of links that go down each cycle")
+  parser.add_argument("--no-scan", action="store_true",
+                      help="Skip the (slow) adjacency scan comparison")
+  args = parser.parse_args()
+
+  rng = random.Random(0)
+  links, next_port = make_fabric(args.switches, args.degree, rng)
+  ports = [(dpid,port) for dpid,count in next_port.iteritems()
+           for port in range(1, count + 1)]
+  print "%i switches, %i links, %i ports" % (args.switches, len(links),
+                                             len(ports))
+
+  d = Discovery(install_flow=False)
+  update_time = 0
+  query_time = 0
+  scan_time = 0
+  for cycle in range(args.cycles):
+    start = time.time()
+    for link in links:
+      d._add_link(link)
+    down = rng.sample(links, int(len(links) * args.flap))
+    d._delete_links(down)
+    update_time += time.time() - start
+
+    start = time.time()
+    edge = [d.is_edge_port(dpid, port) for dpid,port in ports]
+    for dpid in next_port:
+      d.links_for_switch(dpid)
+    query_time += time.time() - start
+
+    if not args.no_scan:
+      start = time.time()
+      scanned = [scan_is_edge_port(d.adjacency, dpid, port)
+                 for dpid,port in ports]
+      scan_time += time.time() - start
+      assert scanned == edge
+
+  print "Link updates:   %0.4f sec/cycle" % (update_time / args.cycles,)
+  print "Indexed query:  %0.4f sec/cycle" % (query_time / args.cycles,)
+  if not args.no_scan:
+    print "Scanning query: %0.4f sec/cycle" % (scan_time / args.cycles,)
+
+
+if __name__ == '__main__':
+  main()
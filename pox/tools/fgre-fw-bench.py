@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark of forwarding.fgre_fw replaying a synthetic flood
+
+Every port on the FGRE path has a well-behaved host sending slowly, and
+one attacker floods a port (optionally spoofing many source MACs).  The
+PacketIns are replayed through the firewall in the scheduler, in batches
+like the ones of_01 raises, against a simulated clock.  The simulated
+switches start dropping matching traffic once a DROP rule has had
+--rule-delay seconds to reach them, and stop sending it to the
+controller until the rule times out.
+
+Reports the controller time per PacketIn, how many PacketIns and
+flow_mods there were, how many writes carried them, what fraction of the
+good traffic was forwarded, and how many sources the firewall tracks.
+
+Some cases worth comparing:
+  fgre-fw-bench.py                          # One flooding host
+  fgre-fw-bench.py --macs=1000 --per-mac    # Spoofed MACs
+  fgre-fw-bench.py --macs=20000 --per-mac --max-keys=4096 --rule-delay=1
+                                            # More MACs than the firewall
+                                            # tracks, for a while
+"""
+
+import sys
+import os
+import time
+import random
+import struct
+import argparse
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import pox.core
+pox.core.initialize()
+from pox.core import core
+import pox.openflow
+import pox.openflow.libopenflow_01 as of
+from pox.lib.packet import ethernet, vlan, ipv4, udp
+from pox.lib.addresses import EthAddr, IPAddr
+import pox.forwarding.fgre_fw as fgre_fw
+import logging
+
+# (dpid, in_port) pairs the firewall forwards
+FGRE_PORTS = [(1,12), (1,3), (3,1), (3,2), (2,3), (2,4), (4,2), (4,5),
+              (5,4), (5,12)]
+
+
+class Clock (object):
+  """
+  Stands in for the time module in fgre_fw
+  """
+  def __init__ (self):
+    self.now = 0.0
+  def time (self):
+    return self.now
+
+
+class FakeConnection (object):
+  """
+  Collects what the firewall sends and keeps the switch's DROP rules
+  """
+  def __init__ (self, dpid, clock, rule_delay):
+    self.dpid = dpid
+    self.clock = clock
+    self.rule_delay = rule_delay
+    self.writes = 0
+    self.flow_mods = 0
+    self.packet_outs = 0
+    self.rules = {} # (in_port, src or None) -> (active from, expires)
+
+  def send (self, data):
+    if type(data) is not bytes:
+      data = data.pack()
+    self.writes += 1
+    offset = 0
+    while offset < len(data):
+      t, = struct.unpack_from("!B", data, offset + 1)
+      length, = struct.unpack_from("!H", data, offset + 2)
+      if t == of.OFPT_PACKET_OUT:
+        self.packet_outs += 1
+      elif t == of.OFPT_FLOW_MOD:
+        self.flow_mods += 1
+        fm = of.ofp_flow_mod()
+        fm.unpack(data[offset:offset+length])
+        if not fm.actions:
+          now = self.clock.now
+          src = fm.match.dl_src
+          key = (fm.match.in_port, None if src is None else src.toRaw())
+          expires = now + (fm.hard_timeout or 1e9)
+          r = self.rules.get(key)
+          if r is not None and now < r[1]:
+            # Replaces the same rule (active or still on its way)
+            self.rules[key] = (r[0], expires)
+          else:
+            self.rules[key] = (now + self.rule_delay, expires)
+      offset += length
+
+  def drops (self, in_port, src):
+    now = self.clock.now
+    for key in ((in_port, None), (in_port, src)):
+      r = self.rules.get(key)
+      if r is not None and r[0] <= now < r[1]:
+        return True
+    return False
+
+
+def make_packet (src, vid):
+  e = ethernet(src=src, dst=EthAddr("02:00:00:00:00:ff"),
+               type=ethernet.VLAN_TYPE)
+  e.payload = vlan(id=vid, eth_type=ethernet.IP_TYPE)
+  e.payload.payload = ipv4(srcip=IPAddr("10.0.0.1"), dstip=IPAddr("10.0.0.2"),
+                           protocol=ipv4.UDP_PROTOCOL,
+                           payload=udp(srcport=1, dstport=2, payload="x" * 64))
+  return e.pack()
+
+
+def make_trace (args, rng):
+  """
+  Returns a time-ordered list of (time, dpid, in_port, src, data, good)
+  """
+  trace = []
+  for i,(dpid,port) in enumerate(FGRE_PORTS):
+    src = EthAddr("02:00:00:00:01:%02x" % (i,)).toRaw()
+    data = make_packet(src, args.vlan)
+    period = 1.0 / args.good_rate
+    t = rng.random() * period
+    while t < args.duration:
+      trace.append((t, dpid, port, src, data, True))
+      t += period * rng.uniform(0.9, 1.1)
+
+  dpid,port = FGRE_PORTS[0]
+  macs = [EthAddr("02" + "%010x" % (rng.getrandbits(40),)).toRaw()
+          for i in range(args.macs)]
+  packets = [(src, make_packet(src, args.vlan)) for src in macs]
+  t = 0.0
+  while t < args.duration:
+    src,data = rng.choice(packets)
+    trace.append((t, dpid, port, src, data, False))
+    t += rng.expovariate(args.flood_rate)
+
+  trace.sort()
+  return trace
+
+
+def main ():
+  parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+  parser.add_argument("--duration", type=float, default=10,
+                      help="simulated seconds of traffic")
+  parser.add_argument("--flood-rate", type=float, default=20000,
+                      help="packets/sec from the attacker")
+  parser.add_argument("--macs", type=int, default=1,
+                      help="source MACs the attacker uses")
+  parser.add_argument("--good-rate", type=float, default=0.5,
+                      help="packets/sec from each well-behaved host")
+  parser.add_argument("--rule-delay", type=float, default=0.005,
+                      help="seconds before a DROP rule takes effect")
+  parser.add_argument("--batch", type=float, default=0.001,
+                      help="simulated seconds of PacketIns per batch")
+  parser.add_argument("--vlan", type=int, default=100)
+  parser.add_argument("--threshold", type=float, default=0.2)
+  parser.add_argument("--rate", type=float)
+  parser.add_argument("--burst", type=float)
+  parser.add_argument("--per-mac", action="store_true")
+  parser.add_argument("--max-keys", type=int,
+                      help="most sources the firewall tracks")
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  logging.getLogger().setLevel(logging.WARNING)
+  core.register("openflow", pox.openflow.OpenFlowNexus())
+
+  clock = Clock()
+  fgre_fw.time = clock
+  kw = {}
+  if args.rate is not None: kw['rate'] = args.rate
+  if args.burst is not None: kw['burst'] = args.burst
+  if args.per_mac: kw['per_mac'] = True
+  if args.max_keys is not None: kw['max_keys'] = args.max_keys
+  fw = fgre_fw.FGREFirewall(args.vlan, args.threshold, **kw)
+
+  trace = make_trace(args, random.Random(args.seed))
+  cons = dict((dpid, FakeConnection(dpid, clock, args.rule_delay))
+              for dpid,port in FGRE_PORTS)
+  counts = dict(packet_ins = 0, good = 0, good_forwarded = 0,
+                flood_in = 0, elapsed = 0.0)
+  done = threading.Event()
+  position = [0]
+
+  if hasattr(fw, 'flush'):
+    # Count the time spent sending deferred rules too
+    flush = fw.flush
+    def timed_flush ():
+      start = time.time()
+      flush()
+      counts['elapsed'] += time.time() - start
+    fw.flush = timed_flush
+
+  def replay ():
+    """
+    Raises the PacketIns for one batch of simulated time
+    """
+    i = position[0]
+    end = clock.now + args.batch
+    while i < len(trace) and trace[i][0] < end:
+      t,dpid,port,src,data,good = trace[i]
+      i += 1
+      clock.now = t
+      con = cons[dpid]
+      if good: counts['good'] += 1
+      if con.drops(port, src): continue
+      counts['packet_ins'] += 1
+      if not good: counts['flood_in'] += 1
+      outs = con.packet_outs
+      msg = of.ofp_packet_in(in_port=port, data=data,
+                             reason=of.OFPR_NO_MATCH)
+      start = time.time()
+      fw._handle_PacketIn(pox.openflow.PacketIn(con, msg))
+      counts['elapsed'] += time.time() - start
+      if good and con.packet_outs > outs:
+        counts['good_forwarded'] += 1
+    clock.now = end
+    position[0] = i
+    if i < len(trace):
+      core.callLater(replay) # After anything the firewall deferred
+    else:
+      core.callLater(done.set)
+
+  wall = time.time()
+  core.callLater(replay)
+  done.wait()
+  wall = time.time() - wall
+
+  detector = getattr(fw, 'detector', None)
+  tracked = len(detector) if detector is not None else \
+      sum(len(v) for v in getattr(fw, 'traffic_frequency', {}).values())
+  packet_ins = counts['packet_ins']
+  print "packets offered:    %i (%i good)" % (len(trace), counts['good'])
+  print "PacketIns handled:  %i (%i from the flood)" % (packet_ins,
+                                                       counts['flood_in'])
+  print "us per PacketIn:    %0.1f" % (1e6 * counts['elapsed'] / packet_ins,)
+  print "wall time:          %0.3f sec" % (wall,)
+  print "flow_mods sent:     %i" % (sum(c.flow_mods for c in cons.values()),)
+  print "writes:             %i" % (sum(c.writes for c in cons.values()),)
+  print "good forwarded:     %0.1f%%" % (100.0 * counts['good_forwarded']
+                                         / max(1, counts['good']),)
+  print "sources tracked:    %i" % (tracked,)
+  sys.stdout.flush()
+  os._exit(0)
+
+
+if __name__ == '__main__':
+  main()
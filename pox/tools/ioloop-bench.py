@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark for the ioworker IO loops
+
+Sets up a lot of idle workers and a few busy ones (which get a message
+and send a reply on every trip around the loop), and then runs each of
+RecocoIOLoop and EpollIOLoop for a while, reporting trips per second.
+
+The loops are driven by hand rather than by the recoco scheduler; the
+Select they yield is serviced with pox.lib.epoll_select (as the scheduler
+does when told to use epoll) so that plain select()'s fd limit doesn't
+get in the way.
+
+Each worker uses two file descriptors, so you may need to raise the open
+file limit (ulimit -n) for the default counts.
+"""
+
+import sys
+import os
+import time
+import socket
+import argparse
+import resource
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import pox.core
+pox.core.initialize()
+from pox.lib.ioworker import RecocoIOLoop, EpollIOLoop
+from pox.lib.epoll_select import EpollSelect
+
+
+def bench (loop_type, idle, busy, duration):
+  loop = loop_type()
+  peers = []
+  busy_peers = []
+  replies = [0]
+  def echo (worker):
+    worker.send(worker.read())
+  for i in range(idle + busy):
+    a,b = socket.socketpair()
+    a.setblocking(0)
+    b.setblocking(0)
+    peers.append((a,b))
+    w = loop.new_worker(a)
+    if i < busy:
+      w.rx_handler = echo
+      busy_peers.append(b)
+
+  sel = EpollSelect()
+  g = loop.run()
+  request = g.next()
+  trips = 0
+  start = time.time()
+  end = start + duration
+  while time.time() < end:
+    for b in busy_peers:
+      try:
+        while b.recv(4096): pass
+      except socket.error:
+        pass
+      b.send("ping")
+    args = request._args
+    rlist, wlist, xlist = sel.select(args[0] or [], args[1] or [],
+                                     args[2] or [], 0)
+    request = g.send((rlist, wlist, xlist))
+    trips += 1
+  elapsed = time.time() - start
+
+  g.close()
+  sel.close()
+  for a,b in peers:
+    a.close()
+    b.close()
+  return trips / elapsed
+
+
+def main ():
+  parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+  parser.add_argument("--idle", type=int, default=10000)
+  parser.add_argument("--busy", type=int, default=100)
+  parser.add_argument("--duration", type=float, default=3)
+  args = parser.parse_args()
+
+  need = 2 * (args.idle + args.busy) + 64
+  soft,hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+  if soft < need:
+    try:
+      resource.setrlimit(resource.RLIMIT_NOFILE, (min(need, hard), hard))
+    except Exception:
+      pass
+    if min(need, hard) < need:
+      print "Warning: open file limit (%s) is probably too low" % (hard,)
+
+  print "%i idle workers, %i busy workers" % (args.idle, args.busy)
+  for loop_type in (RecocoIOLoop, EpollIOLoop):
+    rate = bench(loop_type, args.idle, args.busy, args.duration)
+    print "%-12s %8.1f trips/sec" % (loop_type.__name__, rate)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Throughput benchmark for libopenflow_01 pack/unpack
+
+Packs and unpacks flow_mods, packet_ins, packet_outs and flow stats
+entries and reports thousands of messages per second for each.  Unpacking
+is done from a memoryview over a buffer of many messages, the way
+of_01 sees them.
+"""
+
+import sys
+import os
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import pox.core
+pox.core.initialize()
+import pox.openflow.libopenflow_01 as of
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+def samples ():
+  match = of.ofp_match(in_port=3, dl_src=EthAddr("00:00:00:00:00:01"),
+                       dl_dst=EthAddr("00:00:00:00:00:02"), dl_type=0x800,
+                       nw_proto=6, nw_src=IPAddr("10.0.0.1"),
+                       nw_dst=IPAddr("10.0.0.2"), tp_src=1234, tp_dst=80)
+  actions = [of.ofp_action_dl_addr.set_dst("00:00:00:00:00:03"),
+             of.ofp_action_output(port=4)]
+  payload = "\x00" * 128
+  return [
+    ("flow_mod", of.ofp_flow_mod, None,
+     of.ofp_flow_mod(match=match, actions=actions, idle_timeout=10,
+                     priority=100, xid=1)),
+    ("packet_in", of.ofp_packet_in, None,
+     of.ofp_packet_in(in_port=1, data=payload, xid=2)),
+    ("packet_out", of.ofp_packet_out, None,
+     of.ofp_packet_out(in_port=1, data=payload, actions=actions[1:], xid=3)),
+    ("flow_stats", of.ofp_flow_stats, len,
+     of.ofp_flow_stats(match=match, actions=actions, priority=100,
+                       packet_count=12345, byte_count=1234567)),
+  ]
+
+
+def main ():
+  parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+  parser.add_argument("--count", type=int, default=20000)
+  args = parser.parse_args()
+  n = args.count
+
+  print "%-12s %12s %12s %12s" % ("message", "pack k/s", "pack_into k/s",
+                                  "unpack k/s")
+  for name,cls,avail,msg in samples():
+    start = time.time()
+    for i in xrange(n):
+      msg.pack()
+    pack_rate = n / (time.time() - start) / 1000
+
+    if hasattr(msg, "pack_into"):
+      buf = bytearray(len(msg) * n)
+      start = time.time()
+      offset = 0
+      for i in xrange(n):
+        offset = msg.pack_into(buf, offset)
+      pack_into_rate = "%12.1f" % (n / (time.time() - start) / 1000,)
+    else:
+      pack_into_rate = "%12s" % ("-",)
+
+    data = memoryview(msg.pack() * n)
+    start = time.time()
+    offset = 0
+    for i in xrange(n):
+      o = cls()
+      if avail is None:
+        offset,_ = o.unpack(data, offset)
+      else:
+        offset = o.unpack(data, offset, len(data) - offset)
+    unpack_rate = n / (time.time() - start) / 1000
+    assert o == msg, name
+
+    print "%-12s %12.1f %s %12.1f" % (name, pack_rate, pack_into_rate,
+                                      unpack_rate)
+
+
+if __name__ == '__main__':
+  main()
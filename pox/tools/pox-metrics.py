@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Display runtime metrics from a running POX
+
+Fetches /metrics.json from POX's web server and prints a summary of the
+slowest event handlers and tasks, scheduler lag and per-switch rates.
+
+Requires the info.metrics and web.webcore components to be running.
+"""
+
+import sys
+import os
+import json
+import time
+import argparse
+import urllib2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+
+def main ():
+  parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+  parser.add_argument("--address", default="127.0.0.1",
+                      help="web server address")
+  parser.add_argument("--port", type=int, default=8000,
+                      help="web server port")
+  parser.add_argument("--top", type=int, default=20,
+                      help="how many handlers and tasks to show")
+  parser.add_argument("--interval", type=float,
+                      help="keep printing every this many seconds")
+  args = parser.parse_args()
+
+  from pox.info.metrics_format import format_stats
+
+  url = "http://%s:%i/metrics.json" % (args.address, args.port)
+  while True:
+    stats = json.load(urllib2.urlopen(url))
+    print format_stats(stats, top=args.top)
+    if not args.interval: break
+    print
+    sys.stdout.flush()
+    time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+  main()
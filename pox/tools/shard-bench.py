@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark of controller throughput with openflow.shard
+
+Starts POX running forwarding.l2_learning with 1, 2, ... worker shards,
+connects a number of local SoftwareSwitches to it (spread over a few
+load processes), and has every switch keep a window of table-miss
+packets outstanding.  Reports how many packet_ins per second the
+controller answered.
+"""
+
+import sys
+import os
+import time
+import socket
+import select
+import random
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+POX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def run_load (args):
+  """
+  Runs switches in this process and prints how many replies they got
+  """
+  import pox.core
+  pox.core.initialize()
+  import pox.openflow.libopenflow_01 as of
+  from pox.datapaths.switch import SoftwareSwitch, OFConnection
+  from pox.lib.ioworker import IOWorker
+  from pox.lib.packet import ethernet, ipv4, udp
+  from pox.lib.addresses import EthAddr, IPAddr
+  import logging
+  logging.getLogger().setLevel(logging.ERROR)
+
+  class BenchSwitch (SoftwareSwitch):
+    def __init__ (self, *args, **kw):
+      self.ready = False
+      self.outstanding = 0
+      self.replies = 0
+      SoftwareSwitch.__init__(self, *args, **kw)
+
+    def rx_message (self, connection, msg):
+      t = msg.header_type
+      if t == of.OFPT_PACKET_OUT:
+        self.outstanding -= 1
+        self.replies += 1
+      SoftwareSwitch.rx_message(self, connection, msg)
+      if t == of.OFPT_BARRIER_REQUEST:
+        self.ready = True
+
+    def _output_packet_physical (self, packet, port_no, packet_data=None):
+      pass
+
+  class SocketWorker (IOWorker):
+    def __init__ (self, sock):
+      IOWorker.__init__(self)
+      self.socket = sock
+
+    def send (self, data):
+      self.socket.sendall(data)
+
+  def make_packet ():
+    src = EthAddr("02" + "%010x" % (random.getrandbits(40),))
+    dst = EthAddr("02" + "%010x" % (random.getrandbits(40),))
+    return ethernet(src=src, dst=dst, type=ethernet.IP_TYPE,
+                    payload=ipv4(srcip=IPAddr("10.0.0.1"),
+                                 dstip=IPAddr("10.0.0.2"),
+                                 protocol=ipv4.UDP_PROTOCOL,
+                                 payload=udp(srcport=1, dstport=2,
+                                             payload="x" * 64)))
+
+  workers = {}
+  for i in range(args.switches):
+    sw = BenchSwitch(dpid=args.first_dpid + i, ports=4,
+                     miss_send_len=128)
+    s = socket.create_connection(("127.0.0.1", args.port))
+    w = SocketWorker(s)
+    con = OFConnection(w)
+    w.rx_handler = con.read
+    sw.set_connection(con)
+    sw.send_hello()
+    workers[s] = (w, sw)
+
+  switches = [sw for _,sw in workers.values()]
+  packets = [make_packet() for i in range(1000)]
+  start = None
+  end = time.time() + args.duration + args.warmup
+  while time.time() < end:
+    r,_,_ = select.select(list(workers), [], [], 0.01)
+    for s in r:
+      data = s.recv(65536)
+      if not data:
+        del workers[s]
+        continue
+      w,sw = workers[s]
+      w._push_receive_data(data)
+    for sw in switches:
+      if not sw.ready: continue
+      if start is None:
+        start = time.time() + args.warmup
+      while sw.outstanding < args.window:
+        sw.outstanding += 1
+        sw.rx_packet(random.choice(packets), 1)
+    if start is not None and time.time() >= start:
+      for sw in switches: sw.replies = 0
+      start = float("inf")
+  print sum(sw.replies for sw in switches)
+  # Skip waiting on the scheduler thread; we're done
+  sys.stdout.flush()
+  os._exit(0)
+
+
+def wait_for_port (port, timeout = 10):
+  end = time.time() + timeout
+  while time.time() < end:
+    try:
+      socket.create_connection(("127.0.0.1", port)).close()
+      return True
+    except socket.error:
+      time.sleep(0.1)
+  return False
+
+
+def main ():
+  parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+  parser.add_argument("--workers", default="1,2,4",
+                      help="comma-separated shard counts to try")
+  parser.add_argument("--switches", type=int, default=32)
+  parser.add_argument("--loaders", type=int, default=4,
+                      help="processes to run the switches in")
+  parser.add_argument("--window", type=int, default=8,
+                      help="packet_ins each switch keeps outstanding")
+  parser.add_argument("--duration", type=float, default=5)
+  parser.add_argument("--warmup", type=float, default=1)
+  parser.add_argument("--port", type=int, default=6699)
+  parser.add_argument("--load", action="store_true", help=argparse.SUPPRESS)
+  parser.add_argument("--first-dpid", type=int, default=1,
+                      help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.load:
+    run_load(args)
+    return
+
+  print "%-8s %14s" % ("workers", "packet_ins/s")
+  for workers in [int(x) for x in args.workers.split(",")]:
+    cmd = [sys.executable, "pox.py", "log.level", "--WARNING"]
+    if workers > 1:
+      cmd += ["openflow.shard", "--workers=%i" % (workers,)]
+    cmd += ["openflow.of_01", "--port=%i" % (args.port,),
+            "forwarding.l2_learning"]
+    controller = subprocess.Popen(cmd, cwd=POX_DIR)
+    try:
+      if not wait_for_port(args.port):
+        raise RuntimeError("Controller didn't start")
+      time.sleep(0.5 * workers) # Let the other shards start listening
+      per = args.switches // args.loaders
+      loaders = []
+      for i in range(args.loaders):
+        loaders.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--load",
+             "--port=%i" % (args.port,), "--switches=%i" % (per,),
+             "--first-dpid=%i" % (1 + i * per,),
+             "--window=%i" % (args.window,),
+             "--duration=%s" % (args.duration,),
+             "--warmup=%s" % (args.warmup,)],
+            stdout=subprocess.PIPE))
+      replies = sum(int(l.communicate()[0].split()[-1]) for l in loaders)
+      print "%-8i %14.1f" % (workers, replies / args.duration)
+    finally:
+      controller.terminate()
+      controller.wait()
+      time.sleep(0.5)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at:
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmark of flooding in the software switch
+
+Floods packets out a switch with many ports (48 by default) and reports
+how many floods per second SoftwareSwitchBase._output_packet() manages.
+Physical output is a no-op, so this measures the switch's own overhead
+(port selection, stats and packing).
+"""
+
+import sys
+import os
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+import pox.core
+pox.core.initialize()
+import pox.openflow.libopenflow_01 as of
+from pox.datapaths.switch import SoftwareSwitchBase
+from pox.lib.packet import ethernet, ipv4, udp
+from pox.lib.addresses import EthAddr, IPAddr
+
+
+class BenchSwitch (SoftwareSwitchBase):
+  def __init__ (self, *args, **kw):
+    self.sent = 0
+    SoftwareSwitchBase.__init__(self, *args, **kw)
+
+  def send (self, message):
+    pass
+
+  def _output_packet_physical (self, packet, port_no, packet_data=None):
+    self.sent += 1
+
+
+def main ():
+  parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+  parser.add_argument("--count", type=int, default=2000)
+  parser.add_argument("--ports", type=int, default=48)
+  parser.add_argument("--size", type=int, default=100,
+                      help="UDP payload bytes")
+  args = parser.parse_args()
+  n = args.count
+
+  sw = BenchSwitch(1, ports=args.ports)
+  # A few ports which shouldn't be flooded to
+  for port_no in range(2, args.ports, 8):
+    port = sw.ports[port_no]
+    sw._rx_port_mod(of.ofp_port_mod(port_no=port_no, hw_addr=port.hw_addr,
+                                    mask=of.OFPPC_NO_FLOOD,
+                                    config=of.OFPPC_NO_FLOOD), None)
+
+  packet = ethernet(src=EthAddr("00:00:00:00:00:01"),
+                    dst=EthAddr("ff:ff:ff:ff:ff:ff"), type=ethernet.IP_TYPE,
+                    payload=ipv4(srcip=IPAddr("10.0.0.1"),
+                                 dstip=IPAddr("10.255.255.255"),
+                                 protocol=ipv4.UDP_PROTOCOL,
+                                 payload=udp(srcport=1234, dstport=5678,
+                                             payload="x" * args.size)))
+
+  print "%-6s %12s %14s" % ("port", "floods/s", "port sends/s")
+  for name,out_port in (("FLOOD", of.OFPP_FLOOD), ("ALL", of.OFPP_ALL)):
+    sw.sent = 0
+    start = time.time()
+    for i in xrange(n):
+      sw._output_packet(packet, out_port, 1)
+    elapsed = time.time() - start
+    print "%-6s %12.1f %14.1f" % (name, n / elapsed, sw.sent / elapsed)
+
+
+if __name__ == '__main__':
+  main()